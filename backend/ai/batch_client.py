@@ -0,0 +1,148 @@
+"""
+Клиент Batch API OpenAI для ночной массовой генерации.
+
+Запросы пишутся в JSONL-файл формата Batch API (одна строка — один запрос к
+/v1/chat/completions с custom_id), файл загружается, создаётся пакет, статус
+опрашивается до завершения, затем скачиваются файлы результатов и ошибок.
+Пакет обрабатывается провайдером в течение OPENAI_BATCH_COMPLETION_WINDOW
+по сниженной цене и вне лимитов интерактивных запросов.
+
+Batch API есть только у OpenAI: нужен OPENAI_API_KEY даже при работе через OpenRouter.
+OPENAI_BATCH_BASE_URL позволяет направить клиент на локальный фейковый сервер
+(backend/tools/fake_batch_server.py) для офлайн-проверки.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import httpx
+import openai
+
+from backend.config import settings
+from backend.ai.openai_client import supports_json_mode
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchResult(NamedTuple):
+    """Результат одного запроса пакета: текст ответа или описание ошибки"""
+    custom_id: str
+    content: Optional[str]
+    finish_reason: Optional[str]
+    error: Optional[str]
+
+
+def chat_request_body(
+    system_prompt: str,
+    user_prompt: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    json_mode: bool = True,
+) -> Dict[str, Any]:
+    """Тело запроса Chat Completions — то же, что отправляет OpenAIClient интерактивно"""
+    body: Dict[str, Any] = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if json_mode and supports_json_mode(model):
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+
+def batch_request_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка входного JSONL-файла Batch API"""
+    return {"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_ENDPOINT, "body": body}
+
+
+class BatchClient:
+    """Загрузка файла запросов, создание пакета, опрос статуса и разбор результатов"""
+
+    def __init__(self, client: Optional[openai.OpenAI] = None):
+        self.client = client or self._create_client()
+
+    @staticmethod
+    def _create_client() -> openai.OpenAI:
+        api_key = settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY не найден: Batch API доступен только у OpenAI")
+        proxy_url = settings.HTTPS_PROXY
+        timeout = float(settings.OPENAI_TIMEOUT or 120.0)
+        if proxy_url:
+            http_client = httpx.Client(verify=False, timeout=timeout, proxies=proxy_url)
+        else:
+            http_client = httpx.Client(verify=False, timeout=timeout)
+        create_kwargs: Dict[str, Any] = {"api_key": api_key, "http_client": http_client}
+        if settings.OPENAI_BATCH_BASE_URL:
+            create_kwargs["base_url"] = settings.OPENAI_BATCH_BASE_URL
+        return openai.OpenAI(**create_kwargs)
+
+    def submit(self, lines: List[Dict[str, Any]], metadata: Optional[Dict[str, str]] = None):
+        """Загружает JSONL с запросами и создаёт пакет; возвращает объект Batch"""
+        data = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode("utf-8")
+        input_file = self.client.files.create(file=("batch_requests.jsonl", data), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_ENDPOINT,
+            completion_window=settings.OPENAI_BATCH_COMPLETION_WINDOW,
+            metadata=metadata,
+        )
+        logger.info(f"✅ Пакет {batch.id} создан: {len(lines)} запросов, файл {input_file.id} ({len(data)} байт)")
+        return batch
+
+    def retrieve(self, batch_id: str):
+        return self.client.batches.retrieve(batch_id)
+
+    def wait(self, batch_id: str, poll_interval: Optional[float] = None, timeout: Optional[float] = None):
+        """Опрашивает пакет до конечного статуса (или до timeout секунд); возвращает последний Batch"""
+        poll_interval = settings.OPENAI_BATCH_POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        started = time.monotonic()
+        while True:
+            batch = self.retrieve(batch_id)
+            counts = batch.request_counts
+            logger.info(
+                f"Пакет {batch_id}: {batch.status}"
+                + (f" ({counts.completed}/{counts.total}, ошибок {counts.failed})" if counts else "")
+            )
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return batch
+            time.sleep(poll_interval)
+
+    def results(self, batch) -> Dict[str, BatchResult]:
+        """Результаты пакета по custom_id (успешные из output-файла, ошибки из error-файла)"""
+        results: Dict[str, BatchResult] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            text = self.client.files.content(file_id).text
+            for raw in text.splitlines():
+                if raw.strip():
+                    result = self._parse_line(json.loads(raw))
+                    results[result.custom_id] = result
+        return results
+
+    @staticmethod
+    def _parse_line(line: Dict[str, Any]) -> BatchResult:
+        custom_id = line.get("custom_id", "")
+        error = line.get("error")
+        response = line.get("response") or {}
+        if error:
+            return BatchResult(custom_id, None, None, f"{error.get('code')}: {error.get('message')}")
+        if response.get("status_code") != 200:
+            body_error = (response.get("body") or {}).get("error") or {}
+            return BatchResult(custom_id, None, None, f"HTTP {response.get('status_code')}: {body_error.get('message')}")
+        choice = ((response.get("body") or {}).get("choices") or [{}])[0]
+        content = (choice.get("message") or {}).get("content")
+        return BatchResult(custom_id, content, choice.get("finish_reason"), None if content else "пустой ответ")
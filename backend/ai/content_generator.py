@@ -2,18 +2,22 @@
 Генератор учебного контента для модулей курса
 """
 import logging
-import json
 from typing import Optional, Dict, Any, List
 
 from backend.models.domain import (
     Module, Lecture, Slide, ModuleContent,
-    Lesson, LessonContent, TopicMaterial, GeneratedLecture
+    Lesson, LessonContent, TopicMaterial
 )
+from backend.models.validation import GENERATED_LECTURE_ADAPTER, MODULE_CONTENT_ADAPTER
 from backend.config import settings
 from backend.ai.cache import make_cache_key, get as cache_get, set as cache_set
 from backend.ai.openai_client import OpenAIClient
 from backend.ai.interfaces import AIChatClient
 from backend.ai.json_sanitizer import extract_json
+from backend.ai.similarity_cache import (
+    SimilarMatch, find_similar, remember_similar, similarity_scope, similarity_text
+)
+from backend.ai.telemetry import OUTCOME_DRAFT, ai_task, record_cache_hit
 from backend.ai.prompts import (
     MODULE_CONTENT_SYSTEM_PROMPT,
     MODULE_CONTENT_PROMPT_TEMPLATE,
@@ -27,6 +31,9 @@ from backend.ai.prompts import (
 
 logger = logging.getLogger(__name__)
 
+# Температура генерации детального контента урока
+LESSON_DETAILED_TEMPERATURE = 0.3
+
 
 class ContentGenerator:
     """Класс для генерации учебного контента модулей"""
@@ -56,59 +63,130 @@ class ContentGenerator:
         logger.info(f"Генерируем детальный контент для урока: {lesson.lesson_title}")
         
         try:
-            prompt = LESSON_DETAILED_PROMPT_TEMPLATE.format(
-                course_title=course_title,
-                target_audience=target_audience,
-                module_title=module.module_title,
-                lesson_title=lesson.lesson_title,
-                lesson_goal=lesson.lesson_goal,
-                lesson_format=lesson.format,
-                lesson_time=lesson.estimated_time_minutes,
-                content_outline=format_content_outline(lesson.content_outline),
-            )
+            prompt = self.build_lesson_detailed_prompt(lesson, module, course_title, target_audience)
 
             # Кэш-ключ по содержанию запроса
-            cache_key = make_cache_key(
-                "lesson_detailed",
-                settings.PROMPT_VERSION,
-                LESSON_DETAILED_SYSTEM_PROMPT,
-                prompt,
-                settings.OPENAI_MODEL_DETAILED_CONTENT,
-                str(0.3),
-            )
+            cache_key = self.lesson_detailed_cache_key(prompt)
             if settings.AI_CACHE_ENABLED:
                 cached = cache_get(cache_key)
                 if cached is not None:
                     logger.info("cache hit: lesson_detailed")
+                    record_cache_hit("lesson_detailed", settings.OPENAI_MODEL_DETAILED_CONTENT)
                     return cached
 
-            content_json = self.openai_client.call_ai_json(
-                system_prompt=LESSON_DETAILED_SYSTEM_PROMPT,
-                user_prompt=prompt,
-                model=settings.OPENAI_MODEL_DETAILED_CONTENT,
-                temperature=0.3,
-                max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
-            )
-            if not content_json:
-                logger.warning("❌ JSON mode вернул пустой результат для урока")
-                return None
-            # Валидация pydantic
-            try:
-                _ = GeneratedLecture(**content_json)
-            except Exception as e:
-                logger.warning(f"❌ Невалидная структура лекции: {e}")
-                return None
-            if 'slides' in content_json and isinstance(content_json['slides'], list):
-                logger.info(f"✅ Контент урока сгенерирован: {len(content_json['slides'])} слайдов")
+            # Кэш похожих запросов: совпадение после нормализации отдаём как готовый ответ
+            scope, text = self.lesson_detailed_similarity_key(lesson, module, course_title, target_audience)
+            similar = find_similar("lesson_detailed", scope, text)
+            if similar is not None and similar.final:
+                record_cache_hit("lesson_detailed", settings.OPENAI_MODEL_DETAILED_CONTENT)
+                content_json = self.adapt_lesson_draft(similar.value, lesson)
                 if settings.AI_CACHE_ENABLED:
                     cache_set(cache_key, content_json, settings.AI_CACHE_TTL_SECONDS)
                 return content_json
-            logger.warning(f"❌ Неправильная структура урока. Ключи: {list(content_json.keys())}")
-            return None
+
+            with ai_task("lesson_detailed"):
+                content_json = self.openai_client.call_ai_json(
+                    system_prompt=LESSON_DETAILED_SYSTEM_PROMPT,
+                    user_prompt=prompt,
+                    model=settings.OPENAI_MODEL_DETAILED_CONTENT,
+                    temperature=LESSON_DETAILED_TEMPERATURE,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
+                )
+            content_json = self.validate_lesson_detailed_content(content_json)
+            if content_json is not None:
+                if settings.AI_CACHE_ENABLED:
+                    cache_set(cache_key, content_json, settings.AI_CACHE_TTL_SECONDS)
+                remember_similar(scope, text, content_json)
+            return content_json
                 
         except Exception as e:
             logger.error(f"Ошибка генерации контента урока: {e}")
             return None
+
+    @staticmethod
+    def build_lesson_detailed_prompt(lesson, module: Module, course_title: str, target_audience: str) -> str:
+        """Промпт детального контента урока (общий для интерактивной и пакетной генерации)"""
+        return LESSON_DETAILED_PROMPT_TEMPLATE.format(
+            course_title=course_title,
+            target_audience=target_audience,
+            module_title=module.module_title,
+            lesson_title=lesson.lesson_title,
+            lesson_goal=lesson.lesson_goal,
+            lesson_format=lesson.format,
+            lesson_time=lesson.estimated_time_minutes,
+            content_outline=format_content_outline(lesson.content_outline),
+        )
+
+    def lesson_detailed_draft(
+        self, lesson, module: Module, course_title: str, target_audience: str
+    ) -> Optional[SimilarMatch]:
+        """
+        Черновик контента урока из кэша похожих запросов
+
+        None, если ответ есть в точном кэше или похожий запрос достаточно близок,
+        чтобы generate_lesson_detailed_content сразу отдал его как готовый.
+        """
+        prompt = self.build_lesson_detailed_prompt(lesson, module, course_title, target_audience)
+        if settings.AI_CACHE_ENABLED and cache_get(self.lesson_detailed_cache_key(prompt)) is not None:
+            return None
+        similar = find_similar(
+            "lesson_detailed", *self.lesson_detailed_similarity_key(lesson, module, course_title, target_audience)
+        )
+        if similar is None or similar.final:
+            return None
+        record_cache_hit("lesson_detailed", settings.OPENAI_MODEL_DETAILED_CONTENT, outcome=OUTCOME_DRAFT)
+        return similar._replace(value=self.adapt_lesson_draft(similar.value, lesson))
+
+    @staticmethod
+    def lesson_detailed_similarity_key(lesson, module: Module, course_title: str, target_audience: str) -> tuple:
+        """(scope, текст) для кэша похожих запросов: курс и модель — точно, поля урока — по сходству"""
+        scope = similarity_scope(
+            "lesson_detailed", settings.OPENAI_MODEL_DETAILED_CONTENT, course_title, target_audience
+        )
+        text = similarity_text(
+            module.module_title,
+            lesson.lesson_title,
+            lesson.lesson_goal,
+            lesson.format,
+            lesson.estimated_time_minutes,
+            lesson.content_outline,
+        )
+        return scope, text
+
+    @staticmethod
+    def adapt_lesson_draft(content_json: Dict[str, Any], lesson) -> Dict[str, Any]:
+        """Ответ похожего запроса с названием текущего урока"""
+        content_json["lecture_title"] = lesson.lesson_title
+        return content_json
+
+    @staticmethod
+    def lesson_detailed_cache_key(prompt: str) -> str:
+        return make_cache_key(
+            "lesson_detailed",
+            settings.PROMPT_VERSION,
+            LESSON_DETAILED_SYSTEM_PROMPT,
+            prompt,
+            settings.OPENAI_MODEL_DETAILED_CONTENT,
+            str(LESSON_DETAILED_TEMPERATURE),
+        )
+
+    @staticmethod
+    def validate_lesson_detailed_content(content_json: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Проверяет ответ модели для урока и возвращает его в виде GeneratedLecture (dict); None — невалидный"""
+        if not content_json:
+            logger.warning("❌ JSON mode вернул пустой результат для урока")
+            return None
+        if not isinstance(content_json.get('slides'), list):
+            logger.warning(f"❌ Неправильная структура урока. Ключи: {list(content_json.keys())}")
+            return None
+        # Валидация pydantic; дальше идёт проверенная и нормализованная лекция, а не сырой ответ
+        try:
+            lecture = GENERATED_LECTURE_ADAPTER.validate_python(content_json)
+        except Exception as e:
+            logger.warning(f"❌ Невалидная структура лекции: {e}")
+            return None
+        logger.info(f"✅ Контент урока сгенерирован: {len(lecture.slides)} слайдов")
+        return lecture.model_dump(mode="json")
     
     def generate_module_content(
         self, 
@@ -176,21 +254,25 @@ class ContentGenerator:
                 cached = cache_get(cache_key)
                 if cached is not None:
                     logger.info("cache hit: module_json_mode")
+                    record_cache_hit("module_content", settings.OPENAI_MODEL_DETAILED_CONTENT)
                     try:
-                        return ModuleContent(**cached)
+                        return MODULE_CONTENT_ADAPTER.validate_python(cached)
                     except Exception:
                         pass
 
-            json_content = self.openai_client.call_ai_json(
-                system_prompt=MODULE_CONTENT_SYSTEM_PROMPT + "\n\nВЫВОД ТОЛЬКО В JSON ФОРМАТЕ!",
-                user_prompt=prompt,
-                model=settings.OPENAI_MODEL_DETAILED_CONTENT,
-                temperature=0.3,
-                max_tokens=settings.OPENAI_MAX_TOKENS_MODULE_CONTENT,
-            )
+            with ai_task("module_content"):
+                json_content = self.openai_client.call_ai_json(
+                    system_prompt=MODULE_CONTENT_SYSTEM_PROMPT + "\n\nВЫВОД ТОЛЬКО В JSON ФОРМАТЕ!",
+                    user_prompt=prompt,
+                    model=settings.OPENAI_MODEL_DETAILED_CONTENT,
+                    temperature=0.3,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_MODULE_CONTENT,
+                )
             
             if json_content and "lectures" in json_content:
                 # Добавляем обязательные поля
+                json_content["module_number"] = module.module_number
+                json_content["module_title"] = module.module_title
                 for lecture in json_content["lectures"]:
                     lecture["module_number"] = module.module_number
                     lecture["module_title"] = module.module_title
@@ -201,7 +283,7 @@ class ContentGenerator:
                 json_content["total_slides"] = total_slides
                 json_content["estimated_duration_minutes"] = total_duration
                 
-                module_content = ModuleContent(**json_content)
+                module_content = MODULE_CONTENT_ADAPTER.validate_python(json_content)
                 logger.info(f"✅ JSON mode успешно: {len(module_content.lectures)} лекций, {total_slides} слайдов")
                 if settings.AI_CACHE_ENABLED:
                     cache_set(cache_key, json_content, settings.AI_CACHE_TTL_SECONDS)
@@ -247,24 +329,28 @@ class ContentGenerator:
                 cached = cache_get(cache_key)
                 if cached is not None:
                     logger.info("cache hit: module_text_mode")
+                    record_cache_hit("module_content", "gpt-4")
                     try:
-                        return ModuleContent(**cached)
+                        return MODULE_CONTENT_ADAPTER.validate_python(cached)
                     except Exception:
                         pass
 
-            content = self.openai_client.call_ai(
-                system_prompt=MODULE_CONTENT_SYSTEM_PROMPT,
-                user_prompt=prompt,
-                model="gpt-4",
-                temperature=0.3,
-                max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
-            )
+            with ai_task("module_content"):
+                content = self.openai_client.call_ai(
+                    system_prompt=MODULE_CONTENT_SYSTEM_PROMPT,
+                    user_prompt=prompt,
+                    model="gpt-4",
+                    temperature=0.3,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
+                )
             if not content:
                 return None
             json_content = extract_json(content, expected_key="lectures")
             
             if json_content and "lectures" in json_content:
                 # Добавляем обязательные поля
+                json_content["module_number"] = module.module_number
+                json_content["module_title"] = module.module_title
                 for lecture in json_content["lectures"]:
                     lecture["module_number"] = module.module_number
                     lecture["module_title"] = module.module_title
@@ -275,7 +361,7 @@ class ContentGenerator:
                 json_content["total_slides"] = total_slides
                 json_content["estimated_duration_minutes"] = total_duration
                 
-                module_content = ModuleContent(**json_content)
+                module_content = MODULE_CONTENT_ADAPTER.validate_python(json_content)
                 logger.info(f"✅ Текстовый режим успешно: {len(module_content.lectures)} лекций, {total_slides} слайдов")
                 if settings.AI_CACHE_ENABLED:
                     cache_set(cache_key, json_content, settings.AI_CACHE_TTL_SECONDS)
@@ -317,108 +403,6 @@ class ContentGenerator:
         except Exception as save_error:
             logger.error(f"Не удалось сохранить JSON в файл: {save_error}")
                     
-    def _attempt_close_json(self, json_str: str) -> str:
-        """Пытается закрыть обрезанный JSON
-        
-        Если JSON был обрезан из-за max_tokens, пытаемся закрыть его корректно,
-        чтобы хотя бы получить часть данных.
-        """
-        try:
-            # Подсчитываем открытые/закрытые скобки
-            open_braces = json_str.count('{')
-            close_braces = json_str.count('}')
-            open_brackets = json_str.count('[')
-            close_brackets = json_str.count(']')
-            
-            # Проверяем, находимся ли мы внутри строки (незакрытая кавычка)
-            # Упрощенная проверка: считаем неэкранированные кавычки
-            quote_count = json_str.count('"') - json_str.count('\\"')
-            in_string = (quote_count % 2) == 1
-            
-            # Если находимся внутри строки, закрываем её
-            if in_string:
-                json_str += '"'
-                logger.info("🔧 Закрыли незавершенную строку")
-            
-            # Если последний символ - запятая, удаляем её
-            json_str = json_str.rstrip()
-            if json_str.endswith(','):
-                json_str = json_str[:-1]
-                logger.info("🔧 Удалили trailing запятую")
-            
-            # Закрываем массивы
-            if open_brackets > close_brackets:
-                for _ in range(open_brackets - close_brackets):
-                    json_str += ']'
-                logger.info(f"🔧 Закрыли {open_brackets - close_brackets} массивов")
-            
-            # Закрываем объекты
-            if open_braces > close_braces:
-                for _ in range(open_braces - close_braces):
-                    json_str += '}'
-                logger.info(f"🔧 Закрыли {open_braces - close_braces} объектов")
-            
-            return json_str
-                
-        except Exception as e:
-            logger.warning(f"Ошибка при попытке закрыть JSON: {e}")
-            return json_str
-    
-    def _fix_json_errors(self, json_str: str, error: json.JSONDecodeError) -> str:
-        """Исправляет частые ошибки в JSON от AI
-        
-        Args:
-            json_str: Строка JSON с ошибками
-            error: Ошибка парсинга JSON для контекста
-        """
-        import re
-        
-        # 1. Исправляем trailing запятые перед закрывающими скобками
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-        
-        # 2. Исправляем двойные запятые
-        json_str = json_str.replace(',,', ',')
-        
-        # 3. Исправляем отсутствующие запятые между строками (частая ошибка AI)
-        # Паттерн: "text"\n    "text" -> "text",\n    "text"
-        json_str = re.sub(r'"\s*\n\s*"', '",\n        "', json_str)
-        
-        # 4. Исправляем отсутствующие запятые между объектами в массиве
-        # Паттерн: }\n    { -> },\n    {
-        json_str = re.sub(r'}\s*\n\s*{', '},\n        {', json_str)
-        
-        # 5. Исправляем отсутствующие запятые после закрывающих скобок перед полями
-        # Паттерн: }\n    "field" -> },\n    "field"
-        json_str = re.sub(r'}\s*\n\s*"', '},\n        "', json_str)
-        # Паттерн: ]\n    "field" -> ],\n    "field"
-        json_str = re.sub(r']\s*\n\s*"', '],\n        "', json_str)
-        
-        # 6. Исправляем отсутствующие запятые между значениями массива
-        # Паттерн: "text1"\n    "text2" внутри массива
-        # Это уже покрыто в пункте 3
-        
-        # 7. Удаляем BOM и другие невидимые символы
-        json_str = json_str.replace('\ufeff', '')
-        
-        # 8. Исправляем неэкранированные переносы строк в строковых значениях
-        # Это сложно и может сломать валидный JSON, поэтому пропускаем
-        
-        # 9. Если ошибка указывает на конкретную позицию, пытаемся исправить локально
-        if hasattr(error, 'pos') and error.pos:
-            # Проверяем контекст вокруг ошибки
-            pos = error.pos
-            if pos > 0 and pos < len(json_str):
-                before = json_str[max(0, pos-5):pos]
-                after = json_str[pos:min(len(json_str), pos+5)]
-                
-                # Если перед ошибкой закрывающая кавычка и пробелы, а после - кавычка
-                if before.rstrip().endswith('"') and after.lstrip().startswith('"'):
-                    # Вставляем запятую
-                    json_str = json_str[:pos] + ',' + json_str[pos:]
-                    logger.info(f"🔧 Добавлена запятая на позиции {pos}")
-        
-        return json_str
-    
     def _get_test_module_content(self, module: Module) -> ModuleContent:
         """Возвращает тестовый контент для демонстрации"""
         lectures = []
@@ -506,22 +490,24 @@ class ContentGenerator:
             )
             
             # Пробуем JSON mode с оберткой клиента
-            json_content = self.openai_client.call_ai_json(
-                system_prompt=TOPIC_MATERIAL_SYSTEM_PROMPT,
-                user_prompt=prompt,
-                model=settings.OPENAI_MODEL_DETAILED_CONTENT,
-                temperature=0.7,
-                max_tokens=settings.OPENAI_MAX_TOKENS_TOPIC_MATERIAL,
-            )
-            if not json_content:
-                # Обычный режим + санитайзер
-                content = self.openai_client.call_ai(
+            with ai_task("topic_material"):
+                json_content = self.openai_client.call_ai_json(
                     system_prompt=TOPIC_MATERIAL_SYSTEM_PROMPT,
                     user_prompt=prompt,
-                    model="gpt-4",
+                    model=settings.OPENAI_MODEL_DETAILED_CONTENT,
                     temperature=0.7,
-                    max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_TOPIC_MATERIAL,
                 )
+            if not json_content:
+                # Обычный режим + санитайзер
+                with ai_task("topic_material"):
+                    content = self.openai_client.call_ai(
+                        system_prompt=TOPIC_MATERIAL_SYSTEM_PROMPT,
+                        user_prompt=prompt,
+                        model="gpt-4",
+                        temperature=0.7,
+                        max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
+                    )
                 if not content:
                     return None
                 json_content = extract_json(content, expected_key=None)
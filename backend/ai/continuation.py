@@ -0,0 +1,26 @@
+"""
+Склейка ответа модели, обрезанного по max_tokens, с запросами-продолжениями.
+
+Когда модель упирается в max_tokens (finish_reason == "length"), OpenAIClient.call_ai
+отправляет продолжение: исходный диалог + уже полученный текст как ответ ассистента
++ просьба продолжить с места обрыва. Модель иногда повторяет хвост предыдущей части
+или заново открывает markdown-блок — здесь это убирается перед склейкой.
+"""
+import re
+
+# Сколько последних символов частичного ответа сравнивать с началом продолжения
+MAX_OVERLAP_CHARS = 400
+# Более короткие совпадения (например, '}' или '"') считаем случайными, а не повтором
+MIN_OVERLAP_CHARS = 16
+
+_LEADING_FENCE = re.compile(r"^\s*```(?:json)?[ \t]*\n?")
+
+
+def stitch_continuation(partial: str, continuation: str) -> str:
+    """Присоединяет продолжение к обрезанному ответу, убирая повтор хвоста и markdown-обёртку"""
+    continuation = _LEADING_FENCE.sub("", continuation, count=1)
+    tail = partial[-MAX_OVERLAP_CHARS:]
+    for size in range(min(len(tail), len(continuation)), MIN_OVERLAP_CHARS - 1, -1):
+        if tail.endswith(continuation[:size]):
+            return partial + continuation[size:]
+    return partial + continuation
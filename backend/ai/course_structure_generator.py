@@ -0,0 +1,206 @@
+"""
+Двухфазная генерация структуры курса.
+
+1. Каркас: один короткий запрос возвращает название курса и модули (номер,
+   название, цель) без уроков.
+2. Уроки: для каждого модуля отдельный запрос с каркасом всего курса в качестве
+   контекста; запросы идут параллельно (COURSE_GENERATION_PARALLELISM).
+
+Каждый модуль валидируется отдельно (модель Lesson), и невалидный модуль
+перегенерируется сам по себе — остальной курс не теряется. Собранный курс
+проверяется моделью Course.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+from pydantic import ValidationError
+
+from backend.config import settings
+from backend.ai.interfaces import AIChatClient
+from backend.ai.telemetry import ai_task, bind_context
+from backend.ai.prompts import (
+    COURSE_GENERATION_SYSTEM_PROMPT,
+    COURSE_SKELETON_PROMPT_TEMPLATE,
+    MODULE_LESSONS_PROMPT_TEMPLATE,
+)
+from backend.models.domain import Course, Lesson
+
+logger = logging.getLogger(__name__)
+
+MIN_LESSON_MINUTES = 15
+MAX_LESSON_MINUTES = 480
+
+
+def normalize_lesson_times(lessons: List[Dict[str, Any]]) -> None:
+    """Приводит estimated_time_minutes уроков в диапазон 15..480 минут (in-place)"""
+    for lesson in lessons:
+        time_minutes = lesson.get("estimated_time_minutes")
+        if not isinstance(time_minutes, (int, float)):
+            continue
+        fixed = min(max(time_minutes, MIN_LESSON_MINUTES), MAX_LESSON_MINUTES)
+        if fixed != time_minutes:
+            logger.warning(
+                f"Исправлено время урока '{lesson.get('lesson_title', 'Без названия')}': "
+                f"{time_minutes} -> {fixed} минут"
+            )
+            lesson["estimated_time_minutes"] = fixed
+
+
+def modules_numbered(course_data: Dict[str, Any], expected_count: int) -> bool:
+    """Ровно expected_count модулей-объектов с module_number от 1 до expected_count по порядку"""
+    modules = course_data.get("modules")
+    if not isinstance(modules, list):
+        logger.warning("Поле 'modules' отсутствует или имеет неверный тип")
+        return False
+    if len(modules) != expected_count:
+        return False
+    module_numbers = [module.get("module_number") if isinstance(module, dict) else None for module in modules]
+    return module_numbers == list(range(1, expected_count + 1))
+
+
+class CourseStructureGenerator:
+    """Генерация структуры курса: каркас модулей, затем уроки модулей параллельно"""
+
+    def __init__(self, ai_client: AIChatClient):
+        self.ai_client = ai_client
+
+    def generate(
+        self,
+        topic: str,
+        audience_level: str,
+        module_count: int,
+        course_goals_text: str,
+        duration_text: str,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Генерирует структуру курса в два этапа
+
+        Returns:
+            JSON структура курса (как у одношаговой генерации) или None при ошибке
+        """
+        skeleton = self._generate_skeleton(topic, audience_level, module_count, course_goals_text, duration_text)
+        if skeleton is None:
+            return None
+
+        modules = skeleton["modules"]
+        workers = max(1, min(settings.COURSE_GENERATION_PARALLELISM, len(modules)))
+        logger.info(f"🔧 Каркас курса готов: {len(modules)} модулей, генерируем уроки ({workers} параллельно)")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="course-module") as pool:
+            # bind_context — метки телеметрии запроса переносятся в потоки пула
+            module_lessons = list(pool.map(
+                lambda generate: generate(),
+                [
+                    bind_context(lambda module=module: self._generate_module_lessons(skeleton, module, duration_text))
+                    for module in modules
+                ],
+            ))
+
+        failed = [module["module_number"] for module, lessons in zip(modules, module_lessons) if lessons is None]
+        if failed:
+            logger.error(f"❌ Не удалось сгенерировать уроки модулей: {failed}")
+            return None
+        for module, lessons in zip(modules, module_lessons):
+            module["lessons"] = lessons
+
+        try:
+            Course(**skeleton)
+        except ValidationError as e:
+            logger.error(f"❌ Собранная структура курса не прошла валидацию: {e}")
+            return None
+        logger.info(f"✅ Структура курса создана: {skeleton.get('course_title', 'Без названия')}")
+        return skeleton
+
+    def _generate_skeleton(
+        self,
+        topic: str,
+        audience_level: str,
+        module_count: int,
+        course_goals_text: str,
+        duration_text: str,
+    ) -> Optional[Dict[str, Any]]:
+        """Каркас курса: название, цели, аудитория и модули без уроков"""
+        for attempt in range(2):
+            prompt = COURSE_SKELETON_PROMPT_TEMPLATE.format(
+                topic=topic,
+                course_goals=course_goals_text,
+                audience=audience_level,
+                num_modules=module_count,
+                duration=duration_text,
+            )
+            if attempt > 0:
+                prompt = f"{prompt}\n\nКРИТИЧЕСКИ ВАЖНО: верни РОВНО {module_count} модулей."
+
+            logger.info(f"Генерируем каркас курса: {topic} для {audience_level}")
+            with ai_task("course_skeleton"):
+                skeleton = self.ai_client.call_ai_json(
+                    system_prompt=COURSE_GENERATION_SYSTEM_PROMPT,
+                    user_prompt=prompt,
+                    model=settings.OPENAI_MODEL_DEFAULT,
+                    temperature=0.7,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_COURSE_SKELETON,
+                    retries=settings.OPENAI_RETRIES_DEFAULT,
+                    backoff_seconds=settings.OPENAI_BACKOFF_SECONDS_DEFAULT,
+                )
+            if not skeleton:
+                logger.error("Не удалось извлечь JSON каркаса курса из ответа")
+                continue
+            if not modules_numbered(skeleton, module_count):
+                logger.warning(
+                    f"Каркас с неверным количеством модулей. "
+                    f"Ожидалось: {module_count}, получено: {len(skeleton.get('modules') or [])}"
+                )
+                continue
+            if not all(module.get("module_title") and module.get("module_goal") for module in skeleton["modules"]):
+                logger.warning("В каркасе есть модули без названия или цели")
+                continue
+            return skeleton
+
+        logger.error("Не удалось получить каркас курса с корректным количеством модулей")
+        return None
+
+    def _generate_module_lessons(
+        self,
+        skeleton: Dict[str, Any],
+        module: Dict[str, Any],
+        duration_text: str,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Уроки одного модуля; при невалидном ответе перегенерируется только этот модуль"""
+        modules_overview = "\n".join(
+            f"{m['module_number']}. {m['module_title']} — {m['module_goal']}" for m in skeleton["modules"]
+        )
+        prompt = MODULE_LESSONS_PROMPT_TEMPLATE.format(
+            course_title=skeleton.get("course_title", ""),
+            audience=skeleton.get("target_audience", ""),
+            duration=duration_text,
+            modules_overview=modules_overview,
+            module_number=module["module_number"],
+            module_title=module["module_title"],
+            module_goal=module["module_goal"],
+        )
+        attempts = max(1, settings.COURSE_MODULE_GENERATION_ATTEMPTS)
+        for attempt in range(1, attempts + 1):
+            try:
+                with ai_task("module_lessons"):
+                    content = self.ai_client.call_ai_json(
+                        system_prompt=COURSE_GENERATION_SYSTEM_PROMPT,
+                        user_prompt=prompt,
+                        model=settings.OPENAI_MODEL_DEFAULT,
+                        temperature=0.7,
+                        max_tokens=settings.OPENAI_MAX_TOKENS_MODULE_LESSONS,
+                        retries=settings.OPENAI_RETRIES_DEFAULT,
+                        backoff_seconds=settings.OPENAI_BACKOFF_SECONDS_DEFAULT,
+                    )
+                lessons = (content or {}).get("lessons")
+                if not isinstance(lessons, list) or not lessons:
+                    raise ValueError("в ответе нет списка уроков")
+                normalize_lesson_times(lessons)
+                for lesson in lessons:
+                    Lesson(**lesson)
+                logger.info(f"✅ Модуль {module['module_number']}: {len(lessons)} уроков")
+                return lessons
+            except (ValidationError, ValueError, TypeError, AttributeError) as e:
+                logger.warning(
+                    f"⚠️ Модуль {module['module_number']}: невалидные уроки (попытка {attempt}/{attempts}): {e}"
+                )
+        return None
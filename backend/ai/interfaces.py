@@ -15,6 +15,7 @@ class AIChatClient(Protocol):
         response_format: Optional[Dict[str, str]] = None,
         retries: int = 2,
         backoff_seconds: float = 1.0,
+        max_continuations: Optional[int] = None,
     ) -> Optional[str]:
         ...
 
@@ -27,6 +28,7 @@ class AIChatClient(Protocol):
         max_tokens: int = 3000,
         retries: int = 2,
         backoff_seconds: float = 1.0,
+        max_continuations: Optional[int] = None,
     ) -> Optional[Dict[str, Any]]:
         ...
 
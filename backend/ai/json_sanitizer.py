@@ -1,109 +1,377 @@
 """
 Утилиты для извлечения и «починки» JSON, возвращаемого моделью.
 Выделено из ContentGenerator для повторного использования и тестирования.
+
+Починка выполняется за один линейный проход (`repair_json`): сканер знает,
+находится ли он внутри строки, поэтому `{`, `[` и `"` в примерах кода не ломают
+подсчёт вложенности. Исправляются типовые ошибки модели:
+- обрезанный ответ (max_tokens): незакрытая строка и структуры закрываются,
+  недописанный ключ/литерал отбрасывается до последнего целого значения;
+- висячие и двойные запятые;
+- пропущенные запятые между значениями и пропущенное двоеточие;
+- неэкранированные переносы строк / управляющие символы и кавычки внутри строк;
+- неверные escape-последовательности (`\\d` в регулярках из примеров кода);
+- текст до и после JSON (markdown-обёртка ```json, пояснения модели).
+Каждое исправление попадает в отчёт с позицией во входном тексте.
+
+Корректные поддеревья (объекты/массивы) и строки без ошибок забираются целиком
+разбором на C (`json.JSONDecoder.raw_decode`, одно регулярное выражение), так что
+посимвольно проходится только путь от корня к повреждённым местам.
 """
 import json
 import logging
-from typing import Optional, Dict, Any
+import re
+from collections import Counter
+from typing import Optional, Dict, Any, List, NamedTuple
 
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE = re.compile(r"[ \t\r\n\ufeff]+")
+# Участок строки без кавычек, обратных слэшей и управляющих символов
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]+')
+# Корректная строка целиком (быстрый путь: один вызов regex вместо посимвольного разбора)
+_VALID_STRING = re.compile(r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"')
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LITERAL = re.compile(r"true|false|null")
+_LITERAL_WORD = re.compile(r"(?:true|false|null)\b")
+_BARE_KEY = re.compile(r"[A-Za-z_][\w-]*")
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_VALID_ESCAPES = frozenset('"\\/bfnrt')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _reject_constant(name: str):
+    raise ValueError(f"{name} не допускается в JSON")
+
+
+# Быстрый путь для корректных поддеревьев: разбор на C вместо посимвольного сканера
+# (NaN/Infinity не принимаются — их сканер отбрасывает как неожиданные символы)
+_DECODER = json.JSONDecoder(parse_constant=_reject_constant)
+
+# Состояния контейнера на вершине стека
+_KEY = "key"        # объект: ждём ключ или '}'
+_COLON = "colon"    # объект: ключ прочитан, ждём ':'
+_VALUE = "value"    # ждём значение (после ':' в объекте или элемент массива)
+_AFTER = "after"    # значение прочитано, ждём ',' или закрывающую скобку
+
+
+class JsonRepair(NamedTuple):
+    """Результат починки: исправленный JSON-текст и список исправлений"""
+    text: str
+    repairs: List[str]
+
+
+class _Scanner:
+    """Однопроходный сканер-восстановитель JSON (см. repair_json)"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.n = len(text)
+        self.out: List[str] = []
+        self.repairs: List[str] = []
+
+    def note(self, pos: int, what: str) -> None:
+        self.repairs.append(f"{what} (позиция {pos})")
+
+    def skip_ws(self, i: int) -> int:
+        m = _WHITESPACE.match(self.text, i)
+        return m.end() if m else i
+
+    def string_ends_at(self, i: int) -> bool:
+        """
+        Кавычка на позиции i закрывает строку, если за ней идёт структурный символ, перенос строки или конец.
+
+        После запятой дополнительно должен начинаться ключ или значение: в
+        `"Он написал "стоп", потом ушёл"` кавычка после «стоп» — часть текста,
+        иначе строка разрезалась бы, а «потом» стал бы выдуманным ключом.
+        """
+        text = self.text
+        j = i + 1
+        m = _WHITESPACE.match(text, j)
+        if m:
+            if "\n" in m.group():
+                return True
+            j = m.end()
+        if j >= self.n:
+            return True
+        ch = text[j]
+        if ch != ",":
+            return ch in ":}]"
+        k = self.skip_ws(j + 1)
+        if k >= self.n or text[k] in '"{[]}-0123456789' or _LITERAL_WORD.match(text, k):
+            return True
+        bare_key = _BARE_KEY.match(text, k)
+        if bare_key is None:
+            return False
+        colon = self.skip_ws(bare_key.end())
+        return colon < self.n and text[colon] == ":"
+
+    def valid_container_end(self, i: int) -> Optional[int]:
+        """Конец корректного объекта/массива с позиции i (разбор на C); None — внутри есть что чинить"""
+        try:
+            return _DECODER.raw_decode(self.text, i)[1]
+        except (ValueError, RecursionError):
+            return None
+
+    def scan_string(self, i: int) -> tuple:
+        """
+        Читает строку, начинающуюся с кавычки на позиции i.
+
+        Returns:
+            (позиция после строки, строка закрыта до конца входа)
+        """
+        text, out = self.text, self.out
+        m = _VALID_STRING.match(text, i)
+        if m and self.string_ends_at(m.end() - 1):
+            out.append(m.group())
+            return m.end(), True
+        out.append('"')
+        i += 1
+        while i < self.n:
+            m = _STRING_RUN.match(text, i)
+            if m:
+                out.append(m.group())
+                i = m.end()
+                if i >= self.n:
+                    break
+            ch = text[i]
+            if ch == '"':
+                if self.string_ends_at(i):
+                    out.append('"')
+                    return i + 1, True
+                self.note(i, "экранирована кавычка внутри строки")
+                out.append('\\"')
+                i += 1
+            elif ch == "\\":
+                if i + 1 >= self.n:
+                    self.note(i, "отброшен обрезанный escape")
+                    i += 1
+                    break
+                nxt = text[i + 1]
+                if nxt in _VALID_ESCAPES:
+                    out.append(text[i:i + 2])
+                    i += 2
+                elif nxt == "u" and _HEX4.match(text, i + 2):
+                    out.append(text[i:i + 6])
+                    i += 6
+                else:
+                    self.note(i, "экранирован одиночный обратный слэш")
+                    out.append("\\\\")
+                    i += 1
+            else:
+                self.note(i, "экранирован управляющий символ в строке")
+                out.append(_CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+                i += 1
+        return i, False
+
+    def run(self, start: int) -> str:
+        text, out, n = self.text, self.out, self.n
+        skip_ws = _WHITESPACE.match
+        stack: List[list] = []     # [открывающая скобка, состояние]
+        safe = 0                    # длина out, на которой JSON можно корректно закрыть
+        pending_comma = False       # запятая прочитана, но ещё не выведена
+        i = start
+        while i < n:
+            ws = skip_ws(text, i)
+            if ws:
+                i = ws.end()
+                if i >= n:
+                    break
+            ch = text[i]
+
+            if not stack:
+                if out:
+                    self.note(i, "отброшен текст после JSON")
+                    break
+                if ch not in _CLOSERS:
+                    i += 1
+                    continue
+                out.append(ch)
+                stack.append([ch, _KEY if ch == "{" else _VALUE])
+                safe = len(out)
+                i += 1
+                continue
+
+            top = stack[-1]
+            container, state = top
+
+            if ch == ",":
+                if state == _AFTER:
+                    pending_comma = True
+                    top[1] = _KEY if container == "{" else _VALUE
+                else:
+                    self.note(i, "удалена лишняя запятая")
+                i += 1
+                continue
+
+            if ch in "}]":
+                if pending_comma:
+                    self.note(i, "удалена висячая запятая")
+                    pending_comma = False
+                if container == "{" and state in (_COLON, _VALUE):
+                    self.note(i, "добавлено значение null для ключа без значения")
+                    out.append(":null" if state == _COLON else "null")
+                expected = _CLOSERS[container]
+                if ch != expected:
+                    self.note(i, f"'{ch}' заменена на '{expected}'")
+                out.append(expected)
+                stack.pop()
+                if stack:
+                    stack[-1][1] = _AFTER
+                safe = len(out)
+                i += 1
+                continue
+
+            if ch == ":":
+                if state == _COLON:
+                    out.append(":")
+                    top[1] = _VALUE
+                else:
+                    self.note(i, "удалено лишнее двоеточие")
+                i += 1
+                continue
+
+            if container == "{" and state in (_KEY, _AFTER):
+                # Ключ объекта
+                bare_key = None if ch == '"' else _BARE_KEY.match(text, i)
+                if ch != '"' and bare_key is None:
+                    self.note(i, f"отброшен неожиданный символ {ch!r}")
+                    i += 1
+                    continue
+                if state == _AFTER:
+                    self.note(i, "вставлена пропущенная запятая")
+                    pending_comma = True
+                if pending_comma:
+                    out.append(",")
+                    pending_comma = False
+                if bare_key is None:
+                    i, closed = self.scan_string(i)
+                    if not closed:
+                        break
+                else:
+                    self.note(i, "ключ заключён в кавычки")
+                    out.append(json.dumps(bare_key.group()))
+                    i = bare_key.end()
+                top[1] = _COLON
+                continue
+
+            if state == _COLON:
+                self.note(i, "вставлено пропущенное двоеточие")
+                out.append(":")
+                top[1] = _VALUE
+                continue
+
+            # Значение: элемент массива или значение ключа
+            scalar = None
+            if ch not in _CLOSERS and ch != '"':
+                scalar = _NUMBER.match(text, i) or _LITERAL.match(text, i)
+                if scalar is None:
+                    rest = text[i:].rstrip() if self.n - i <= 5 else ""
+                    if rest and any(lit.startswith(rest) for lit in ("true", "false", "null")):
+                        # Обрезанный литерал в конце ответа
+                        break
+                    self.note(i, f"отброшен неожиданный символ {ch!r}")
+                    i += 1
+                    continue
+            if state == _AFTER:
+                self.note(i, "вставлена пропущенная запятая")
+                pending_comma = True
+            if pending_comma:
+                out.append(",")
+                pending_comma = False
+            if ch in _CLOSERS:
+                end = self.valid_container_end(i)
+                if end is None:
+                    out.append(ch)
+                    stack.append([ch, _KEY if ch == "{" else _VALUE])
+                    i += 1
+                else:
+                    out.append(text[i:end])
+                    i = end
+                    top[1] = _AFTER
+            elif scalar is None:
+                i, closed = self.scan_string(i)
+                if not closed:
+                    self.note(i, "закрыта обрезанная строка")
+                    out.append('"')
+                top[1] = _AFTER
+            else:
+                out.append(scalar.group())
+                i = scalar.end()
+                top[1] = _AFTER
+            safe = len(out)
+
+        if stack:
+            if len(out) > safe:
+                self.note(self.n, "отброшен недописанный фрагмент в конце")
+                del out[safe:]
+            self.note(self.n, f"закрыто незавершённых структур: {len(stack)}")
+            out.extend(_CLOSERS[c] for c, _ in reversed(stack))
+        return "".join(out)
+
+
+def repair_json(content: str) -> Optional[JsonRepair]:
+    """Однопроходная починка JSON-текста ответа модели.
+
+    Время работы — O(длина входа × глубина вложенности): неудачная попытка быстрого
+    разбора поддерева повторяется на каждом уровне пути к ошибке. Возвращает None, если в тексте нет
+    ни одного объекта/массива. Первым корнем считается первая `{` или `[`.
+    """
+    scanner = _Scanner(content)
+    start = min((p for p in (content.find("{"), content.find("[")) if p != -1), default=-1)
+    if start == -1:
+        return None
+    if content[:start].strip():
+        scanner.note(0, "отброшен текст перед JSON")
+    return JsonRepair(scanner.run(start), scanner.repairs)
+
+
+def summarize_repairs(repairs: List[str]) -> str:
+    """Краткая сводка исправлений для лога: вид исправления и количество"""
+    counts = Counter(r.rsplit(" (позиция", 1)[0] for r in repairs)
+    return "; ".join(f"{what} ×{count}" if count > 1 else what for what, count in counts.items())
+
 
 def extract_json(content: str, expected_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
-    """Извлекает JSON из текстового ответа, пытаясь автоматически исправить частые ошибки.
+    """Извлекает JSON из текстового ответа, автоматически исправляя частые ошибки.
 
-    - Удаляет markdown-блоки ```json ... ```
-    - Пытается закрыть обрезанный JSON
-    - Применяет набор регулярных правок для типовых ошибок
+    Сначала пробует разобрать первый объект как есть (быстрый путь на C, текст
+    после него игнорируется); сканер `repair_json` запускается только если этот
+    разбор не удался. На всех путях NaN/Infinity отвергаются, как и в сканере.
     """
     try:
-        content = content.replace('```json', '').replace('```', '').strip()
-
         start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
-        if start_idx == -1 or end_idx <= start_idx:
+        if start_idx == -1:
             logger.error("JSON блок не найден в ответе")
             return None
 
-        json_str = content[start_idx:end_idx]
-
-        # Попытка закрыть обрезанный JSON
-        if not json_str.rstrip().endswith('}'):
-            json_str = _attempt_close_json(json_str)
-
-        # Попытка 1: обычный парсинг
         try:
-            parsed = json.loads(json_str)
-            if expected_key and expected_key not in parsed:
-                logger.warning(f"Ожидаемый ключ '{expected_key}' отсутствует. Ключи: {list(parsed.keys())}")
-            return parsed
-        except json.JSONDecodeError as e:
-            logger.info("json_sanitizer: applying fixes after JSONDecodeError")
-            fixed_json = _fix_json_errors(json_str, e)
+            parsed, _ = _DECODER.raw_decode(content, start_idx)
+        except ValueError as e:
+            repaired = repair_json(content[start_idx:])
             try:
-                parsed = json.loads(fixed_json)
-                if expected_key and expected_key not in parsed:
-                    logger.warning(f"Ожидаемый ключ '{expected_key}' отсутствует после фикса. Ключи: {list(parsed.keys())}")
-                return parsed
-            except json.JSONDecodeError as e2:
-                _log_problem_fragment(json_str, fixed_json, e2)
+                parsed = _DECODER.decode(repaired.text)
+            except ValueError as e2:
+                logger.error(f"❌ JSON не удалось восстановить: {e2}")
+                _log_problem_fragment(content[start_idx:], repaired.text, e)
                 return None
+            if repaired.repairs:
+                logger.info(f"🔧 JSON восстановлен ({len(repaired.repairs)} исправлений): {summarize_repairs(repaired.repairs)}")
+                logger.debug("Исправления JSON: " + "; ".join(repaired.repairs))
+
+        if not isinstance(parsed, dict):
+            logger.error(f"Ожидался JSON-объект, получен {type(parsed).__name__}")
+            return None
+        if expected_key and expected_key not in parsed:
+            logger.warning(f"Ожидаемый ключ '{expected_key}' отсутствует. Ключи: {list(parsed.keys())}")
+        return parsed
     except Exception as e:
         logger.error(f"Неожиданная ошибка извлечения JSON: {e}")
         return None
 
 
-def _attempt_close_json(json_str: str) -> str:
-    try:
-        open_braces = json_str.count('{')
-        close_braces = json_str.count('}')
-        open_brackets = json_str.count('[')
-        close_brackets = json_str.count(']')
-
-        quote_count = json_str.count('"') - json_str.count('\\"')
-        in_string = (quote_count % 2) == 1
-        if in_string:
-            json_str += '"'
-
-        json_str = json_str.rstrip()
-        if json_str.endswith(','):
-            json_str = json_str[:-1]
-
-        if open_brackets > close_brackets:
-            json_str += ']' * (open_brackets - close_brackets)
-        if open_braces > close_braces:
-            json_str += '}' * (open_braces - close_braces)
-        return json_str
-    except Exception:
-        return json_str
-
-
-def _fix_json_errors(json_str: str, error: json.JSONDecodeError) -> str:
-    import re
-    # Удаляем запятые перед закрывающими скобками
-    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-    # Двойные запятые
-    json_str = json_str.replace(',,', ',')
-    # Между строками и объектами
-    json_str = re.sub(r'"\s*\n\s*"', '",\n        "', json_str)
-    json_str = re.sub(r'}\s*\n\s*{', '},\n        {', json_str)
-    json_str = re.sub(r'}\s*\n\s*"', '},\n        "', json_str)
-    json_str = re.sub(r']\s*\n\s*"', '],\n        "', json_str)
-    # Удаляем BOM
-    json_str = json_str.replace('\ufeff', '')
-
-    # Локальная вставка запятой по позиции ошибки
-    if hasattr(error, 'pos') and error.pos:
-        pos = error.pos
-        if 0 < pos < len(json_str):
-            before = json_str[max(0, pos-5):pos]
-            after = json_str[pos:min(len(json_str), pos+5)]
-            if before.rstrip().endswith('"') and after.lstrip().startswith('"'):
-                json_str = json_str[:pos] + ',' + json_str[pos:]
-    return json_str
-
-
 def _log_problem_fragment(original_json: str, fixed_json: str, error: Exception) -> None:
     try:
         error_pos = getattr(error, 'pos', None)
@@ -117,5 +385,3 @@ def _log_problem_fragment(original_json: str, fixed_json: str, error: Exception)
             )
     except Exception:
         pass
-
-
@@ -0,0 +1,246 @@
+"""
+Маршрутизация запросов к моделям: резервные модели, хеджирование и статистика задержек.
+
+Для каждой задачи (модель по умолчанию, детальный контент, тесты) настраивается
+упорядоченный список кандидатов: основная модель из settings и резервные из
+OPENAI_MODEL_*_FALLBACKS. Роутер:
+- ведёт скользящее окно задержек и ошибок по каждой модели (p50/p95, доля ошибок);
+- переносит в конец списка модель с долей ошибок выше AI_ROUTER_MAX_ERROR_RATE
+  (после паузы без вызовов модель снова пробуется первой);
+- при ошибке кандидата сразу переходит к следующему (без ретраев на промежуточных);
+  ошибкой модели считается только исключение вызова (API/сеть, ModelCallFailed) —
+  ответ, который не удалось разобрать (call вернул None), отдаётся вызывающему
+  как есть и на статистику и выбор модели не влияет;
+- если кандидат не ответил за порог хеджирования, параллельно запускает следующего
+  и возвращает первый успешный ответ (опоздавший запрос дорабатывает в фоне).
+
+Порог хеджирования — max(AI_ROUTER_HEDGE_AFTER_SECONDS, p95 модели), чтобы
+длинные генерации, обычные для этой модели, не дублировались.
+Без резервных моделей вызов идёт напрямую, без пула потоков.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.config import settings
+from backend.ai.telemetry import bind_context
+
+logger = logging.getLogger(__name__)
+
+# Минимум наблюдений, после которого статистика модели учитывается
+MIN_SAMPLES = 5
+# Через сколько секунд без вызовов модель с высокой долей ошибок снова пробуется первой
+UNHEALTHY_COOLDOWN_SECONDS = 300
+# Результат _timed: вызов модели завершился ошибкой (в отличие от None — неразобранного ответа)
+_FAILED = object()
+
+
+class ModelCallFailed(Exception):
+    """Модель не ответила: ошибка API после всех ретраев"""
+
+
+def _parse_models(value: Optional[str]) -> List[str]:
+    return [model.strip() for model in (value or "").split(",") if model.strip()]
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ModelStats:
+    """Скользящее окно последних вызовов модели: задержка успешных и признак ошибки"""
+
+    def __init__(self, window: int):
+        self._calls: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.last_call_at = 0.0
+
+    def record(self, latency_seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._calls.append((latency_seconds, ok))
+            self.last_call_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self._calls)
+        latencies = sorted(latency for latency, ok in calls if ok)
+        errors = sum(1 for _, ok in calls if not ok)
+        return {
+            "calls": len(calls),
+            "errors": errors,
+            "error_rate": round(errors / len(calls), 3) if calls else 0.0,
+            "p50_seconds": _percentile(latencies, 0.5),
+            "p95_seconds": _percentile(latencies, 0.95),
+        }
+
+
+class ModelRouter:
+    """Выбор модели-кандидата, хеджирование медленных запросов и переход на резерв при ошибках"""
+
+    def __init__(
+        self,
+        fallbacks: Optional[Dict[str, List[str]]] = None,
+        hedge_after_seconds: Optional[float] = None,
+        max_error_rate: Optional[float] = None,
+        window: Optional[int] = None,
+    ):
+        self.fallbacks = fallbacks if fallbacks is not None else self._fallbacks_from_settings()
+        self.hedge_after_seconds = (
+            settings.AI_ROUTER_HEDGE_AFTER_SECONDS if hedge_after_seconds is None else hedge_after_seconds
+        )
+        self.max_error_rate = settings.AI_ROUTER_MAX_ERROR_RATE if max_error_rate is None else max_error_rate
+        self.window = window or settings.AI_ROUTER_WINDOW
+        self._stats: Dict[str, ModelStats] = {}
+        self._stats_lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def _fallbacks_from_settings() -> Dict[str, List[str]]:
+        """Резервные модели по основной модели задачи; одинаковые основные модели объединяются"""
+        fallbacks: Dict[str, List[str]] = {}
+        for primary, extra in (
+            (settings.OPENAI_MODEL_DEFAULT, settings.OPENAI_MODEL_DEFAULT_FALLBACKS),
+            (settings.OPENAI_MODEL_DETAILED_CONTENT, settings.OPENAI_MODEL_DETAILED_CONTENT_FALLBACKS),
+            (settings.OPENAI_MODEL_TEST, settings.OPENAI_MODEL_TEST_FALLBACKS),
+        ):
+            models = fallbacks.setdefault(primary, [])
+            for model in _parse_models(extra):
+                if model != primary and model not in models:
+                    models.append(model)
+        return fallbacks
+
+    def stats_for(self, model: str) -> ModelStats:
+        with self._stats_lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelStats(self.window)
+            return stats
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по всем моделям, которые вызывались"""
+        with self._stats_lock:
+            models = list(self._stats.items())
+        return {model: stats.snapshot() for model, stats in models}
+
+    def _unhealthy(self, model: str) -> bool:
+        stats = self.stats_for(model)
+        if time.monotonic() - stats.last_call_at > UNHEALTHY_COOLDOWN_SECONDS:
+            return False
+        snapshot = stats.snapshot()
+        return snapshot["calls"] >= MIN_SAMPLES and snapshot["error_rate"] > self.max_error_rate
+
+    def candidates(self, model: str) -> List[str]:
+        """Основная модель и резервные; модели с высокой долей ошибок — в конце списка"""
+        ordered = [model] + self.fallbacks.get(model, [])
+        healthy = [m for m in ordered if not self._unhealthy(m)]
+        return healthy + [m for m in ordered if m not in healthy]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Через сколько секунд запускать запрос к следующему кандидату (None — не хеджировать)"""
+        if self.hedge_after_seconds <= 0:
+            return None
+        snapshot = self.stats_for(model).snapshot()
+        p95 = snapshot["p95_seconds"] if snapshot["calls"] >= MIN_SAMPLES else None
+        return max(self.hedge_after_seconds, p95 or 0.0)
+
+    def _timed(self, call: Callable[[str, bool], Optional[Any]], model: str, last: bool) -> Any:
+        """Результат call или _FAILED при исключении; в статистику идут ошибки и разобранные ответы"""
+        started = time.monotonic()
+        try:
+            result = call(model, last)
+        except Exception as e:
+            logger.warning(f"Модель {model}: ошибка вызова: {e}")
+            self.stats_for(model).record(time.monotonic() - started, False)
+            return _FAILED
+        if result is not None:
+            self.stats_for(model).record(time.monotonic() - started, True)
+        return result
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=settings.AI_ROUTER_MAX_WORKERS, thread_name_prefix="ai-router"
+                )
+            return self._pool
+
+    def call(self, model: str, call: Callable[[str, bool], Optional[Any]]) -> Optional[Any]:
+        """
+        Выполняет call(модель, последний_кандидат) с резервированием.
+
+        call возвращает результат, None — модель ответила, но ответ не разобран
+        (возвращается вызывающему без перехода на резерв), или бросает исключение
+        (ModelCallFailed и т.п.) — тогда пробуется следующий кандидат. Последний
+        кандидат получает last=True (ему можно ретраить, промежуточным — нет).
+        """
+        candidates = self.candidates(model)
+        if len(candidates) == 1:
+            result = self._timed(call, model, True)
+            return None if result is _FAILED else result
+
+        pool = self._executor()
+        pending: Dict[Any, str] = {}
+        next_index = 0
+
+        def launch() -> str:
+            nonlocal next_index
+            candidate = candidates[next_index]
+            next_index += 1
+            # Метки телеметрии (задача, маршрут, курс) переносим в поток пула
+            future = pool.submit(bind_context(self._timed), call, candidate, next_index == len(candidates))
+            pending[future] = candidate
+            return candidate
+
+        current = launch()
+        hedge_deadline = self._deadline(current)
+        while pending:
+            timeout = None
+            if hedge_deadline is not None and next_index < len(candidates):
+                timeout = max(0.0, hedge_deadline - time.monotonic())
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                previous, current = current, launch()
+                logger.warning(f"⚠️ Модель {previous} отвечает дольше порога, хеджируем запросом к {current}")
+                hedge_deadline = self._deadline(current)
+                continue
+            for future in done:
+                candidate = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    logger.warning(f"⚠️ Ответ модели {candidate} не удалось разобрать, резерв не используется")
+                    return None
+                if result is not _FAILED:
+                    if candidate != model:
+                        logger.info(f"✅ Ответ получен от резервной модели {candidate}")
+                    return result
+                logger.warning(f"❌ Модель {candidate} не вернула ответ")
+            if not pending and next_index < len(candidates):
+                current = launch()
+                logger.warning(f"🔧 Переключаемся на резервную модель {current}")
+                hedge_deadline = self._deadline(current)
+        logger.error(f"❌ Ни одна модель не ответила: {candidates}")
+        return None
+
+    def _deadline(self, model: str) -> Optional[float]:
+        delay = self.hedge_delay(model)
+        return None if delay is None else time.monotonic() + delay
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Общий роутер процесса: статистика копится по всем экземплярам OpenAIClient"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
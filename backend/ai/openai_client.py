@@ -17,10 +17,21 @@ import json
 import logging
 import httpx
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
+# Список моделей, которые поддерживают JSON mode (OpenAI и OpenRouter-идентификаторы)
+JSON_MODE_MODELS = (
+    "gpt-4-turbo-preview", "gpt-4-turbo", "gpt-4o", "gpt-4o-mini",
+    "gpt-3.5-turbo", "gpt-3.5-turbo-16k",
+    "claude-3", "claude-3.5", "claude-3-opus", "claude-3-sonnet",
+)
+
+
+def supports_json_mode(model: str) -> bool:
+    return any(json_model in model.lower() for json_model in JSON_MODE_MODELS)
+
 
 class OpenAIClient:
     """Клиент для работы с OpenAI API или OpenRouter с поддержкой прокси.
@@ -90,6 +101,9 @@ class OpenAIClient:
     ) -> Optional[Dict[str, Any]]:
         """Генерирует структуру курса с помощью Chat Completions.
 
+        При COURSE_GENERATION_TWO_PHASE — каркас модулей, затем уроки модулей
+        параллельно (см. CourseStructureGenerator), иначе одним запросом.
+
         Args:
             topic: Тема курса
             audience_level: Уровень аудитории (junior/middle/senior)
@@ -102,7 +116,10 @@ class OpenAIClient:
             JSON структура курса или None при ошибке
         """
         try:
+            from pydantic import ValidationError
+            from backend.models.domain import Course
             from .prompts import COURSE_GENERATION_SYSTEM_PROMPT, COURSE_GENERATION_PROMPT_TEMPLATE
+            from .telemetry import ai_task
             
             # Формируем строку длительности
             duration_text = ""
@@ -116,6 +133,16 @@ class OpenAIClient:
             course_goals_text = course_goals.strip() if course_goals and course_goals.strip() else "Не указаны"
 
             from backend.config import settings
+            if settings.COURSE_GENERATION_TWO_PHASE:
+                from backend.ai.course_structure_generator import CourseStructureGenerator
+                return CourseStructureGenerator(self).generate(
+                    topic=topic,
+                    audience_level=audience_level,
+                    module_count=module_count,
+                    course_goals_text=course_goals_text,
+                    duration_text=duration_text,
+                )
+
             model = settings.OPENAI_MODEL_DEFAULT
 
             for attempt in range(2):
@@ -131,15 +158,16 @@ class OpenAIClient:
 
                 logger.info(f"Генерируем структуру курса: {topic} для {audience_level}")
 
-                json_content = self.call_ai_json(
-                    system_prompt=COURSE_GENERATION_SYSTEM_PROMPT,
-                    user_prompt=prompt,
-                    model=model,
-                    temperature=0.7,
-                    max_tokens=settings.OPENAI_MAX_TOKENS_COURSE_STRUCTURE,
-                    retries=settings.OPENAI_RETRIES_DEFAULT,
-                    backoff_seconds=settings.OPENAI_BACKOFF_SECONDS_DEFAULT,
-                )
+                with ai_task("course_structure"):
+                    json_content = self.call_ai_json(
+                        system_prompt=COURSE_GENERATION_SYSTEM_PROMPT,
+                        user_prompt=prompt,
+                        model=model,
+                        temperature=0.7,
+                        max_tokens=settings.OPENAI_MAX_TOKENS_COURSE_STRUCTURE,
+                        retries=settings.OPENAI_RETRIES_DEFAULT,
+                        backoff_seconds=settings.OPENAI_BACKOFF_SECONDS_DEFAULT,
+                    )
 
                 if not json_content:
                     logger.error("Не удалось извлечь JSON из ответа OpenAI")
@@ -155,6 +183,13 @@ class OpenAIClient:
                     )
                     continue
 
+                # Склеенный из продолжений ответ проверяем целиком: потерянные поля — повод повторить
+                try:
+                    Course(**json_content)
+                except ValidationError as e:
+                    logger.warning(f"❌ Структура курса не прошла валидацию: {e}")
+                    continue
+
                 logger.info(f"✅ Структура курса создана: {json_content.get('course_title', 'Без названия')}")
                 return json_content
 
@@ -166,35 +201,14 @@ class OpenAIClient:
             return None
     
     def _normalize_lesson_times(self, course_data: Dict[str, Any]) -> None:
-        """Нормализует estimated_time_minutes для всех уроков: гарантирует >= 15 минут.
+        """Нормализует estimated_time_minutes для всех уроков: от 15 до 480 минут.
         
         Args:
             course_data: Словарь с данными курса (будет изменен in-place)
         """
-        if "modules" not in course_data:
-            return
-        
+        from backend.ai.course_structure_generator import normalize_lesson_times
         for module in course_data.get("modules", []):
-            if "lessons" not in module:
-                continue
-            
-            for lesson in module.get("lessons", []):
-                if "estimated_time_minutes" in lesson:
-                    time_minutes = lesson["estimated_time_minutes"]
-                    # Если значение меньше 15, устанавливаем минимум 15
-                    if isinstance(time_minutes, (int, float)) and time_minutes < 15:
-                        logger.warning(
-                            f"Исправлено время урока '{lesson.get('lesson_title', 'Без названия')}': "
-                            f"{time_minutes} -> 15 минут"
-                        )
-                        lesson["estimated_time_minutes"] = 15
-                    # Если значение больше 480, ограничиваем до 480
-                    elif isinstance(time_minutes, (int, float)) and time_minutes > 480:
-                        logger.warning(
-                            f"Исправлено время урока '{lesson.get('lesson_title', 'Без названия')}': "
-                            f"{time_minutes} -> 480 минут"
-                        )
-                        lesson["estimated_time_minutes"] = 480
+            normalize_lesson_times(module.get("lessons", []))
     
     def _extract_json_from_response(self, content: str) -> Optional[Dict[str, Any]]:
         """Извлекает JSON из текстового ответа модели.
@@ -205,45 +219,12 @@ class OpenAIClient:
         Returns:
             Распарсенный JSON или None
         """
-        try:
-            # Удаляем markdown блоки если есть
-            content = content.replace('```json', '').replace('```', '').strip()
-            
-            # Ищем JSON блок в ответе
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = content[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                # Если JSON не найден, пытаемся распарсить весь контент
-                return json.loads(content)
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка парсинга JSON: {e}")
-            logger.debug(f"Проблемный контент: {content[:500]}...")
-            return None
+        from backend.ai.json_sanitizer import extract_json
+        return extract_json(content, expected_key=None)
 
     def _validate_module_count(self, course_data: Dict[str, Any], expected_count: int) -> bool:
-        modules = course_data.get("modules")
-        if not isinstance(modules, list):
-            logger.warning("Поле 'modules' отсутствует или имеет неверный тип")
-            return False
-
-        if len(modules) != expected_count:
-            return False
-
-        module_numbers: List[int] = []
-        for module in modules:
-            if not isinstance(module, dict):
-                return False
-            module_number = module.get("module_number")
-            if not isinstance(module_number, int):
-                return False
-            module_numbers.append(module_number)
-
-        return module_numbers == list(range(1, expected_count + 1))
+        from backend.ai.course_structure_generator import modules_numbered
+        return modules_numbered(course_data, expected_count)
     
     def call_ai(
         self, 
@@ -254,26 +235,75 @@ class OpenAIClient:
         max_tokens: int = None,
         response_format: Optional[Dict[str, str]] = None,
         retries: int = None,
-        backoff_seconds: float = None
+        backoff_seconds: float = None,
+        max_continuations: int = None
     ) -> Optional[str]:
         """
         Универсальный метод для вызова OpenAI API
         
+        Если ответ обрезан по max_tokens (finish_reason == "length"), отправляются
+        запросы-продолжения с уже полученным текстом, части склеиваются.
+        Модель выбирает ModelRouter: при ошибке или медленном ответе основной модели
+        запрос уходит резервной (OPENAI_MODEL_*_FALLBACKS).
+        
         Args:
             system_prompt: Системный промпт
             user_prompt: Промпт пользователя
             model: Модель GPT
             temperature: Температура генерации
-            max_tokens: Максимум токенов
+            max_tokens: Максимум токенов (на каждую часть ответа)
             response_format: Формат ответа (например {"type": "json_object"})
+            max_continuations: Максимум продолжений обрезанного ответа (0 — не продолжать)
             
         Returns:
             Текст ответа или None
         """
         from backend.config import settings
-        # Применяем значения по умолчанию из settings при отсутствии явных аргументов
+        from backend.ai.model_router import get_model_router
         if model is None:
             model = settings.OPENAI_MODEL_DEFAULT
+        # Роутер перебирает основную и резервные модели; полный бюджет ретраев — у последнего кандидата
+        return get_model_router().call(
+            model,
+            lambda candidate, last: self._call_model(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                model=candidate,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_format=response_format,
+                retries=self._candidate_retries(retries, last),
+                backoff_seconds=backoff_seconds,
+                max_continuations=max_continuations,
+            ),
+        )
+
+    @staticmethod
+    def _candidate_retries(retries: Optional[int], last: bool) -> int:
+        """Ретраи кандидата ModelRouter: у последнего — все, у остальных — не больше AI_ROUTER_CANDIDATE_RETRIES"""
+        from backend.config import settings
+        if retries is None:
+            retries = settings.OPENAI_RETRIES_DEFAULT
+        return retries if last else min(retries, settings.AI_ROUTER_CANDIDATE_RETRIES)
+
+    def _call_model(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        response_format: Optional[Dict[str, str]],
+        retries: Optional[int],
+        backoff_seconds: Optional[float],
+        max_continuations: Optional[int],
+    ) -> Optional[str]:
+        """Вызов одной конкретной модели с ретраями и продолжениями обрезанного ответа; ModelCallFailed — модель не ответила"""
+        from backend.config import settings
+        from backend.ai.model_router import ModelCallFailed
+        from backend.ai.continuation import stitch_continuation
+        from backend.ai.prompts import CONTINUATION_PROMPT
+        # Применяем значения по умолчанию из settings при отсутствии явных аргументов
         if temperature is None:
             temperature = settings.OPENAI_TEMPERATURE_DEFAULT
         if max_tokens is None:
@@ -282,35 +312,95 @@ class OpenAIClient:
             retries = settings.OPENAI_RETRIES_DEFAULT
         if backoff_seconds is None:
             backoff_seconds = settings.OPENAI_BACKOFF_SECONDS_DEFAULT
+        if max_continuations is None:
+            max_continuations = settings.OPENAI_MAX_CONTINUATIONS
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        kwargs = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if response_format:
+            kwargs["response_format"] = response_format
+        response = self._create_completion(kwargs, retries, backoff_seconds)
+        if response is None:
+            # Ошибка API — для ModelRouter это сбой модели (в отличие от неразобранного ответа)
+            raise ModelCallFailed(f"Модель {model} не ответила")
+        content, finish_reason = self._response_text(response)
+
+        continuations = 0
+        while finish_reason == "length" and continuations < max_continuations:
+            continuations += 1
+            logger.warning(
+                f"⚠️ Ответ обрезан по max_tokens ({len(content)} символов), "
+                f"запрашиваем продолжение {continuations}/{max_continuations}"
+            )
+            # JSON mode требует законченный объект в каждом ответе, поэтому продолжение — обычным текстом
+            continuation_kwargs = {
+                key: value for key, value in kwargs.items() if key != "response_format"
+            }
+            continuation_kwargs["messages"] = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": CONTINUATION_PROMPT},
+            ]
+            response = self._create_completion(continuation_kwargs, retries, backoff_seconds)
+            if response is None:
+                logger.error("❌ Продолжение не получено, возвращаем обрезанный ответ")
+                break
+            part, finish_reason = self._response_text(response)
+            content = stitch_continuation(content, part)
+
+        if finish_reason == "length":
+            logger.warning(f"⚠️ Ответ остаётся обрезанным после {continuations} продолжений")
+        elif continuations:
+            logger.info(f"✅ Ответ склеен из {continuations + 1} частей ({len(content)} символов)")
+        return content.strip()
 
+    @staticmethod
+    def _response_text(response) -> tuple:
+        """Текст первого варианта ответа и причина остановки генерации"""
+        choice = response.choices[0]
+        return choice.message.content or "", getattr(choice, "finish_reason", None)
+
+    def _create_completion(self, kwargs: Dict[str, Any], retries: int, backoff_seconds: float):
+        """Один запрос Chat Completions с ретраями, логированием метрик и телеметрией; None после исчерпания ретраев"""
         import time
+        from backend.ai.telemetry import OUTCOME_ERROR, OUTCOME_OK, OUTCOME_TRUNCATED, record_ai_call
         start_time = time.time()
         attempt = 0
         last_error: Optional[Exception] = None
         while attempt <= retries:
             try:
-                kwargs = {
-                    "model": model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "max_tokens": max_tokens,
-                    "temperature": temperature
-                }
-                if response_format:
-                    kwargs["response_format"] = response_format
                 response = self.client.chat.completions.create(**kwargs)
                 latency_ms = int((time.time() - start_time) * 1000)
                 usage = getattr(response, "usage", None)
                 total_tokens = getattr(usage, "total_tokens", None) if usage else None
                 prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
                 completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
+                prompt_details = getattr(usage, "prompt_tokens_details", None) if usage else None
+                cached_tokens = getattr(prompt_details, "cached_tokens", None) if prompt_details else None
+                finish_reason = getattr(response.choices[0], "finish_reason", None)
                 logger.info(
                     f"OpenAI call ok | model={kwargs['model']} temp={kwargs['temperature']} max_tokens={kwargs['max_tokens']} "
-                    f"attempt={attempt+1} latency_ms={latency_ms} tokens_total={total_tokens} tokens_prompt={prompt_tokens} tokens_completion={completion_tokens}"
+                    f"attempt={attempt+1} latency_ms={latency_ms} tokens_total={total_tokens} tokens_prompt={prompt_tokens} tokens_cached={cached_tokens} tokens_completion={completion_tokens} "
+                    f"finish_reason={finish_reason}"
+                )
+                record_ai_call(
+                    model=kwargs["model"],
+                    latency_ms=latency_ms,
+                    outcome=OUTCOME_TRUNCATED if finish_reason == "length" else OUTCOME_OK,
+                    retries=attempt,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    cached_tokens=cached_tokens,
+                    total_tokens=total_tokens,
                 )
-                return response.choices[0].message.content.strip()
+                return response
             except Exception as e:
                 last_error = e
                 logger.warning(f"OpenAI call fail attempt {attempt + 1}/{retries + 1}: {e}")
@@ -323,6 +413,7 @@ class OpenAIClient:
                 attempt += 1
         total_duration_ms = int((time.time() - start_time) * 1000)
         logger.error(f"OpenAI call failed after {retries + 1} attempts in {total_duration_ms} ms: {last_error}")
+        record_ai_call(model=kwargs["model"], latency_ms=total_duration_ms, outcome=OUTCOME_ERROR, retries=retries)
         return None
 
     def call_ai_json(
@@ -333,54 +424,62 @@ class OpenAIClient:
         temperature: float = None,
         max_tokens: int = None,
         retries: int = None,
-        backoff_seconds: float = None
+        backoff_seconds: float = None,
+        max_continuations: int = None
     ) -> Optional[Dict[str, Any]]:
         """Вызывает модель в JSON-режиме и парсит результат в dict.
         Возвращает None, если парсинг не удался.
         Если модель не поддерживает JSON mode, делает fallback на обычный вызов.
+        Обрезанный по max_tokens ответ дополняется продолжениями, при ошибке или
+        медленном ответе используются резервные модели (см. call_ai, ModelRouter).
         """
         from backend.config import settings
+        from backend.ai.model_router import get_model_router
         if model is None:
             model = settings.OPENAI_MODEL_DEFAULT
-        
-        # Список моделей, которые поддерживают JSON mode (OpenAI и OpenRouter-идентификаторы)
-        json_mode_models = [
-            "gpt-4-turbo-preview", "gpt-4-turbo", "gpt-4o", "gpt-4o-mini",
-            "gpt-3.5-turbo", "gpt-3.5-turbo-16k",
-            "claude-3", "claude-3.5", "claude-3-opus", "claude-3-sonnet",
-        ]
-        # OpenRouter поддерживает JSON mode для многих моделей — при использовании OpenRouter пробуем всегда
-        use_json_mode = self._use_openrouter or any(
-            json_model in model.lower() for json_model in json_mode_models
-        )
-        
-        if use_json_mode:
-            content = self.call_ai(
+        return get_model_router().call(
+            model,
+            lambda candidate, last: self._call_model_json(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
-                model=model,
+                model=candidate,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                response_format={"type": "json_object"},
-                retries=retries,
+                retries=self._candidate_retries(retries, last),
                 backoff_seconds=backoff_seconds,
-            )
-        else:
+                max_continuations=max_continuations,
+            ),
+        )
+
+    def _call_model_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        retries: Optional[int],
+        backoff_seconds: Optional[float],
+        max_continuations: Optional[int],
+    ) -> Optional[Dict[str, Any]]:
+        """JSON-вызов одной конкретной модели (JSON mode, если модель его поддерживает)"""
+        # OpenRouter поддерживает JSON mode для многих моделей — при использовании OpenRouter пробуем всегда
+        use_json_mode = self._use_openrouter or supports_json_mode(model)
+        if not use_json_mode:
             # Fallback: вызываем без JSON mode и парсим ответ
             logger.warning(f"Модель {model} не поддерживает JSON mode, используем fallback")
-            content = self.call_ai(
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format=None,
-                retries=retries,
-                backoff_seconds=backoff_seconds,
-            )
-        
-        if content is None:
-            return None
+
+        content = self._call_model(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"} if use_json_mode else None,
+            retries=retries,
+            backoff_seconds=backoff_seconds,
+            max_continuations=max_continuations,
+        )
         try:
             # Пытаемся распарсить JSON
             return json.loads(content)
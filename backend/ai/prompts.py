@@ -1,5 +1,11 @@
 """
 Шаблоны промптов для генерации и перегенерации контента
+
+Порядок частей шаблона рассчитан на кэширование промпта у провайдера (OpenAI
+кэширует совпадающее начало запроса от 1024 токенов): сначала постоянные
+инструкции и формат ответа, затем контекст курса, и только в конце поля
+модуля/урока. Для шаблонов, вызываемых много раз в рамках курса, общий префикс
+вынесен в *_PROMPT_PREFIX — он одинаков для всех уроков одного курса.
 """
 
 # ============================================================================
@@ -10,13 +16,7 @@ COURSE_GENERATION_SYSTEM_PROMPT = """Ты — эксперт по создани
 Создаёшь детальные учебные программы с модулями и уроками.
 Отвечаешь строго в JSON формате без дополнительных комментариев."""
 
-COURSE_GENERATION_PROMPT_TEMPLATE = """Создай структуру IT-курса по следующим параметрам:
-
-ТЕМА: {topic}
-ЦЕЛИ КУРСА: {course_goals}
-АУДИТОРИЯ: {audience}
-КОЛИЧЕСТВО МОДУЛЕЙ: {num_modules}
-ДЛИТЕЛЬНОСТЬ: {duration}
+COURSE_GENERATION_PROMPT_TEMPLATE = """Создай структуру IT-курса. Параметры курса — в разделе ПАРАМЕТРЫ КУРСА в конце сообщения.
 
 ТРЕБОВАНИЯ:
 - Каждый модуль должен иметь четкую цель
@@ -24,20 +24,19 @@ COURSE_GENERATION_PROMPT_TEMPLATE = """Создай структуру IT-кур
 - Уроки должны иметь разные форматы: theory, practice, lab, quiz, project
 - Указывай время в минутах для каждого урока
 - ВАЖНО: estimated_time_minutes должен быть не менее 15 минут и не более 480 минут (от 15 до 480)
-- Количество модулей ДОЛЖНО быть ровно {num_modules}
-- В массиве "modules" должно быть ровно {num_modules} элементов
-- module_number должен идти от 1 до {num_modules} без пропусков
+- Количество модулей ДОЛЖНО совпадать с указанным в параметрах
+- module_number должен идти от 1 до количества модулей без пропусков
 - Если в целях курса перечислены темы или навыки, распределяй их по модулям так,
   чтобы уложиться в указанное количество модулей. Не добавляй лишние модули.
 - ЛАКОНИЧНОСТЬ (чтобы JSON не обрезался): module_goal — не более 1-2 предложений;
   lesson_goal — одно предложение; content_outline — 3-5 коротких пунктов на урок;
   assessment — кратко (не более 10 слов).
 
-ФОРМАТ ОТВЕТА: строго JSON
+ФОРМАТ ОТВЕТА: строго JSON (course_goals и target_audience — из параметров курса)
 {{
   "course_title": "название курса",
-  "course_goals": "{course_goals}",
-  "target_audience": "{audience}",
+  "course_goals": "цели курса",
+  "target_audience": "аудитория",
   "modules": [
     {{
       "module_number": 1,
@@ -63,7 +62,94 @@ COURSE_GENERATION_PROMPT_TEMPLATE = """Создай структуру IT-кур
 - Рекомендуемые значения: 15, 30, 45, 60, 90, 120 минут
 
 ВАЖНО: Верни ТОЛЬКО валидный JSON (объект с course_title, course_goals, target_audience, modules).
-Без комментариев, без обёртки в ```json или markdown — только сырой JSON, готовый для парсинга."""
+Без комментариев, без обёртки в ```json или markdown — только сырой JSON, готовый для парсинга.
+
+ПАРАМЕТРЫ КУРСА:
+ТЕМА: {topic}
+ЦЕЛИ КУРСА: {course_goals}
+АУДИТОРИЯ: {audience}
+КОЛИЧЕСТВО МОДУЛЕЙ: {num_modules}
+ДЛИТЕЛЬНОСТЬ: {duration}
+
+В массиве "modules" должно быть ровно {num_modules} элементов (module_number от 1 до {num_modules})."""
+
+
+# ============================================================================
+# ДВУХФАЗНАЯ ГЕНЕРАЦИЯ СТРУКТУРЫ: СКЕЛЕТ КУРСА, ЗАТЕМ УРОКИ КАЖДОГО МОДУЛЯ
+# ============================================================================
+
+COURSE_SKELETON_PROMPT_TEMPLATE = """Создай КАРКАС IT-курса (только модули, без уроков). Параметры курса — в разделе ПАРАМЕТРЫ КУРСА в конце сообщения.
+
+ТРЕБОВАНИЯ:
+- Модули идут от простого к сложному и вместе покрывают цели курса
+- Каждый модуль должен иметь четкую цель (1-2 предложения)
+- Количество модулей ДОЛЖНО совпадать с указанным в параметрах
+- module_number должен идти от 1 до количества модулей без пропусков
+- Уроки НЕ нужны — они будут созданы отдельно для каждого модуля
+
+ФОРМАТ ОТВЕТА: строго JSON (course_goals и target_audience — из параметров курса)
+{{
+  "course_title": "название курса",
+  "course_goals": "цели курса",
+  "target_audience": "аудитория",
+  "modules": [
+    {{
+      "module_number": 1,
+      "module_title": "название модуля",
+      "module_goal": "цель модуля (1-2 предложения)"
+    }}
+  ]
+}}
+
+Верни ТОЛЬКО валидный JSON, без комментариев и без обёртки в ```json.
+
+ПАРАМЕТРЫ КУРСА:
+ТЕМА: {topic}
+ЦЕЛИ КУРСА: {course_goals}
+АУДИТОРИЯ: {audience}
+КОЛИЧЕСТВО МОДУЛЕЙ: {num_modules}
+ДЛИТЕЛЬНОСТЬ: {duration}
+
+В массиве "modules" должно быть ровно {num_modules} элементов (module_number от 1 до {num_modules})."""
+
+MODULE_LESSONS_PROMPT_PREFIX = """Составь уроки для одного модуля IT-курса.
+Курс и все его модули — в разделе КУРС, модуль для уроков — в разделе ТЕКУЩИЙ МОДУЛЬ в конце сообщения.
+
+ТРЕБОВАНИЯ:
+- В модуле 3-7 уроков
+- Не повторяй темы соседних модулей
+- Уроки должны иметь разные форматы: theory, practice, lab, quiz, project
+- estimated_time_minutes — от 15 до 480 минут (рекомендуемые: 15, 30, 45, 60, 90, 120)
+- ЛАКОНИЧНОСТЬ: lesson_goal — одно предложение; content_outline — 3-5 коротких пунктов;
+  assessment — кратко (не более 10 слов)
+
+ФОРМАТ ОТВЕТА: строго JSON
+{{
+  "lessons": [
+    {{
+      "lesson_title": "название урока",
+      "lesson_goal": "цель урока (одно предложение)",
+      "estimated_time_minutes": 60,
+      "format": "theory",
+      "assessment": "кратко",
+      "content_outline": ["пункт 1", "пункт 2", "пункт 3"]
+    }}
+  ]
+}}
+
+Верни ТОЛЬКО валидный JSON, без комментариев и без обёртки в ```json.
+
+КУРС: {course_title}
+АУДИТОРИЯ: {audience}
+ДЛИТЕЛЬНОСТЬ КУРСА: {duration}
+
+ВСЕ МОДУЛИ КУРСА:
+{modules_overview}
+"""
+
+MODULE_LESSONS_PROMPT_TEMPLATE = MODULE_LESSONS_PROMPT_PREFIX + """
+ТЕКУЩИЙ МОДУЛЬ {module_number}: {module_title}
+ЦЕЛЬ МОДУЛЯ: {module_goal}"""
 
 
 # ============================================================================
@@ -84,19 +170,11 @@ MODULE_CONTENT_SYSTEM_PROMPT = """Ты — эксперт по созданию
 - НИКОГДА не возвращай структуру урока с полями lesson_title, lesson_goal, content_outline
 - Отвечаешь строго в указанном JSON формате без отклонений."""
 
-MODULE_CONTENT_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебный контент для модуля IT-курса в формате ЛЕКЦИЙ СО СЛАЙДАМИ.
-
-КОНТЕКСТ КУРСА:
-- Курс: {course_title}
-- Аудитория: {target_audience}
-- Модуль №{module_number}: {module_title}
-- Цель модуля: {module_goal}
-
-ТЕМЫ ДЛЯ ЛЕКЦИЙ (создай по одной лекции на каждую тему):
-{lessons_list}
+MODULE_CONTENT_PROMPT_PREFIX = """Создай ДЕТАЛЬНЫЙ учебный контент для модуля IT-курса в формате ЛЕКЦИЙ СО СЛАЙДАМИ.
+Курс — в разделе КОНТЕКСТ КУРСА, модуль и темы лекций — в разделе МОДУЛЬ в конце сообщения.
 
 ЗАДАЧА: 
-Создай {num_lessons} ЛЕКЦИЙ (lectures) в формате презентаций.
+Создай по одной ЛЕКЦИИ (lectures) в формате презентаций на каждую тему из раздела МОДУЛЬ.
 Каждая ЛЕКЦИЯ должна содержать массив СЛАЙДОВ (slides).
 Одна лекция = 8-12 слайдов презентации.
 
@@ -124,13 +202,13 @@ MODULE_CONTENT_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебны
 
 ОБЯЗАТЕЛЬНАЯ СТРУКТУРА JSON:
 {{
-  "module_number": {module_number},
-  "module_title": "{module_title}",
+  "module_number": 1,
+  "module_title": "Название модуля",
   "lectures": [
     {{
       "lecture_title": "название лекции (например: 'Введение в переменные и типы данных')",
-      "module_number": {module_number},
-      "module_title": "{module_title}",
+      "module_number": 1,
+      "module_title": "Название модуля",
       "duration_minutes": 45,
       "learning_objectives": [
         "конкретная цель 1",
@@ -169,14 +247,29 @@ MODULE_CONTENT_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебны
 2. Каждая лекция в "lectures" ОБЯЗАТЕЛЬНО должна содержать поле "slides" (массив слайдов)
 3. НЕ возвращай структуру УРОКА (lesson с полями lesson_title, lesson_goal, content_outline)
 4. Возвращай структуру ЛЕКЦИЙ (lectures с вложенными slides)
-5. Создай {num_lessons} лекций, каждая с 8-12 слайдами
-6. Верни ТОЛЬКО JSON, без комментариев и markdown блоков!
+5. Создай по лекции на каждую тему, каждая с 8-12 слайдами
+6. module_number и module_title — из раздела МОДУЛЬ
+7. Верни ТОЛЬКО JSON, без комментариев и markdown блоков!
 
 ВАЖНО ПРО CONTENT И NOTES:
 - "content" - это ВЕСЬ учебный материал для студента (детальные объяснения, определения, примеры)
 - "notes" - это КОРОТКИЕ методические указания для преподавателя (1-2 предложения)
 - НЕ пиши в "content" краткие тезисы! Пиши полноценный учебный текст!
-- НЕ пиши весь учебный материал в "notes"! Notes - только для преподавателя!"""
+- НЕ пиши весь учебный материал в "notes"! Notes - только для преподавателя!
+
+КОНТЕКСТ КУРСА:
+- Курс: {course_title}
+- Аудитория: {target_audience}
+"""
+
+MODULE_CONTENT_PROMPT_TEMPLATE = MODULE_CONTENT_PROMPT_PREFIX + """
+МОДУЛЬ:
+- Модуль №{module_number}: {module_title}
+- Цель модуля: {module_goal}
+
+ТЕМЫ ДЛЯ ЛЕКЦИЙ (создай {num_lessons} лекций — по одной на каждую тему):
+{lessons_list}
+Верни ТОЛЬКО JSON!"""
 
 
 # ============================================================================
@@ -248,18 +341,8 @@ TEST_GENERATION_SYSTEM_PROMPT = """Ты — эксперт по созданию
 Тесты должны проверять понимание материала, а не просто запоминание.
 Отвечаешь строго в JSON формате."""
 
-TEST_GENERATION_PROMPT_TEMPLATE = """Создай тест для проверки знаний по уроку IT-курса.
-
-КОНТЕКСТ:
-- Курс: {course_title}
-- Аудитория: {target_audience}
-- Модуль: {module_title}
-- Урок: {lesson_title}
-- Цель урока: {lesson_goal}
-- План контента: {content_outline}
-
-ЗАДАЧА:
-Создай тест из {num_questions} вопросов, который проверит понимание материала урока.
+TEST_GENERATION_PROMPT_PREFIX = """Создай тест для проверки знаний по уроку IT-курса.
+Курс — в разделе КОНТЕКСТ КУРСА, урок и число вопросов — в разделе УРОК в конце сообщения.
 
 ТРЕБОВАНИЯ К ТЕСТУ:
 1. Каждый вопрос должен проверять понимание конкретной концепции из урока
@@ -269,10 +352,10 @@ TEST_GENERATION_PROMPT_TEMPLATE = """Создай тест для проверк
 5. Неправильные варианты должны быть правдоподобными (не очевидно неправильными)
 6. Для каждого вопроса добавь краткое объяснение правильного ответа
 
-ФОРМАТ ОТВЕТА: строго JSON
+ФОРМАТ ОТВЕТА: строго JSON (lesson_title и lesson_goal — из раздела УРОК, total_questions — число вопросов)
 {{
-  "lesson_title": "{lesson_title}",
-  "lesson_goal": "{lesson_goal}",
+  "lesson_title": "Название урока",
+  "lesson_goal": "Цель урока",
   "questions": [
     {{
       "question_text": "Текст вопроса (четкий и понятный)",
@@ -293,7 +376,7 @@ TEST_GENERATION_PROMPT_TEMPLATE = """Создай тест для проверк
       "explanation": "Краткое объяснение, почему правильный ответ корректен (2-3 предложения)"
     }}
   ],
-  "total_questions": {num_questions},
+  "total_questions": 10,
   "passing_score_percent": 70
 }}
 
@@ -301,7 +384,74 @@ TEST_GENERATION_PROMPT_TEMPLATE = """Создай тест для проверк
 - Верни ТОЛЬКО JSON, без комментариев и markdown блоков!
 - Убедись, что в каждом вопросе ровно один вариант с is_correct: true
 - Количество вариантов ответа должно быть от 3 до 5 для каждого вопроса
-- Вопросы должны быть разнообразными и проверять разные аспекты урока"""
+- Вопросы должны быть разнообразными и проверять разные аспекты урока
+
+КОНТЕКСТ КУРСА:
+- Курс: {course_title}
+- Аудитория: {target_audience}
+"""
+
+TEST_GENERATION_PROMPT_TEMPLATE = TEST_GENERATION_PROMPT_PREFIX + """
+УРОК:
+- Модуль: {module_title}
+- Урок: {lesson_title}
+- Цель урока: {lesson_goal}
+- План контента: {content_outline}
+
+Создай тест из {num_questions} вопросов по этому уроку. Верни ТОЛЬКО JSON!"""
+
+TEST_BATCH_GENERATION_PROMPT_PREFIX = """Создай тесты для проверки знаний по НЕСКОЛЬКИМ урокам одного модуля IT-курса.
+Курс — в разделе КОНТЕКСТ КУРСА, модуль, уроки и число вопросов — в конце сообщения.
+
+ТРЕБОВАНИЯ К КАЖДОМУ ТЕСТУ:
+1. Вопросы проверяют понимание концепций именно своего урока (не смешивай уроки)
+2. Вопросы разного уровня сложности (от простых к сложным)
+3. В каждом вопросе от 3 до 5 вариантов ответа, ровно один правильный
+4. Неправильные варианты правдоподобны (не очевидно неправильные)
+5. Для каждого вопроса краткое объяснение правильного ответа
+
+ФОРМАТ ОТВЕТА: строго JSON, ключ в "tests" — номер урока из списка УРОКИ (строкой),
+total_questions — число вопросов в тесте
+{{
+  "tests": {{
+    "1": {{
+      "lesson_title": "название урока",
+      "lesson_goal": "цель урока",
+      "questions": [
+        {{
+          "question_text": "Текст вопроса",
+          "options": [
+            {{"option_text": "Вариант ответа 1", "is_correct": true}},
+            {{"option_text": "Вариант ответа 2", "is_correct": false}},
+            {{"option_text": "Вариант ответа 3", "is_correct": false}}
+          ],
+          "explanation": "Краткое объяснение (1-2 предложения)"
+        }}
+      ],
+      "total_questions": 10,
+      "passing_score_percent": 70
+    }}
+  }}
+}}
+
+Верни ТОЛЬКО JSON, без комментариев и markdown блоков!
+
+КОНТЕКСТ КУРСА:
+- Курс: {course_title}
+- Аудитория: {target_audience}
+"""
+
+TEST_BATCH_GENERATION_PROMPT_TEMPLATE = TEST_BATCH_GENERATION_PROMPT_PREFIX + """- Модуль: {module_title}
+
+УРОКИ (для каждого нужен отдельный тест из {num_questions} вопросов):
+{lessons_block}
+
+ВАЖНО: в "tests" должны быть ВСЕ уроки из списка: {lesson_keys}"""
+
+TEST_BATCH_LESSON_TEMPLATE = """Урок {lesson_index}: {lesson_title}
+  Цель: {lesson_goal}
+  План контента:
+{content_outline}"""
 
 # ============================================================================
 # ПРОМПТ ДЛЯ ГЕНЕРАЦИИ ДЕТАЛЬНОГО УЧЕБНОГО МАТЕРИАЛА ПО ТЕМЕ
@@ -312,17 +462,8 @@ TOPIC_MATERIAL_SYSTEM_PROMPT = """Ты — эксперт по созданию
 Материалы должны быть понятными, структурированными и содержать много примеров.
 Отвечаешь строго в JSON формате."""
 
-TOPIC_MATERIAL_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебный материал для изучения конкретной темы из IT-курса.
-
-КОНТЕКСТ КУРСА:
-- Курс: {course_title}
-- Аудитория: {target_audience}
-- Модуль: {module_title}
-- Урок: {lesson_title}
-- Цель урока: {lesson_goal}
-
-ТЕМА ДЛЯ ДЕТАЛИЗАЦИИ:
-Тема №{topic_number}: {topic_title}
+TOPIC_MATERIAL_PROMPT_PREFIX = """Создай ДЕТАЛЬНЫЙ учебный материал для изучения конкретной темы из IT-курса.
+Курс — в разделе КОНТЕКСТ КУРСА, урок и тема — в разделе ТЕМА ДЛЯ ДЕТАЛИЗАЦИИ в конце сообщения.
 
 ЗАДАЧА:
 Создай полноценный учебный материал, который студент может изучать самостоятельно.
@@ -376,8 +517,8 @@ TOPIC_MATERIAL_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебны
 ФОРМАТ ОТВЕТА: строго JSON
 
 {{
-  "topic_title": "{topic_title}",
-  "topic_number": {topic_number},
+  "topic_title": "Название темы",
+  "topic_number": 1,
   "introduction": "Многострочное введение в тему (2-3 абзаца)...",
   "theory": "Подробное теоретическое объяснение (4-6 абзацев)...",
   "examples": [
@@ -425,8 +566,23 @@ TOPIC_MATERIAL_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНЫЙ учебны
 - Все тексты должны быть содержательными и развернутыми
 - Примеры должны быть конкретными и практичными
 - Код должен быть рабочим и с комментариями
-- Учитывай уровень аудитории: {target_audience}
-- Верни ТОЛЬКО JSON, без комментариев и markdown блоков!"""
+- Учитывай уровень аудитории из раздела КОНТЕКСТ КУРСА
+- topic_title и topic_number — из раздела ТЕМА ДЛЯ ДЕТАЛИЗАЦИИ
+- Верни ТОЛЬКО JSON, без комментариев и markdown блоков!
+
+КОНТЕКСТ КУРСА:
+- Курс: {course_title}
+- Аудитория: {target_audience}
+"""
+
+TOPIC_MATERIAL_PROMPT_TEMPLATE = TOPIC_MATERIAL_PROMPT_PREFIX + """
+ТЕМА ДЛЯ ДЕТАЛИЗАЦИИ:
+- Модуль: {module_title}
+- Урок: {lesson_title}
+- Цель урока: {lesson_goal}
+- Тема №{topic_number}: {topic_title}
+
+Верни ТОЛЬКО JSON!"""
 
 
 # ============================================================================
@@ -472,22 +628,11 @@ LESSON_DETAILED_SYSTEM_PROMPT = """Ты эксперт по созданию д
 Создаёшь полноценные учебные материалы со слайдами: с контекстом, развёрнутыми примерами и чёткой структурой.
 ВЫВОДИ ТОЛЬКО JSON!"""
 
-LESSON_DETAILED_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНУЮ лекцию со слайдами для одного урока IT-курса.
-
-КОНТЕКСТ:
-- Курс: {course_title}
-- Аудитория: {target_audience}
-- Модуль: {module_title}
-- Урок: {lesson_title}
-- Цель урока: {lesson_goal}
-- Формат: {lesson_format}
-- Время: {lesson_time} минут
-
-ПЛАН КОНТЕНТА УРОКА:
-{content_outline}
+LESSON_DETAILED_PROMPT_PREFIX = """Создай ДЕТАЛЬНУЮ лекцию со слайдами для одного урока IT-курса.
+Курс — в разделе КОНТЕКСТ КУРСА, урок и его план — в разделе УРОК в конце сообщения.
 
 ЗАДАЧА:
-Создай одну ЛЕКЦИЮ со СЛАЙДАМИ, покрывающими все пункты плана контента.
+Создай одну ЛЕКЦИЮ со СЛАЙДАМИ, покрывающими все пункты плана контента урока.
 Ориентируйся на 1 слайд каждые 4-6 минут урока.
 Для урока 60 минут сделай 10-14 слайдов.
 
@@ -506,10 +651,10 @@ LESSON_DETAILED_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНУЮ лекци
 - learning_objectives (3-4 цели) и key_takeaways (3-4 вывода) — конкретные формулировки.
 - Материал рассчитан на заявленную длительность урока — не сокращай объяснения.
 
-ФОРМАТ JSON:
+ФОРМАТ JSON (lecture_title — название урока, duration_minutes — время урока в минутах):
 {{
-  "lecture_title": "{lesson_title}",
-  "duration_minutes": {lesson_time},
+  "lecture_title": "Название урока",
+  "duration_minutes": 60,
   "learning_objectives": ["цель 1", "цель 2", "цель 3"],
   "key_takeaways": ["вывод 1", "вывод 2", "вывод 3"],
   "slides": [
@@ -524,4 +669,31 @@ LESSON_DETAILED_PROMPT_TEMPLATE = """Создай ДЕТАЛЬНУЮ лекци
   ]
 }}
 
+КОНТЕКСТ КУРСА:
+- Курс: {course_title}
+- Аудитория: {target_audience}
+"""
+
+# Поля урока идут после общего для всего курса префикса (кэширование промпта у провайдера)
+LESSON_DETAILED_PROMPT_TEMPLATE = LESSON_DETAILED_PROMPT_PREFIX + """
+УРОК:
+- Модуль: {module_title}
+- Урок: {lesson_title}
+- Цель урока: {lesson_goal}
+- Формат: {lesson_format}
+- Время: {lesson_time} минут
+
+ПЛАН КОНТЕНТА УРОКА:
+{content_outline}
+
 Верни ТОЛЬКО JSON!"""
+
+
+# ============================================================================
+# ПРОДОЛЖЕНИЕ ОТВЕТА, ОБРЕЗАННОГО ПО max_tokens
+# ============================================================================
+
+CONTINUATION_PROMPT = """Твой предыдущий ответ был обрезан из-за ограничения длины.
+Продолжи его РОВНО с того символа, на котором он оборвался: без повторения уже написанного,
+без пояснений и без обёртки в ```json. Если обрыв пришёлся на середину строки — допиши строку.
+Заверши JSON полностью."""
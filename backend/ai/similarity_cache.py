@@ -0,0 +1,236 @@
+"""
+Кэш похожих запросов (второй уровень после точного AI-кэша).
+
+Точный кэш (backend/ai/cache.py) промахивается при любой правке промпта:
+«Введение в Python» и «Введение в Python.» дают разные ключи. Здесь запросы
+сравниваются по нормализованному тексту полей урока:
+- текст нормализуется (регистр, ё→е, пунктуация, пробелы) и режется на
+  символьные шинглы длины AI_SIMILARITY_SHINGLE_SIZE;
+- по шинглам строится MinHash-сигнатура из AI_SIMILARITY_NUM_PERM хешей,
+  кандидаты ищутся через LSH (полосы по LSH_ROWS хешей), сходство — доля
+  совпавших хешей (оценка коэффициента Жаккара);
+- поля, которые должны совпадать точно (версия промпта, модель, курс,
+  число вопросов), входят в scope и в сравнении не участвуют.
+
+Всё считается локально, без внешних сервисов эмбеддингов. Хранилище — в памяти
+процесса, как и точный кэш (TTL — AI_CACHE_TTL_SECONDS, не более
+AI_SIMILARITY_MAX_ENTRIES записей).
+
+Пороги:
+- AI_SIMILARITY_ACCEPT_THRESHOLD — ответ похожего запроса отдаётся как готовый
+  (по умолчанию 1.0: только если нормализованные тексты совпали);
+- AI_SIMILARITY_DRAFT_THRESHOLD — ответ отдаётся как черновик, а свежая
+  генерация идёт в фоне (backend/services/draft_refresh_service.py).
+"""
+import copy
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from backend.config import settings
+from backend.ai.cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Хешей в одной полосе LSH: при 64 хешах — 16 полос; кандидат со сходством 0.8
+# попадает в общую полосу с вероятностью > 0.999
+LSH_ROWS = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё→е, пунктуация и повторные пробелы убираются"""
+    text = (text or "").lower().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def shingles(text: str, size: int) -> Set[str]:
+    """Символьные шинглы нормализованного текста (короткий текст — один шингл)"""
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+class MinHasher:
+    """MinHash-сигнатуры: num_perm универсальных хешей вида (a·x + b) mod p"""
+
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, items: Iterable[str]) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+            for item in items
+        ]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._params
+        )
+
+
+def estimate_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Оценка коэффициента Жаккара по MinHash-сигнатурам"""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class SimilarMatch(NamedTuple):
+    """Найденный похожий запрос: сохранённый ответ, сходство и признак «можно отдавать как готовый»"""
+    value: Any
+    similarity: float
+    text: str
+    final: bool
+
+
+class _Entry(NamedTuple):
+    scope: str
+    signature: Tuple[int, ...]
+    digest: str
+    text: str
+    value: Any
+    expires_at: float
+
+
+class SimilarityCache:
+    """Индекс MinHash/LSH по scope: добавление ответа и поиск самого похожего запроса"""
+
+    def __init__(
+        self,
+        num_perm: Optional[int] = None,
+        shingle_size: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ):
+        num_perm = num_perm or settings.AI_SIMILARITY_NUM_PERM
+        self.rows = min(LSH_ROWS, num_perm)
+        self.bands = num_perm // self.rows
+        self.hasher = MinHasher(self.bands * self.rows)
+        self.shingle_size = shingle_size or settings.AI_SIMILARITY_SHINGLE_SIZE
+        self.max_entries = max_entries or settings.AI_SIMILARITY_MAX_ENTRIES
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _prepare(self, text: str) -> Tuple[Tuple[int, ...], str]:
+        signature = self.hasher.signature(shingles(text, self.shingle_size))
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return signature, digest
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry.scope, entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def add(self, scope: str, text: str, value: Any, ttl_seconds: int) -> None:
+        signature, digest = self._prepare(text)
+        with self._lock:
+            # Тот же нормализованный запрос — заменяем старый ответ
+            for entry_id in self._candidates(scope, signature):
+                if self._entries[entry_id].digest == digest:
+                    self._remove(entry_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(
+                scope, signature, digest, text, copy.deepcopy(value), time.time() + ttl_seconds
+            )
+            for key in self._band_keys(scope, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _candidates(self, scope: str, signature: Tuple[int, ...]) -> Set[int]:
+        found: Set[int] = set()
+        for key in self._band_keys(scope, signature):
+            found |= self._buckets.get(key, set())
+        return found
+
+    def lookup(self, scope: str, text: str, threshold: float, accept_threshold: float) -> Optional[SimilarMatch]:
+        """Самый похожий живой запрос с тем же scope и сходством не ниже threshold"""
+        signature, digest = self._prepare(text)
+        now = time.time()
+        best: Optional[Tuple[float, _Entry]] = None
+        with self._lock:
+            for entry_id in self._candidates(scope, signature):
+                entry = self._entries[entry_id]
+                if entry.expires_at < now:
+                    self._remove(entry_id)
+                    continue
+                # 1.0 — только для совпавшего нормализованного текста, а не для совпавшей оценки
+                similarity = 1.0 if entry.digest == digest else min(estimate_similarity(signature, entry.signature), 0.99)
+                if similarity >= threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry)
+        if best is None:
+            return None
+        similarity, entry = best
+        return SimilarMatch(copy.deepcopy(entry.value), similarity, entry.text, similarity >= accept_threshold)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[SimilarityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_similarity_cache() -> SimilarityCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SimilarityCache()
+        return _cache
+
+
+def similarity_scope(kind: str, *parts: Any) -> str:
+    """Ключ точного совпадения: тип запроса, версия промпта и поля, которые не сравниваются по сходству"""
+    return make_cache_key(kind, settings.PROMPT_VERSION, *(str(part) for part in parts))
+
+
+def similarity_text(*parts: Any) -> str:
+    """Текст для сравнения: поля запроса, по которым допустимо «почти совпадение»"""
+    return "\n".join(
+        "\n".join(str(item) for item in part) if isinstance(part, (list, tuple)) else str(part)
+        for part in parts
+    )
+
+
+def find_similar(kind: str, scope: str, text: str) -> Optional[SimilarMatch]:
+    """Похожий запрос из кэша (None — уровень выключен или ничего похожего)"""
+    if not settings.AI_SIMILARITY_CACHE_ENABLED:
+        return None
+    match = get_similarity_cache().lookup(
+        scope, text, settings.AI_SIMILARITY_DRAFT_THRESHOLD, settings.AI_SIMILARITY_ACCEPT_THRESHOLD
+    )
+    if match is not None:
+        logger.info(
+            f"similar cache hit: {kind} (сходство {match.similarity:.2f}, "
+            f"{'готовый ответ' if match.final else 'черновик'})"
+        )
+    return match
+
+
+def remember_similar(scope: str, text: str, value: Any) -> None:
+    if settings.AI_SIMILARITY_CACHE_ENABLED:
+        get_similarity_cache().add(scope, text, value, settings.AI_CACHE_TTL_SECONDS)
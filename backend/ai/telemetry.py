@@ -0,0 +1,165 @@
+"""
+Телеметрия вызовов AI: задача, модель, версия промпта, курс, задержка, токены,
+попадание в кэш, ретраи и исход каждого вызова.
+
+Запись не лежит на пути запроса: record_* только кладут запись в буфер в памяти
+(не больше AI_TELEMETRY_BUFFER_SIZE, при переполнении теряются самые старые),
+а фоновый воркер (backend/services/ai_telemetry_service.py) пачками пишет их
+в таблицу ai_calls.
+
+Метки вызова берутся из контекста (contextvars):
+- маршрут и course_id — из запроса HTTP (middleware в backend/main.py);
+- задача — из ai_task("lesson_test") вокруг вызова модели в сервисе.
+Пулы потоков контекст сами не переносят — задачи для них оборачиваются
+в bind_context (роутер моделей, параллельная генерация модулей).
+"""
+import contextvars
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+UNKNOWN_TASK = "unknown"
+
+# Исходы вызова
+OUTCOME_OK = "ok"
+OUTCOME_TRUNCATED = "truncated"  # ответ обрезан по max_tokens
+OUTCOME_ERROR = "error"
+OUTCOME_DRAFT = "draft"  # отдан черновик из кэша похожих запросов
+
+_task: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ai_task", default=None)
+_request_scope: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "ai_request_scope", default=None
+)
+
+_buffer: Deque[Dict[str, Any]] = deque(maxlen=settings.AI_TELEMETRY_BUFFER_SIZE)
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+@contextmanager
+def ai_task(task: str) -> Iterator[None]:
+    """Помечает вызовы AI внутри блока задачей task (lesson_detailed, lesson_test, ...)"""
+    token = _task.set(task)
+    try:
+        yield
+    finally:
+        _task.reset(token)
+
+
+@contextmanager
+def request_context(scope: Dict[str, Any]) -> Iterator[None]:
+    """Связывает вызовы AI с запросом HTTP: маршрут и course_id читаются из scope при записи"""
+    token = _request_scope.set(scope)
+    try:
+        yield
+    finally:
+        _request_scope.reset(token)
+
+
+def bind_context(func: Callable[..., T]) -> Callable[..., T]:
+    """Функция для пула потоков с метками текущего контекста (своя копия на каждый вызов bind_context)"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def _request_labels() -> Dict[str, Any]:
+    scope = _request_scope.get()
+    if scope is None:
+        return {"route": None, "course_id": None}
+    # После маршрутизации Starlette кладёт в scope сам маршрут (шаблон пути) и параметры пути
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path")
+    course_id = (scope.get("path_params") or {}).get("course_id")
+    try:
+        course_id = int(course_id) if course_id is not None else None
+    except (TypeError, ValueError):
+        course_id = None
+    return {"route": f"{scope.get('method', '')} {path}".strip(), "course_id": course_id}
+
+
+def _record(**fields: Any) -> None:
+    global _dropped
+    if not settings.AI_TELEMETRY_ENABLED:
+        return
+    record = {
+        "created_at": datetime.utcnow(),
+        "task": fields.pop("task", None) or _task.get() or UNKNOWN_TASK,
+        "prompt_version": settings.PROMPT_VERSION,
+        **_request_labels(),
+        **fields,
+    }
+    if len(_buffer) == _buffer.maxlen:
+        with _dropped_lock:
+            _dropped += 1
+    _buffer.append(record)
+
+
+def record_ai_call(
+    model: str,
+    latency_ms: int,
+    outcome: str,
+    retries: int = 0,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    cached_tokens: Optional[int] = None,
+    total_tokens: Optional[int] = None,
+) -> None:
+    """Один запрос к API модели (с ретраями внутри) — вызывается из OpenAIClient"""
+    if total_tokens is None and (prompt_tokens is not None or completion_tokens is not None):
+        total_tokens = (prompt_tokens or 0) + (completion_tokens or 0)
+    _record(
+        model=model,
+        latency_ms=latency_ms,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cached_tokens=cached_tokens,
+        total_tokens=total_tokens,
+        cache_hit=False,
+        retries=retries,
+        outcome=outcome,
+    )
+
+
+def record_cache_hit(task: str, model: Optional[str] = None, outcome: str = OUTCOME_OK) -> None:
+    """Ответ отдан из кэша (точного или похожих запросов) без вызова модели"""
+    _record(
+        task=task,
+        model=model,
+        latency_ms=0,
+        prompt_tokens=None,
+        completion_tokens=None,
+        cached_tokens=None,
+        total_tokens=None,
+        cache_hit=True,
+        retries=0,
+        outcome=outcome,
+    )
+
+
+def drain(limit: int) -> List[Dict[str, Any]]:
+    """Забирает из буфера до limit записей (для фонового воркера)"""
+    records = []
+    while len(records) < limit:
+        try:
+            records.append(_buffer.popleft())
+        except IndexError:
+            break
+    return records
+
+
+def buffered() -> int:
+    return len(_buffer)
+
+
+def dropped() -> int:
+    """Сколько записей потеряно из-за переполнения буфера с момента старта процесса"""
+    return _dropped
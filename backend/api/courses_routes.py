@@ -7,9 +7,9 @@
 - `pydantic` модели из `backend.models.domain` — строгая валидация входных/выходных данных.
 - `logging` — логирование действий и ошибок для диагностики.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query
 from fastapi.concurrency import run_in_threadpool
-from typing import List
+from typing import List, Optional
 import logging
 import json
 
@@ -18,6 +18,8 @@ from backend.models.domain import (
 )
 from backend.ai.openai_client import OpenAIClient
 from backend.database import db
+from backend.database.concurrency import CourseVersionConflict, make_course_etag, parse_course_etag
+from backend.database.course_summary import encode_cursor
 from backend.services.export_service import export_service
 from backend.services.export.scorm import SCORM_VERSION_12, SCORM_VERSION_2004
 from backend.utils.formatters import safe_filename, format_content_disposition
@@ -67,13 +69,13 @@ async def create_course(request: CourseCreateRequest):
             course_data["course_goals"] = request.course_goals
 
         course = Course(**course_data)
-        course_id = db.save_course(course.dict())
+        course_dict = course.dict()
+        course_id = db.save_course(course_dict)
         
         logger.info(f"✅ Курс создан с ID: {course_id}")
         
-        # Добавляем course_id в данные курса
-        course_dict = course.dict()
-        course_dict["course_id"] = course_id
+        # Добавляем course_id в данные курса (save_course словарь не меняет — дамп не повторяем)
+        course_dict = {**course_dict, "course_id": course_id}
         
         return {
             "id": course_id,
@@ -92,19 +94,35 @@ async def create_course(request: CourseCreateRequest):
 
 
 @router.get("/", response_model=List[dict])
-async def get_courses(limit: int = 50, offset: int = 0):
-    """Получить список всех курсов"""
+async def get_courses(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=200),
+):
+    """
+    Получить список курсов со сводкой (модули, уроки, контент, тесты, готовые видео)
+
+    Пагинация по курсору: если есть следующая страница, её курсор возвращается
+    в заголовке `X-Next-Cursor` — передайте его параметром `cursor`.
+    `q` — полнотекстовый поиск по названиям курса, модулей и уроков (по началу слов).
+    """
     try:
-        courses = db.get_all_courses(limit=limit, offset=offset)
+        courses = db.get_all_courses(limit=limit, cursor=cursor, search=q)
+        if len(courses) == limit:
+            last = courses[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
         return courses
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка получения списка курсов: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{course_id}", response_model=CourseResponse)
-async def get_course(course_id: int):
-    """Получить курс по ID"""
+async def get_course(course_id: int, response: Response):
+    """Получить курс по ID (ETag — версия курса для If-Match при сохранении)"""
     try:
         course_data = db.get_course(course_id)
         
@@ -114,6 +132,7 @@ async def get_course(course_id: int):
         saved_id = course_data.pop('id', None)
         course_data.pop('created_at', None)
         course_data.pop('updated_at', None)
+        response.headers["ETag"] = make_course_etag(course_data.pop('version'))
         
         course = Course(**course_data)
         
@@ -132,19 +151,31 @@ async def get_course(course_id: int):
 
 
 @router.put("/{course_id}", response_model=CourseResponse)
-async def update_course(course_id: int, course: Course):
-    """Обновить курс"""
+async def update_course(
+    course_id: int,
+    course: Course,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+):
+    """
+    Обновить курс
+
+    С заголовком `If-Match` (ETag из GET) запись выполняется только если курс не менялся
+    с момента чтения, иначе — 409. Без заголовка курс перезаписывается безусловно.
+    """
     try:
-        existing = db.get_course(course_id)
-        if not existing:
-            raise HTTPException(status_code=404, detail="Курс не найден")
+        try:
+            expected_version = parse_course_etag(if_match)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        success = db.update_course(course_id, course.dict())
+        new_version = db.update_course(course_id, course.dict(), expected_version=expected_version)
         
-        if not success:
-            raise HTTPException(status_code=500, detail="Не удалось обновить курс")
+        if new_version is None:
+            raise HTTPException(status_code=404, detail="Курс не найден")
         
-        logger.info(f"✅ Курс {course_id} обновлен")
+        response.headers["ETag"] = make_course_etag(new_version)
+        logger.info(f"✅ Курс {course_id} обновлен (версия {new_version})")
         
         return CourseResponse(
             id=course_id,
@@ -155,6 +186,12 @@ async def update_course(course_id: int, course: Course):
         
     except HTTPException:
         raise
+    except CourseVersionConflict as e:
+        logger.warning(f"⚠️ {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="Курс был изменён после загрузки. Обновите страницу и повторите изменения",
+        )
     except Exception as e:
         logger.error(f"Ошибка обновления курса {course_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -14,9 +14,13 @@ from typing import Optional
 import logging
 import json
 
-from backend.models.domain import Course, LessonTest, LessonContentUpdate
+from backend.models.domain import LessonTest, LessonContentUpdate
+from backend.models.validation import COURSE_ADAPTER, course_lesson
 from backend.ai.content_generator import ContentGenerator
 from backend.database import db
+from backend.database.concurrency import CourseVersionConflict
+from backend.services.course_update_service import CourseNotFound, update_course_with_retry
+from backend.services.draft_refresh_service import draft_refresh_service
 from backend.services.generation_service import generation_service
 from backend.services.test_generator_service import TestGeneratorService
 from backend.services.export_service import export_service
@@ -46,43 +50,32 @@ class DuplicateLessonRequest(BaseModel):
 async def duplicate_lesson(course_id: int, module_number: int, lesson_index: int, body: DuplicateLessonRequest):
     """Создать полную копию урока (включая детальный контент) с новым индексом."""
     try:
-        course_data = db.get_course(course_id)
-        if not course_data:
-            raise HTTPException(status_code=404, detail="Курс не найден")
-
-        # Работаем с сырыми данными
-        raw_course = dict(course_data)
-        raw_course.pop('id', None)
-        raw_course.pop('created_at', None)
-        raw_course.pop('updated_at', None)
-
-        modules = raw_course.get('modules') or []
-        source_module = next((m for m in modules if int(m.get('module_number', -1)) == int(module_number)), None)
-        if not source_module:
-            raise HTTPException(status_code=404, detail="Модуль не найден")
-        lessons = source_module.get('lessons') or []
-        if lesson_index < 0 or lesson_index >= len(lessons):
-            raise HTTPException(status_code=404, detail="Урок не найден")
-
-        import copy
-        new_lesson = copy.deepcopy(lessons[lesson_index])
-        new_lesson['lesson_title'] = body.lesson_title
-        new_lesson['lesson_goal'] = body.lesson_goal
-        if body.content_outline is not None:
-            new_lesson['content_outline'] = body.content_outline
-        if body.assessment is not None:
-            new_lesson['assessment'] = body.assessment
-
-        lessons.append(new_lesson)
-        source_module['lessons'] = lessons
-        raw_course['modules'] = modules
-
-        saved = db.update_course(course_id, raw_course)
-        if not saved:
-            raise HTTPException(status_code=500, detail="Не удалось сохранить копию урока")
-
-        # Новый индекс — в конце списка
-        new_index = len(lessons) - 1
+        # Работаем с сырыми данными; при параллельной правке курса копия применяется к свежей версии
+        def add_copy(raw_course):
+            modules = raw_course.get('modules') or []
+            source_module = next((m for m in modules if int(m.get('module_number', -1)) == int(module_number)), None)
+            if not source_module:
+                raise HTTPException(status_code=404, detail="Модуль не найден")
+            lessons = source_module.get('lessons') or []
+            if lesson_index < 0 or lesson_index >= len(lessons):
+                raise HTTPException(status_code=404, detail="Урок не найден")
+
+            import copy
+            new_lesson = copy.deepcopy(lessons[lesson_index])
+            new_lesson['lesson_title'] = body.lesson_title
+            new_lesson['lesson_goal'] = body.lesson_goal
+            if body.content_outline is not None:
+                new_lesson['content_outline'] = body.content_outline
+            if body.assessment is not None:
+                new_lesson['assessment'] = body.assessment
+
+            lessons.append(new_lesson)
+            source_module['lessons'] = lessons
+            raw_course['modules'] = modules
+            # Новый индекс — в конце списка
+            return len(lessons) - 1, new_lesson
+
+        (new_index, new_lesson), _ = update_course_with_retry(course_id, add_copy)
 
         # Копируем детальный контент урока, если есть
         try:
@@ -101,6 +94,10 @@ async def duplicate_lesson(course_id: int, module_number: int, lesson_index: int
         return {"status": "duplicated", "new_lesson_index": new_index}
     except HTTPException:
         raise
+    except CourseNotFound:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+    except CourseVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка дублирования урока: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -108,46 +105,87 @@ async def duplicate_lesson(course_id: int, module_number: int, lesson_index: int
 
 @router.delete("/{course_id}/modules/{module_number}/lessons/{lesson_index}", response_model=dict)
 async def delete_lesson(course_id: int, module_number: int, lesson_index: int):
-    """Удалить урок из модуля и его детальный контент."""
+    """Удалить урок из модуля и его детальный контент.
+
+    Удаление атомарно на стороне БД: контент последующих уроков сдвигается вместе с ними.
+    """
     try:
-        course_data = db.get_course(course_id)
-        if not course_data:
-            raise HTTPException(status_code=404, detail="Курс не найден")
+        new_version = db.delete_lesson(course_id, module_number, lesson_index)
+        if new_version is None:
+            raise HTTPException(status_code=404, detail="Курс, модуль или урок не найден")
+
+        return {"status": "deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка удаления урока: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        raw_course = dict(course_data)
-        raw_course.pop('id', None)
-        raw_course.pop('created_at', None)
-        raw_course.pop('updated_at', None)
 
+def _set_lesson_fields(module_number: int, lesson_index: int, **fields):
+    """Правка для update_course_with_retry: меняет поля урока в JSON курса"""
+    def mutate(raw_course):
         modules = raw_course.get('modules') or []
-        source_module = next((m for m in modules if int(m.get('module_number', -1)) == int(module_number)), None)
-        if not source_module:
-            raise HTTPException(status_code=404, detail="Модуль не найден")
-        lessons = source_module.get('lessons') or []
+        module = next((m for m in modules if int(m.get('module_number', -1)) == int(module_number)), None)
+        lessons = (module or {}).get('lessons') or []
         if lesson_index < 0 or lesson_index >= len(lessons):
-            raise HTTPException(status_code=404, detail="Урок не найден")
+            raise HTTPException(status_code=404, detail="Модуль или урок не найден")
+        lessons[lesson_index].update(fields)
+    return mutate
 
-        # Удаляем урок
-        del lessons[lesson_index]
-        source_module['lessons'] = lessons
-        raw_course['modules'] = modules
 
-        saved = db.update_course(course_id, raw_course)
-        if not saved:
-            raise HTTPException(status_code=500, detail="Не удалось обновить курс")
+def _draft_info(draft, refreshing: bool) -> dict:
+    """Поле ответа о черновике из кэша похожих запросов"""
+    return {"similarity": round(draft.similarity, 3), "refreshing": refreshing}
 
-        # Удаляем детальный контент урока
-        try:
-            _ = db.delete_lesson_content(course_id, module_number, lesson_index)
-        except Exception as e:
-            logger.warning(f"Не удалось удалить контент урока: {e}")
 
-        return {"status": "deleted"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка удаления урока: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def _replace_outline_draft(course_id: int, module_number: int, lesson_index: int, draft_outline, fresh_outline) -> bool:
+    """Заменяет черновик плана урока свежим, если план с тех пор не меняли"""
+    def mutate(raw_course):
+        modules = raw_course.get('modules') or []
+        module = next((m for m in modules if int(m.get('module_number', -1)) == int(module_number)), None)
+        lessons = (module or {}).get('lessons') or []
+        if lesson_index >= len(lessons) or lessons[lesson_index].get('content_outline') != draft_outline:
+            return False
+        lessons[lesson_index]['content_outline'] = fresh_outline
+        return True
+    replaced, _ = update_course_with_retry(course_id, mutate)
+    return replaced
+
+
+def _replace_lesson_content_draft(
+    course_id: int, module_number: int, lesson_index: int, lesson_title: str, draft_content: dict, fresh_content: dict
+) -> bool:
+    """Заменяет черновик контента урока свежим, если контент с тех пор не меняли"""
+    current = db.get_lesson_content(course_id, module_number, lesson_index) or {}
+    current.pop('video_info', None)
+    if current != draft_content:
+        return False
+    db.save_lesson_content(
+        course_id=course_id,
+        module_number=module_number,
+        lesson_index=lesson_index,
+        lesson_title=lesson_title,
+        content_data=fresh_content
+    )
+    return True
+
+
+def _replace_test_draft(
+    course_id: int, module_number: int, lesson_index: int, lesson_title: str, draft_test: dict, fresh_test
+) -> bool:
+    """Заменяет черновик теста свежим, если тест с тех пор не меняли"""
+    current = db.get_lesson_test(course_id, module_number, lesson_index) or {}
+    if current.get('questions') != draft_test.get('questions'):
+        return False
+    db.save_lesson_test(
+        course_id=course_id,
+        module_number=module_number,
+        lesson_index=lesson_index,
+        lesson_title=lesson_title,
+        test_data=fresh_test.dict()
+    )
+    return True
 
 
 class RegenerateLessonContentRequest(BaseModel):
@@ -175,46 +213,61 @@ async def regenerate_lesson_content(
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
-        if not module or lesson_index >= len(module.lessons):
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module, lesson = course_lesson(course_data, module_number, lesson_index)
+        if lesson is None:
             raise HTTPException(status_code=404, detail="Модуль или урок не найден")
         
-        lesson = module.lessons[lesson_index]
-        
         # Используем значения из запроса, если они переданы, иначе берем из базы данных
         lesson_title = body.lesson_title if body and body.lesson_title else lesson.lesson_title
         lesson_goal = body.lesson_goal if body and body.lesson_goal else lesson.lesson_goal
         
         # Если переданы новые значения, сначала обновляем урок в базе данных
         if body and (body.lesson_title or body.lesson_goal):
-            lesson.lesson_title = lesson_title
-            lesson.lesson_goal = lesson_goal
-            db.update_course(course_id, course.dict())
+            update_course_with_retry(
+                course_id,
+                _set_lesson_fields(module_number, lesson_index, lesson_title=lesson_title, lesson_goal=lesson_goal),
+            )
         
-        new_content_outline = generation_service.regenerate_lesson_content_outline(
-            course_title=course.course_title,
+        outline_request = dict(
+            course_title=course_data["course_title"],
             module_title=module.module_title,
             lesson_title=lesson_title,
             lesson_goal=lesson_goal,
             lesson_format=lesson.format,
             estimated_time_minutes=lesson.estimated_time_minutes
         )
+
+        # Похожий запрос уже был — сразу отдаём его план как черновик, свежий план генерируется в фоне
+        draft = generation_service.content_outline_draft(**outline_request)
+        if draft is not None:
+            update_course_with_retry(
+                course_id, _set_lesson_fields(module_number, lesson_index, content_outline=draft.value)
+            )
+            refreshing = draft_refresh_service.schedule(
+                f"outline:{course_id}:{module_number}:{lesson_index}",
+                lambda: generation_service.regenerate_lesson_content_outline(**outline_request),
+                lambda fresh: _replace_outline_draft(course_id, module_number, lesson_index, draft.value, fresh),
+            )
+            return {
+                "status": "regenerated",
+                "module_number": module_number,
+                "lesson_index": lesson_index,
+                "new_content_outline": draft.value,
+                "draft": _draft_info(draft, refreshing),
+            }
+
+        new_content_outline = await run_in_threadpool(
+            generation_service.regenerate_lesson_content_outline, **outline_request
+        )
         
         if not new_content_outline:
             raise HTTPException(status_code=500, detail="Не удалось регенерировать план контента")
         
-        lesson.content_outline = new_content_outline
-        db.update_course(course_id, course.dict())
+        # Вливаем результат в актуальную версию курса (пока шла генерация, курс могли изменить)
+        update_course_with_retry(
+            course_id, _set_lesson_fields(module_number, lesson_index, content_outline=new_content_outline)
+        )
         
         logger.info(f"✅ План контента урока {lesson_index} модуля {module_number} регенерирован")
         
@@ -227,6 +280,10 @@ async def regenerate_lesson_content(
         
     except HTTPException:
         raise
+    except CourseNotFound:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+    except CourseVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка регенерации плана контента урока: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -240,31 +297,52 @@ async def generate_lesson_content(course_id: int, module_number: int, lesson_ind
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
-        if not module or lesson_index >= len(module.lessons):
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module, lesson = course_lesson(course_data, module_number, lesson_index)
+        if lesson is None:
             raise HTTPException(status_code=404, detail="Модуль или урок не найден")
         
-        lesson = module.lessons[lesson_index]
-        
         logger.info(f"Генерация контента для урока {lesson_index} модуля {module_number} курса {course_id}")
-        
-        lesson_content = await run_in_threadpool(
-            content_generator.generate_lesson_detailed_content,
-            lesson=lesson,
-            module=module,
-            course_title=course.course_title,
-            target_audience=course.target_audience,
+
+        def generate():
+            return content_generator.generate_lesson_detailed_content(
+                lesson=lesson,
+                module=module,
+                course_title=course_data["course_title"],
+                target_audience=course_data["target_audience"],
+            )
+
+        # Похожий урок уже генерировался — сохраняем его контент как черновик, свежий генерируется в фоне
+        draft = await run_in_threadpool(
+            content_generator.lesson_detailed_draft,
+            lesson,
+            module,
+            course_data["course_title"],
+            course_data["target_audience"],
         )
+        if draft is not None:
+            db.save_lesson_content(
+                course_id=course_id,
+                module_number=module_number,
+                lesson_index=lesson_index,
+                lesson_title=lesson.lesson_title,
+                content_data=draft.value
+            )
+            refreshing = draft_refresh_service.schedule(
+                f"lesson:{course_id}:{module_number}:{lesson_index}",
+                generate,
+                lambda fresh: _replace_lesson_content_draft(
+                    course_id, module_number, lesson_index, lesson.lesson_title, draft.value, fresh
+                ),
+            )
+            return {
+                "status": "generated",
+                "message": f"Черновик контента урока '{lesson.lesson_title}' из похожего урока, свежая версия генерируется",
+                "lesson_content": draft.value,
+                "draft": _draft_info(draft, refreshing),
+            }
+
+        lesson_content = await run_in_threadpool(generate)
         
         if not lesson_content:
             raise HTTPException(
@@ -377,22 +455,11 @@ async def export_lesson_content(course_id: int, module_number: int, lesson_index
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
-        if not module or lesson_index >= len(module.lessons):
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module, lesson = course_lesson(course_data, module_number, lesson_index)
+        if lesson is None:
             raise HTTPException(status_code=404, detail="Модуль или урок не найден")
         
-        lesson = module.lessons[lesson_index]
-        
         content_data = db.get_lesson_content(course_id, module_number, lesson_index)
         if not content_data:
             raise HTTPException(
@@ -400,10 +467,17 @@ async def export_lesson_content(course_id: int, module_number: int, lesson_index
                 detail="Детальный контент урока не найден. Сначала сгенерируйте его."
             )
         
+        # Экспортёрам markdown/html/pptx нужен весь курс — собираем его один раз, JSON обходится словарём
+        course = None
+        if format != "json":
+            course = COURSE_ADAPTER.validate_python(
+                {k: v for k, v in course_data.items() if k not in ("id", "created_at", "updated_at")}
+            )
+
         # Генерируем экспорт
         if format == "json":
             content = json.dumps({
-                "course_title": course.course_title,
+                "course_title": course_data["course_title"],
                 "module_title": module.module_title,
                 "lesson_title": lesson.lesson_title,
                 "lesson_content": content_data
@@ -482,38 +556,56 @@ async def generate_lesson_test(
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
-        if not module or lesson_index >= len(module.lessons):
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module, lesson = course_lesson(course_data, module_number, lesson_index)
+        if lesson is None:
             raise HTTPException(status_code=404, detail="Модуль или урок не найден")
         
-        lesson = module.lessons[lesson_index]
-        
         logger.info(f"Генерация теста для урока {lesson_index} модуля {module_number} курса {course_id}")
         
-        # Генерируем тест
-        test = await run_in_threadpool(
-            test_generator.generate_test,
+        test_request = dict(
             lesson_title=lesson.lesson_title,
             lesson_goal=lesson.lesson_goal,
             content_outline=lesson.content_outline,
-            course_title=course.course_title,
-            target_audience=course.target_audience,
+            course_title=course_data["course_title"],
+            target_audience=course_data["target_audience"],
             module_title=module.module_title,
             num_questions=body.num_questions,
             model=body.model,
-            temperature=body.temperature,
-            max_tokens=body.max_tokens,
         )
+
+        def generate():
+            return test_generator.generate_test(
+                **test_request, temperature=body.temperature, max_tokens=body.max_tokens
+            )
+
+        # Похожий урок уже получал тест — сохраняем его как черновик, свежий тест генерируется в фоне
+        draft = await run_in_threadpool(test_generator.test_draft, **test_request)
+        if draft is not None:
+            draft_data = draft.value.dict()
+            db.save_lesson_test(
+                course_id=course_id,
+                module_number=module_number,
+                lesson_index=lesson_index,
+                lesson_title=lesson.lesson_title,
+                test_data=draft_data
+            )
+            refreshing = draft_refresh_service.schedule(
+                f"test:{course_id}:{module_number}:{lesson_index}",
+                generate,
+                lambda fresh: _replace_test_draft(
+                    course_id, module_number, lesson_index, lesson.lesson_title, draft_data, fresh
+                ),
+            )
+            return {
+                "status": "generated",
+                "message": f"Черновик теста для урока '{lesson.lesson_title}' из похожего урока, свежий тест генерируется",
+                "test": draft_data,
+                "draft": _draft_info(draft, refreshing),
+            }
+
+        # Генерируем тест
+        test = await run_in_threadpool(generate)
         
         if not test:
             raise HTTPException(
@@ -521,13 +613,14 @@ async def generate_lesson_test(
                 detail="Не удалось сгенерировать тест"
             )
         
-        # Сохраняем тест в БД
+        # Сохраняем тест в БД (словарь строим один раз — и для БД, и для ответа)
+        test_data = test.dict()
         db.save_lesson_test(
             course_id=course_id,
             module_number=module_number,
             lesson_index=lesson_index,
             lesson_title=lesson.lesson_title,
-            test_data=test.dict()
+            test_data=test_data
         )
         
         logger.info(f"✅ Тест для урока {lesson_index} модуля {module_number} сгенерирован")
@@ -535,7 +628,7 @@ async def generate_lesson_test(
         return {
             "status": "generated",
             "message": f"Тест для урока '{lesson.lesson_title}' сгенерирован",
-            "test": test.dict()
+            "test": test_data
         }
         
     except HTTPException:
@@ -584,27 +677,13 @@ async def update_lesson_test(
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
-        if not module or lesson_index >= len(module.lessons):
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module, lesson = course_lesson(course_data, module_number, lesson_index)
+        if lesson is None:
             raise HTTPException(status_code=404, detail="Модуль или урок не найден")
         
-        lesson = module.lessons[lesson_index]
-        
-        # Валидация теста через Pydantic
-        try:
-            test = LessonTest(**body.test.dict())
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Невалидные данные теста: {e}")
+        # Тест уже провалидирован FastAPI при разборе тела запроса (UpdateTestRequest.test)
+        test_data = body.test.dict()
         
         # Сохраняем обновленный тест
         db.save_lesson_test(
@@ -612,7 +691,7 @@ async def update_lesson_test(
             module_number=module_number,
             lesson_index=lesson_index,
             lesson_title=lesson.lesson_title,
-            test_data=test.dict()
+            test_data=test_data
         )
         
         logger.info(f"✅ Тест для урока {lesson_index} модуля {module_number} обновлен")
@@ -620,7 +699,7 @@ async def update_lesson_test(
         return {
             "status": "updated",
             "message": f"Тест для урока '{lesson.lesson_title}' обновлен",
-            "test": test.dict()
+            "test": test_data
         }
         
     except HTTPException:
@@ -0,0 +1,34 @@
+"""
+Маршруты FastAPI для метрик: сводка телеметрии вызовов AI.
+
+Используемые библиотеки и концепции:
+- `fastapi` — `APIRouter` для группировки endpoint-ов; `Query` для валидации параметров.
+- `run_in_threadpool` — чтение и агрегация записей из БД не блокируют event loop.
+"""
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+import logging
+
+from backend.services.ai_telemetry_service import GROUP_FIELDS, ai_telemetry_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/ai", response_model=dict)
+async def get_ai_metrics(
+    hours: float = Query(24, gt=0, le=24 * 90, description="За сколько последних часов"),
+    group_by: str = Query("task", description=f"Группировка: {', '.join(GROUP_FIELDS)}"),
+):
+    """Сводка вызовов AI: итоги и группы (вызовы, кэш, ошибки, ретраи, токены, p50/p90/p95/p99 задержки)"""
+    if group_by not in GROUP_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестная группировка '{group_by}'. Допустимо: {', '.join(GROUP_FIELDS)}",
+        )
+    try:
+        return await run_in_threadpool(ai_telemetry_service.summary, hours, group_by)
+    except Exception as e:
+        logger.error(f"Ошибка сводки телеметрии AI: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -15,8 +15,11 @@ import logging
 import json
 
 from backend.models.domain import Course, Module
+from backend.models.validation import course_module
 from backend.ai.content_generator import ContentGenerator
 from backend.database import db
+from backend.database.concurrency import CourseVersionConflict
+from backend.services.course_update_service import CourseNotFound, update_course_with_retry
 from backend.services.generation_service import generation_service
 from backend.services.test_generator_service import TestGeneratorService
 from backend.services.export_service import export_service
@@ -46,6 +49,10 @@ class GenerateModuleTestsRequest(BaseModel):
     model: Optional[str] = Field(default=None, description="Модель AI")
     temperature: Optional[float] = Field(default=None, ge=0.0, le=2.0, description="Температура")
     max_tokens: Optional[int] = Field(default=None, ge=100, description="Макс. токенов")
+    batch_size: Optional[int] = Field(
+        default=None, ge=1, le=10,
+        description="Уроков в одном запросе к AI (по умолчанию TEST_BATCH_SIZE; 1 — по одному уроку)",
+    )
 
 
 def build_module_content_from_lessons(
@@ -95,68 +102,38 @@ def build_module_content_from_lessons(
 async def duplicate_module(course_id: int, module_number: int, body: DuplicateModuleRequest):
     """Создать полную копию модуля (включая детальный контент) с новым номером."""
     try:
-        course_data = db.get_course(course_id)
-        if not course_data:
-            raise HTTPException(status_code=404, detail="Курс не найден")
-
-        # Восстанавливаем модель курса
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-
-        # Ищем исходный модуль
-        source_module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                source_module = m
-                break
-        if not source_module:
-            raise HTTPException(status_code=404, detail="Модуль не найден")
+        # Правка применяется к актуальной версии курса (повторяется при параллельном изменении)
+        def add_copy(raw_course):
+            # Валидируем только исходный модуль, остальные модули курса уже проверены при записи
+            source_module = course_module(raw_course, module_number)
+            if not source_module:
+                raise HTTPException(status_code=404, detail="Модуль не найден")
+
+            # Новый номер модуля = max + 1
+            modules = raw_course.setdefault('modules', [])
+            new_number = max((m.get('module_number', 0) for m in modules), default=0) + 1
+
+            # Копия модуля (validate_python уже создал независимые объекты)
+            new_module = source_module.model_copy(update={
+                "module_number": new_number,
+                "module_title": body.module_title,
+                "module_goal": body.module_goal,
+            })
+
+            # Добавляем модуль в курс
+            modules.append(new_module.model_dump(mode="json"))
+            return new_number, new_module
+
+        # Структура курса и детальный контент модуля и уроков (INSERT ... SELECT) пишутся
+        # одной транзакцией: при ошибке копирования модуль-копия не появляется
+        def write_with_contents(raw_course, expected_version, result):
+            new_number, new_module = result
+            return db.duplicate_module(
+                course_id, raw_course, expected_version,
+                module_number, new_number, module_title=new_module.module_title,
+            )
 
-        # Новый номер модуля = max + 1
-        new_number = max((m.module_number for m in course.modules), default=0) + 1
-
-        # Глубокая копия структуры модуля
-        import copy
-        new_module = copy.deepcopy(source_module)
-        new_module.module_number = new_number
-        new_module.module_title = body.module_title
-        new_module.module_goal = body.module_goal
-
-        # Добавляем модуль в курс и сохраняем курс
-        course.modules.append(new_module)
-        saved = db.update_course(course_id, course.dict())
-        if not saved:
-            raise HTTPException(status_code=500, detail="Не удалось сохранить копию модуля в курсе")
-
-        # Копируем детальный контент модуля, если есть
-        try:
-            src_module_content = db.get_module_content(course_id, module_number)
-            if src_module_content:
-                db.save_module_content(
-                    course_id=course_id,
-                    module_number=new_number,
-                    module_title=new_module.module_title,
-                    content_data=src_module_content
-                )
-        except Exception as e:
-            logger.warning(f"Не удалось скопировать детальный контент модуля: {e}")
-
-        # Копируем детальный контент уроков
-        try:
-            for idx, lesson in enumerate(new_module.lessons):
-                src_lesson_content = db.get_lesson_content(course_id, module_number, idx)
-                if src_lesson_content:
-                    db.save_lesson_content(
-                        course_id=course_id,
-                        module_number=new_number,
-                        lesson_index=idx,
-                        lesson_title=lesson.lesson_title,
-                        content_data=src_lesson_content
-                    )
-        except Exception as e:
-            logger.warning(f"Не удалось скопировать контент уроков: {e}")
+        (new_number, new_module), _ = update_course_with_retry(course_id, add_copy, write=write_with_contents)
 
         return {
             "status": "duplicated",
@@ -165,6 +142,10 @@ async def duplicate_module(course_id: int, module_number: int, body: DuplicateMo
         }
     except HTTPException:
         raise
+    except CourseNotFound:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+    except CourseVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка дублирования модуля: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -172,32 +153,14 @@ async def duplicate_module(course_id: int, module_number: int, body: DuplicateMo
 
 @router.delete("/{course_id}/modules/{module_number}", response_model=dict)
 async def delete_module(course_id: int, module_number: int):
-    """Удалить модуль из курса и все связанный детальный контент (модуль+уроки)."""
-    try:
-        course_data = db.get_course(course_id)
-        if not course_data:
-            raise HTTPException(status_code=404, detail="Курс не найден")
-        # Работаем с «сырыми» данными курса без строгой валидации, чтобы избежать ошибок схем
-        raw_course = dict(course_data)
-        raw_course.pop('id', None)
-        raw_course.pop('created_at', None)
-        raw_course.pop('updated_at', None)
-        modules = raw_course.get('modules') or []
-        before_count = len(modules)
-        # Сравниваем как числа
-        filtered_modules = [m for m in modules if int(m.get('module_number', -1)) != int(module_number)]
-        if len(filtered_modules) == before_count:
-            raise HTTPException(status_code=404, detail="Модуль не найден")
-        raw_course['modules'] = filtered_modules
+    """Удалить модуль из курса и все связанный детальный контент (модуль+уроки).
 
-        saved = db.update_course(course_id, raw_course)
-        if not saved:
-            raise HTTPException(status_code=500, detail="Не удалось обновить курс")
-
-        # Удаляем детальный контент модуля и уроков
-        del_mod = db.delete_module_content(course_id, module_number)
-        del_lessons = db.delete_lesson_contents_for_module(course_id, module_number)
-        logger.info(f"Удалён модуль {module_number}: module_contents={del_mod}, lesson_contents={del_lessons}")
+    Одна транзакция: номера последующих модулей сдвигаются вместе с их контентом.
+    """
+    try:
+        new_version = db.delete_module(course_id, module_number)
+        if new_version is None:
+            raise HTTPException(status_code=404, detail="Курс или модуль не найден")
 
         return {"status": "deleted", "module_number": module_number}
     except HTTPException:
@@ -215,19 +178,8 @@ async def generate_module_content(course_id: int, module_number: int):
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        
-        course = Course(**course_data)
-        
-        # Находим модуль
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module = course_module(course_data, module_number)
         if not module:
             raise HTTPException(status_code=404, detail="Модуль не найден")
         
@@ -251,8 +203,8 @@ async def generate_module_content(course_id: int, module_number: int):
                 content_generator.generate_lesson_detailed_content,
                 lesson=lesson,
                 module=module,
-                course_title=course.course_title,
-                target_audience=course.target_audience,
+                course_title=course_data["course_title"],
+                target_audience=course_data["target_audience"],
             )
 
             if not lesson_content:
@@ -312,18 +264,8 @@ async def generate_module_tests(
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
 
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-
-        course = Course(**course_data)
-
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module = course_module(course_data, module_number)
         if not module:
             raise HTTPException(status_code=404, detail="Модуль не найден")
 
@@ -332,27 +274,31 @@ async def generate_module_tests(
         generated_lessons = []
         skipped_lessons = []
         failed_lessons = []
+        pending_lessons = []
 
         for lesson_index, lesson in enumerate(module.lessons):
             existing_test = db.get_lesson_test(course_id, module_number, lesson_index)
             if existing_test:
                 skipped_lessons.append(lesson_index)
-                continue
-
-            test = await run_in_threadpool(
-                test_generator.generate_test,
-                lesson_title=lesson.lesson_title,
-                lesson_goal=lesson.lesson_goal,
-                content_outline=lesson.content_outline,
-                course_title=course.course_title,
-                target_audience=course.target_audience,
-                module_title=module.module_title,
-                num_questions=body.num_questions,
-                model=body.model,
-                temperature=body.temperature,
-                max_tokens=body.max_tokens,
-            )
+            else:
+                pending_lessons.append((lesson_index, lesson))
+
+        # Несколько уроков на запрос; уроки с невалидным тестом догенерируются по одному
+        tests, batch_stats = await run_in_threadpool(
+            test_generator.generate_tests_batch,
+            lessons=pending_lessons,
+            course_title=course_data["course_title"],
+            target_audience=course_data["target_audience"],
+            module_title=module.module_title,
+            num_questions=body.num_questions,
+            model=body.model,
+            temperature=body.temperature,
+            max_tokens=body.max_tokens,
+            batch_size=body.batch_size,
+        )
 
+        for lesson_index, lesson in pending_lessons:
+            test = tests.get(lesson_index)
             if not test:
                 failed_lessons.append(lesson_index)
                 continue
@@ -372,6 +318,7 @@ async def generate_module_tests(
             "generated_lessons": generated_lessons,
             "skipped_lessons": skipped_lessons,
             "failed_lessons": failed_lessons,
+            "batch_stats": batch_stats,
         }
 
     except HTTPException:
@@ -389,23 +336,14 @@ async def regenerate_module_goal(course_id: int, module_number: int):
         if not course_data:
             raise HTTPException(status_code=404, detail="Курс не найден")
         
-        course_data.pop('id', None)
-        course_data.pop('created_at', None)
-        course_data.pop('updated_at', None)
-        course = Course(**course_data)
-        
-        module = None
-        for m in course.modules:
-            if m.module_number == module_number:
-                module = m
-                break
-        
+        # Валидируем только нужный модуль — остальной курс уже проверен при записи
+        module = course_module(course_data, module_number)
         if not module:
             raise HTTPException(status_code=404, detail="Модуль не найден")
         
         new_goal = generation_service.regenerate_module_goal(
-            course_title=course.course_title,
-            target_audience=course.target_audience,
+            course_title=course_data["course_title"],
+            target_audience=course_data["target_audience"],
             module_number=module.module_number,
             module_title=module.module_title
         )
@@ -413,8 +351,15 @@ async def regenerate_module_goal(course_id: int, module_number: int):
         if not new_goal:
             raise HTTPException(status_code=500, detail="Не удалось регенерировать цель")
         
-        module.module_goal = new_goal
-        db.update_course(course_id, course.dict())
+        # Вливаем цель в актуальную версию курса (пока шла генерация, курс могли изменить)
+        def set_goal(raw_course):
+            for m in raw_course.get('modules') or []:
+                if int(m.get('module_number', -1)) == int(module_number):
+                    m['module_goal'] = new_goal
+                    return
+            raise HTTPException(status_code=404, detail="Модуль не найден")
+
+        update_course_with_retry(course_id, set_goal)
         
         logger.info(f"✅ Цель модуля {module_number} регенерирована")
         
@@ -426,6 +371,10 @@ async def regenerate_module_goal(course_id: int, module_number: int):
         
     except HTTPException:
         raise
+    except CourseNotFound:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+    except CourseVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Ошибка регенерации цели модуля: {e}")
         raise HTTPException(status_code=500, detail=str(e))
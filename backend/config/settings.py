@@ -24,6 +24,12 @@ OPENAI_TEMPERATURE_DEFAULT = float(os.getenv("OPENAI_TEMPERATURE_DEFAULT", "0.7"
 OPENAI_MAX_TOKENS_DEFAULT = int(os.getenv("OPENAI_MAX_TOKENS_DEFAULT", "3000"))
 # Генерация структуры курса (большой JSON): 12000 чтобы ответ не обрезался (для очень больших курсов — 16000)
 OPENAI_MAX_TOKENS_COURSE_STRUCTURE = int(os.getenv("OPENAI_MAX_TOKENS_COURSE_STRUCTURE", "12000"))
+# Двухфазная генерация структуры: каркас модулей, затем уроки каждого модуля параллельными запросами
+COURSE_GENERATION_TWO_PHASE = (os.getenv("COURSE_GENERATION_TWO_PHASE", "true").lower() in ("1", "true", "yes"))
+COURSE_GENERATION_PARALLELISM = int(os.getenv("COURSE_GENERATION_PARALLELISM", "4"))
+COURSE_MODULE_GENERATION_ATTEMPTS = int(os.getenv("COURSE_MODULE_GENERATION_ATTEMPTS", "2"))
+OPENAI_MAX_TOKENS_COURSE_SKELETON = int(os.getenv("OPENAI_MAX_TOKENS_COURSE_SKELETON", "2000"))
+OPENAI_MAX_TOKENS_MODULE_LESSONS = int(os.getenv("OPENAI_MAX_TOKENS_MODULE_LESSONS", "3000"))
 OPENAI_MAX_TOKENS_MODULE_CONTENT = int(os.getenv("OPENAI_MAX_TOKENS_MODULE_CONTENT", "4096"))
 OPENAI_MAX_TOKENS_LESSON_DETAILED = int(os.getenv("OPENAI_MAX_TOKENS_LESSON_DETAILED", "4000"))
 OPENAI_MAX_TOKENS_TOPIC_MATERIAL = int(os.getenv("OPENAI_MAX_TOKENS_TOPIC_MATERIAL", "4096"))
@@ -34,11 +40,50 @@ OPENAI_MAX_TOKENS_SHORT_MAX = int(os.getenv("OPENAI_MAX_TOKENS_SHORT_MAX", "500"
 OPENAI_MODEL_TEST = os.getenv("OPENAI_MODEL_TEST", "gpt-4-turbo-preview")
 OPENAI_TEMPERATURE_TEST = float(os.getenv("OPENAI_TEMPERATURE_TEST", "0.7"))
 OPENAI_MAX_TOKENS_TEST = int(os.getenv("OPENAI_MAX_TOKENS_TEST", "3000"))
+# Пакетная генерация тестов модуля: уроков в одном запросе и потолок токенов ответа пакета
+TEST_BATCH_SIZE = int(os.getenv("TEST_BATCH_SIZE", "4"))
+OPENAI_MAX_TOKENS_TEST_BATCH = int(os.getenv("OPENAI_MAX_TOKENS_TEST_BATCH", "12000"))
 OPENAI_RETRIES_DEFAULT = int(os.getenv("OPENAI_RETRIES_DEFAULT", "2"))
 OPENAI_BACKOFF_SECONDS_DEFAULT = float(os.getenv("OPENAI_BACKOFF_SECONDS_DEFAULT", "1.0"))
+# Сколько запросов-продолжений отправлять, если ответ обрезан по max_tokens (finish_reason == "length")
+OPENAI_MAX_CONTINUATIONS = int(os.getenv("OPENAI_MAX_CONTINUATIONS", "3"))
+# Резервные модели по задачам (через запятую, по приоритету) и параметры роутера моделей:
+# переход на резерв при ошибке, хеджирование запроса, не ответившего за порог (сек; 0 — без хеджирования)
+OPENAI_MODEL_DEFAULT_FALLBACKS = os.getenv("OPENAI_MODEL_DEFAULT_FALLBACKS", "")
+OPENAI_MODEL_DETAILED_CONTENT_FALLBACKS = os.getenv("OPENAI_MODEL_DETAILED_CONTENT_FALLBACKS", "")
+OPENAI_MODEL_TEST_FALLBACKS = os.getenv("OPENAI_MODEL_TEST_FALLBACKS", "")
+AI_ROUTER_HEDGE_AFTER_SECONDS = float(os.getenv("AI_ROUTER_HEDGE_AFTER_SECONDS", "45"))
+AI_ROUTER_MAX_ERROR_RATE = float(os.getenv("AI_ROUTER_MAX_ERROR_RATE", "0.5"))
+AI_ROUTER_WINDOW = int(os.getenv("AI_ROUTER_WINDOW", "50"))
+AI_ROUTER_MAX_WORKERS = int(os.getenv("AI_ROUTER_MAX_WORKERS", "16"))
+# Ретраи основной (не последней) модели перед переходом к резервной; у последней — OPENAI_RETRIES_DEFAULT
+AI_ROUTER_CANDIDATE_RETRIES = int(os.getenv("AI_ROUTER_CANDIDATE_RETRIES", "1"))
+# Batch API (ночная массовая генерация, только OpenAI): адрес API (пусто — по умолчанию;
+# для офлайн-проверки — фейковый сервер backend/tools/fake_batch_server.py), окно выполнения,
+# интервал опроса статуса и каталог файлов заданий
+OPENAI_BATCH_BASE_URL = os.getenv("OPENAI_BATCH_BASE_URL") or None
+OPENAI_BATCH_COMPLETION_WINDOW = os.getenv("OPENAI_BATCH_COMPLETION_WINDOW", "24h")
+OPENAI_BATCH_POLL_INTERVAL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_INTERVAL_SECONDS", "60"))
+BATCH_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "batch_jobs")
 PROMPT_VERSION = os.getenv("PROMPT_VERSION", "v1")
 AI_CACHE_ENABLED = (os.getenv("AI_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"))
 AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", "86400"))
+# Кэш похожих запросов (MinHash по нормализованному тексту полей урока, backend/ai/similarity_cache.py):
+# сходство >= ACCEPT — ответ отдаётся как готовый (1.0 — только при совпадении нормализованного текста),
+# >= DRAFT — как черновик, а свежая генерация идёт в фоне
+AI_SIMILARITY_CACHE_ENABLED = (os.getenv("AI_SIMILARITY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"))
+AI_SIMILARITY_DRAFT_THRESHOLD = float(os.getenv("AI_SIMILARITY_DRAFT_THRESHOLD", "0.8"))
+AI_SIMILARITY_ACCEPT_THRESHOLD = float(os.getenv("AI_SIMILARITY_ACCEPT_THRESHOLD", "1.0"))
+AI_SIMILARITY_NUM_PERM = int(os.getenv("AI_SIMILARITY_NUM_PERM", "64"))
+AI_SIMILARITY_SHINGLE_SIZE = int(os.getenv("AI_SIMILARITY_SHINGLE_SIZE", "4"))
+AI_SIMILARITY_MAX_ENTRIES = int(os.getenv("AI_SIMILARITY_MAX_ENTRIES", "5000"))
+# Телеметрия вызовов AI (таблица ai_calls, сводка — GET /api/metrics/ai): записи копятся в буфере
+# в памяти и пишутся в БД фоновым воркером пачками раз в FLUSH_SECONDS; старше RETENTION_DAYS удаляются
+AI_TELEMETRY_ENABLED = (os.getenv("AI_TELEMETRY_ENABLED", "true").lower() in ("1", "true", "yes"))
+AI_TELEMETRY_FLUSH_SECONDS = float(os.getenv("AI_TELEMETRY_FLUSH_SECONDS", "5"))
+AI_TELEMETRY_BATCH_SIZE = int(os.getenv("AI_TELEMETRY_BATCH_SIZE", "200"))
+AI_TELEMETRY_BUFFER_SIZE = int(os.getenv("AI_TELEMETRY_BUFFER_SIZE", "10000"))
+AI_TELEMETRY_RETENTION_DAYS = int(os.getenv("AI_TELEMETRY_RETENTION_DAYS", "30"))
 
 # HeyGen
 HEYGEN_API_KEY = os.getenv("HEYGEN_API_KEY")
@@ -51,6 +96,25 @@ HEYGEN_TIMEOUT = int(os.getenv("HEYGEN_TIMEOUT", "30"))
 HEYGEN_STATUS_TIMEOUT = int(os.getenv("HEYGEN_STATUS_TIMEOUT", "10"))
 HEYGEN_DOWNLOAD_TIMEOUT = int(os.getenv("HEYGEN_DOWNLOAD_TIMEOUT", "60"))
 HEYGEN_POLL_INTERVAL_SECONDS = int(os.getenv("HEYGEN_POLL_INTERVAL_SECONDS", "10"))
+# Лимит одновременно рендерящихся видео на один аккаунт HeyGen (очередь не отправит больше)
+HEYGEN_MAX_CONCURRENT_RENDERS = int(os.getenv("HEYGEN_MAX_CONCURRENT_RENDERS", "3"))
+# Лимиты сегмента озвучки для одного видео (длина текста и оценка длительности)
+HEYGEN_MAX_SCRIPT_CHARS = int(os.getenv("HEYGEN_MAX_SCRIPT_CHARS", "1500"))
+HEYGEN_MAX_SEGMENT_SECONDS = int(os.getenv("HEYGEN_MAX_SEGMENT_SECONDS", "120"))
+# TTL кэша каталога аватаров/голосов HeyGen (после истечения отдаём старый и обновляем в фоне)
+HEYGEN_CATALOG_TTL_SECONDS = int(os.getenv("HEYGEN_CATALOG_TTL_SECONDS", "21600"))
+# Каталог локальных копий видео и размер блока при скачивании/отдаче (байт)
+VIDEO_FILES_DIR = os.getenv("VIDEO_FILES_DIR", "video_files")
+VIDEO_DOWNLOAD_CHUNK_SIZE = int(os.getenv("VIDEO_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Файл персистентной очереди генерации видео
+VIDEO_QUEUE_FILE = os.getenv("VIDEO_QUEUE_FILE", "video_queue.json")
+
+# SQLite (локальная БД): ожидание блокировки и размер кэша подготовленных выражений на соединение
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "30"))
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+# Повторы серверных правок курса при конфликте версий (оптимистичная блокировка)
+COURSE_UPDATE_RETRIES = int(os.getenv("COURSE_UPDATE_RETRIES", "3"))
 
 # Network
 HTTPS_PROXY = os.getenv("HTTPS_PROXY") or os.getenv("HTTP_PROXY")
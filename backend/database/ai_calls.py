@@ -0,0 +1,85 @@
+"""
+Колонки таблицы телеметрии вызовов AI (`ai_calls`), общие для SQLite и PostgreSQL.
+
+Записи приходят из backend/ai/telemetry.py пачками через фоновый воркер
+(backend/services/ai_telemetry_service.py); created_at — время вызова в UTC,
+а не время записи в БД. Сводка для GET /api/metrics/ai считается в БД
+(GROUP BY и оконные функции), SQL общий для обоих бэкендов.
+"""
+from typing import Optional
+
+AI_CALL_FIELDS = (
+    "created_at",
+    "task",
+    "route",
+    "course_id",
+    "model",
+    "prompt_version",
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "total_tokens",
+    "cache_hit",
+    "retries",
+    "outcome",
+)
+
+# Формат времени в SQLite (как у CURRENT_TIMESTAMP): строки сравниваются по порядку времени
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Суммы по группе в сводке (кроме числа вызовов и задержки)
+AI_CALL_SUM_FIELDS = ("retries", "prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens")
+# Перцентили задержки в сводке (по ближайшему рангу), в процентах
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile_rank(percent: int, count: int) -> int:
+    """Ранг (с 1) перцентиля по ближайшему рангу: ceil(percent / 100 × count) в целых числах"""
+    return (percent * count + 99) // 100
+
+
+def _group_column(group_by: str) -> str:
+    # Имя колонки подставляется в SQL — только из списка известных полей
+    if group_by not in AI_CALL_FIELDS:
+        raise ValueError(f"Неизвестное поле группировки ai_calls: {group_by}")
+    return group_by
+
+
+def ai_call_stats_sql(group_by: str, placeholder: str) -> str:
+    """
+    Счётчики и суммы ai_calls за период (параметр — начало периода) с GROUP BY в БД.
+
+    Строка на сочетание (группа, outcome, cache_hit): в Python приходят единицы
+    строк на группу, а не все вызовы за период. Одинаково для SQLite и PostgreSQL.
+    """
+    column = _group_column(group_by)
+    sums = ", ".join(f"SUM({field}) AS {field}" for field in AI_CALL_SUM_FIELDS)
+    return f"""
+        SELECT {column} AS group_key, outcome, cache_hit, COUNT(*) AS calls, {sums},
+               SUM(latency_ms) AS latency_ms_total, MAX(latency_ms) AS latency_ms_max
+        FROM ai_calls
+        WHERE created_at >= {placeholder}
+        GROUP BY {column}, outcome, cache_hit
+    """
+
+
+def ai_call_latency_ranks_sql(group_by: Optional[str], placeholder: str) -> str:
+    """
+    Задержки вызовов модели (без попаданий в кэш) на рангах LATENCY_PERCENTILES.
+
+    Ранги считает оконная функция в БД, в Python приходит не больше
+    len(LATENCY_PERCENTILES) строк на группу. group_by=None — по всем вызовам.
+    """
+    partition = f"PARTITION BY {_group_column(group_by)}" if group_by else ""
+    ranks = ", ".join(f"({percent} * n + 99) / 100" for percent in LATENCY_PERCENTILES)
+    return f"""
+        SELECT group_key, latency_rank, n, latency_ms FROM (
+            SELECT {group_by or 'NULL'} AS group_key, latency_ms,
+                   ROW_NUMBER() OVER ({partition} ORDER BY latency_ms) AS latency_rank,
+                   COUNT(*) OVER ({partition}) AS n
+            FROM ai_calls
+            WHERE created_at >= {placeholder} AND NOT cache_hit
+        ) ranked
+        WHERE latency_rank IN ({ranks})
+    """
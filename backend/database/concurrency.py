@@ -0,0 +1,43 @@
+"""
+Оптимистичная блокировка курсов.
+
+Каждая запись курса увеличивает `courses.version`. Запись с ожидаемой версией
+(compare-and-swap) не проходит, если курс успел изменить кто-то другой, — вместо
+молчаливой потери чужих правок вызывающий код получает `CourseVersionConflict`.
+"""
+from typing import Optional
+
+
+class CourseVersionConflict(Exception):
+    """Курс изменён после чтения: ожидаемая версия не совпала с текущей"""
+
+    def __init__(self, course_id: int, expected_version: int, current_version: Optional[int]):
+        self.course_id = course_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(
+            f"Курс {course_id} изменён: ожидалась версия {expected_version}, текущая {current_version}"
+        )
+
+
+def make_course_etag(version: int) -> str:
+    """ETag курса по номеру версии"""
+    return f'"v{version}"'
+
+
+def parse_course_etag(if_match: Optional[str]) -> Optional[int]:
+    """
+    Версия из заголовка If-Match (None — заголовок не задан или `*`)
+
+    Raises:
+        ValueError: заголовок не похож на ETag курса
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.startswith("v") or not value[1:].isdigit():
+        raise ValueError(f"Некорректный If-Match: {if_match}")
+    return int(value[1:])
@@ -0,0 +1,70 @@
+"""
+Сводка по курсу для списка курсов, курсор keyset-пагинации и текст для полнотекстового поиска.
+
+Счётчики хранятся в колонках `courses` и обновляются при каждой записи курса
+или урока, поэтому списку курсов не нужно читать JSON курсов и уроков.
+- module_count, lesson_count — из структуры курса (при save/update курса);
+- lessons_with_content, lessons_with_tests, videos_completed — агрегаты по
+  `lesson_contents` одного курса (при записи/удалении урока, теста, видео).
+"""
+import base64
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+SUMMARY_FIELDS = (
+    "module_count",
+    "lesson_count",
+    "lessons_with_content",
+    "lessons_with_tests",
+    "videos_completed",
+)
+
+# Максимум слов поискового запроса (остальные отбрасываются)
+MAX_SEARCH_TERMS = 8
+_SEARCH_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def course_structure_counts(course_data: Dict[str, Any]) -> Tuple[int, int]:
+    """Количество модулей и уроков в структуре курса"""
+    modules = course_data.get("modules") or []
+    return len(modules), sum(len(module.get("lessons") or []) for module in modules)
+
+
+def encode_cursor(created_at: Any, course_id: int) -> str:
+    """Непрозрачный курсор на позицию (created_at, id) последнего курса страницы"""
+    if hasattr(created_at, "isoformat"):
+        created_at = created_at.isoformat()
+    raw = json.dumps([str(created_at), course_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    Разбирает курсор из encode_cursor
+
+    Raises:
+        ValueError: курсор повреждён
+    """
+    if not cursor:
+        return None
+    try:
+        created_at, course_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(course_id)
+    except Exception as e:
+        raise ValueError(f"Некорректный курсор пагинации: {cursor}") from e
+
+
+def course_search_text(course_data: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Тексты для поискового индекса: название курса, названия модулей, названия уроков"""
+    modules = course_data.get("modules") or []
+    module_titles = " ".join(m.get("module_title") or "" for m in modules)
+    lesson_titles = " ".join(
+        lesson.get("lesson_title") or "" for m in modules for lesson in (m.get("lessons") or [])
+    )
+    return course_data.get("course_title") or "", module_titles, lesson_titles
+
+
+def search_terms(query: Optional[str]) -> List[str]:
+    """Слова запроса (только буквы/цифры — безопасно подставлять в синтаксис FTS5 и tsquery)"""
+    return _SEARCH_TERM_RE.findall((query or "").lower())[:MAX_SEARCH_TERMS]
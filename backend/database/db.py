@@ -3,13 +3,22 @@
 """
 import sqlite3
 import json
+import threading
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import logging
 from pathlib import Path
 
-logger = logging.getLogger(__name__)
+from backend.config import settings
+from .ai_calls import AI_CALL_FIELDS, TIMESTAMP_FORMAT, ai_call_latency_ranks_sql, ai_call_stats_sql
+from .concurrency import CourseVersionConflict
+from .course_summary import (
+    SUMMARY_FIELDS, course_search_text, course_structure_counts, decode_cursor, search_terms,
+)
+from .migrations import SQLITE_MIGRATIONS, run_migrations
+from .slide_video import slide_video_patch
 
+logger = logging.getLogger(__name__)
 
 class CourseDatabase:
     """Класс для работы с базой данных курсов"""
@@ -22,83 +31,46 @@ class CourseDatabase:
             db_path: Путь к файлу базы данных
         """
         self.db_path = db_path
+        # Соединение на поток: переиспользуется между вызовами (sqlite3 не разрешает делить его между потоками)
+        self._local = threading.local()
         self._init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение текущего потока (создаёт при первом обращении)
+        
+        - WAL: читатели не блокируют писателя и наоборот;
+        - busy_timeout: при блокировке ждём, а не падаем с "database is locked";
+        - cached_statements: кэш подготовленных выражений sqlite3 живёт вместе с соединением.
+        
+        Используется как `with self._connect() as conn:` — контекст фиксирует/откатывает транзакцию,
+        но соединение не закрывает.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=settings.SQLITE_BUSY_TIMEOUT_SECONDS,
+                cached_statements=settings.SQLITE_STATEMENT_CACHE_SIZE,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+            self._local.conn = conn
+        return conn
+    
+    def close(self):
+        """Закрывает соединение текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
     def _init_db(self):
-        """Создание таблиц в базе данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Таблица курсов
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS courses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_title TEXT NOT NULL,
-                    target_audience TEXT NOT NULL,
-                    duration_hours INTEGER,
-                    duration_weeks INTEGER,
-                    course_data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Таблица модулей с контентом
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS module_contents (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    module_number INTEGER NOT NULL,
-                    module_title TEXT NOT NULL,
-                    content_data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
-                    UNIQUE (course_id, module_number)
-                )
-            """)
-            
-            # Таблица уроков с детальным контентом
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS lesson_contents (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    course_id INTEGER NOT NULL,
-                    module_number INTEGER NOT NULL,
-                    lesson_index INTEGER NOT NULL,
-                    lesson_title TEXT NOT NULL,
-                    content_data TEXT NOT NULL,
-                    video_id TEXT,
-                    video_download_url TEXT,
-                    video_status TEXT,
-                    video_generated_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
-                    UNIQUE (course_id, module_number, lesson_index)
-                )
-            """)
-            
-            # Добавляем колонки для видео, если их еще нет (для существующих БД)
-            try:
-                cursor.execute("ALTER TABLE lesson_contents ADD COLUMN video_id TEXT")
-            except sqlite3.OperationalError:
-                pass  # Колонка уже существует
-            
-            try:
-                cursor.execute("ALTER TABLE lesson_contents ADD COLUMN video_download_url TEXT")
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                cursor.execute("ALTER TABLE lesson_contents ADD COLUMN video_status TEXT")
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                cursor.execute("ALTER TABLE lesson_contents ADD COLUMN video_generated_at TIMESTAMP")
-            except sqlite3.OperationalError:
-                pass
-            
-            conn.commit()
-            logger.info("✅ База данных инициализирована")
+        """Применение неприменённых миграций схемы (при актуальной схеме — одна проверка версии)"""
+        version = run_migrations(self._connect(), SQLITE_MIGRATIONS, "sqlite")
+        logger.info(f"✅ База данных инициализирована (схема v{version})")
     
     def save_course(self, course_data: Dict[str, Any]) -> int:
         """
@@ -110,25 +82,30 @@ class CourseDatabase:
         Returns:
             ID созданного курса
         """
-        with sqlite3.connect(self.db_path) as conn:
+        module_count, lesson_count = course_structure_counts(course_data)
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
                 INSERT INTO courses (
                     course_title, target_audience, duration_hours, 
-                    duration_weeks, course_data, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    duration_weeks, course_data, module_count, lesson_count,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 course_data.get('course_title', 'Без названия'),
                 course_data.get('target_audience', 'Не указано'),
                 course_data.get('duration_hours'),
                 course_data.get('duration_weeks'),
                 json.dumps(course_data, ensure_ascii=False),
+                module_count,
+                lesson_count,
                 datetime.now().isoformat(),
                 datetime.now().isoformat()
             ))
             
             course_id = cursor.lastrowid
+            self._index_course_search(cursor, course_id, course_data)
             conn.commit()
             
             logger.info(f"✅ Курс сохранен с ID: {course_id}")
@@ -144,7 +121,7 @@ class CourseDatabase:
         Returns:
             Данные курса или None
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -159,85 +136,144 @@ class CourseDatabase:
                 course_data['id'] = row['id']
                 course_data['created_at'] = row['created_at']
                 course_data['updated_at'] = row['updated_at']
+                course_data['version'] = row['version']
                 return course_data
             
             return None
     
-    def get_all_courses(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    def get_all_courses(
+        self, limit: int = 50, cursor: Optional[str] = None, search: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Получить список всех курсов
+        Получить список курсов со сводкой (новые первыми)
         
         Args:
             limit: Максимальное количество курсов
-            offset: Смещение для пагинации
+            cursor: Курсор из encode_cursor по последнему курсу предыдущей страницы
+            search: Поиск по словам (префиксам слов) в названиях курса, модулей и уроков
             
         Returns:
             Список курсов
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute("""
+        conditions = []
+        params: List[Any] = []
+        position = decode_cursor(cursor)
+        if position:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(position)
+        terms = search_terms(search)
+        if terms:
+            conditions.append("id IN (SELECT rowid FROM courses_fts WHERE courses_fts MATCH ?)")
+            params.append(" ".join(f'"{term}"*' for term in terms))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        with self._connect() as conn:
+            db_cursor = conn.cursor()
+            # Keyset-пагинация по индексу (created_at, id): без сканирования пропущенных строк, как при OFFSET
+            db_cursor.execute(f"""
                 SELECT id, course_title, target_audience, 
-                       duration_hours, duration_weeks, created_at, updated_at
+                       duration_hours, duration_weeks, created_at, updated_at,
+                       {', '.join(SUMMARY_FIELDS)}
                 FROM courses
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-            """, (limit, offset))
-            
-            rows = cursor.fetchall()
-            
-            courses = []
-            for row in rows:
-                courses.append({
-                    'id': row['id'],
-                    'course_title': row['course_title'],
-                    'target_audience': row['target_audience'],
-                    'duration_hours': row['duration_hours'],
-                    'duration_weeks': row['duration_weeks'],
-                    'created_at': row['created_at'],
-                    'updated_at': row['updated_at']
-                })
-            
-            return courses
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            """, (*params, limit))
+            
+            return [dict(row) for row in db_cursor.fetchall()]
+    
+    def _index_course_search(self, cursor: sqlite3.Cursor, course_id: int, course_data: Dict[str, Any]) -> None:
+        """Обновляет строку курса в полнотекстовом индексе courses_fts"""
+        cursor.execute("DELETE FROM courses_fts WHERE rowid = ?", (course_id,))
+        cursor.execute("""
+            INSERT INTO courses_fts (rowid, course_title, module_titles, lesson_titles)
+            VALUES (?, ?, ?, ?)
+        """, (course_id, *course_search_text(course_data)))
+    
+    def _refresh_lesson_summary(self, cursor: sqlite3.Cursor, course_id: int) -> None:
+        """Пересчитывает счётчики уроков курса (в той же транзакции, что и запись урока)"""
+        cursor.execute("""
+            UPDATE courses SET
+                lessons_with_content = (
+                    SELECT COUNT(*) FROM lesson_contents WHERE course_id = courses.id
+                ),
+                lessons_with_tests = (
+                    SELECT COUNT(*) FROM lesson_contents
+                    WHERE course_id = courses.id AND json_extract(content_data, '$.test') IS NOT NULL
+                ),
+                videos_completed = (
+                    SELECT COUNT(*) FROM lesson_contents
+                    WHERE course_id = courses.id AND video_status = 'completed'
+                )
+            WHERE id = ?
+        """, (course_id,))
     
-    def update_course(self, course_id: int, course_data: Dict[str, Any]) -> bool:
+    def update_course(
+        self, course_id: int, course_data: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
         """
         Обновить курс
         
         Args:
             course_id: ID курса
             course_data: Новые данные курса
+            expected_version: Версия, на основе которой сделаны изменения (None — записать безусловно)
             
         Returns:
-            True если обновление успешно
+            Новая версия курса или None, если курс не найден
+        
+        Raises:
+            CourseVersionConflict: курс изменён после чтения (версия не совпала)
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE courses 
-                SET course_title = ?, 
-                    target_audience = ?, 
-                    duration_hours = ?,
-                    duration_weeks = ?,
-                    course_data = ?,
-                    updated_at = ?
-                WHERE id = ?
-            """, (
-                course_data.get('course_title', 'Без названия'),
-                course_data.get('target_audience', 'Не указано'),
-                course_data.get('duration_hours'),
-                course_data.get('duration_weeks'),
-                json.dumps(course_data, ensure_ascii=False),
-                datetime.now().isoformat(),
-                course_id
-            ))
-            
+            new_version = self._write_course(cursor, course_id, course_data, expected_version)
+            if new_version is None:
+                return None
             conn.commit()
-            
-            return cursor.rowcount > 0
+            return new_version
+    
+    def _write_course(
+        self, cursor: sqlite3.Cursor, course_id: int, course_data: Dict[str, Any], expected_version: Optional[int]
+    ) -> Optional[int]:
+        """Записывает JSON курса с проверкой версии (без commit); None — курса нет"""
+        module_count, lesson_count = course_structure_counts(course_data)
+        cursor.execute("""
+            UPDATE courses 
+            SET course_title = ?, 
+                target_audience = ?, 
+                duration_hours = ?,
+                duration_weeks = ?,
+                course_data = ?,
+                module_count = ?,
+                lesson_count = ?,
+                updated_at = ?,
+                version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
+            RETURNING version
+        """, (
+            course_data.get('course_title', 'Без названия'),
+            course_data.get('target_audience', 'Не указано'),
+            course_data.get('duration_hours'),
+            course_data.get('duration_weeks'),
+            json.dumps(course_data, ensure_ascii=False),
+            module_count,
+            lesson_count,
+            datetime.now().isoformat(),
+            course_id,
+            expected_version,
+            expected_version
+        ))
+        row = cursor.fetchone()
+        if row is None:
+            if expected_version is not None:
+                cursor.execute("SELECT version FROM courses WHERE id = ?", (course_id,))
+                current = cursor.fetchone()
+                if current is not None:
+                    raise CourseVersionConflict(course_id, expected_version, current[0])
+            return None
+        self._index_course_search(cursor, course_id, course_data)
+        return row[0]
     
     def delete_course(self, course_id: int) -> bool:
         """
@@ -249,13 +285,15 @@ class CourseDatabase:
         Returns:
             True если удаление успешно
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("DELETE FROM courses WHERE id = ?", (course_id,))
+            deleted = cursor.rowcount > 0
+            cursor.execute("DELETE FROM courses_fts WHERE rowid = ?", (course_id,))
             conn.commit()
             
-            return cursor.rowcount > 0
+            return deleted
     
     def save_module_content(
         self, 
@@ -276,44 +314,24 @@ class CourseDatabase:
         Returns:
             ID созданной записи
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            
-            # Проверяем, существует ли уже контент для этого модуля
+            # Один запрос вместо SELECT + INSERT/UPDATE: без гонки на UNIQUE (course_id, module_number)
             cursor.execute("""
-                SELECT id FROM module_contents 
-                WHERE course_id = ? AND module_number = ?
-            """, (course_id, module_number))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Обновляем существующий
-                cursor.execute("""
-                    UPDATE module_contents 
-                    SET module_title = ?, content_data = ?
-                    WHERE course_id = ? AND module_number = ?
-                """, (
-                    module_title,
-                    json.dumps(content_data, ensure_ascii=False),
-                    course_id,
-                    module_number
-                ))
-                record_id = existing[0]
-            else:
-                # Создаем новый
-                cursor.execute("""
-                    INSERT INTO module_contents (
-                        course_id, module_number, module_title, content_data
-                    ) VALUES (?, ?, ?, ?)
-                """, (
-                    course_id,
-                    module_number,
-                    module_title,
-                    json.dumps(content_data, ensure_ascii=False)
-                ))
-                record_id = cursor.lastrowid
-            
+                INSERT INTO module_contents (
+                    course_id, module_number, module_title, content_data
+                ) VALUES (?, ?, ?, ?)
+                ON CONFLICT (course_id, module_number) DO UPDATE SET
+                    module_title = excluded.module_title,
+                    content_data = excluded.content_data
+                RETURNING id
+            """, (
+                course_id,
+                module_number,
+                module_title,
+                json.dumps(content_data, ensure_ascii=False)
+            ))
+            record_id = cursor.fetchone()[0]
             conn.commit()
             logger.info(f"✅ Контент модуля {module_number} сохранен (ID: {record_id})")
             return record_id
@@ -329,7 +347,7 @@ class CourseDatabase:
         Returns:
             Данные контента модуля или None
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -351,7 +369,7 @@ class CourseDatabase:
 
         Returns количество удалённых строк.
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -388,7 +406,7 @@ class CourseDatabase:
         Returns:
             True если обновление прошло успешно
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Сначала проверяем, существует ли запись
@@ -427,6 +445,8 @@ class CourseDatabase:
                         SET {', '.join(update_fields)}
                         WHERE course_id = ? AND module_number = ? AND lesson_index = ?
                     """, params)
+                    if video_status is not None:
+                        self._refresh_lesson_summary(cursor, course_id)
                     conn.commit()
                     logger.info(f"Обновлена информация о видео для урока {course_id}/{module_number}/{lesson_index}")
                     return True
@@ -443,10 +463,13 @@ class CourseDatabase:
         video_id: Optional[str] = None,
         video_status: Optional[str] = None,
         video_download_url: Optional[str] = None,
+        slide_part: Optional[int] = None,
     ) -> bool:
         """
         Обновляет информацию о видео для слайда урока (в content_data.slides[slide_index]).
 
+        Массив слайдов не дополняется: если слайда с таким индексом нет, ничего не пишется.
+
         Args:
             course_id: ID курса
             module_number: Номер модуля
@@ -455,42 +478,31 @@ class CourseDatabase:
             video_id: ID видео в HeyGen
             video_status: Статус видео
             video_download_url: URL для скачивания видео
+            slide_part: Часть озвучки слайда; со 2-й части видео пишется в slides[i].video_parts["<N>"]
 
         Returns:
-            True если обновление прошло успешно
+            True если обновление прошло успешно, False — нет контента урока или такого слайда
         """
-        content_data = self.get_lesson_content(course_id, module_number, lesson_index)
-        if not content_data:
-            logger.warning(f"Контент урока {course_id}/{module_number}/{lesson_index} не найден")
-            return False
-        slides = content_data.get("slides") or []
-        if not isinstance(slides, list):
-            slides = []
-        while len(slides) <= slide_index:
-            slides.append({"slide_number": len(slides) + 1, "title": "", "content": ""})
-        slide = slides[slide_index]
-        if not isinstance(slide, dict):
-            slide = {"slide_number": slide_index + 1, "title": "", "content": ""}
-            slides[slide_index] = slide
-        if video_id is not None:
-            slide["video_id"] = video_id
-        if video_status is not None:
-            slide["video_status"] = video_status
-        if video_download_url is not None:
-            slide["video_download_url"] = video_download_url
-        content_data["slides"] = slides
-        course_data = self.get_course(course_id)
-        if not course_data:
-            return False
-        modules = course_data.get("modules") or []
-        module = next((m for m in modules if int(m.get("module_number", -1)) == int(module_number)), None)
-        if not module:
-            return False
-        lessons = module.get("lessons") or []
-        if lesson_index < 0 or lesson_index >= len(lessons):
-            return False
-        lesson_title = lessons[lesson_index].get("lesson_title") or "Урок"
-        self.save_lesson_content(course_id, module_number, lesson_index, lesson_title, content_data)
+        patch = slide_video_patch(video_id, video_status, video_download_url, slide_part)
+        if not patch:
+            return True
+        slide_path = f"$.slides[{int(slide_index)}]"
+
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Частичное обновление одним выражением: сливаем патч в объект слайда внутри content_data
+            # (json_patch сливает вложенные объекты, поэтому части в video_parts не затирают друг друга)
+            cursor.execute(f"""
+                UPDATE lesson_contents
+                SET content_data = json_set(content_data, '{slide_path}',
+                                            json_patch(json_extract(content_data, '{slide_path}'), ?))
+                WHERE course_id = ? AND module_number = ? AND lesson_index = ?
+                  AND json_type(content_data, '{slide_path}') = 'object'
+            """, (json.dumps(patch, ensure_ascii=False), course_id, module_number, lesson_index))
+            if not cursor.rowcount:
+                logger.warning(f"Слайд {slide_index} урока {course_id}/{module_number}/{lesson_index} не найден, видео не сохранено")
+                return False
+            conn.commit()
         logger.info(f"Обновлена информация о видео для слайда {slide_index} урока {course_id}/{module_number}/{lesson_index}")
         return True
 
@@ -515,46 +527,25 @@ class CourseDatabase:
         Returns:
             ID созданной записи
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            
-            # Проверяем существование
             cursor.execute("""
-                SELECT id FROM lesson_contents
-                WHERE course_id = ? AND module_number = ? AND lesson_index = ?
-            """, (course_id, module_number, lesson_index))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Обновляем
-                cursor.execute("""
-                    UPDATE lesson_contents
-                    SET lesson_title = ?, content_data = ?
-                    WHERE course_id = ? AND module_number = ? AND lesson_index = ?
-                """, (
-                    lesson_title,
-                    json.dumps(content_data, ensure_ascii=False),
-                    course_id,
-                    module_number,
-                    lesson_index
-                ))
-                record_id = existing[0]
-            else:
-                # Создаем новый
-                cursor.execute("""
-                    INSERT INTO lesson_contents (
-                        course_id, module_number, lesson_index, lesson_title, content_data
-                    ) VALUES (?, ?, ?, ?, ?)
-                """, (
-                    course_id,
-                    module_number,
-                    lesson_index,
-                    lesson_title,
-                    json.dumps(content_data, ensure_ascii=False)
-                ))
-                record_id = cursor.lastrowid
-            
+                INSERT INTO lesson_contents (
+                    course_id, module_number, lesson_index, lesson_title, content_data
+                ) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                    lesson_title = excluded.lesson_title,
+                    content_data = excluded.content_data
+                RETURNING id
+            """, (
+                course_id,
+                module_number,
+                lesson_index,
+                lesson_title,
+                json.dumps(content_data, ensure_ascii=False)
+            ))
+            record_id = cursor.fetchone()[0]
+            self._refresh_lesson_summary(cursor, course_id)
             conn.commit()
             logger.info(f"✅ Контент урока {lesson_index} сохранен (ID: {record_id})")
             return record_id
@@ -576,7 +567,7 @@ class CourseDatabase:
         Returns:
             Данные контента урока или None
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -625,7 +616,7 @@ class CourseDatabase:
             Словарь с информацией о видео или None
         """
         logger.debug(f"Запрос видео информации для курса {course_id}, модуль {module_number}, урок {lesson_index}")
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -682,42 +673,27 @@ class CourseDatabase:
         Returns:
             ID созданной/обновленной записи
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            
-            # Получаем существующий контент, если есть
-            existing_content = self.get_lesson_content(course_id, module_number, lesson_index)
-            
-            if existing_content:
-                # Обновляем существующий контент, добавляя/обновляя тест
-                existing_content['test'] = test_data
-                cursor.execute("""
-                    UPDATE lesson_contents
-                    SET content_data = ?
-                    WHERE course_id = ? AND module_number = ? AND lesson_index = ?
-                """, (
-                    json.dumps(existing_content, ensure_ascii=False),
-                    course_id,
-                    module_number,
-                    lesson_index
-                ))
-                record_id = cursor.lastrowid
-            else:
-                # Создаем новый контент только с тестом
-                content_data = {'test': test_data}
-                cursor.execute("""
-                    INSERT INTO lesson_contents (
-                        course_id, module_number, lesson_index, lesson_title, content_data
-                    ) VALUES (?, ?, ?, ?, ?)
-                """, (
-                    course_id,
-                    module_number,
-                    lesson_index,
-                    lesson_title,
-                    json.dumps(content_data, ensure_ascii=False)
-                ))
-                record_id = cursor.lastrowid
-            
+            # Тест вливается в content_data на стороне БД (json_set), остальной контент урока не трогаем
+            test_json = json.dumps(test_data, ensure_ascii=False)
+            cursor.execute("""
+                INSERT INTO lesson_contents (
+                    course_id, module_number, lesson_index, lesson_title, content_data
+                ) VALUES (?, ?, ?, ?, json_object('test', json(?)))
+                ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                    content_data = json_set(lesson_contents.content_data, '$.test', json(?))
+                RETURNING id
+            """, (
+                course_id,
+                module_number,
+                lesson_index,
+                lesson_title,
+                test_json,
+                test_json
+            ))
+            record_id = cursor.fetchone()[0]
+            self._refresh_lesson_summary(cursor, course_id)
             conn.commit()
             logger.info(f"✅ Тест для урока {lesson_index} сохранен (ID: {record_id})")
             return record_id
@@ -739,14 +715,66 @@ class CourseDatabase:
         Returns:
             Данные теста или None
         """
-        content_data = self.get_lesson_content(course_id, module_number, lesson_index)
-        if content_data and 'test' in content_data:
-            return content_data['test']
-        return None
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Проекция на стороне БД: забираем только тест, а не весь контент урока
+            cursor.execute("""
+                SELECT json_extract(content_data, '$.test') FROM lesson_contents
+                WHERE course_id = ? AND module_number = ? AND lesson_index = ?
+            """, (course_id, module_number, lesson_index))
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                return json.loads(row[0])
+            return None
     
+    def get_lessons_video_overview(
+        self,
+        course_id: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Плоский список уроков курсов с информацией о видео (проекция на стороне БД через json_each)
+        
+        Args:
+            course_id: ID курса (None — последние `limit` курсов)
+            limit: Максимальное количество курсов
+            
+        Returns:
+            Список строк: course_id, course_title, module_number, module_title,
+            lesson_index, lesson_title, video_id, video_status, video_download_url
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT c.id AS course_id,
+                       c.course_title,
+                       CAST(json_extract(m.value, '$.module_number') AS INTEGER) AS module_number,
+                       json_extract(m.value, '$.module_title') AS module_title,
+                       l.key AS lesson_index,
+                       json_extract(l.value, '$.lesson_title') AS lesson_title,
+                       lc.video_id,
+                       lc.video_status,
+                       lc.video_download_url
+                FROM (
+                    SELECT id, course_title, course_data, created_at FROM courses
+                    WHERE ? IS NULL OR id = ?
+                    ORDER BY created_at DESC
+                    LIMIT ?
+                ) c
+                JOIN json_each(c.course_data, '$.modules') m
+                JOIN json_each(m.value, '$.lessons') l
+                LEFT JOIN lesson_contents lc
+                       ON lc.course_id = c.id
+                      AND lc.module_number = CAST(json_extract(m.value, '$.module_number') AS INTEGER)
+                      AND lc.lesson_index = l.key
+                ORDER BY c.created_at DESC, module_number, lesson_index
+            """, (course_id, course_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
     def delete_lesson_content(self, course_id: int, module_number: int, lesson_index: int) -> int:
         """Удалить запись детального контента одного урока."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -755,15 +783,204 @@ class CourseDatabase:
                 """,
                 (course_id, module_number, lesson_index),
             )
+            deleted = cursor.rowcount
+            self._refresh_lesson_summary(cursor, course_id)
             conn.commit()
-            return cursor.rowcount
+            return deleted
+
+    def delete_lesson(self, course_id: int, module_number: int, lesson_index: int) -> Optional[int]:
+        """
+        Удалить урок из структуры курса вместе с его контентом (одна транзакция)
+        
+        Урок вырезается из JSON курса на стороне БД (json_remove), контент урока удаляется,
+        а контент последующих уроков модуля сдвигается на одну позицию — lesson_index
+        в lesson_contents остаётся согласованным с порядком уроков в курсе.
+        
+        Returns:
+            Новая версия курса или None, если курс/модуль/урок не найден
+        """
+        if lesson_index < 0:
+            return None
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                WITH target AS (
+                    SELECT '$.modules[' || m.key || '].lessons[' || ? || ']' AS path
+                    FROM courses c, json_each(c.course_data, '$.modules') AS m
+                    WHERE c.id = ? AND json_extract(m.value, '$.module_number') = ?
+                    LIMIT 1
+                )
+                UPDATE courses SET
+                    course_data = json_remove(course_data, (SELECT path FROM target)),
+                    lesson_count = lesson_count - 1,
+                    updated_at = ?,
+                    version = version + 1
+                WHERE id = ? AND json_type(course_data, (SELECT path FROM target)) IS NOT NULL
+                RETURNING version, course_data
+            """, (lesson_index, course_id, module_number, datetime.now().isoformat(), course_id))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            new_version = row[0]
+            self._index_course_search(cursor, course_id, json.loads(row[1]))
+            
+            cursor.execute("""
+                DELETE FROM lesson_contents
+                WHERE course_id = ? AND module_number = ? AND lesson_index = ?
+            """, (course_id, module_number, lesson_index))
+            self._shift_down(
+                cursor, "lesson_contents", "lesson_index", lesson_index,
+                "course_id = ? AND module_number = ?", (course_id, module_number),
+            )
+            self._refresh_lesson_summary(cursor, course_id)
+            conn.commit()
+            logger.info(f"✅ Урок {module_number}/{lesson_index} удалён из курса {course_id} (версия {new_version})")
+            return new_version
+
+    @staticmethod
+    def _shift_down(cursor: sqlite3.Cursor, table: str, column: str, after: int, scope_sql: str, scope_params: tuple) -> None:
+        """
+        Уменьшает на 1 значения column > after в пределах scope.
+        
+        Сдвиг в два шага (через отрицательные значения): UNIQUE проверяется построчно,
+        и прямое `column = column - 1` может столкнуться с ещё не сдвинутой строкой.
+        """
+        cursor.execute(
+            f"UPDATE {table} SET {column} = -{column} WHERE {scope_sql} AND {column} > ?",
+            (*scope_params, after),
+        )
+        cursor.execute(
+            f"UPDATE {table} SET {column} = -{column} - 1 WHERE {scope_sql} AND {column} < 0",
+            scope_params,
+        )
+
+    def duplicate_module(
+        self,
+        course_id: int,
+        course_data: Dict[str, Any],
+        expected_version: Optional[int],
+        src_module_number: int,
+        dst_module_number: int,
+        module_title: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Записать курс с модулем-копией и скопировать детальный контент модуля и уроков (одна транзакция)
+        
+        Если копирование контента не удалось, не записывается и структура курса —
+        модуль-копия без контента не появляется.
+        
+        Args:
+            course_id: ID курса
+            course_data: JSON курса, уже содержащий модуль-копию
+            expected_version: Версия, на основе которой сделаны изменения
+            src_module_number: Номер исходного модуля
+            dst_module_number: Номер модуля-копии
+            module_title: Название модуля-копии (по умолчанию — как у исходного)
+            
+        Returns:
+            Новая версия курса или None, если курс не найден
+        
+        Raises:
+            CourseVersionConflict: курс изменён после чтения (версия не совпала)
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            new_version = self._write_course(cursor, course_id, course_data, expected_version)
+            if new_version is None:
+                return None
+            cursor.execute("""
+                INSERT INTO module_contents (course_id, module_number, module_title, content_data)
+                SELECT course_id, ?, COALESCE(?, module_title), content_data
+                FROM module_contents
+                WHERE course_id = ? AND module_number = ?
+                ON CONFLICT (course_id, module_number) DO UPDATE SET
+                    module_title = excluded.module_title,
+                    content_data = excluded.content_data
+            """, (dst_module_number, module_title, course_id, src_module_number))
+            cursor.execute("""
+                INSERT INTO lesson_contents (course_id, module_number, lesson_index, lesson_title, content_data)
+                SELECT course_id, ?, lesson_index, lesson_title, content_data
+                FROM lesson_contents
+                WHERE course_id = ? AND module_number = ?
+                ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                    lesson_title = excluded.lesson_title,
+                    content_data = excluded.content_data
+            """, (dst_module_number, course_id, src_module_number))
+            copied = cursor.rowcount
+            self._refresh_lesson_summary(cursor, course_id)
+            conn.commit()
+            logger.info(
+                f"✅ Модуль {src_module_number} скопирован в модуль {dst_module_number} "
+                f"вместе с контентом (уроков: {copied}, версия {new_version})"
+            )
+            return new_version
+
+    def delete_module(self, course_id: int, module_number: int) -> Optional[int]:
+        """
+        Удалить модуль из курса вместе с контентом и сдвинуть номера последующих модулей (одна транзакция)
+        
+        Returns:
+            Новая версия курса или None, если курс/модуль не найден
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Читаем и переписываем структуру под блокировкой записи
+            conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT course_data FROM courses WHERE id = ?", (course_id,))
+            row = cursor.fetchone()
+            course_data = json.loads(row[0]) if row else None
+            modules = (course_data or {}).get('modules') or []
+            if not any(int(m.get('module_number', -1)) == int(module_number) for m in modules):
+                conn.rollback()
+                return None
+            
+            remaining = []
+            for m in modules:
+                number = int(m.get('module_number', -1))
+                if number == int(module_number):
+                    continue
+                if number > module_number:
+                    m['module_number'] = number - 1
+                remaining.append(m)
+            course_data['modules'] = remaining
+            module_count, lesson_count = course_structure_counts(course_data)
+            cursor.execute("""
+                UPDATE courses SET
+                    course_data = ?,
+                    module_count = ?,
+                    lesson_count = ?,
+                    updated_at = ?,
+                    version = version + 1
+                WHERE id = ?
+                RETURNING version
+            """, (
+                json.dumps(course_data, ensure_ascii=False),
+                module_count,
+                lesson_count,
+                datetime.now().isoformat(),
+                course_id
+            ))
+            new_version = cursor.fetchone()[0]
+            self._index_course_search(cursor, course_id, course_data)
+            
+            for table in ("module_contents", "lesson_contents"):
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE course_id = ? AND module_number = ?",
+                    (course_id, module_number),
+                )
+                self._shift_down(cursor, table, "module_number", module_number, "course_id = ?", (course_id,))
+            self._refresh_lesson_summary(cursor, course_id)
+            conn.commit()
+            logger.info(f"✅ Модуль {module_number} удалён из курса {course_id} (версия {new_version})")
+            return new_version
 
     def delete_lesson_contents_for_module(self, course_id: int, module_number: int) -> int:
         """Удалить все записи детального контента уроков для указанного модуля.
 
         Returns количество удалённых строк.
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -772,6 +989,60 @@ class CourseDatabase:
                 """,
                 (course_id, module_number),
             )
+            deleted = cursor.rowcount
+            self._refresh_lesson_summary(cursor, course_id)
+            conn.commit()
+            return deleted
+
+
+    # ------------------------------------------------------------------
+    # Телеметрия вызовов AI
+    # ------------------------------------------------------------------
+
+    def save_ai_calls(self, records: List[Dict[str, Any]]) -> int:
+        """Записать пачку записей телеметрии AI одной транзакцией
+
+        Args:
+            records: Записи из backend/ai/telemetry.py (created_at — datetime в UTC)
+
+        Returns:
+            Количество записанных строк
+        """
+        if not records:
+            return 0
+        with self._connect() as conn:
+            conn.executemany(f"""
+                INSERT INTO ai_calls ({', '.join(AI_CALL_FIELDS)})
+                VALUES ({', '.join('?' for _ in AI_CALL_FIELDS)})
+            """, [
+                tuple(
+                    record["created_at"].strftime(TIMESTAMP_FORMAT) if field == "created_at" else record.get(field)
+                    for field in AI_CALL_FIELDS
+                )
+                for record in records
+            ])
+            conn.commit()
+            return len(records)
+
+    def get_ai_call_stats(self, since: datetime, group_by: str) -> List[Dict[str, Any]]:
+        """Счётчики и суммы телеметрии AI не старше since (UTC) по группам group_by, outcome и cache_hit"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ai_call_stats_sql(group_by, "?"), (since.strftime(TIMESTAMP_FORMAT),))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_ai_call_latency_ranks(self, since: datetime, group_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Задержки вызовов модели на рангах перцентилей (group_by=None — по всем вызовам)"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ai_call_latency_ranks_sql(group_by, "?"), (since.strftime(TIMESTAMP_FORMAT),))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def delete_ai_calls_before(self, before: datetime) -> int:
+        """Удалить записи телеметрии AI старше before (UTC); возвращает число удалённых"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM ai_calls WHERE created_at < ?", (before.strftime(TIMESTAMP_FORMAT),))
             conn.commit()
             return cursor.rowcount
 
@@ -10,8 +10,23 @@ from datetime import datetime
 import logging
 from urllib.parse import urlparse
 
+from .ai_calls import AI_CALL_FIELDS, ai_call_latency_ranks_sql, ai_call_stats_sql
+from .concurrency import CourseVersionConflict
+from .course_summary import (
+    SUMMARY_FIELDS, course_search_text, course_structure_counts, decode_cursor, search_terms,
+)
+from .migrations import POSTGRES_MIGRATIONS, run_migrations
+from .slide_video import slide_video_patch
+
 logger = logging.getLogger(__name__)
 
+# tsvector для поиска по курсу (веса: A — курс, B — модули, C — уроки), параметры — course_search_text
+_SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('simple', %s), 'A')
+    || setweight(to_tsvector('simple', %s), 'B')
+    || setweight(to_tsvector('simple', %s), 'C')
+"""
+
 
 class RenderDatabase:
     """Класс для работы с PostgreSQL базой данных на Render"""
@@ -52,130 +67,11 @@ class RenderDatabase:
             raise
     
     def _init_db(self):
-        """Создание таблиц в базе данных"""
+        """Применение неприменённых миграций схемы (при актуальной схеме — одна проверка версии)"""
         try:
             with self._get_connection() as conn:
-                with conn.cursor() as cursor:
-                    
-                    # Таблица курсов
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS courses (
-                            id SERIAL PRIMARY KEY,
-                            course_title VARCHAR(255) NOT NULL,
-                            target_audience VARCHAR(255) NOT NULL,
-                            duration_hours INTEGER,
-                            duration_weeks INTEGER,
-                            course_data JSONB NOT NULL,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """)
-                    
-                    # Таблица модулей с контентом
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS module_contents (
-                            id SERIAL PRIMARY KEY,
-                            course_id INTEGER NOT NULL,
-                            module_number INTEGER NOT NULL,
-                            module_title VARCHAR(255) NOT NULL,
-                            content_data JSONB NOT NULL,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
-                            UNIQUE (course_id, module_number)
-                        )
-                    """)
-                    
-                    # Таблица уроков с детальным контентом
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS lesson_contents (
-                            id SERIAL PRIMARY KEY,
-                            course_id INTEGER NOT NULL,
-                            module_number INTEGER NOT NULL,
-                            lesson_index INTEGER NOT NULL,
-                            lesson_title VARCHAR(255) NOT NULL,
-                            content_data JSONB NOT NULL,
-                            video_id TEXT,
-                            video_download_url TEXT,
-                            video_status TEXT,
-                            video_generated_at TIMESTAMP,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
-                            UNIQUE (course_id, module_number, lesson_index)
-                        )
-                    """)
-                    
-                    # Миграции для совместимости со старыми схемами таблицы
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS lesson_title VARCHAR(255)")
-                    except psycopg2.Error:
-                        pass
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ALTER COLUMN lesson_title SET DEFAULT ''")
-                    except psycopg2.Error:
-                        pass
-                    try:
-                        cursor.execute("UPDATE lesson_contents SET lesson_title = '' WHERE lesson_title IS NULL")
-                    except psycopg2.Error:
-                        pass
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ALTER COLUMN lesson_title SET NOT NULL")
-                    except psycopg2.Error:
-                        pass
-
-                    # Миграция: добавить module_title в module_contents (для БД, созданных до появления колонки)
-                    try:
-                        cursor.execute("ALTER TABLE module_contents ADD COLUMN IF NOT EXISTS module_title VARCHAR(255) DEFAULT ''")
-                    except psycopg2.Error:
-                        pass
-                    try:
-                        cursor.execute("UPDATE module_contents SET module_title = '' WHERE module_title IS NULL")
-                    except psycopg2.Error:
-                        pass
-                    try:
-                        cursor.execute("ALTER TABLE module_contents ALTER COLUMN module_title SET NOT NULL")
-                    except psycopg2.Error:
-                        pass
-
-                    # Добавляем колонки для видео, если их еще нет
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_id TEXT")
-                    except psycopg2.Error:
-                        pass
-                    
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_download_url TEXT")
-                    except psycopg2.Error:
-                        pass
-                    
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_status TEXT")
-                    except psycopg2.Error:
-                        pass
-                    
-                    try:
-                        cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_generated_at TIMESTAMP")
-                    except psycopg2.Error:
-                        pass
-                    
-                    # Создаем индексы для улучшения производительности
-                    cursor.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_courses_created_at 
-                        ON courses (created_at DESC)
-                    """)
-                    
-                    cursor.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_module_contents_course_id 
-                        ON module_contents (course_id)
-                    """)
-                    
-                    cursor.execute("""
-                        CREATE INDEX IF NOT EXISTS idx_lesson_contents_course_id 
-                        ON lesson_contents (course_id)
-                    """)
-                    
-                    conn.commit()
-                    logger.info("✅ PostgreSQL база данных инициализирована")
-                    
+                version = run_migrations(conn, POSTGRES_MIGRATIONS, "postgres")
+                logger.info(f"✅ PostgreSQL база данных инициализирована (схема v{version})")
         except psycopg2.Error as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
@@ -190,15 +86,17 @@ class RenderDatabase:
         Returns:
             ID созданного курса
         """
+        module_count, lesson_count = course_structure_counts(course_data)
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cursor:
                     
-                    cursor.execute("""
+                    cursor.execute(f"""
                         INSERT INTO courses (
                             course_title, target_audience, duration_hours, 
-                            duration_weeks, course_data, created_at, updated_at
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                            duration_weeks, course_data, module_count, lesson_count,
+                            search_vector, created_at, updated_at
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, {_SEARCH_VECTOR_SQL}, %s, %s)
                         RETURNING id
                     """, (
                         course_data.get('course_title', 'Без названия'),
@@ -206,6 +104,9 @@ class RenderDatabase:
                         course_data.get('duration_hours'),
                         course_data.get('duration_weeks'),
                         json.dumps(course_data, ensure_ascii=False),
+                        module_count,
+                        lesson_count,
+                        *course_search_text(course_data),
                         datetime.now(),
                         datetime.now()
                     ))
@@ -250,6 +151,7 @@ class RenderDatabase:
                         course_data['id'] = row['id']
                         course_data['created_at'] = row['created_at'].isoformat()
                         course_data['updated_at'] = row['updated_at'].isoformat()
+                        course_data['version'] = row['version']
                         return course_data
                     
                     return None
@@ -258,42 +160,52 @@ class RenderDatabase:
             logger.error(f"Ошибка получения курса: {e}")
             raise
     
-    def get_all_courses(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    def get_all_courses(
+        self, limit: int = 50, cursor: Optional[str] = None, search: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Получить список всех курсов
+        Получить список курсов со сводкой (новые первыми)
         
         Args:
             limit: Максимальное количество курсов
-            offset: Смещение для пагинации
+            cursor: Курсор из encode_cursor по последнему курсу предыдущей страницы
+            search: Поиск по словам (префиксам слов) в названиях курса, модулей и уроков
             
         Returns:
             Список курсов
         """
+        conditions = []
+        params: List[Any] = []
+        position = decode_cursor(cursor)
+        if position:
+            conditions.append("(created_at, id) < (%s::timestamp, %s)")
+            params.extend(position)
+        terms = search_terms(search)
+        if terms:
+            conditions.append("search_vector @@ to_tsquery('simple', %s)")
+            params.append(" & ".join(f"{term}:*" for term in terms))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
         try:
             with self._get_connection() as conn:
-                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                    
-                    cursor.execute("""
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as db_cursor:
+                    # Keyset-пагинация по индексу (created_at, id): без сканирования пропущенных строк, как при OFFSET
+                    db_cursor.execute(f"""
                         SELECT id, course_title, target_audience, 
-                               duration_hours, duration_weeks, created_at, updated_at
+                               duration_hours, duration_weeks, created_at, updated_at,
+                               {', '.join(SUMMARY_FIELDS)}
                         FROM courses
-                        ORDER BY created_at DESC
-                        LIMIT %s OFFSET %s
-                    """, (limit, offset))
-                    
-                    rows = cursor.fetchall()
+                        {where}
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s
+                    """, (*params, limit))
                     
                     courses = []
-                    for row in rows:
-                        courses.append({
-                            'id': row['id'],
-                            'course_title': row['course_title'],
-                            'target_audience': row['target_audience'],
-                            'duration_hours': row['duration_hours'],
-                            'duration_weeks': row['duration_weeks'],
-                            'created_at': row['created_at'].isoformat(),
-                            'updated_at': row['updated_at'].isoformat()
-                        })
+                    for row in db_cursor.fetchall():
+                        course = dict(row)
+                        course['created_at'] = row['created_at'].isoformat()
+                        course['updated_at'] = row['updated_at'].isoformat()
+                        courses.append(course)
                     
                     return courses
                     
@@ -301,48 +213,99 @@ class RenderDatabase:
             logger.error(f"Ошибка получения списка курсов: {e}")
             raise
     
-    def update_course(self, course_id: int, course_data: Dict[str, Any]) -> bool:
+    def _refresh_lesson_summary(self, cursor, course_id: int) -> None:
+        """Пересчитывает счётчики уроков курса (в той же транзакции, что и запись урока)"""
+        cursor.execute("""
+            UPDATE courses SET
+                lessons_with_content = s.lessons_with_content,
+                lessons_with_tests = s.lessons_with_tests,
+                videos_completed = s.videos_completed
+            FROM (
+                SELECT COUNT(*) AS lessons_with_content,
+                       COUNT(*) FILTER (
+                           WHERE content_data->'test' IS NOT NULL AND content_data->'test' <> 'null'::jsonb
+                       ) AS lessons_with_tests,
+                       COUNT(*) FILTER (WHERE video_status = 'completed') AS videos_completed
+                FROM lesson_contents
+                WHERE course_id = %s
+            ) AS s
+            WHERE courses.id = %s
+        """, (course_id, course_id))
+    
+    def update_course(
+        self, course_id: int, course_data: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
         """
         Обновить курс
         
         Args:
             course_id: ID курса
             course_data: Новые данные курса
+            expected_version: Версия, на основе которой сделаны изменения (None — записать безусловно)
             
         Returns:
-            True если обновление успешно
+            Новая версия курса или None, если курс не найден
+        
+        Raises:
+            CourseVersionConflict: курс изменён после чтения (версия не совпала)
         """
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cursor:
-                    
-                    cursor.execute("""
-                        UPDATE courses 
-                        SET course_title = %s, 
-                            target_audience = %s, 
-                            duration_hours = %s,
-                            duration_weeks = %s,
-                            course_data = %s,
-                            updated_at = %s
-                        WHERE id = %s
-                    """, (
-                        course_data.get('course_title', 'Без названия'),
-                        course_data.get('target_audience', 'Не указано'),
-                        course_data.get('duration_hours'),
-                        course_data.get('duration_weeks'),
-                        json.dumps(course_data, ensure_ascii=False),
-                        datetime.now(),
-                        course_id
-                    ))
+                    new_version = self._write_course(cursor, course_id, course_data, expected_version)
+                    if new_version is None:
+                        return None
                     
                     conn.commit()
                     
-                    return cursor.rowcount > 0
+                    return new_version
                     
         except psycopg2.Error as e:
             logger.error(f"Ошибка обновления курса: {e}")
             raise
     
+    @staticmethod
+    def _write_course(cursor, course_id: int, course_data: Dict[str, Any], expected_version: Optional[int]) -> Optional[int]:
+        """Записывает JSON курса с проверкой версии (без commit); None — курса нет"""
+        module_count, lesson_count = course_structure_counts(course_data)
+        cursor.execute(f"""
+            UPDATE courses 
+            SET course_title = %s, 
+                target_audience = %s, 
+                duration_hours = %s,
+                duration_weeks = %s,
+                course_data = %s,
+                module_count = %s,
+                lesson_count = %s,
+                search_vector = {_SEARCH_VECTOR_SQL},
+                updated_at = %s,
+                version = version + 1
+            WHERE id = %s AND (%s::int IS NULL OR version = %s)
+            RETURNING version
+        """, (
+            course_data.get('course_title', 'Без названия'),
+            course_data.get('target_audience', 'Не указано'),
+            course_data.get('duration_hours'),
+            course_data.get('duration_weeks'),
+            json.dumps(course_data, ensure_ascii=False),
+            module_count,
+            lesson_count,
+            *course_search_text(course_data),
+            datetime.now(),
+            course_id,
+            expected_version,
+            expected_version
+        ))
+        row = cursor.fetchone()
+        if row is None:
+            if expected_version is not None:
+                cursor.execute("SELECT version FROM courses WHERE id = %s", (course_id,))
+                current = cursor.fetchone()
+                if current is not None:
+                    raise CourseVersionConflict(course_id, expected_version, current[0])
+            return None
+        return row[0]
+    
     def delete_course(self, course_id: int) -> bool:
         """
         Удалить курс
@@ -388,43 +351,22 @@ class RenderDatabase:
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cursor:
-                    
-                    # Проверяем, существует ли уже контент для этого модуля
+                    # Один запрос вместо SELECT + INSERT/UPDATE: без гонки на UNIQUE (course_id, module_number)
                     cursor.execute("""
-                        SELECT id FROM module_contents 
-                        WHERE course_id = %s AND module_number = %s
-                    """, (course_id, module_number))
-                    
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # Обновляем существующий
-                        cursor.execute("""
-                            UPDATE module_contents 
-                            SET module_title = %s, content_data = %s
-                            WHERE course_id = %s AND module_number = %s
-                        """, (
-                            module_title,
-                            json.dumps(content_data, ensure_ascii=False),
-                            course_id,
-                            module_number
-                        ))
-                        record_id = existing[0]
-                    else:
-                        # Создаем новый
-                        cursor.execute("""
-                            INSERT INTO module_contents (
-                                course_id, module_number, module_title, content_data
-                            ) VALUES (%s, %s, %s, %s)
-                            RETURNING id
-                        """, (
-                            course_id,
-                            module_number,
-                            module_title,
-                            json.dumps(content_data, ensure_ascii=False)
-                        ))
-                        record_id = cursor.fetchone()[0]
-                    
+                        INSERT INTO module_contents (
+                            course_id, module_number, module_title, content_data
+                        ) VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (course_id, module_number) DO UPDATE SET
+                            module_title = EXCLUDED.module_title,
+                            content_data = EXCLUDED.content_data
+                        RETURNING id
+                    """, (
+                        course_id,
+                        module_number,
+                        module_title,
+                        json.dumps(content_data, ensure_ascii=False)
+                    ))
+                    record_id = cursor.fetchone()[0]
                     conn.commit()
                     logger.info(f"✅ Контент модуля {module_number} сохранен (ID: {record_id})")
                     return record_id
@@ -493,45 +435,23 @@ class RenderDatabase:
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cursor:
-                    
-                    # Проверяем существование
                     cursor.execute("""
-                        SELECT id FROM lesson_contents
-                        WHERE course_id = %s AND module_number = %s AND lesson_index = %s
-                    """, (course_id, module_number, lesson_index))
-                    
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # Обновляем
-                        cursor.execute("""
-                            UPDATE lesson_contents
-                            SET lesson_title = %s, content_data = %s
-                            WHERE course_id = %s AND module_number = %s AND lesson_index = %s
-                        """, (
-                            lesson_title,
-                            json.dumps(content_data, ensure_ascii=False),
-                            course_id,
-                            module_number,
-                            lesson_index
-                        ))
-                        record_id = existing[0]
-                    else:
-                        # Создаем новый
-                        cursor.execute("""
-                            INSERT INTO lesson_contents (
-                                course_id, module_number, lesson_index, lesson_title, content_data
-                            ) VALUES (%s, %s, %s, %s, %s)
-                            RETURNING id
-                        """, (
-                            course_id,
-                            module_number,
-                            lesson_index,
-                            lesson_title,
-                            json.dumps(content_data, ensure_ascii=False)
-                        ))
-                        record_id = cursor.fetchone()[0]
-                    
+                        INSERT INTO lesson_contents (
+                            course_id, module_number, lesson_index, lesson_title, content_data
+                        ) VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                            lesson_title = EXCLUDED.lesson_title,
+                            content_data = EXCLUDED.content_data
+                        RETURNING id
+                    """, (
+                        course_id,
+                        module_number,
+                        lesson_index,
+                        lesson_title,
+                        json.dumps(content_data, ensure_ascii=False)
+                    ))
+                    record_id = cursor.fetchone()[0]
+                    self._refresh_lesson_summary(cursor, course_id)
                     conn.commit()
                     logger.info(f"✅ Контент урока {lesson_index} сохранен (ID: {record_id})")
                     return record_id
@@ -614,43 +534,27 @@ class RenderDatabase:
             ID созданной/обновленной записи
         """
         try:
-            import json
             with self._get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Получаем существующий контент, если есть
-                    existing_content = self.get_lesson_content(course_id, module_number, lesson_index)
-                    
-                    if existing_content:
-                        # Обновляем существующий контент, добавляя/обновляя тест
-                        existing_content['test'] = test_data
-                        cursor.execute("""
-                            UPDATE lesson_contents
-                            SET content_data = %s
-                            WHERE course_id = %s AND module_number = %s AND lesson_index = %s
-                        """, (
-                            json.dumps(existing_content, ensure_ascii=False),
-                            course_id,
-                            module_number,
-                            lesson_index
-                        ))
-                        record_id = cursor.rowcount
-                    else:
-                        # Создаем новый контент только с тестом
-                        content_data = {'test': test_data}
-                        cursor.execute("""
-                            INSERT INTO lesson_contents (
-                                course_id, module_number, lesson_index, lesson_title, content_data
-                            ) VALUES (%s, %s, %s, %s, %s)
-                            RETURNING id
-                        """, (
-                            course_id,
-                            module_number,
-                            lesson_index,
-                            lesson_title,
-                            json.dumps(content_data, ensure_ascii=False)
-                        ))
-                        record_id = cursor.fetchone()[0]
-                    
+                    # Тест вливается в content_data на стороне БД (jsonb_set), без чтения блоба
+                    test_json = json.dumps(test_data, ensure_ascii=False)
+                    cursor.execute("""
+                        INSERT INTO lesson_contents (
+                            course_id, module_number, lesson_index, lesson_title, content_data
+                        ) VALUES (%s, %s, %s, %s, jsonb_build_object('test', %s::jsonb))
+                        ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                            content_data = jsonb_set(lesson_contents.content_data, '{test}', %s::jsonb)
+                        RETURNING id
+                    """, (
+                        course_id,
+                        module_number,
+                        lesson_index,
+                        lesson_title,
+                        test_json,
+                        test_json
+                    ))
+                    record_id = cursor.fetchone()[0]
+                    self._refresh_lesson_summary(cursor, course_id)
                     conn.commit()
                     logger.info(f"✅ Тест для урока {lesson_index} сохранен (ID: {record_id})")
                     return record_id
@@ -676,10 +580,19 @@ class RenderDatabase:
         Returns:
             Данные теста или None
         """
-        content_data = self.get_lesson_content(course_id, module_number, lesson_index)
-        if content_data and 'test' in content_data:
-            return content_data['test']
-        return None
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Проекция на стороне БД: забираем только тест, а не весь контент урока
+                    cursor.execute("""
+                        SELECT content_data->'test' FROM lesson_contents
+                        WHERE course_id = %s AND module_number = %s AND lesson_index = %s
+                    """, (course_id, module_number, lesson_index))
+                    row = cursor.fetchone()
+                    return row[0] if row and row[0] is not None else None
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка получения теста урока: {e}")
+            return None
     
     def get_lesson_video_info(
         self,
@@ -751,12 +664,217 @@ class RenderDatabase:
                         """,
                         (course_id, module_number, lesson_index),
                     )
+                    deleted = cursor.rowcount
+                    self._refresh_lesson_summary(cursor, course_id)
                     conn.commit()
-                    return cursor.rowcount
+                    return deleted
         except psycopg2.Error as e:
             logger.error(f"Ошибка удаления контента урока: {e}")
             raise
 
+    def delete_lesson(self, course_id: int, module_number: int, lesson_index: int) -> Optional[int]:
+        """
+        Удалить урок из структуры курса вместе с его контентом (одна транзакция)
+        
+        Урок вырезается из JSONB курса на стороне БД (оператор #-), контент урока удаляется,
+        а контент последующих уроков модуля сдвигается на одну позицию — lesson_index
+        в lesson_contents остаётся согласованным с порядком уроков в курсе.
+        
+        Returns:
+            Новая версия курса или None, если курс/модуль/урок не найден
+        """
+        if lesson_index < 0:
+            return None
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        WITH target AS (
+                            SELECT ARRAY['modules', (m.ordinality - 1)::text, 'lessons', %s::text] AS path
+                            FROM courses c
+                            CROSS JOIN LATERAL jsonb_array_elements(
+                                COALESCE(c.course_data->'modules', '[]'::jsonb)) WITH ORDINALITY AS m(value, ordinality)
+                            WHERE c.id = %s AND (m.value->>'module_number')::int = %s
+                            LIMIT 1
+                        )
+                        UPDATE courses SET
+                            course_data = course_data #- (SELECT path FROM target),
+                            lesson_count = lesson_count - 1,
+                            updated_at = %s,
+                            version = version + 1
+                        WHERE id = %s AND course_data #> (SELECT path FROM target) IS NOT NULL
+                        RETURNING version, course_data
+                    """, (lesson_index, course_id, module_number, datetime.now(), course_id))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return None
+                    new_version, course_data = row
+                    cursor.execute(
+                        f"UPDATE courses SET search_vector = {_SEARCH_VECTOR_SQL} WHERE id = %s",
+                        (*course_search_text(course_data), course_id),
+                    )
+                    
+                    cursor.execute("""
+                        DELETE FROM lesson_contents
+                        WHERE course_id = %s AND module_number = %s AND lesson_index = %s
+                    """, (course_id, module_number, lesson_index))
+                    self._shift_down(
+                        cursor, "lesson_contents", "lesson_index", lesson_index,
+                        "course_id = %s AND module_number = %s", (course_id, module_number),
+                    )
+                    self._refresh_lesson_summary(cursor, course_id)
+                    conn.commit()
+                    logger.info(f"✅ Урок {module_number}/{lesson_index} удалён из курса {course_id} (версия {new_version})")
+                    return new_version
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка удаления урока: {e}")
+            raise
+
+    @staticmethod
+    def _shift_down(cursor, table: str, column: str, after: int, scope_sql: str, scope_params: tuple) -> None:
+        """
+        Уменьшает на 1 значения column > after в пределах scope.
+        
+        Сдвиг в два шага (через отрицательные значения): UNIQUE проверяется построчно,
+        и прямое `column = column - 1` может столкнуться с ещё не сдвинутой строкой.
+        """
+        cursor.execute(
+            f"UPDATE {table} SET {column} = -{column} WHERE {scope_sql} AND {column} > %s",
+            (*scope_params, after),
+        )
+        cursor.execute(
+            f"UPDATE {table} SET {column} = -{column} - 1 WHERE {scope_sql} AND {column} < 0",
+            scope_params,
+        )
+
+    def duplicate_module(
+        self,
+        course_id: int,
+        course_data: Dict[str, Any],
+        expected_version: Optional[int],
+        src_module_number: int,
+        dst_module_number: int,
+        module_title: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Записать курс с модулем-копией и скопировать детальный контент модуля и уроков (одна транзакция)
+        
+        Если копирование контента не удалось, не записывается и структура курса —
+        модуль-копия без контента не появляется.
+        
+        Args:
+            course_id: ID курса
+            course_data: JSON курса, уже содержащий модуль-копию
+            expected_version: Версия, на основе которой сделаны изменения
+            src_module_number: Номер исходного модуля
+            dst_module_number: Номер модуля-копии
+            module_title: Название модуля-копии (по умолчанию — как у исходного)
+            
+        Returns:
+            Новая версия курса или None, если курс не найден
+        
+        Raises:
+            CourseVersionConflict: курс изменён после чтения (версия не совпала)
+        """
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    new_version = self._write_course(cursor, course_id, course_data, expected_version)
+                    if new_version is None:
+                        return None
+                    cursor.execute("""
+                        INSERT INTO module_contents (course_id, module_number, module_title, content_data)
+                        SELECT course_id, %s, COALESCE(%s, module_title), content_data
+                        FROM module_contents
+                        WHERE course_id = %s AND module_number = %s
+                        ON CONFLICT (course_id, module_number) DO UPDATE SET
+                            module_title = EXCLUDED.module_title,
+                            content_data = EXCLUDED.content_data
+                    """, (dst_module_number, module_title, course_id, src_module_number))
+                    cursor.execute("""
+                        INSERT INTO lesson_contents (course_id, module_number, lesson_index, lesson_title, content_data)
+                        SELECT course_id, %s, lesson_index, lesson_title, content_data
+                        FROM lesson_contents
+                        WHERE course_id = %s AND module_number = %s
+                        ON CONFLICT (course_id, module_number, lesson_index) DO UPDATE SET
+                            lesson_title = EXCLUDED.lesson_title,
+                            content_data = EXCLUDED.content_data
+                    """, (dst_module_number, course_id, src_module_number))
+                    copied = cursor.rowcount
+                    self._refresh_lesson_summary(cursor, course_id)
+                    conn.commit()
+                    logger.info(
+                        f"✅ Модуль {src_module_number} скопирован в модуль {dst_module_number} "
+                        f"вместе с контентом (уроков: {copied}, версия {new_version})"
+                    )
+                    return new_version
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка дублирования модуля: {e}")
+            raise
+
+    def delete_module(self, course_id: int, module_number: int) -> Optional[int]:
+        """
+        Удалить модуль из курса вместе с контентом и сдвинуть номера последующих модулей (одна транзакция)
+        
+        Returns:
+            Новая версия курса или None, если курс/модуль не найден
+        """
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Читаем и переписываем структуру под блокировкой строки курса
+                    cursor.execute("SELECT course_data FROM courses WHERE id = %s FOR UPDATE", (course_id,))
+                    row = cursor.fetchone()
+                    course_data = row[0] if row else None
+                    modules = (course_data or {}).get('modules') or []
+                    if not any(int(m.get('module_number', -1)) == int(module_number) for m in modules):
+                        conn.rollback()
+                        return None
+                    
+                    remaining = []
+                    for m in modules:
+                        number = int(m.get('module_number', -1))
+                        if number == int(module_number):
+                            continue
+                        if number > module_number:
+                            m['module_number'] = number - 1
+                        remaining.append(m)
+                    course_data['modules'] = remaining
+                    module_count, lesson_count = course_structure_counts(course_data)
+                    cursor.execute(f"""
+                        UPDATE courses SET
+                            course_data = %s,
+                            module_count = %s,
+                            lesson_count = %s,
+                            search_vector = {_SEARCH_VECTOR_SQL},
+                            updated_at = %s,
+                            version = version + 1
+                        WHERE id = %s
+                        RETURNING version
+                    """, (
+                        json.dumps(course_data, ensure_ascii=False),
+                        module_count,
+                        lesson_count,
+                        *course_search_text(course_data),
+                        datetime.now(),
+                        course_id
+                    ))
+                    new_version = cursor.fetchone()[0]
+                    
+                    for table in ("module_contents", "lesson_contents"):
+                        cursor.execute(
+                            f"DELETE FROM {table} WHERE course_id = %s AND module_number = %s",
+                            (course_id, module_number),
+                        )
+                        self._shift_down(cursor, table, "module_number", module_number, "course_id = %s", (course_id,))
+                    self._refresh_lesson_summary(cursor, course_id)
+                    conn.commit()
+                    logger.info(f"✅ Модуль {module_number} удалён из курса {course_id} (версия {new_version})")
+                    return new_version
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка удаления модуля: {e}")
+            raise
+
     def delete_module_content(self, course_id: int, module_number: int) -> int:
         """Удалить запись детального контента модуля."""
         try:
@@ -787,8 +905,10 @@ class RenderDatabase:
                         """,
                         (course_id, module_number),
                     )
+                    deleted = cursor.rowcount
+                    self._refresh_lesson_summary(cursor, course_id)
                     conn.commit()
-                    return cursor.rowcount
+                    return deleted
         except psycopg2.Error as e:
             logger.error(f"Ошибка удаления контента уроков: {e}")
             raise
@@ -858,6 +978,8 @@ class RenderDatabase:
                                 SET {', '.join(update_fields)}
                                 WHERE course_id = %s AND module_number = %s AND lesson_index = %s
                             """, params)
+                            if video_status is not None:
+                                self._refresh_lesson_summary(cursor, course_id)
                             conn.commit()
                             logger.info(f"Обновлена информация о видео для урока {course_id}/{module_number}/{lesson_index}")
                             return True
@@ -878,44 +1000,163 @@ class RenderDatabase:
         video_id: Optional[str] = None,
         video_status: Optional[str] = None,
         video_download_url: Optional[str] = None,
+        slide_part: Optional[int] = None,
     ) -> bool:
         """
         Обновляет информацию о видео для слайда урока (в content_data.slides[slide_index]).
+
+        Массив слайдов не дополняется: если слайда с таким индексом нет, ничего не пишется.
+        Со 2-й части озвучки видео пишется в slides[i].video_parts["<N>"].
         """
-        content_data = self.get_lesson_content(course_id, module_number, lesson_index)
-        if not content_data:
-            logger.warning(f"Контент урока {course_id}/{module_number}/{lesson_index} не найден")
-            return False
-        slides = content_data.get("slides") or []
-        if not isinstance(slides, list):
-            slides = []
-        while len(slides) <= slide_index:
-            slides.append({"slide_number": len(slides) + 1, "title": "", "content": ""})
-        slide = slides[slide_index]
-        if not isinstance(slide, dict):
-            slide = {"slide_number": slide_index + 1, "title": "", "content": ""}
-            slides[slide_index] = slide
-        if video_id is not None:
-            slide["video_id"] = video_id
-        if video_status is not None:
-            slide["video_status"] = video_status
-        if video_download_url is not None:
-            slide["video_download_url"] = video_download_url
-        content_data["slides"] = slides
-        course_data = self.get_course(course_id)
-        if not course_data:
-            return False
-        modules = course_data.get("modules") or []
-        module = next((m for m in modules if int(m.get("module_number", -1)) == int(module_number)), None)
-        if not module:
-            return False
-        lessons = module.get("lessons") or []
-        if lesson_index < 0 or lesson_index >= len(lessons):
-            return False
-        lesson_title = lessons[lesson_index].get("lesson_title") or "Урок"
-        self.save_lesson_content(course_id, module_number, lesson_index, lesson_title, content_data)
-        logger.info(f"Обновлена информация о видео для слайда {slide_index} урока {course_id}/{module_number}/{lesson_index}")
-        return True
+        patch = slide_video_patch(video_id, video_status, video_download_url, slide_part)
+        if not patch:
+            return True
+        slide_index = int(slide_index)
+        # Оператор || сливает объекты только на верхнем уровне — video_parts дополняем отдельно
+        parts_patch = patch.pop("video_parts", None)
+        merged_sql = "(content_data->'slides'->%s) || %s::jsonb"
+        params = [slide_index, slide_index, json.dumps(patch, ensure_ascii=False)]
+        if parts_patch:
+            merged_sql += (
+                " || jsonb_build_object('video_parts', "
+                "COALESCE(content_data->'slides'->%s->'video_parts', '{}'::jsonb) || %s::jsonb)"
+            )
+            params += [slide_index, json.dumps(parts_patch, ensure_ascii=False)]
+        params += [course_id, module_number, lesson_index, slide_index]
+
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Частичное обновление одним выражением: jsonb_set + слияние патча в объект слайда
+                    cursor.execute(f"""
+                        UPDATE lesson_contents
+                        SET content_data = jsonb_set(content_data, ARRAY['slides', %s::text], {merged_sql})
+                        WHERE course_id = %s AND module_number = %s AND lesson_index = %s
+                          AND jsonb_typeof(content_data->'slides'->%s) = 'object'
+                    """, params)
+                    if not cursor.rowcount:
+                        conn.rollback()
+                        logger.warning(f"Слайд {slide_index} урока {course_id}/{module_number}/{lesson_index} не найден, видео не сохранено")
+                        return False
+                    conn.commit()
+            logger.info(f"Обновлена информация о видео для слайда {slide_index} урока {course_id}/{module_number}/{lesson_index}")
+            return True
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка обновления информации о видео слайда: {e}")
+            raise
+
+    def get_lessons_video_overview(
+        self,
+        course_id: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Плоский список уроков курсов с информацией о видео (проекция на стороне БД)
+        
+        Модули и уроки разворачиваются из course_data через jsonb_array_elements,
+        в Python не загружаются целые документы курсов.
+        
+        Args:
+            course_id: ID курса (None — последние `limit` курсов)
+            limit: Максимальное количество курсов
+            
+        Returns:
+            Список строк: course_id, course_title, module_number, module_title,
+            lesson_index, lesson_title, video_id, video_status, video_download_url
+        """
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                    cursor.execute("""
+                        SELECT c.id AS course_id,
+                               c.course_title,
+                               (m.value->>'module_number')::int AS module_number,
+                               m.value->>'module_title' AS module_title,
+                               (l.ordinality - 1)::int AS lesson_index,
+                               l.value->>'lesson_title' AS lesson_title,
+                               lc.video_id,
+                               lc.video_status,
+                               lc.video_download_url
+                        FROM (
+                            SELECT id, course_title, course_data, created_at FROM courses
+                            WHERE %s::int IS NULL OR id = %s::int
+                            ORDER BY created_at DESC
+                            LIMIT %s
+                        ) c
+                        CROSS JOIN LATERAL jsonb_array_elements(
+                            COALESCE(c.course_data->'modules', '[]'::jsonb)) AS m(value)
+                        CROSS JOIN LATERAL jsonb_array_elements(
+                            COALESCE(m.value->'lessons', '[]'::jsonb)) WITH ORDINALITY AS l(value, ordinality)
+                        LEFT JOIN lesson_contents lc
+                               ON lc.course_id = c.id
+                              AND lc.module_number = (m.value->>'module_number')::int
+                              AND lc.lesson_index = l.ordinality - 1
+                        ORDER BY c.created_at DESC, module_number, lesson_index
+                    """, (course_id, course_id, limit))
+                    return [dict(row) for row in cursor.fetchall()]
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка получения сводки видео по урокам: {e}")
+            raise
+
+
+    # ------------------------------------------------------------------
+    # Телеметрия вызовов AI
+    # ------------------------------------------------------------------
+
+    def save_ai_calls(self, records: List[Dict[str, Any]]) -> int:
+        """Записать пачку записей телеметрии AI одной транзакцией
+
+        Args:
+            records: Записи из backend/ai/telemetry.py (created_at — datetime в UTC)
+
+        Returns:
+            Количество записанных строк
+        """
+        if not records:
+            return 0
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        f"INSERT INTO ai_calls ({', '.join(AI_CALL_FIELDS)}) VALUES %s",
+                        [tuple(record.get(field) for field in AI_CALL_FIELDS) for record in records],
+                    )
+                    conn.commit()
+                    return len(records)
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка записи телеметрии AI: {e}")
+            raise
+
+    def get_ai_call_stats(self, since: datetime, group_by: str) -> List[Dict[str, Any]]:
+        """Счётчики и суммы телеметрии AI не старше since (UTC) по группам group_by, outcome и cache_hit"""
+        return self._fetch_ai_call_summary(ai_call_stats_sql(group_by, "%s"), since)
+
+    def get_ai_call_latency_ranks(self, since: datetime, group_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Задержки вызовов модели на рангах перцентилей (group_by=None — по всем вызовам)"""
+        return self._fetch_ai_call_summary(ai_call_latency_ranks_sql(group_by, "%s"), since)
+
+    def _fetch_ai_call_summary(self, sql: str, since: datetime) -> List[Dict[str, Any]]:
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                    cursor.execute(sql, (since,))
+                    return [dict(row) for row in cursor.fetchall()]
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка чтения телеметрии AI: {e}")
+            raise
+
+    def delete_ai_calls_before(self, before: datetime) -> int:
+        """Удалить записи телеметрии AI старше before (UTC); возвращает число удалённых"""
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM ai_calls WHERE created_at < %s", (before,))
+                    conn.commit()
+                    return cursor.rowcount
+        except psycopg2.Error as e:
+            logger.error(f"Ошибка очистки телеметрии AI: {e}")
+            raise
 
 
 # Функция для создания экземпляра базы данных
@@ -0,0 +1,443 @@
+"""
+Версионированные миграции схемы БД (SQLite и PostgreSQL).
+
+Как устроено:
+- таблица `schema_version` хранит номера применённых миграций;
+- миграции пронумерованы и применяются по порядку, каждая — один раз;
+- при старте выполняется одна проверка версии; DDL и тяжёлые UPDATE
+  запускаются только если есть неприменённые миграции.
+
+Миграции написаны идемпотентно (IF NOT EXISTS, проверка наличия колонок), поэтому
+БД, созданные до появления `schema_version`, корректно доводятся до текущей версии.
+
+Чтобы изменить схему, добавьте новую миграцию в конец `SQLITE_MIGRATIONS`
+и/или `POSTGRES_MIGRATIONS` со следующим номером.
+"""
+import logging
+from typing import Any, Callable, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Any], None]  # Получает курсор открытой транзакции
+
+
+# ============================================================================
+# SQLite
+# ============================================================================
+
+def _sqlite_add_column(cursor, table: str, column: str, definition: str) -> None:
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _sqlite_001_initial(cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_title TEXT NOT NULL,
+            target_audience TEXT NOT NULL,
+            duration_hours INTEGER,
+            duration_weeks INTEGER,
+            course_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS module_contents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER NOT NULL,
+            module_number INTEGER NOT NULL,
+            module_title TEXT NOT NULL,
+            content_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+            UNIQUE (course_id, module_number)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lesson_contents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER NOT NULL,
+            module_number INTEGER NOT NULL,
+            lesson_index INTEGER NOT NULL,
+            lesson_title TEXT NOT NULL,
+            content_data TEXT NOT NULL,
+            video_id TEXT,
+            video_download_url TEXT,
+            video_status TEXT,
+            video_generated_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+            UNIQUE (course_id, module_number, lesson_index)
+        )
+    """)
+    # Колонки видео для БД, созданных до их появления
+    _sqlite_add_column(cursor, "lesson_contents", "video_id", "TEXT")
+    _sqlite_add_column(cursor, "lesson_contents", "video_download_url", "TEXT")
+    _sqlite_add_column(cursor, "lesson_contents", "video_status", "TEXT")
+    _sqlite_add_column(cursor, "lesson_contents", "video_generated_at", "TIMESTAMP")
+
+
+def _sqlite_002_indexes(cursor) -> None:
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_created_at ON courses (created_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_contents_video_id ON lesson_contents (video_id)")
+
+
+def _sqlite_003_course_summary(cursor) -> None:
+    for column in (
+        "module_count", "lesson_count", "lessons_with_content", "lessons_with_tests", "videos_completed",
+    ):
+        _sqlite_add_column(cursor, "courses", column, "INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_created_at_id ON courses (created_at DESC, id DESC)")
+    # Заполняем сводку для существующих курсов
+    cursor.execute("""
+        UPDATE courses SET
+            module_count = COALESCE(json_array_length(course_data, '$.modules'), 0),
+            lesson_count = COALESCE((
+                SELECT SUM(json_array_length(m.value, '$.lessons'))
+                FROM json_each(courses.course_data, '$.modules') AS m
+            ), 0),
+            lessons_with_content = (
+                SELECT COUNT(*) FROM lesson_contents l WHERE l.course_id = courses.id
+            ),
+            lessons_with_tests = (
+                SELECT COUNT(*) FROM lesson_contents l
+                WHERE l.course_id = courses.id AND json_extract(l.content_data, '$.test') IS NOT NULL
+            ),
+            videos_completed = (
+                SELECT COUNT(*) FROM lesson_contents l
+                WHERE l.course_id = courses.id AND l.video_status = 'completed'
+            )
+    """)
+
+
+def _sqlite_004_course_search(cursor) -> None:
+    # rowid = courses.id; индекс поддерживается при записи курса (CourseDatabase._index_course_search)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+            course_title, module_titles, lesson_titles,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("DELETE FROM courses_fts")
+    cursor.execute("""
+        INSERT INTO courses_fts (rowid, course_title, module_titles, lesson_titles)
+        SELECT c.id,
+               c.course_title,
+               COALESCE((
+                   SELECT group_concat(json_extract(m.value, '$.module_title'), ' ')
+                   FROM json_each(c.course_data, '$.modules') AS m
+               ), ''),
+               COALESCE((
+                   SELECT group_concat(json_extract(l.value, '$.lesson_title'), ' ')
+                   FROM json_each(c.course_data, '$.modules') AS m,
+                        json_each(m.value, '$.lessons') AS l
+               ), '')
+        FROM courses c
+    """)
+
+
+def _sqlite_005_course_version(cursor) -> None:
+    _sqlite_add_column(cursor, "courses", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _sqlite_006_ai_calls(cursor) -> None:
+    # Без внешнего ключа на courses: телеметрия переживает удаление курса
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            task TEXT NOT NULL,
+            route TEXT,
+            course_id INTEGER,
+            model TEXT,
+            prompt_version TEXT,
+            latency_ms INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached_tokens INTEGER,
+            total_tokens INTEGER,
+            cache_hit INTEGER NOT NULL DEFAULT 0,
+            retries INTEGER NOT NULL DEFAULT 0,
+            outcome TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_created_at ON ai_calls (created_at)")
+
+
+SQLITE_MIGRATIONS: List[Migration] = [
+    Migration(1, "Начальная схема: courses, module_contents, lesson_contents + колонки видео", _sqlite_001_initial),
+    Migration(2, "Индексы для списка курсов и поиска урока по video_id", _sqlite_002_indexes),
+    Migration(3, "Сводка по курсу в courses и индекс для keyset-пагинации", _sqlite_003_course_summary),
+    Migration(4, "Полнотекстовый индекс FTS5 по названиям курса, модулей и уроков", _sqlite_004_course_search),
+    Migration(5, "Версия курса для оптимистичной блокировки", _sqlite_005_course_version),
+    Migration(6, "Телеметрия вызовов AI (ai_calls)", _sqlite_006_ai_calls),
+]
+
+
+# ============================================================================
+# PostgreSQL
+# ============================================================================
+
+def _pg_001_initial(cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS courses (
+            id SERIAL PRIMARY KEY,
+            course_title VARCHAR(255) NOT NULL,
+            target_audience VARCHAR(255) NOT NULL,
+            duration_hours INTEGER,
+            duration_weeks INTEGER,
+            course_data JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS module_contents (
+            id SERIAL PRIMARY KEY,
+            course_id INTEGER NOT NULL,
+            module_number INTEGER NOT NULL,
+            module_title VARCHAR(255) NOT NULL,
+            content_data JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+            UNIQUE (course_id, module_number)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lesson_contents (
+            id SERIAL PRIMARY KEY,
+            course_id INTEGER NOT NULL,
+            module_number INTEGER NOT NULL,
+            lesson_index INTEGER NOT NULL,
+            lesson_title VARCHAR(255) NOT NULL,
+            content_data JSONB NOT NULL,
+            video_id TEXT,
+            video_download_url TEXT,
+            video_status TEXT,
+            video_generated_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses (id) ON DELETE CASCADE,
+            UNIQUE (course_id, module_number, lesson_index)
+        )
+    """)
+
+
+def _pg_002_legacy_columns(cursor) -> None:
+    """Колонки, которых не было в старых схемах (раньше прогонялось при каждом старте)"""
+    cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS lesson_title VARCHAR(255)")
+    cursor.execute("ALTER TABLE lesson_contents ALTER COLUMN lesson_title SET DEFAULT ''")
+    cursor.execute("UPDATE lesson_contents SET lesson_title = '' WHERE lesson_title IS NULL")
+    cursor.execute("ALTER TABLE lesson_contents ALTER COLUMN lesson_title SET NOT NULL")
+
+    cursor.execute("ALTER TABLE module_contents ADD COLUMN IF NOT EXISTS module_title VARCHAR(255) DEFAULT ''")
+    cursor.execute("UPDATE module_contents SET module_title = '' WHERE module_title IS NULL")
+    cursor.execute("ALTER TABLE module_contents ALTER COLUMN module_title SET NOT NULL")
+
+    cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_id TEXT")
+    cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_download_url TEXT")
+    cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_status TEXT")
+    cursor.execute("ALTER TABLE lesson_contents ADD COLUMN IF NOT EXISTS video_generated_at TIMESTAMP")
+
+
+def _pg_003_jsonb(cursor) -> None:
+    """Старые БД хранили JSON в TEXT — переводим в JSONB"""
+    for table, column in (
+        ("courses", "course_data"),
+        ("module_contents", "content_data"),
+        ("lesson_contents", "content_data"),
+    ):
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = %s AND column_name = %s
+        """, (table, column))
+        column_type = cursor.fetchone()
+        if column_type and column_type[0] != "jsonb":
+            logger.info(f"🔧 Миграция {table}.{column}: {column_type[0]} -> JSONB")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb")
+
+
+def _pg_004_indexes(cursor) -> None:
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_created_at ON courses (created_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_module_contents_course_id ON module_contents (course_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_contents_course_id ON lesson_contents (course_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_contents_video_id ON lesson_contents (video_id)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_courses_course_data_gin
+        ON courses USING GIN (course_data jsonb_path_ops)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lesson_contents_content_data_gin
+        ON lesson_contents USING GIN (content_data jsonb_path_ops)
+    """)
+
+
+def _pg_005_course_summary(cursor) -> None:
+    cursor.execute("""
+        ALTER TABLE courses
+            ADD COLUMN IF NOT EXISTS module_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS lesson_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS lessons_with_content INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS lessons_with_tests INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS videos_completed INTEGER NOT NULL DEFAULT 0
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_created_at_id ON courses (created_at DESC, id DESC)")
+    # Заполняем сводку для существующих курсов
+    cursor.execute("""
+        UPDATE courses c SET
+            module_count = COALESCE(jsonb_array_length(c.course_data->'modules'), 0),
+            lesson_count = COALESCE((
+                SELECT SUM(jsonb_array_length(COALESCE(m.value->'lessons', '[]'::jsonb)))
+                FROM jsonb_array_elements(COALESCE(c.course_data->'modules', '[]'::jsonb)) AS m(value)
+            ), 0),
+            lessons_with_content = s.lessons_with_content,
+            lessons_with_tests = s.lessons_with_tests,
+            videos_completed = s.videos_completed
+        FROM (
+            SELECT courses.id AS course_id,
+                   COUNT(l.id) AS lessons_with_content,
+                   COUNT(l.id) FILTER (
+                       WHERE l.content_data->'test' IS NOT NULL AND l.content_data->'test' <> 'null'::jsonb
+                   ) AS lessons_with_tests,
+                   COUNT(l.id) FILTER (WHERE l.video_status = 'completed') AS videos_completed
+            FROM courses
+            LEFT JOIN lesson_contents l ON l.course_id = courses.id
+            GROUP BY courses.id
+        ) AS s
+        WHERE s.course_id = c.id
+    """)
+
+
+def _pg_006_course_search(cursor) -> None:
+    # Веса: A — название курса, B — модули, C — уроки; поддерживается при записи курса
+    cursor.execute("ALTER TABLE courses ADD COLUMN IF NOT EXISTS search_vector tsvector")
+    cursor.execute("""
+        UPDATE courses c SET search_vector =
+            setweight(to_tsvector('simple', COALESCE(c.course_title, '')), 'A')
+            || setweight(to_tsvector('simple', COALESCE((
+                SELECT string_agg(m.value->>'module_title', ' ')
+                FROM jsonb_array_elements(COALESCE(c.course_data->'modules', '[]'::jsonb)) AS m(value)
+            ), '')), 'B')
+            || setweight(to_tsvector('simple', COALESCE((
+                SELECT string_agg(l.value->>'lesson_title', ' ')
+                FROM jsonb_array_elements(COALESCE(c.course_data->'modules', '[]'::jsonb)) AS m(value)
+                CROSS JOIN LATERAL jsonb_array_elements(COALESCE(m.value->'lessons', '[]'::jsonb)) AS l(value)
+            ), '')), 'C')
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_courses_search_vector ON courses USING GIN (search_vector)")
+
+
+def _pg_007_course_version(cursor) -> None:
+    cursor.execute("ALTER TABLE courses ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+
+def _pg_008_ai_calls(cursor) -> None:
+    # Без внешнего ключа на courses: телеметрия переживает удаление курса
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_calls (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL,
+            task VARCHAR(64) NOT NULL,
+            route TEXT,
+            course_id INTEGER,
+            model VARCHAR(255),
+            prompt_version VARCHAR(64),
+            latency_ms INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            cached_tokens INTEGER,
+            total_tokens INTEGER,
+            cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+            retries INTEGER NOT NULL DEFAULT 0,
+            outcome VARCHAR(32) NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_created_at ON ai_calls (created_at)")
+
+
+POSTGRES_MIGRATIONS: List[Migration] = [
+    Migration(1, "Начальная схема: courses, module_contents, lesson_contents", _pg_001_initial),
+    Migration(2, "Колонки старых схем: lesson_title, module_title, видео", _pg_002_legacy_columns),
+    Migration(3, "JSON-колонки в JSONB", _pg_003_jsonb),
+    Migration(4, "Индексы (в т.ч. GIN по JSONB)", _pg_004_indexes),
+    Migration(5, "Сводка по курсу в courses и индекс для keyset-пагинации", _pg_005_course_summary),
+    Migration(6, "Полнотекстовый поиск (tsvector + GIN) по названиям курса, модулей и уроков", _pg_006_course_search),
+    Migration(7, "Версия курса для оптимистичной блокировки", _pg_007_course_version),
+    Migration(8, "Телеметрия вызовов AI (ai_calls)", _pg_008_ai_calls),
+]
+
+
+# ============================================================================
+# Раннер
+# ============================================================================
+
+_SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Ключ advisory-блокировки: несколько воркеров не мигрируют одновременно
+_PG_MIGRATION_LOCK_KEY = 7_351_002
+
+
+def _current_version(cursor, dialect: str) -> int:
+    if dialect == "postgres":
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    else:
+        cursor.execute("SELECT COUNT(*) > 0 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn, migrations: List[Migration], dialect: str) -> int:
+    """
+    Применяет неприменённые миграции в одной транзакции
+
+    Args:
+        conn: Открытое соединение (sqlite3 или psycopg2)
+        migrations: Список миграций по возрастанию версии
+        dialect: "sqlite" или "postgres"
+
+    Returns:
+        Версия схемы после применения
+    """
+    target = migrations[-1].version
+    cursor = conn.cursor()
+    current = _current_version(cursor, dialect)
+    if current >= target:
+        conn.commit()
+        return current
+
+    placeholder = "%s" if dialect == "postgres" else "?"
+    try:
+        if dialect == "postgres":
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_PG_MIGRATION_LOCK_KEY,))
+        else:
+            conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(_SCHEMA_VERSION_DDL)
+        # Перечитываем под блокировкой: другой процесс мог уже мигрировать
+        current = _current_version(cursor, dialect)
+        for migration in migrations:
+            if migration.version <= current:
+                continue
+            logger.info(f"🔧 Миграция схемы v{migration.version}: {migration.description}")
+            migration.apply(cursor)
+            cursor.execute(f"INSERT INTO schema_version (version) VALUES ({placeholder})", (migration.version,))
+            current = migration.version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return current
@@ -0,0 +1,29 @@
+"""
+Патч видео слайда в content_data урока, общий для SQLite и PostgreSQL.
+
+Видео слайда целиком (или первой части озвучки) хранится в полях самого слайда
+(video_id, video_status, video_download_url). Если озвучка слайда разбита на
+несколько видео (backend/services/video_script_planner.py), части со 2-й
+хранятся в slides[i].video_parts["<номер части>"] — так части не затирают
+друг друга, а число слайдов урока не меняется.
+"""
+from typing import Any, Dict, Optional
+
+
+def slide_video_patch(
+    video_id: Optional[str] = None,
+    video_status: Optional[str] = None,
+    video_download_url: Optional[str] = None,
+    slide_part: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Объект для слияния со слайдом (пустой — нечего обновлять)"""
+    patch: Dict[str, Any] = {}
+    if video_id is not None:
+        patch["video_id"] = video_id
+    if video_status is not None:
+        patch["video_status"] = video_status
+    if video_download_url is not None:
+        patch["video_download_url"] = video_download_url
+    if patch and slide_part and slide_part > 1:
+        return {"video_parts": {str(slide_part): patch}}
+    return patch
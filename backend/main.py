@@ -12,7 +12,7 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT_DIR))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -55,21 +55,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # Курсор следующей страницы списка курсов, версия курса
 )
 
+
+@app.middleware("http")
+async def ai_telemetry_context(request: Request, call_next):
+    """Вызовы AI внутри запроса помечаются его маршрутом и course_id (backend/ai/telemetry.py)"""
+    from backend.ai.telemetry import request_context
+    with request_context(request.scope):
+        return await call_next(request)
+
+
 # Импортируем роутеры (разделенные на модули)
 from backend.api.courses_routes import router as courses_router
 from backend.api.modules_routes import router as modules_router
 from backend.api.lessons_routes import router as lessons_router
+from backend.api.metrics_routes import router as metrics_router
 from backend.routes.video_routes import router as video_router
 
 # Подключаем роутеры
 app.include_router(courses_router)
 app.include_router(modules_router)
 app.include_router(lessons_router)
+app.include_router(metrics_router)
 app.include_router(video_router)
 
 
+@app.on_event("startup")
+async def on_startup():
+    """Запускает фоновые воркеры: очередь видео, прогрев каталога HeyGen, запись телеметрии AI"""
+    from backend.routes.video_dependencies import video_queue_service, heygen_catalog_service
+    video_queue_service.start()
+    heygen_catalog_service.warm_up()
+    from backend.services.ai_telemetry_service import ai_telemetry_service
+    ai_telemetry_service.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Останавливает очередь видео и дописывает накопленную телеметрию AI"""
+    from backend.routes.video_dependencies import video_queue_service
+    await video_queue_service.stop()
+    from backend.services.ai_telemetry_service import ai_telemetry_service
+    await ai_telemetry_service.stop()
+
+
 @app.get("/")
 async def root():
     """Корневой endpoint"""
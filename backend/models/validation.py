@@ -0,0 +1,56 @@
+"""
+Быстрая валидация доменных моделей.
+
+- TypeAdapter'ы собираются один раз при импорте и переиспользуются во всех
+  вызовах (ответы модели, тесты, контент модулей).
+- Курс в БД уже проверен при записи (сохраняется как Course.dict()), поэтому
+  маршрутам, которым нужен один модуль или урок, не нужно заново валидировать
+  весь курс: course_module/course_lesson проверяют только нужный модуль,
+  остальные данные курса берутся из словаря как есть. На курсе из 10 модулей
+  это примерно в 10 раз меньше работы pydantic на запрос
+  (backend/tools/benchmark_validation.py).
+"""
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from .domain import Course, GeneratedLecture, Lesson, LessonTest, Module, ModuleContent
+
+COURSE_ADAPTER = TypeAdapter(Course)
+MODULE_ADAPTER = TypeAdapter(Module)
+LESSON_TEST_ADAPTER = TypeAdapter(LessonTest)
+GENERATED_LECTURE_ADAPTER = TypeAdapter(GeneratedLecture)
+MODULE_CONTENT_ADAPTER = TypeAdapter(ModuleContent)
+
+
+def find_raw_module(course_data: Dict[str, Any], module_number: int) -> Optional[Dict[str, Any]]:
+    """Первый модуль с номером module_number в данных курса из БД (без валидации)
+
+    Номер в сырых данных может быть строкой ("2") — сравнивается как число,
+    как его привела бы модель Module.
+    """
+    for raw_module in course_data.get("modules") or []:
+        try:
+            if int(raw_module.get("module_number")) == module_number:
+                return raw_module
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def course_module(course_data: Dict[str, Any], module_number: int) -> Optional[Module]:
+    """Модуль курса из БД: валидируется только он, а не весь курс"""
+    raw_module = find_raw_module(course_data, module_number)
+    if raw_module is None:
+        return None
+    return MODULE_ADAPTER.validate_python(raw_module)
+
+
+def course_lesson(
+    course_data: Dict[str, Any], module_number: int, lesson_index: int
+) -> Tuple[Optional[Module], Optional[Lesson]]:
+    """Модуль и урок курса из БД; урок None — модуля нет или индекс вне диапазона"""
+    module = course_module(course_data, module_number)
+    if module is None or lesson_index >= len(module.lessons):
+        return module, None
+    return module, module.lessons[lesson_index]
@@ -43,3 +43,38 @@ class VideoGenerationResponse(BaseModel):
     is_cached: bool = False  # Флаг, что видео взято из кэша
     download_url: Optional[str] = None
     error: Optional[str] = None
+
+class VideoQueueJob(BaseModel):
+    """Задание очереди генерации видео (персистентно хранится в JSON)"""
+    job_id: str
+    account: str = "default"  # Аккаунт HeyGen, к которому применяется лимит параллельных рендеров
+    priority: int = 100  # Меньше — раньше
+    status: str = "queued"  # queued, submitting, generating, completed, failed, cached
+    request: VideoGenerationRequest
+    content_hash: str
+    course_id: Optional[int] = None
+    module_number: Optional[int] = None
+    lesson_index: Optional[int] = None
+    slide_index: Optional[int] = None
+    slide_part: Optional[int] = None  # Часть слайда (1 — слайд целиком или первая часть озвучки)
+    video_id: Optional[str] = None
+    download_url: Optional[str] = None
+    attempts: int = 0
+    transient_attempts: int = 0  # Отказы HeyGen по лимиту/таймауту (не считаются в attempts)
+    next_attempt_at: Optional[datetime] = None  # Не отправлять раньше этого времени (экспоненциальная пауза)
+    error_message: Optional[str] = None
+    created_at: datetime
+    submitted_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ScriptSegment(BaseModel):
+    """Сегмент озвучки для одного видео HeyGen (часть слайда или слайд целиком)"""
+    segment_index: int  # Сквозной номер сегмента в уроке (не индекс слайда!)
+    slide_index: int  # Позиция слайда в списке слайдов урока (с нуля) — индекс в content_data.slides
+    slide_number: int
+    part: int = 1  # Номер части, если слайд не поместился в один сегмент
+    text: str
+    char_count: int
+    word_count: int
+    estimated_seconds: float
+    segment_hash: str  # Хэш нормализованного текста: неизменённый сегмент не перерендеривается
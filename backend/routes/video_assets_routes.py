@@ -1,10 +1,14 @@
 """
 Роуты для работы с артефактами (скачивание) и кэшем видео.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
 import logging
 
-from .video_dependencies import video_service, video_cache_service, heygen_service
+from .video_dependencies import video_service, video_cache_service, heygen_catalog_service, video_file_service
+from ..services.video_file_service import RangeNotSatisfiable, VideoNotReady, VideoUnavailable
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +28,56 @@ async def download_video(video_id: str, output_path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/download/{video_id}")
+async def stream_video(
+    video_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """Потоковая отдача MP4 (локальная копия, Range/206, ETag/304)"""
+    try:
+        path = await run_in_threadpool(video_file_service.ensure_local, video_id)
+    except VideoNotReady as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except VideoUnavailable as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при получении видео {video_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Не удалось получить видео: {str(e)}")
+
+    file_size = path.stat().st_size
+    etag = video_file_service.make_etag(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+    }
+    if video_file_service.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = video_file_service.parse_range(range_header, file_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    else:
+        start, end = 0, file_size - 1
+        status_code = 200
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        video_file_service.iter_file(path, start, end),
+        status_code=status_code,
+        media_type="video/mp4",
+        headers=headers,
+    )
+
+
 @router.get("/cache/stats")
 async def get_video_cache_stats():
     try:
@@ -35,29 +89,26 @@ async def get_video_cache_stats():
 
 
 @router.get("/voices")
-async def get_available_voices():
+async def get_available_voices(language: Optional[str] = None, gender: Optional[str] = None):
+    """Голоса HeyGen из кэша каталога (фильтр по языку, например language=ru)"""
     try:
-        raw = heygen_service.get_available_voices()
-        # Нормализуем под фронт: ожидается поле voices (массив)
-        voices = []
-        if isinstance(raw, dict):
-            # HeyGen обычно кладёт список в raw["data"]
-            voices = raw.get("data") or raw.get("voices") or []
-        return {"success": True, "voices": voices}
+        voices = await heygen_catalog_service.get_voices(language=language, gender=gender)
+        return {"success": True, "voices": voices, "total": len(voices)}
     except Exception as e:
         logger.error(f"Ошибка при получении голосов HeyGen: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/avatars")
-async def get_available_avatars():
+async def get_available_avatars(
+    gender: Optional[str] = None,
+    style: Optional[str] = None,
+    search: Optional[str] = None,
+):
+    """Аватары HeyGen из кэша каталога (фильтр по полу/стилю/имени)"""
     try:
-        raw = heygen_service.get_available_avatars()
-        # Нормализуем под фронт: ожидается поле avatars (массив)
-        avatars = []
-        if isinstance(raw, dict):
-            avatars = raw.get("data") or raw.get("avatars") or []
-        return {"success": True, "avatars": avatars}
+        avatars = await heygen_catalog_service.get_avatars(gender=gender, style=style, search=search)
+        return {"success": True, "avatars": avatars, "total": len(avatars)}
     except Exception as e:
         logger.error(f"Ошибка при получении аватаров HeyGen: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
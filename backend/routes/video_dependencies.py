@@ -7,17 +7,27 @@ import logging
 from ..services.video_generation_service import VideoGenerationService
 from ..services.heygen_service import HeyGenService
 from ..services.video_cache_service import VideoCacheService
+from ..services.video_queue_service import VideoQueueService
+from ..services.heygen_catalog_service import HeyGenCatalogService
+from ..services.video_file_service import VideoFileService
 
 
 logger = logging.getLogger(__name__)
 
-# Сервис координации генерации видео (асинхронные действия, оркестрация)
-video_service = VideoGenerationService()
+# Служба кэширования видео-результатов
+video_cache_service = VideoCacheService()
 
 # Принудительно используем реальный HeyGen клиент (для диагностики сети)
 heygen_service = HeyGenService()
 
-# Служба кэширования видео-результатов
-video_cache_service = VideoCacheService()
+# Кэш каталога аватаров/голосов HeyGen (TTL + фоновое обновление)
+heygen_catalog_service = HeyGenCatalogService(heygen_service)
+
+# Локальные копии MP4 для потоковой отдачи клиенту (Range/ETag)
+video_file_service = VideoFileService(heygen_service, video_cache_service)
 
+# Персистентная очередь отправки видео в HeyGen (лимит параллельных рендеров)
+video_queue_service = VideoQueueService(heygen_service, video_cache_service)
 
+# Сервис координации генерации видео (асинхронные действия, оркестрация)
+video_service = VideoGenerationService(queue_service=video_queue_service)
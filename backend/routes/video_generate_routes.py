@@ -9,6 +9,7 @@ import logging
 from .video_dependencies import video_service, heygen_service, video_cache_service
 from ..models.video_cache_models import VideoGenerationRequest, VideoGenerationResponse
 from ..database import db
+from ..services.video_script_planner import ScriptPlanner
 from datetime import datetime
 
 
@@ -32,6 +33,21 @@ async def generate_lesson_with_video_cached(
             cached_video = video_cache_service.get_cached_video(
                 course_id, module_number, lesson_index, request.content, slide_index=None
             )
+            if not cached_video:
+                # Идентичный скрипт уже отрендерен для другого урока/курса — берём готовое видео
+                cached_video = video_cache_service.reuse_video_by_script(
+                    course_id, module_number, lesson_index, request, slide_index=None
+                )
+                if cached_video:
+                    db.update_lesson_video_info(
+                        course_id=course_id,
+                        module_number=module_number,
+                        lesson_index=lesson_index,
+                        video_id=cached_video.video_id,
+                        video_download_url=cached_video.download_url,
+                        video_status=cached_video.status,
+                        video_generated_at=datetime.now(),
+                    )
             if cached_video:
                 logger.info(
                     f"Используем кэшированное видео: {cached_video.video_id}, статус: {cached_video.status}"
@@ -153,6 +169,20 @@ async def generate_slide_with_video_cached(
             cached_video = video_cache_service.get_cached_video(
                 course_id, module_number, lesson_index, request.content, slide_index=slide_index
             )
+            if not cached_video:
+                cached_video = video_cache_service.reuse_video_by_script(
+                    course_id, module_number, lesson_index, request, slide_index=slide_index
+                )
+                if cached_video:
+                    db.update_lesson_slide_video_info(
+                        course_id=course_id,
+                        module_number=module_number,
+                        lesson_index=lesson_index,
+                        slide_index=slide_index,
+                        video_id=cached_video.video_id,
+                        video_status=cached_video.status,
+                        video_download_url=cached_video.download_url,
+                    )
             if cached_video:
                 logger.info(
                     f"Используем кэшированное видео для слайда: {cached_video.video_id}, статус: {cached_video.status}"
@@ -298,6 +328,23 @@ async def generate_lesson_with_slide_videos(lesson_data: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/script-plan/{course_id}/{module_number}/{lesson_index}")
+async def get_lesson_script_plan(course_id: int, module_number: int, lesson_index: int, language: str = "ru"):
+    """Сегменты озвучки по сохранённым слайдам урока: длина, оценка длительности, хэш"""
+    lesson_content = db.get_lesson_content(course_id, module_number, lesson_index)
+    if not lesson_content:
+        raise HTTPException(status_code=404, detail="Контент урока не найден")
+    segments = ScriptPlanner(language=language).plan(lesson_content.get("slides") or [])
+    return {
+        "success": True,
+        "data": {
+            "segments": [segment.model_dump() for segment in segments],
+            "total_segments": len(segments),
+            "estimated_duration_seconds": round(sum(s.estimated_seconds for s in segments), 1),
+        },
+    }
+
+
 @router.post("/generate-course")
 async def generate_course_with_videos(course_data: Dict[str, Any]):
     try:
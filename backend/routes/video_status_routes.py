@@ -6,7 +6,8 @@ from typing import List
 import logging
 from datetime import datetime
 
-from .video_dependencies import video_service, video_cache_service
+from .video_dependencies import video_service, video_cache_service, video_queue_service, heygen_catalog_service
+from backend.config import settings
 from ..database import db
 
 
@@ -41,11 +42,13 @@ async def get_video_status(video_id: str):
                 if cached_video:
                     parts = cached_video.lesson_key.split("_")
                     try:
-                        if len(parts) == 4:
+                        if len(parts) in (4, 5):
                             course_id = int(parts[0])
                             module_number = int(parts[1])
                             lesson_index = int(parts[2])
                             slide_index = int(parts[3])
+                            # Части озвучки слайда со 2-й: ключ курс_модуль_урок_слайд_p<N>
+                            slide_part = int(parts[4].lstrip("p")) if len(parts) == 5 else None
                             db.update_lesson_slide_video_info(
                                 course_id=course_id,
                                 module_number=module_number,
@@ -54,6 +57,7 @@ async def get_video_status(video_id: str):
                                 video_id=video_id,
                                 video_status="completed",
                                 video_download_url=status.get("download_url"),
+                                slide_part=slide_part,
                             )
                             logger.info(
                                 f"Информация о видео слайда {video_id} сохранена в БД"
@@ -172,13 +176,21 @@ async def get_lesson_video_info(course_id: int, module_number: int, lesson_index
 
 @router.get("/health")
 async def health_check():
+    """Состояние видеосервиса без живого запроса каталога HeyGen (каталог берётся из кэша)"""
     try:
-        avatars = await video_service.get_available_avatars()
+        catalog = heygen_catalog_service.get_status()
+        avatars = catalog["avatars"]
+        if avatars["loaded"]:
+            heygen_api = "available" if not avatars["last_error"] else "degraded"
+        else:
+            heygen_api = "unavailable" if avatars["last_error"] else "unknown"
         return {
-            "success": True,
-            "status": "healthy",
-            "heygen_api": "available",
-            "avatars_count": len(avatars),
+            "success": heygen_api != "unavailable",
+            "status": "healthy" if heygen_api != "unavailable" else "unhealthy",
+            "heygen_api": heygen_api,
+            "heygen_configured": bool(settings.HEYGEN_API_KEY),
+            "avatars_count": avatars["count"],
+            "catalog": catalog,
             "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
@@ -192,6 +204,24 @@ async def health_check():
         }
 
 
+@router.get("/queue")
+async def get_video_queue_stats():
+    """Глубина очереди генерации видео, занятые слоты рендера и пропускная способность"""
+    try:
+        return {"success": True, "data": video_queue_service.get_queue_stats()}
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики очереди видео: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/queue/jobs/{job_id}")
+async def get_video_queue_job(job_id: str):
+    job = video_queue_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание очереди не найдено")
+    return {"success": True, "data": job.model_dump(mode="json")}
+
+
 @router.post("/batch-status")
 async def check_batch_video_status(video_ids: List[str]):
     try:
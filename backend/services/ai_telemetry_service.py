@@ -0,0 +1,186 @@
+"""
+Фоновая запись телеметрии вызовов AI и сводка для GET /api/metrics/ai.
+
+- Воркер раз в AI_TELEMETRY_FLUSH_SECONDS забирает записи из буфера
+  backend/ai/telemetry.py и пишет их в таблицу ai_calls пачками по
+  AI_TELEMETRY_BATCH_SIZE (запись в БД — в пуле потоков, запросы её не ждут);
+  раз в час удаляет записи старше AI_TELEMETRY_RETENTION_DAYS.
+- Сводка группирует вызовы за последние hours часов по задаче, маршруту, курсу,
+  версии промпта или модели: число вызовов, попадания в кэш, ошибки, ретраи,
+  токены и перцентили задержки (только по реальным вызовам модели — ответы
+  из кэша перцентили не занижают). Суммы и ранги перцентилей считает БД
+  (GROUP BY и оконные функции), в Python приходят единицы строк на группу.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.ai import telemetry
+from backend.config import settings
+from backend.database import db
+from backend.database.ai_calls import AI_CALL_SUM_FIELDS, LATENCY_PERCENTILES, percentile_rank
+
+logger = logging.getLogger(__name__)
+
+# Поля, по которым можно группировать сводку
+GROUP_FIELDS = ("task", "route", "course_id", "prompt_version", "model")
+PRUNE_INTERVAL_SECONDS = 3600
+# Счётчики сводки по исходу вызова
+OUTCOME_COUNTERS = {
+    telemetry.OUTCOME_ERROR: "errors",
+    telemetry.OUTCOME_TRUNCATED: "truncated",
+    telemetry.OUTCOME_DRAFT: "drafts",
+}
+
+
+def _new_group() -> Dict[str, Any]:
+    group = {"calls": 0, "model_calls": 0, "cache_hits": 0, "errors": 0, "truncated": 0, "drafts": 0}
+    group.update({field: 0 for field in AI_CALL_SUM_FIELDS})
+    group.update({"latency_ms_total": 0, "latency_ms_max": None})
+    return group
+
+
+def _add_stats(group: Dict[str, Any], row: Dict[str, Any]) -> None:
+    calls = row["calls"]
+    group["calls"] += calls
+    if row["cache_hit"]:
+        group["cache_hits"] += calls
+    else:
+        # Задержка — только по реальным вызовам модели, ответы из кэша её не занижают
+        group["model_calls"] += calls
+        group["latency_ms_total"] += int(row["latency_ms_total"] or 0)
+        group["latency_ms_max"] = max(group["latency_ms_max"] or 0, row["latency_ms_max"] or 0)
+    counter = OUTCOME_COUNTERS.get(row["outcome"])
+    if counter:
+        group[counter] += calls
+    for field in AI_CALL_SUM_FIELDS:
+        group[field] += int(row[field] or 0)
+
+
+def _finish(group: Dict[str, Any], ranks: Dict[int, int]) -> Dict[str, Any]:
+    """Доля попаданий в кэш и перцентили задержки по рангам, посчитанным в БД"""
+    model_calls = group["model_calls"]
+    latency_max = group.pop("latency_ms_max")
+    group["cache_hit_rate"] = round(group["cache_hits"] / group["calls"], 3) if group["calls"] else 0.0
+    group["latency_ms"] = {
+        **{
+            f"p{percent}": ranks.get(percentile_rank(percent, model_calls)) if model_calls else None
+            for percent in LATENCY_PERCENTILES
+        },
+        "max": latency_max,
+    }
+    return group
+
+
+def summarize_ai_call_stats(
+    stats: List[Dict[str, Any]],
+    group_ranks: List[Dict[str, Any]],
+    total_ranks: List[Dict[str, Any]],
+    group_by: str = "task",
+) -> Dict[str, Any]:
+    """
+    Итоги и группы по полю group_by из агрегатов БД (get_ai_call_stats / get_ai_call_latency_ranks).
+
+    Группы — по убыванию токенов, затем суммарной задержки.
+    """
+    totals = _new_group()
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for row in stats:
+        _add_stats(totals, row)
+        _add_stats(groups.setdefault(row["group_key"], _new_group()), row)
+    ranks: Dict[Any, Dict[int, int]] = {}
+    for row in group_ranks:
+        ranks.setdefault(row["group_key"], {})[row["latency_rank"]] = row["latency_ms"]
+    items = [{group_by: key, **_finish(group, ranks.get(key, {}))} for key, group in groups.items()]
+    items.sort(key=lambda item: (item["total_tokens"], item["latency_ms_total"]), reverse=True)
+    total_latencies = {row["latency_rank"]: row["latency_ms"] for row in total_ranks}
+    return {"totals": _finish(totals, total_latencies), "groups": items}
+
+
+class AITelemetryService:
+    """Фоновый воркер записи телеметрии AI и сводка по ней"""
+
+    def __init__(self, database=None):
+        self.db = database or db
+        self._worker_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_prune = 0.0
+
+    def start(self):
+        """Запускает фоновую запись (вызывается при старте приложения)"""
+        if not settings.AI_TELEMETRY_ENABLED:
+            return
+        if self._worker_task and not self._worker_task.done():
+            return
+        self._stopping = False
+        self._worker_task = asyncio.create_task(self._run())
+        logger.info(f"Запись телеметрии AI запущена (раз в {settings.AI_TELEMETRY_FLUSH_SECONDS} с)")
+
+    async def stop(self):
+        """Останавливает воркер и дописывает накопленные записи"""
+        self._stopping = True
+        if self._worker_task:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker_task = None
+        await run_in_threadpool(self.flush)
+
+    async def _run(self):
+        while not self._stopping:
+            await asyncio.sleep(settings.AI_TELEMETRY_FLUSH_SECONDS)
+            try:
+                await run_in_threadpool(self.flush)
+                if time.monotonic() - self._last_prune > PRUNE_INTERVAL_SECONDS:
+                    await run_in_threadpool(self.prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи телеметрии AI: {e}")
+
+    def flush(self) -> int:
+        """Пишет все накопленные записи пачками; возвращает число записанных"""
+        written = 0
+        while True:
+            records = telemetry.drain(settings.AI_TELEMETRY_BATCH_SIZE)
+            if not records:
+                return written
+            try:
+                written += self.db.save_ai_calls(records)
+            except Exception as e:
+                logger.error(f"❌ Телеметрия AI: пачка из {len(records)} записей не записана: {e}")
+                return written
+
+    def prune(self) -> int:
+        """Удаляет записи старше AI_TELEMETRY_RETENTION_DAYS"""
+        self._last_prune = time.monotonic()
+        before = datetime.utcnow() - timedelta(days=settings.AI_TELEMETRY_RETENTION_DAYS)
+        deleted = self.db.delete_ai_calls_before(before)
+        if deleted:
+            logger.info(f"♻️ Телеметрия AI: удалено {deleted} записей старше {settings.AI_TELEMETRY_RETENTION_DAYS} дней")
+        return deleted
+
+    def summary(self, hours: float, group_by: str = "task") -> Dict[str, Any]:
+        """Сводка за последние hours часов (накопленные в буфере записи сначала дописываются)"""
+        self.flush()
+        since = datetime.utcnow() - timedelta(hours=hours)
+        stats = self.db.get_ai_call_stats(since, group_by)
+        group_ranks = self.db.get_ai_call_latency_ranks(since, group_by)
+        total_ranks = self.db.get_ai_call_latency_ranks(since)
+        return {
+            "since": since.isoformat(timespec="seconds") + "Z",
+            "hours": hours,
+            "group_by": group_by,
+            **summarize_ai_call_stats(stats, group_ranks, total_ranks, group_by),
+            "dropped": telemetry.dropped(),
+        }
+
+
+# Глобальный экземпляр
+ai_telemetry_service = AITelemetryService()
@@ -0,0 +1,284 @@
+"""
+Массовая (ночная) генерация детального контента уроков через Batch API.
+
+Сценарий — перегенерация каталога, например после смены PROMPT_VERSION:
+1. submit: уроки выбранных курсов превращаются в запросы Batch API теми же
+   построителями промптов, что и интерактивная генерация (ContentGenerator);
+   состояние задания сохраняется в BATCH_JOBS_DIR/<batch_id>.json.
+2. status: статус пакета у провайдера.
+3. ingest: результаты проходят ту же валидацию, что и в ContentGenerator,
+   сохраняются в lesson_contents и в AI-кэш. Урок, изменившийся после
+   отправки пакета (другое название по тому же индексу), пропускается.
+
+Запуск — backend/tools/bulk_generate_lessons.py.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend.ai.batch_client import BatchClient, batch_request_line, chat_request_body
+from backend.ai.cache import set as cache_set
+from backend.ai.content_generator import ContentGenerator, LESSON_DETAILED_TEMPERATURE
+from backend.ai.json_sanitizer import extract_json
+from backend.ai.prompts import LESSON_DETAILED_SYSTEM_PROMPT
+from backend.config import settings
+from backend.database.course_summary import encode_cursor
+from backend.models.domain import Course
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND_LESSON_DETAILED = "lesson_detailed"
+
+
+def lesson_custom_id(course_id: int, module_number: int, lesson_index: int) -> str:
+    return f"lesson:{course_id}:{module_number}:{lesson_index}"
+
+
+class BulkLessonGenerationService:
+    """Отправка уроков в Batch API и приём результатов"""
+
+    def __init__(
+        self,
+        database=None,
+        batch_client: Optional[BatchClient] = None,
+        jobs_dir: Optional[str] = None,
+    ):
+        if database is None:
+            from backend.database import db as database
+        self.db = database
+        self._batch_client = batch_client
+        self.jobs_dir = jobs_dir or settings.BATCH_JOBS_DIR
+
+    @property
+    def batch_client(self) -> BatchClient:
+        if self._batch_client is None:
+            self._batch_client = BatchClient()
+        return self._batch_client
+
+    # ------------------------------------------------------------------
+    # Выбор уроков и отправка
+    # ------------------------------------------------------------------
+
+    def _iter_courses(self, course_ids: Optional[List[int]]) -> Iterable[tuple]:
+        if course_ids:
+            for course_id in course_ids:
+                course_data = self.db.get_course(course_id)
+                if course_data:
+                    yield course_id, course_data
+                else:
+                    logger.warning(f"⚠️ Курс {course_id} не найден")
+            return
+        cursor = None
+        while True:
+            page = self.db.get_all_courses(limit=100, cursor=cursor)
+            for summary in page:
+                course_data = self.db.get_course(summary["id"])
+                if course_data:
+                    yield summary["id"], course_data
+            if len(page) < 100:
+                return
+            cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+
+    def collect_requests(
+        self,
+        course_ids: Optional[List[int]] = None,
+        only_missing: bool = False,
+        limit: Optional[int] = None,
+    ) -> tuple:
+        """
+        Строки JSONL для Batch API и описание уроков задания
+
+        Returns:
+            (строки запросов, {custom_id: {course_id, module_number, lesson_index, lesson_title}})
+        """
+        lines: List[Dict[str, Any]] = []
+        items: Dict[str, Dict[str, Any]] = {}
+        for course_id, course_data in self._iter_courses(course_ids):
+            course = Course(**{k: v for k, v in course_data.items() if k not in ("id", "created_at", "updated_at")})
+            for module in course.modules:
+                for lesson_index, lesson in enumerate(module.lessons):
+                    if limit is not None and len(lines) >= limit:
+                        return lines, items
+                    if only_missing and self.db.get_lesson_content(course_id, module.module_number, lesson_index):
+                        continue
+                    prompt = ContentGenerator.build_lesson_detailed_prompt(
+                        lesson, module, course.course_title, course.target_audience
+                    )
+                    custom_id = lesson_custom_id(course_id, module.module_number, lesson_index)
+                    body = chat_request_body(
+                        system_prompt=LESSON_DETAILED_SYSTEM_PROMPT,
+                        user_prompt=prompt,
+                        model=settings.OPENAI_MODEL_DETAILED_CONTENT,
+                        temperature=LESSON_DETAILED_TEMPERATURE,
+                        max_tokens=settings.OPENAI_MAX_TOKENS_LESSON_DETAILED,
+                    )
+                    lines.append(batch_request_line(custom_id, body))
+                    items[custom_id] = {
+                        "course_id": course_id,
+                        "module_number": module.module_number,
+                        "lesson_index": lesson_index,
+                        "lesson_title": lesson.lesson_title,
+                        "cache_key": ContentGenerator.lesson_detailed_cache_key(prompt),
+                    }
+        return lines, items
+
+    def submit(
+        self,
+        course_ids: Optional[List[int]] = None,
+        only_missing: bool = False,
+        limit: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Отправляет уроки в Batch API и сохраняет задание; None — нечего отправлять"""
+        lines, items = self.collect_requests(course_ids, only_missing, limit)
+        if not lines:
+            logger.info("Нет уроков для пакетной генерации")
+            return None
+        batch = self.batch_client.submit(
+            lines,
+            metadata={"kind": JOB_KIND_LESSON_DETAILED, "prompt_version": settings.PROMPT_VERSION},
+        )
+        job = {
+            "batch_id": batch.id,
+            "kind": JOB_KIND_LESSON_DETAILED,
+            "prompt_version": settings.PROMPT_VERSION,
+            "model": settings.OPENAI_MODEL_DETAILED_CONTENT,
+            "submitted_at": datetime.now().isoformat(),
+            "status": batch.status,
+            "items": items,
+            "ingested_at": None,
+            "report": None,
+        }
+        self._save_job(job)
+        return job
+
+    # ------------------------------------------------------------------
+    # Статус и приём результатов
+    # ------------------------------------------------------------------
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.batch_client.retrieve(batch_id)
+        job = self.load_job(batch_id)
+        job["status"] = batch.status
+        self._save_job(job)
+        counts = batch.request_counts
+        return {
+            "batch_id": batch_id,
+            "status": batch.status,
+            "total": counts.total if counts else len(job["items"]),
+            "completed": counts.completed if counts else None,
+            "failed": counts.failed if counts else None,
+            "ingested_at": job.get("ingested_at"),
+        }
+
+    def ingest(self, batch_id: str, wait: bool = False, poll_interval: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Сохраняет результаты завершённого пакета
+
+        Returns:
+            Отчёт: saved / invalid / truncated / failed / stale / missing (списки custom_id)
+        """
+        job = self.load_job(batch_id)
+        batch = (
+            self.batch_client.wait(batch_id, poll_interval=poll_interval)
+            if wait else self.batch_client.retrieve(batch_id)
+        )
+        job["status"] = batch.status
+        if batch.status != "completed":
+            self._save_job(job)
+            raise ValueError(f"Пакет {batch_id} ещё не завершён: {batch.status}")
+
+        results = self.batch_client.results(batch)
+        report: Dict[str, List[str]] = {
+            "saved": [], "invalid": [], "truncated": [], "failed": [], "stale": [], "missing": [],
+        }
+        courses: Dict[int, Optional[Dict[str, Any]]] = {}
+        for custom_id, item in job["items"].items():
+            result = results.get(custom_id)
+            if result is None:
+                report["missing"].append(custom_id)
+                continue
+            if result.error:
+                logger.warning(f"❌ {custom_id}: {result.error}")
+                report["failed"].append(custom_id)
+                continue
+            if result.finish_reason == "length":
+                # В пакете нет продолжений: такой урок перегенерируется интерактивно
+                logger.warning(f"⚠️ {custom_id}: ответ обрезан по max_tokens")
+                report["truncated"].append(custom_id)
+                continue
+            content_json = ContentGenerator.validate_lesson_detailed_content(
+                extract_json(result.content, expected_key="slides")
+            )
+            if content_json is None:
+                report["invalid"].append(custom_id)
+                continue
+            if not self._lesson_unchanged(courses, item):
+                logger.warning(f"⚠️ {custom_id}: урок изменён или удалён после отправки пакета")
+                report["stale"].append(custom_id)
+                continue
+            self.db.save_lesson_content(
+                course_id=item["course_id"],
+                module_number=item["module_number"],
+                lesson_index=item["lesson_index"],
+                lesson_title=item["lesson_title"],
+                content_data=content_json,
+            )
+            if settings.AI_CACHE_ENABLED and item.get("cache_key"):
+                cache_set(item["cache_key"], content_json, settings.AI_CACHE_TTL_SECONDS)
+            report["saved"].append(custom_id)
+
+        job["ingested_at"] = datetime.now().isoformat()
+        job["report"] = {key: len(ids) for key, ids in report.items()}
+        self._save_job(job)
+        logger.info(f"✅ Пакет {batch_id} принят: {job['report']}")
+        return report
+
+    def _lesson_unchanged(self, courses: Dict[int, Optional[Dict[str, Any]]], item: Dict[str, Any]) -> bool:
+        course_id = item["course_id"]
+        if course_id not in courses:
+            courses[course_id] = self.db.get_course(course_id)
+        course_data = courses[course_id]
+        if not course_data:
+            return False
+        for module in course_data.get("modules") or []:
+            if module.get("module_number") == item["module_number"]:
+                lessons = module.get("lessons") or []
+                index = item["lesson_index"]
+                return index < len(lessons) and lessons[index].get("lesson_title") == item["lesson_title"]
+        return False
+
+    # ------------------------------------------------------------------
+    # Файлы заданий
+    # ------------------------------------------------------------------
+
+    def _job_path(self, batch_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{batch_id}.json")
+
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._job_path(job["batch_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def load_job(self, batch_id: str) -> Dict[str, Any]:
+        path = self._job_path(batch_id)
+        if not os.path.exists(path):
+            raise ValueError(f"Задание пакета {batch_id} не найдено в {self.jobs_dir}")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = []
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.jobs_dir, name), encoding="utf-8") as f:
+                    job = json.load(f)
+                jobs.append({key: job.get(key) for key in ("batch_id", "status", "submitted_at", "ingested_at", "report")}
+                            | {"items": len(job.get("items") or {})})
+        return jobs
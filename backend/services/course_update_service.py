@@ -0,0 +1,82 @@
+"""
+Серверные правки структуры курса с оптимистичной блокировкой.
+
+Маршруты (дублирование/удаление модулей и уроков, регенерация целей и планов) меняют
+JSON курса целиком. Чтобы параллельные правки не затирали друг друга, правка
+выполняется как «прочитать → изменить → записать с ожидаемой версией»; при конфликте
+курс перечитывается и правка применяется заново к свежей версии (до `COURSE_UPDATE_RETRIES` раз).
+Функция правки должна быть чистой и быстрой: вызовы LLM делаются до неё, а она лишь
+вливает результат в актуальные данные.
+"""
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from backend.config import settings
+from backend.database import db
+from backend.database.concurrency import CourseVersionConflict
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Служебные поля, которые get_course добавляет к JSON курса
+_META_FIELDS = ("id", "created_at", "updated_at", "version")
+
+
+class CourseNotFound(LookupError):
+    """Курс не найден"""
+
+
+def split_course_meta(course_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Отделяет служебные поля (id, даты, version) от JSON курса"""
+    raw = dict(course_data)
+    meta = {field: raw.pop(field, None) for field in _META_FIELDS}
+    return raw, meta
+
+
+def update_course_with_retry(
+    course_id: int,
+    mutate: Callable[[Dict[str, Any]], T],
+    retries: Optional[int] = None,
+    write: Optional[Callable[[Dict[str, Any], Optional[int], T], Optional[int]]] = None,
+) -> Tuple[T, int]:
+    """
+    Применяет правку к курсу с повтором при конфликте версий
+
+    Args:
+        course_id: ID курса
+        mutate: Меняет переданный JSON курса на месте и возвращает результат правки
+        retries: Сколько раз повторить при конфликте (по умолчанию COURSE_UPDATE_RETRIES)
+        write: Запись правки (JSON курса, ожидаемая версия, результат mutate) → новая версия;
+            по умолчанию db.update_course. Нужна, когда вместе со структурой в той же
+            транзакции меняются другие таблицы (дублирование модуля с контентом)
+
+    Returns:
+        (результат mutate, новая версия курса)
+
+    Raises:
+        CourseNotFound: курса нет
+        CourseVersionConflict: конфликт не разрешился за retries повторов
+    """
+    retries = settings.COURSE_UPDATE_RETRIES if retries is None else retries
+    attempt = 0
+    while True:
+        course_data = db.get_course(course_id)
+        if not course_data:
+            raise CourseNotFound(f"Курс {course_id} не найден")
+        raw_course, meta = split_course_meta(course_data)
+        result = mutate(raw_course)
+        try:
+            if write is None:
+                new_version = db.update_course(course_id, raw_course, expected_version=meta["version"])
+            else:
+                new_version = write(raw_course, meta["version"], result)
+        except CourseVersionConflict as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logger.info(f"♻️ {e} — повтор правки ({attempt}/{retries})")
+            continue
+        if new_version is None:
+            raise CourseNotFound(f"Курс {course_id} не найден")
+        return result, new_version
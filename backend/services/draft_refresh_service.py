@@ -0,0 +1,58 @@
+"""
+Фоновая замена черновиков из кэша похожих запросов свежей генерацией.
+
+Когда для урока нашёлся похожий запрос (backend/ai/similarity_cache.py),
+маршрут сразу сохраняет и возвращает черновик, а здесь запускается обычная
+генерация. Её результат применяется функцией apply, которая сама проверяет,
+что черновик за это время не правили (иначе правка пользователя важнее).
+На один объект (урок/тест/план) одновременно идёт не больше одного обновления.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class DraftRefreshService:
+    """Фоновые задачи «сгенерировать заново и заменить черновик»"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(
+        self,
+        key: str,
+        generate: Callable[[], Optional[Any]],
+        apply: Callable[[Any], bool],
+    ) -> bool:
+        """Запускает обновление черновика key; False — обновление уже идёт"""
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            return False
+        self._tasks[key] = asyncio.create_task(self._refresh(key, generate, apply))
+        return True
+
+    async def _refresh(self, key: str, generate: Callable[[], Optional[Any]], apply: Callable[[Any], bool]) -> None:
+        try:
+            result = await run_in_threadpool(generate)
+            if result is None:
+                logger.warning(f"⚠️ Черновик {key}: свежая генерация не удалась, черновик остаётся")
+                return
+            if await run_in_threadpool(apply, result):
+                logger.info(f"✅ Черновик {key} заменён свежей генерацией")
+            else:
+                logger.info(f"Черновик {key} изменён пользователем — свежая генерация не применена")
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления черновика {key}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    def pending(self) -> List[str]:
+        return [key for key, task in self._tasks.items() if not task.done()]
+
+
+# Глобальный экземпляр
+draft_refresh_service = DraftRefreshService()
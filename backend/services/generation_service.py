@@ -11,6 +11,10 @@ from typing import Optional, Dict, Any, List
 
 from backend.ai.openai_client import OpenAIClient
 from backend.ai.interfaces import AIChatClient
+from backend.ai.similarity_cache import (
+    SimilarMatch, find_similar, remember_similar, similarity_scope, similarity_text
+)
+from backend.ai.telemetry import OUTCOME_DRAFT, ai_task, record_cache_hit
 from backend.config import settings
 
 logger = logging.getLogger(__name__)
@@ -44,13 +48,14 @@ class GenerationService:
 Сгенерируй краткую (1-2 предложения) и четкую цель для этого модуля.
 Ответь ТОЛЬКО целью, без дополнительного текста."""
             
-            new_goal = self.openai_client.call_ai(
-                system_prompt="Ты эксперт по созданию образовательного контента.",
-                user_prompt=prompt,
-                model=settings.OPENAI_MODEL_DEFAULT,
-                temperature=0.7,
-                max_tokens=settings.OPENAI_MAX_TOKENS_SHORT_MIN
-            )
+            with ai_task("module_goal"):
+                new_goal = self.openai_client.call_ai(
+                    system_prompt="Ты эксперт по созданию образовательного контента.",
+                    user_prompt=prompt,
+                    model=settings.OPENAI_MODEL_DEFAULT,
+                    temperature=0.7,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_SHORT_MIN
+                )
             logger.info(f"✅ Цель модуля регенерирована: {new_goal[:50]}...")
             return new_goal
             
@@ -72,6 +77,15 @@ class GenerationService:
         Возвращает список пунктов (5–7) или None при ошибке.
         """
         try:
+            # Кэш похожих запросов: совпадение после нормализации отдаём как готовый план
+            scope, text = self.content_outline_similarity_key(
+                course_title, module_title, lesson_title, lesson_goal, lesson_format, estimated_time_minutes
+            )
+            similar = find_similar("lesson_outline", scope, text)
+            if similar is not None and similar.final:
+                record_cache_hit("lesson_outline", settings.OPENAI_MODEL_DEFAULT)
+                return similar.value
+
             prompt = f"""Курс: {course_title}
 Модуль: {module_title}
 Урок: {lesson_title}
@@ -82,13 +96,14 @@ class GenerationService:
 Сгенерируй детальный план контента для этого урока (5-7 пунктов).
 Верни ТОЛЬКО список пунктов, каждый с новой строки, начиная с "- "."""
             
-            content_text = self.openai_client.call_ai(
-                system_prompt="Ты эксперт по созданию образовательного контента.",
-                user_prompt=prompt,
-                model=settings.OPENAI_MODEL_DEFAULT,
-                temperature=0.7,
-                max_tokens=settings.OPENAI_MAX_TOKENS_SHORT_MAX
-            )
+            with ai_task("lesson_outline"):
+                content_text = self.openai_client.call_ai(
+                    system_prompt="Ты эксперт по созданию образовательного контента.",
+                    user_prompt=prompt,
+                    model=settings.OPENAI_MODEL_DEFAULT,
+                    temperature=0.7,
+                    max_tokens=settings.OPENAI_MAX_TOKENS_SHORT_MAX
+                )
             
             # Парсим ответ в список
             new_content_outline = []
@@ -105,6 +120,7 @@ class GenerationService:
                 new_content_outline = [content_text]
             
             logger.info(f"✅ План контента регенерирован: {len(new_content_outline)} пунктов")
+            remember_similar(scope, text, new_content_outline)
             return new_content_outline
             
         except Exception as e:
@@ -112,6 +128,43 @@ class GenerationService:
             return None
 
 
+    def content_outline_draft(
+        self,
+        course_title: str,
+        module_title: str,
+        lesson_title: str,
+        lesson_goal: str,
+        lesson_format: str,
+        estimated_time_minutes: int
+    ) -> Optional[SimilarMatch]:
+        """Черновик плана контента из кэша похожих запросов.
+
+        None — похожего запроса нет или он достаточно близок, чтобы
+        regenerate_lesson_content_outline сразу отдал его как готовый.
+        """
+        similar = find_similar("lesson_outline", *self.content_outline_similarity_key(
+            course_title, module_title, lesson_title, lesson_goal, lesson_format, estimated_time_minutes
+        ))
+        if similar is None or similar.final:
+            return None
+        record_cache_hit("lesson_outline", settings.OPENAI_MODEL_DEFAULT, outcome=OUTCOME_DRAFT)
+        return similar
+
+    @staticmethod
+    def content_outline_similarity_key(
+        course_title: str,
+        module_title: str,
+        lesson_title: str,
+        lesson_goal: str,
+        lesson_format: str,
+        estimated_time_minutes: int
+    ) -> tuple:
+        """(scope, текст) для кэша похожих запросов: курс и модель — точно, поля урока — по сходству"""
+        scope = similarity_scope("lesson_outline", settings.OPENAI_MODEL_DEFAULT, course_title)
+        text = similarity_text(module_title, lesson_title, lesson_goal, lesson_format, estimated_time_minutes)
+        return scope, text
+
+
 # Глобальный экземпляр
 generation_service = GenerationService()
 
@@ -0,0 +1,213 @@
+"""
+Кэш каталога аватаров и голосов HeyGen.
+
+Списки аватаров (`/v2/avatars`) и голосов (`/v1/voice.list`) большие и меняются редко,
+поэтому панель видео не должна ходить в HeyGen на каждый запрос:
+- свежий каталог (моложе TTL) отдаётся из памяти;
+- устаревший каталог отдаётся сразу, а обновление запускается в фоне (stale-while-revalidate);
+- при ошибке HeyGen продолжаем отдавать последний успешно загруженный каталог.
+
+Фильтрация выполняется на сервере: голоса — по языку, аватары — по полу/стилю.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Коды языков -> названия, которые HeyGen возвращает в поле language
+LANGUAGE_NAMES = {
+    "ru": "russian",
+    "en": "english",
+    "de": "german",
+    "fr": "french",
+    "es": "spanish",
+    "it": "italian",
+    "uk": "ukrainian",
+    "zh": "chinese",
+}
+
+
+def _extract_list(raw: Any, *keys: str) -> List[Dict[str, Any]]:
+    """Достаёт список из ответа HeyGen (data может быть массивом или объектом с массивом)"""
+    data = raw.get("data", raw) if isinstance(raw, dict) else raw
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in keys:
+            if isinstance(data.get(key), list):
+                return data[key]
+    return []
+
+
+class _CatalogEntry:
+    def __init__(self):
+        self.items: Optional[List[Dict[str, Any]]] = None
+        self.fetched_at: float = 0.0
+        self.last_error: Optional[str] = None
+        self.lock = asyncio.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+
+
+class HeyGenCatalogService:
+    """Кэш каталога HeyGen с TTL и фоновым обновлением"""
+
+    def __init__(self, heygen_client, ttl_seconds: Optional[int] = None):
+        self.heygen_client = heygen_client
+        self.ttl_seconds = ttl_seconds or settings.HEYGEN_CATALOG_TTL_SECONDS
+        self._loaders: Dict[str, Callable[[], List[Dict[str, Any]]]] = {
+            "avatars": self._load_avatars,
+            "voices": self._load_voices,
+        }
+        self._entries: Dict[str, _CatalogEntry] = {name: _CatalogEntry() for name in self._loaders}
+
+    # ------------------------------------------------------------------
+    # Загрузка из HeyGen
+    # ------------------------------------------------------------------
+
+    def _load_avatars(self) -> List[Dict[str, Any]]:
+        return _extract_list(self.heygen_client.get_available_avatars(), "avatars", "list")
+
+    def _load_voices(self) -> List[Dict[str, Any]]:
+        return _extract_list(self.heygen_client.get_available_voices(), "voices", "list")
+
+    async def _refresh(self, name: str) -> List[Dict[str, Any]]:
+        entry = self._entries[name]
+        try:
+            items = await run_in_threadpool(self._loaders[name])
+        except Exception as e:
+            entry.last_error = str(e)
+            logger.warning(f"Не удалось обновить каталог HeyGen '{name}': {e}")
+            if entry.items is None:
+                raise
+            return entry.items
+        entry.items = items
+        entry.fetched_at = time.time()
+        entry.last_error = None
+        logger.info(f"✅ Каталог HeyGen '{name}' обновлён: {len(items)} записей")
+        return items
+
+    def _is_fresh(self, entry: _CatalogEntry) -> bool:
+        return entry.items is not None and time.time() - entry.fetched_at < self.ttl_seconds
+
+    def _schedule_refresh(self, name: str):
+        entry = self._entries[name]
+        if entry.refresh_task and not entry.refresh_task.done():
+            return
+        entry.refresh_task = asyncio.create_task(self._refresh_quietly(name))
+
+    async def _refresh_quietly(self, name: str):
+        try:
+            async with self._entries[name].lock:
+                await self._refresh(name)
+        except Exception:
+            pass
+
+    async def _get_catalog(self, name: str) -> List[Dict[str, Any]]:
+        entry = self._entries[name]
+        if self._is_fresh(entry):
+            return entry.items
+        if entry.items is not None:
+            # Отдаём устаревший каталог сразу, обновляем в фоне
+            self._schedule_refresh(name)
+            return entry.items
+        # Каталога ещё нет — загружаем один раз, остальные запросы ждут на блокировке
+        async with entry.lock:
+            if entry.items is not None:
+                return entry.items
+            return await self._refresh(name)
+
+    def warm_up(self):
+        """Запускает фоновую загрузку каталогов (вызывается при старте приложения)"""
+        for name in self._loaders:
+            self._schedule_refresh(name)
+
+    # ------------------------------------------------------------------
+    # Публичный API
+    # ------------------------------------------------------------------
+
+    async def get_avatars(
+        self,
+        gender: Optional[str] = None,
+        style: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Возвращает аватары из кэша с фильтрацией
+
+        Args:
+            gender: Пол аватара (male/female)
+            style: Стиль — ищется в полях style/type и в имени аватара (например, expressive)
+            search: Подстрока в имени или ID аватара
+        """
+        avatars = await self._get_catalog("avatars")
+        if gender:
+            gender = gender.lower()
+            avatars = [a for a in avatars if str(a.get("gender", "")).lower() == gender]
+        if style:
+            style = style.lower()
+            avatars = [
+                a for a in avatars
+                if style in " ".join(
+                    str(a.get(field, "")) for field in ("style", "type", "avatar_name", "avatar_id")
+                ).lower()
+            ]
+        if search:
+            search = search.lower()
+            avatars = [
+                a for a in avatars
+                if search in str(a.get("avatar_name", "")).lower() or search in str(a.get("avatar_id", "")).lower()
+            ]
+        return avatars
+
+    async def get_voices(
+        self,
+        language: Optional[str] = None,
+        gender: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Возвращает голоса из кэша с фильтрацией
+
+        Args:
+            language: Код языка (ru, en, ...) или название (Russian)
+            gender: Пол голоса (male/female)
+        """
+        voices = await self._get_catalog("voices")
+        if language:
+            voices = [v for v in voices if self._matches_language(v, language)]
+        if gender:
+            gender = gender.lower()
+            voices = [v for v in voices if str(v.get("gender", "")).lower() == gender]
+        return voices
+
+    @staticmethod
+    def _matches_language(voice: Dict[str, Any], language: str) -> bool:
+        language = language.lower()
+        name = LANGUAGE_NAMES.get(language, language)
+        voice_language = str(voice.get("language", "")).lower()
+        if voice_language in (language, name) or voice_language.startswith(name):
+            return True
+        for field in ("language_code", "locale"):
+            code = str(voice.get(field, "")).lower()
+            if code == language or code.startswith(language + "-") or code.startswith(language + "_"):
+                return True
+        return False
+
+    def get_status(self) -> Dict[str, Any]:
+        """Состояние каталога без обращения к HeyGen (для health-check)"""
+        now = time.time()
+        status = {}
+        for name, entry in self._entries.items():
+            status[name] = {
+                "loaded": entry.items is not None,
+                "count": len(entry.items) if entry.items is not None else 0,
+                "age_seconds": round(now - entry.fetched_at) if entry.items is not None else None,
+                "fresh": self._is_fresh(entry),
+                "last_error": entry.last_error,
+            }
+        return status
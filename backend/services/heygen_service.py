@@ -217,10 +217,12 @@ class HeyGenService:
             response.raise_for_status()
             
             # Создаем директорию если не существует
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
             
             with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+                for chunk in response.iter_content(chunk_size=settings.VIDEO_DOWNLOAD_CHUNK_SIZE):
                     f.write(chunk)
             
             logger.info(f"Видео {video_id} успешно скачано")
@@ -2,21 +2,36 @@
 Сервис для генерации тестов для уроков с использованием AI
 """
 import logging
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, List, Tuple
 
 from backend.ai.openai_client import OpenAIClient
 from backend.ai.interfaces import AIChatClient
 from backend.ai.json_sanitizer import extract_json
+from backend.ai.similarity_cache import (
+    SimilarMatch, find_similar, remember_similar, similarity_scope, similarity_text
+)
+from backend.ai.telemetry import OUTCOME_DRAFT, ai_task, record_cache_hit
 from backend.ai.prompts import (
     TEST_GENERATION_SYSTEM_PROMPT,
     TEST_GENERATION_PROMPT_TEMPLATE,
+    TEST_BATCH_GENERATION_PROMPT_TEMPLATE,
+    TEST_BATCH_LESSON_TEMPLATE,
     format_content_outline
 )
 from backend.models.domain import LessonTest
+from backend.models.validation import LESSON_TEST_ADAPTER
 from backend.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Грубая оценка токенов промпта по длине текста (для отчёта об экономии пакетного режима)
+CHARS_PER_TOKEN = 4
+
+
+def _estimate_tokens(*texts: str) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN
+
 
 class TestGeneratorService:
     """Сервис для генерации тестов для уроков"""
@@ -66,6 +81,16 @@ class TestGeneratorService:
             if max_tokens is None:
                 max_tokens = getattr(settings, 'OPENAI_MAX_TOKENS_TEST', settings.OPENAI_MAX_TOKENS_DEFAULT)
             
+            # Кэш похожих запросов: совпадение после нормализации отдаём как готовый тест
+            scope, text = self.test_similarity_key(
+                lesson_title, lesson_goal, content_outline, course_title, target_audience,
+                module_title, num_questions, model
+            )
+            similar = find_similar("lesson_test", scope, text)
+            if similar is not None and similar.final:
+                record_cache_hit("lesson_test", model)
+                return self._adapt_test(similar.value, lesson_title, lesson_goal)
+
             prompt = TEST_GENERATION_PROMPT_TEMPLATE.format(
                 course_title=course_title,
                 target_audience=target_audience,
@@ -77,13 +102,14 @@ class TestGeneratorService:
             )
             
             # Генерируем тест через AI
-            content_json = self.openai_client.call_ai_json(
-                system_prompt=TEST_GENERATION_SYSTEM_PROMPT,
-                user_prompt=prompt,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            with ai_task("lesson_test"):
+                content_json = self.openai_client.call_ai_json(
+                    system_prompt=TEST_GENERATION_SYSTEM_PROMPT,
+                    user_prompt=prompt,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
             
             if not content_json:
                 logger.warning("❌ AI не вернул результат для теста")
@@ -91,10 +117,11 @@ class TestGeneratorService:
             
             # Валидация через Pydantic
             try:
-                test = LessonTest(**content_json)
+                test = LESSON_TEST_ADAPTER.validate_python(content_json)
                 # Убеждаемся, что total_questions соответствует количеству вопросов
                 test.total_questions = len(test.questions)
                 logger.info(f"✅ Тест успешно сгенерирован: {test.total_questions} вопросов")
+                remember_similar(scope, text, test.dict())
                 return test
             except Exception as e:
                 logger.error(f"❌ Ошибка валидации теста: {e}")
@@ -107,3 +134,238 @@ class TestGeneratorService:
             logger.debug(traceback.format_exc())
             return None
 
+    def test_draft(
+        self,
+        lesson_title: str,
+        lesson_goal: str,
+        content_outline: list[str],
+        course_title: str,
+        target_audience: str,
+        module_title: str,
+        num_questions: int = 10,
+        model: str = None,
+    ) -> Optional[SimilarMatch]:
+        """Черновик теста из кэша похожих запросов (value — LessonTest); None — черновика нет
+        или совпадение настолько точное, что generate_test сразу отдаст его как готовый"""
+        if model is None:
+            model = getattr(settings, 'OPENAI_MODEL_TEST', settings.OPENAI_MODEL_DEFAULT)
+        similar = find_similar("lesson_test", *self.test_similarity_key(
+            lesson_title, lesson_goal, content_outline, course_title, target_audience,
+            module_title, num_questions, model
+        ))
+        if similar is None or similar.final:
+            return None
+        record_cache_hit("lesson_test", model, outcome=OUTCOME_DRAFT)
+        return similar._replace(value=self._adapt_test(similar.value, lesson_title, lesson_goal))
+
+    @staticmethod
+    def test_similarity_key(
+        lesson_title: str,
+        lesson_goal: str,
+        content_outline: list[str],
+        course_title: str,
+        target_audience: str,
+        module_title: str,
+        num_questions: int,
+        model: str,
+    ) -> tuple:
+        """(scope, текст) для кэша похожих запросов: курс, модель и число вопросов — точно, урок — по сходству"""
+        scope = similarity_scope("lesson_test", model, course_title, target_audience, num_questions)
+        text = similarity_text(module_title, lesson_title, lesson_goal, content_outline or [])
+        return scope, text
+
+    @staticmethod
+    def _adapt_test(test_data: Dict[str, Any], lesson_title: str, lesson_goal: str) -> LessonTest:
+        """Тест похожего урока с названием и целью текущего"""
+        return LESSON_TEST_ADAPTER.validate_python(
+            {**test_data, "lesson_title": lesson_title, "lesson_goal": lesson_goal}
+        )
+
+    def generate_tests_batch(
+        self,
+        lessons: List[Tuple[int, Any]],
+        course_title: str,
+        target_audience: str,
+        module_title: str,
+        num_questions: int = 10,
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        batch_size: int = None
+    ) -> Tuple[Dict[int, LessonTest], Dict[str, Any]]:
+        """
+        Генерирует тесты для нескольких уроков модуля пакетами (несколько уроков на запрос)
+        
+        Системный промпт и контекст курса передаются один раз на пакет; ответ —
+        объект "tests", где ключ — индекс урока. Каждый тест валидируется отдельно,
+        уроки без валидного теста догенерируются одиночными запросами (generate_test).
+        
+        Args:
+            lessons: Пары (индекс урока в модуле, урок с lesson_title/lesson_goal/content_outline)
+            max_tokens: Лимит токенов на один тест (у пакета — на урок × размер пакета,
+                но не больше OPENAI_MAX_TOKENS_TEST_BATCH)
+            batch_size: Уроков в одном запросе (по умолчанию TEST_BATCH_SIZE; 1 — без пакетов)
+            
+        Returns:
+            (тесты по индексу урока, статистика: запросы, оценка токенов промптов, время)
+        """
+        if model is None:
+            model = getattr(settings, 'OPENAI_MODEL_TEST', settings.OPENAI_MODEL_DEFAULT)
+        if temperature is None:
+            temperature = getattr(settings, 'OPENAI_TEMPERATURE_TEST', settings.OPENAI_TEMPERATURE_DEFAULT)
+        if max_tokens is None:
+            max_tokens = getattr(settings, 'OPENAI_MAX_TOKENS_TEST', settings.OPENAI_MAX_TOKENS_DEFAULT)
+        batch_size = max(1, batch_size or settings.TEST_BATCH_SIZE)
+
+        started = time.monotonic()
+        tests: Dict[int, LessonTest] = {}
+        single_prompt_tokens = 0
+        sent_prompt_tokens = 0
+        calls = 0
+        batched_lessons = 0
+
+        for lesson_index, lesson in lessons:
+            single_prompt_tokens += _estimate_tokens(
+                TEST_GENERATION_SYSTEM_PROMPT,
+                self._single_prompt(lesson, course_title, target_audience, module_title, num_questions),
+            )
+
+        if batch_size > 1:
+            for start in range(0, len(lessons), batch_size):
+                batch = lessons[start:start + batch_size]
+                if len(batch) == 1:
+                    break
+                prompt = self._batch_prompt(batch, course_title, target_audience, module_title, num_questions)
+                sent_prompt_tokens += _estimate_tokens(TEST_GENERATION_SYSTEM_PROMPT, prompt)
+                calls += 1
+                logger.info(f"Генерируем тесты пакетом: уроки {[index for index, _ in batch]}")
+                try:
+                    with ai_task("lesson_test_batch"):
+                        content_json = self.openai_client.call_ai_json(
+                            system_prompt=TEST_GENERATION_SYSTEM_PROMPT,
+                            user_prompt=prompt,
+                            model=model,
+                            temperature=temperature,
+                            max_tokens=min(max_tokens * len(batch), settings.OPENAI_MAX_TOKENS_TEST_BATCH),
+                        )
+                except Exception as e:
+                    logger.error(f"❌ Ошибка пакетной генерации тестов: {e}")
+                    content_json = None
+                batch_tests = self._parse_batch(content_json, batch)
+                for lesson_index, lesson in batch:
+                    if lesson_index in batch_tests:
+                        remember_similar(*self.test_similarity_key(
+                            lesson.lesson_title, lesson.lesson_goal, lesson.content_outline, course_title,
+                            target_audience, module_title, num_questions, model
+                        ), batch_tests[lesson_index].dict())
+                batched_lessons += len(batch_tests)
+                tests.update(batch_tests)
+
+        # Уроки без валидного теста из пакета (и остаток из одного урока) — одиночными запросами
+        for lesson_index, lesson in lessons:
+            if lesson_index in tests:
+                continue
+            sent_prompt_tokens += _estimate_tokens(
+                TEST_GENERATION_SYSTEM_PROMPT,
+                self._single_prompt(lesson, course_title, target_audience, module_title, num_questions),
+            )
+            calls += 1
+            test = self.generate_test(
+                lesson_title=lesson.lesson_title,
+                lesson_goal=lesson.lesson_goal,
+                content_outline=lesson.content_outline,
+                course_title=course_title,
+                target_audience=target_audience,
+                module_title=module_title,
+                num_questions=num_questions,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            if test:
+                tests[lesson_index] = test
+
+        elapsed = time.monotonic() - started
+        stats = {
+            "lessons": len(lessons),
+            "generated": len(tests),
+            "batched_lessons": batched_lessons,
+            "fallback_lessons": len(tests) - batched_lessons,
+            "llm_calls": calls,
+            "llm_calls_saved": len(lessons) - calls,
+            "prompt_tokens_estimated": sent_prompt_tokens,
+            "prompt_tokens_saved_estimated": single_prompt_tokens - sent_prompt_tokens,
+            "elapsed_seconds": round(elapsed, 2),
+            "seconds_per_lesson": round(elapsed / len(lessons), 2) if lessons else 0.0,
+        }
+        logger.info(
+            f"✅ Тесты: {len(tests)}/{len(lessons)} уроков за {calls} запросов "
+            f"(экономия {stats['llm_calls_saved']} запросов, ~{stats['prompt_tokens_saved_estimated']} токенов промпта), "
+            f"{stats['elapsed_seconds']} с"
+        )
+        return tests, stats
+
+    @staticmethod
+    def _single_prompt(lesson, course_title: str, target_audience: str, module_title: str, num_questions: int) -> str:
+        return TEST_GENERATION_PROMPT_TEMPLATE.format(
+            course_title=course_title,
+            target_audience=target_audience,
+            module_title=module_title,
+            lesson_title=lesson.lesson_title,
+            lesson_goal=lesson.lesson_goal,
+            content_outline=format_content_outline(lesson.content_outline),
+            num_questions=num_questions
+        )
+
+    @staticmethod
+    def _batch_prompt(
+        batch: List[Tuple[int, Any]],
+        course_title: str,
+        target_audience: str,
+        module_title: str,
+        num_questions: int,
+    ) -> str:
+        lessons_block = "\n\n".join(
+            TEST_BATCH_LESSON_TEMPLATE.format(
+                lesson_index=lesson_index,
+                lesson_title=lesson.lesson_title,
+                lesson_goal=lesson.lesson_goal,
+                content_outline=format_content_outline(lesson.content_outline).rstrip(),
+            )
+            for lesson_index, lesson in batch
+        )
+        return TEST_BATCH_GENERATION_PROMPT_TEMPLATE.format(
+            course_title=course_title,
+            target_audience=target_audience,
+            module_title=module_title,
+            num_questions=num_questions,
+            lessons_block=lessons_block,
+            lesson_keys=", ".join(str(lesson_index) for lesson_index, _ in batch),
+        )
+
+    @staticmethod
+    def _parse_batch(content_json: Optional[Dict[str, Any]], batch: List[Tuple[int, Any]]) -> Dict[int, LessonTest]:
+        """Валидирует тесты пакета по отдельности; невалидные и отсутствующие уроки пропускаются"""
+        raw_tests = (content_json or {}).get("tests") if isinstance(content_json, dict) else None
+        if not isinstance(raw_tests, dict):
+            logger.warning("❌ Пакетный ответ без объекта 'tests' — все уроки пакета уйдут в одиночные запросы")
+            return {}
+        tests: Dict[int, LessonTest] = {}
+        for lesson_index, lesson in batch:
+            payload = raw_tests.get(str(lesson_index))
+            if not isinstance(payload, dict):
+                logger.warning(f"⚠️ В пакетном ответе нет теста для урока {lesson_index}")
+                continue
+            payload.setdefault("lesson_title", lesson.lesson_title)
+            payload.setdefault("lesson_goal", lesson.lesson_goal)
+            try:
+                test = LESSON_TEST_ADAPTER.validate_python(payload)
+            except Exception as e:
+                logger.warning(f"⚠️ Невалидный тест урока {lesson_index} в пакете: {e}")
+                continue
+            if not test.questions:
+                logger.warning(f"⚠️ Тест урока {lesson_index} в пакете без вопросов")
+                continue
+            test.total_questions = len(test.questions)
+            tests[lesson_index] = test
+        return tests
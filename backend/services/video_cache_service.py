@@ -27,6 +27,8 @@ class VideoCacheService:
     def __init__(self, cache_file: str = "video_cache.json"):
         self.cache_file = Path(cache_file)
         self.cache: Dict[str, VideoCache] = {}
+        # Глобальный индекс готовых видео: ключ скрипта -> lesson_key записи с этим видео
+        self.script_index: Dict[str, str] = {}
         self._load_cache()
     
     def _load_cache(self):
@@ -40,7 +42,8 @@ class VideoCacheService:
                         video_data['created_at'] = datetime.fromisoformat(video_data['created_at'])
                         video_data['updated_at'] = datetime.fromisoformat(video_data['updated_at'])
                         self.cache[key] = VideoCache(**video_data)
-                logger.info(f"Загружен кэш видео: {len(self.cache)} записей")
+                self._rebuild_script_index()
+                logger.info(f"Загружен кэш видео: {len(self.cache)} записей, уникальных готовых скриптов: {len(self.script_index)}")
             else:
                 logger.info("Файл кэша видео не найден, создаем новый")
         except Exception as e:
@@ -70,11 +73,14 @@ class VideoCacheService:
         module_number: int,
         lesson_index: int,
         slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
     ) -> str:
-        """Генерирует уникальный ключ для урока (или для слайда урока)."""
+        """Генерирует уникальный ключ для урока (или для слайда урока; части слайда со 2-й — с суффиксом _p<N>)."""
         key = f"{course_id}_{module_number}_{lesson_index}"
         if slide_index is not None:
             key = f"{key}_{slide_index}"
+            if slide_part and slide_part > 1:
+                key = f"{key}_p{slide_part}"
         return key
     
     def _generate_content_hash(self, content: str) -> str:
@@ -82,6 +88,106 @@ class VideoCacheService:
         import hashlib
         return hashlib.md5(content.encode('utf-8')).hexdigest()
     
+    @staticmethod
+    def _normalize_script(content: str) -> str:
+        """Нормализует текст скрипта: схлопывает пробелы и переводы строк"""
+        return " ".join(content.split())
+    
+    def _generate_script_key(
+        self,
+        content: str,
+        avatar_id: str,
+        voice_id: str,
+        language: str,
+        quality: str,
+    ) -> str:
+        """Ключ глобального индекса: одинаковый скрипт + те же аватар/голос/язык/качество дают тот же рендер"""
+        import hashlib
+        normalized = self._normalize_script(content)
+        raw = "\x1f".join([normalized, avatar_id, voice_id, language, quality])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _script_key_for(self, video: VideoCache) -> str:
+        return self._generate_script_key(video.content, video.avatar_id, video.voice_id, video.language, video.quality)
+    
+    def _index_video(self, video: VideoCache):
+        """Добавляет готовое видео в глобальный индекс"""
+        if video.status == "completed" and video.video_id:
+            self.script_index.setdefault(self._script_key_for(video), video.lesson_key)
+    
+    def _rebuild_script_index(self):
+        """Перестраивает глобальный индекс по всем записям кэша"""
+        self.script_index = {}
+        for video in self.cache.values():
+            self._index_video(video)
+    
+    def _unindex_lesson_key(self, lesson_key: str):
+        """Убирает запись из индекса и ищет другую запись с тем же готовым видео"""
+        video = self.cache.get(lesson_key)
+        if not video:
+            return
+        script_key = self._script_key_for(video)
+        if self.script_index.get(script_key) != lesson_key:
+            return
+        del self.script_index[script_key]
+        for other_key, other in self.cache.items():
+            if other_key != lesson_key and other.status == "completed" and other.video_id \
+                    and self._script_key_for(other) == script_key:
+                self.script_index[script_key] = other_key
+                break
+    
+    def find_video_by_script(self, request: VideoGenerationRequest) -> Optional[VideoCache]:
+        """
+        Ищет готовое видео с тем же скриптом и параметрами рендера в любом уроке/курсе.
+        """
+        script_key = self._generate_script_key(
+            request.content, request.avatar_id, request.voice_id, request.language, request.quality
+        )
+        lesson_key = self.script_index.get(script_key)
+        if not lesson_key:
+            return None
+        video = self.cache.get(lesson_key)
+        if not video or video.status != "completed" or self._script_key_for(video) != script_key:
+            # Индекс устарел (запись перезаписана) — чиним лениво
+            self.script_index.pop(script_key, None)
+            return None
+        return video
+    
+    def reuse_video_by_script(
+        self,
+        course_id: int,
+        module_number: int,
+        lesson_index: int,
+        request: VideoGenerationRequest,
+        slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
+    ) -> Optional[VideoCache]:
+        """
+        Привязывает к уроку/слайду уже готовое видео с идентичным скриптом (без нового рендера HeyGen).
+        
+        Returns:
+            Запись кэша для урока/слайда или None, если такого видео ещё нет
+        """
+        source = self.find_video_by_script(request)
+        if not source:
+            return None
+        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index, slide_part)
+        if lesson_key == source.lesson_key:
+            return source
+        now = datetime.now()
+        video_cache = source.model_copy(update={
+            "lesson_key": lesson_key,
+            "title": request.title,
+            "content": request.content,
+            "created_at": now,
+            "updated_at": now,
+        })
+        self._unindex_lesson_key(lesson_key)
+        self.cache[lesson_key] = video_cache
+        self._save_cache()
+        logger.info(f"♻️ Видео {source.video_id} из {source.lesson_key} переиспользовано для {lesson_key} (идентичный скрипт)")
+        return video_cache
+    
     def get_cached_video(
         self,
         course_id: int,
@@ -89,11 +195,12 @@ class VideoCacheService:
         lesson_index: int,
         content: str,
         slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
     ) -> Optional[VideoCache]:
         """
         Получает кэшированное видео для урока (или для слайда при slide_index is not None).
         """
-        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index)
+        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index, slide_part)
         content_hash = self._generate_content_hash(content)
         
         if lesson_key in self.cache:
@@ -127,9 +234,10 @@ class VideoCacheService:
         download_url: Optional[str] = None,
         error_message: Optional[str] = None,
         slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
     ) -> VideoCache:
         """Сохраняет информацию о видео в кэш (для урока или для слайда при slide_index)."""
-        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index)
+        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index, slide_part)
         now = datetime.now()
         
         video_cache = VideoCache(
@@ -148,7 +256,9 @@ class VideoCacheService:
             error_message=error_message
         )
         
+        self._unindex_lesson_key(lesson_key)
         self.cache[lesson_key] = video_cache
+        self._index_video(video_cache)
         self._save_cache()
         
         logger.info(f"Видео {video_id} сохранено в кэш для урока {lesson_key}")
@@ -172,6 +282,8 @@ class VideoCacheService:
             error_message: Сообщение об ошибке
             error_code: Код ошибки
         """
+        # Одно видео может быть привязано к нескольким урокам (переиспользование по скрипту)
+        updated = False
         for lesson_key, video_cache in self.cache.items():
             if video_cache.video_id == video_id:
                 video_cache.status = status
@@ -188,9 +300,16 @@ class VideoCacheService:
                 if error_code:
                     video_cache.error_code = error_code
                 
-                self._save_cache()
-                logger.info(f"Статус видео {video_id} обновлен: {status}")
-                return
+                if status == "completed":
+                    self._index_video(video_cache)
+                else:
+                    self._unindex_lesson_key(lesson_key)
+                updated = True
+        
+        if updated:
+            self._save_cache()
+            logger.info(f"Статус видео {video_id} обновлен: {status}")
+            return
         
         logger.warning(f"Видео {video_id} не найдено в кэше для обновления")
     
@@ -207,11 +326,13 @@ class VideoCacheService:
         module_number: int,
         lesson_index: int,
         slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
     ) -> bool:
         """Удаляет видео из кэша (для урока или для слайда при slide_index)."""
-        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index)
+        lesson_key = self._generate_lesson_key(course_id, module_number, lesson_index, slide_index, slide_part)
         
         if lesson_key in self.cache:
+            self._unindex_lesson_key(lesson_key)
             del self.cache[lesson_key]
             self._save_cache()
             logger.info(f"Видео для урока {lesson_key} удалено из кэша")
@@ -231,5 +352,6 @@ class VideoCacheService:
             "completed_videos": completed_videos,
             "failed_videos": failed_videos,
             "generating_videos": generating_videos,
+            "unique_completed_scripts": len(self.script_index),
             "cache_file": str(self.cache_file)
         }
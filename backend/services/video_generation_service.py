@@ -12,15 +12,19 @@ from backend.config import settings
 
 from .mock_heygen_service import AdaptiveHeyGenService
 from .generation_service import GenerationService
+from ..models.video_cache_models import VideoGenerationRequest
+from .video_script_planner import ScriptPlanner
 
 logger = logging.getLogger(__name__)
 
 class VideoGenerationService:
     """Сервис для генерации уроков с видео-контентом"""
     
-    def __init__(self):
+    def __init__(self, queue_service=None):
         self.generation_service = GenerationService()
         self.heygen_service = AdaptiveHeyGenService()
+        # Очередь отправки в HeyGen (VideoQueueService); без неё видео отправляются напрямую
+        self.queue_service = queue_service
         
         # Настройки по умолчанию для видео
         self.default_avatar_id = settings.HEYGEN_DEFAULT_AVATAR_ID
@@ -44,27 +48,42 @@ class VideoGenerationService:
             # 1. Создаем базовый контент урока
             lesson_content = self._create_basic_lesson_content(lesson_data)
             
-            # 2. Разбиваем контент на слайды
-            slides = self._split_content_to_slides(lesson_content)
+            # 2. Берём сохранённые слайды урока (или режем текст по абзацам) и планируем сегменты озвучки
+            slides = lesson_data.get('slides') or self._split_content_to_slides(lesson_content)
+            planner = ScriptPlanner(language=lesson_data.get('language', 'ru'))
+            segments = planner.plan(slides)
             
-            # 3. Создаем видео для каждого слайда
+            # 3. Создаем видео для каждого сегмента (через очередь, если она подключена)
             slide_videos = []
-            for i, slide in enumerate(slides):
-                logger.info(f"Создание видео для слайда {i+1}/{len(slides)}")
+            for segment in segments:
+                logger.info(f"Создание видео для сегмента {segment.segment_index + 1}/{len(segments)} (слайд {segment.slide_number})")
+                # Слайд — по позиции в списке: номера сегментов сквозные и с индексами слайдов не совпадают
+                slide = slides[segment.slide_index]
                 
-                video_config = self._prepare_slide_video_config(slide, lesson_data, i+1)
-                video_info = await self._create_slide_video(video_config)
+                video_config = self._prepare_slide_video_config(
+                    {'content': segment.text}, lesson_data, segment.slide_number
+                )
+                if self.queue_service:
+                    video_info = self._enqueue_slide_video(
+                        video_config, lesson_data, segment.slide_index, segment.part
+                    )
+                else:
+                    video_info = await self._create_slide_video(video_config)
                 
                 slide_videos.append({
-                    'slide_number': i+1,
-                    'slide_title': slide.get('title', f'Слайд {i+1}'),
+                    'slide_number': segment.slide_number,
+                    'slide_title': slide.get('title', f'Слайд {segment.slide_number}'),
                     'slide_content': slide.get('content', ''),
+                    'slide_index': segment.slide_index,
+                    'segment': segment.model_dump(),
                     'video': video_info
                 })
             
             # 4. Добавляем информацию о видео к контенту урока
             lesson_content['slides'] = slide_videos
             lesson_content['total_slides'] = len(slides)
+            lesson_content['total_segments'] = len(segments)
+            lesson_content['estimated_duration_seconds'] = round(sum(s.estimated_seconds for s in segments), 1)
             
             # 5. Сохраняем метаданные
             lesson_content['metadata'] = {
@@ -139,6 +158,47 @@ class VideoGenerationService:
             'test_mode': lesson_data.get('test_mode', True)
         }
     
+    def _enqueue_slide_video(
+        self, video_config: Dict[str, Any], lesson_data: Dict[str, Any], slide_index: int, slide_part: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Ставит видео слайда в очередь генерации
+        
+        Args:
+            video_config: Конфигурация для видео
+            lesson_data: Исходные данные урока (course_id/module_number/lesson_index — опционально)
+            slide_index: Позиция слайда в уроке (с нуля) — индекс в content_data.slides
+            slide_part: Часть озвучки слайда (с 1); ключ в кэше видео — (slide_index, slide_part)
+            
+        Returns:
+            Dict с информацией о задании очереди
+        """
+        has_lesson_key = all(lesson_data.get(k) is not None for k in ('course_id', 'module_number', 'lesson_index'))
+        job = self.queue_service.enqueue(
+            VideoGenerationRequest(
+                title=video_config['title'],
+                content=video_config['content'],
+                avatar_id=video_config['avatar_id'],
+                voice_id=video_config['voice_id'],
+                language=video_config['language'],
+                quality=video_config['quality'],
+            ),
+            course_id=lesson_data.get('course_id'),
+            module_number=lesson_data.get('module_number'),
+            lesson_index=lesson_data.get('lesson_index'),
+            slide_index=slide_index if has_lesson_key else None,
+            slide_part=slide_part if has_lesson_key else None,
+            priority=lesson_data.get('priority', 100),
+        )
+        return {
+            'job_id': job.job_id,
+            'video_id': job.video_id,
+            'status': job.status,
+            'created_at': job.created_at.isoformat(),
+            'slide_number': video_config['slide_number'],
+            'title': video_config['title']
+        }
+    
     async def _create_slide_video(self, video_config: Dict[str, Any]) -> Dict[str, Any]:
         """
         Создает видео для слайда
@@ -494,6 +554,11 @@ class VideoGenerationService:
             
             lessons = course_data.get('lessons', [])
             
+            if self.queue_service:
+                course_videos['lessons'] = self._enqueue_course_lessons(course_data, lessons)
+                logger.info(f"Видео курса поставлены в очередь: {len(lessons)} уроков")
+                return course_videos
+            
             for lesson in lessons:
                 try:
                     # Генерируем видео для каждого урока
@@ -523,9 +588,57 @@ class VideoGenerationService:
             logger.error(f"Ошибка при генерации видео для курса: {str(e)}")
             raise Exception(f"Error generating course videos: {str(e)}")
     
+    def _enqueue_course_lessons(self, course_data: Dict[str, Any], lessons: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Ставит видео всех уроков курса в очередь (сама отправка в HeyGen идёт в фоне)
+        
+        Args:
+            course_data: Данные курса
+            lessons: Уроки курса
+            
+        Returns:
+            List с заданиями очереди по урокам
+        """
+        queued = []
+        for lesson in lessons:
+            try:
+                content = self._optimize_script_for_video(lesson.get('content', ''))
+                if not content.strip():
+                    raise Exception("Пустой текст урока")
+                job = self.queue_service.enqueue(
+                    VideoGenerationRequest(
+                        title=lesson.get('title', 'Урок'),
+                        content=content,
+                        avatar_id=lesson.get('avatar_id', self.default_avatar_id),
+                        voice_id=lesson.get('voice_id', self.default_voice_id),
+                        language=lesson.get('language', 'ru'),
+                        quality=lesson.get('quality', 'low'),
+                    ),
+                    course_id=course_data.get('id'),
+                    module_number=lesson.get('module_number'),
+                    lesson_index=lesson.get('lesson_index'),
+                    priority=lesson.get('priority', course_data.get('priority', 100)),
+                )
+                queued.append({
+                    'lesson_id': lesson.get('id'),
+                    'lesson_title': lesson.get('title'),
+                    'job_id': job.job_id,
+                    'video_id': job.video_id,
+                    'status': job.status
+                })
+            except Exception as e:
+                logger.error(f"Ошибка постановки видео урока {lesson.get('title')} в очередь: {str(e)}")
+                queued.append({
+                    'lesson_id': lesson.get('id'),
+                    'lesson_title': lesson.get('title'),
+                    'error': str(e),
+                    'status': 'error'
+                })
+        return queued
+    
     def _optimize_script_for_video(self, content: str, max_length: int = 2000) -> str:
         """
-        Оптимизирует скрипт для видео (ограничивает длину)
+        Оптимизирует скрипт для видео (ограничивает длину по границе предложения)
         
         Args:
             content: Исходный контент
@@ -534,17 +647,4 @@ class VideoGenerationService:
         Returns:
             Оптимизированный скрипт
         """
-        if len(content) <= max_length:
-            return content
-        
-        # Разбиваем на предложения и берем первые
-        sentences = content.split('. ')
-        optimized_content = ""
-        
-        for sentence in sentences:
-            if len(optimized_content + sentence + '. ') <= max_length:
-                optimized_content += sentence + '. '
-            else:
-                break
-        
-        return optimized_content.rstrip()
+        return ScriptPlanner().truncate(content, max_length)
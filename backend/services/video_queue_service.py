@@ -0,0 +1,520 @@
+"""
+Сервис персистентной очереди отправки видео в HeyGen.
+
+Зачем нужен:
+- HeyGen ограничивает число одновременно рендерящихся видео на аккаунт.
+  Очередь держит не больше `HEYGEN_MAX_CONCURRENT_RENDERS` активных рендеров
+  и отправляет следующие задания по мере освобождения слотов.
+- Задания упорядочены по приоритету (меньше — раньше), затем по времени постановки.
+- Очередь хранится в JSON-файле (как и кэш видео), поэтому после рестарта
+  процесса незавершённые задания продолжают обрабатываться.
+- Отказ отправки (в том числе по лимиту/таймауту HeyGen) повторяется с
+  экспоненциальной паузой (`next_attempt_at`), число повторов ограничено.
+- Перед отправкой проверяется `VideoCacheService`: урок с тем же содержимым
+  не рендерится повторно.
+
+Используемые библиотеки и компоненты:
+- `asyncio` — фоновый воркер в event loop FastAPI.
+- `fastapi.concurrency.run_in_threadpool` — синхронный HeyGen клиент вызывается в пуле потоков.
+- `json`, `pathlib.Path` — хранение очереди в файле.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from backend.config import settings
+from backend.database import db
+from ..models.video_cache_models import VideoGenerationRequest, VideoQueueJob
+from .video_cache_service import VideoCacheService
+
+logger = logging.getLogger(__name__)
+
+# Статусы, занимающие слот рендера HeyGen
+ACTIVE_STATUSES = ("submitting", "generating")
+# Финальные статусы заданий
+FINAL_STATUSES = ("completed", "failed", "cached")
+# Максимум попыток отправки одного задания
+MAX_SUBMIT_ATTEMPTS = 3
+# Максимум повторов после отказа HeyGen по лимиту/таймауту (считаются отдельно от MAX_SUBMIT_ATTEMPTS)
+MAX_TRANSIENT_ATTEMPTS = 10
+# Пауза перед повтором: RETRY_BASE_DELAY_SECONDS * 2^(n-1), не больше RETRY_MAX_DELAY_SECONDS
+RETRY_BASE_DELAY_SECONDS = 5
+RETRY_MAX_DELAY_SECONDS = 600
+# Сколько завершённых заданий хранить в файле очереди
+MAX_FINISHED_JOBS = 500
+
+
+class VideoQueueService:
+    """Очередь заданий на генерацию видео с лимитом параллельных рендеров.
+
+    ✅ Переживает рестарт (JSON-файл)
+    ✅ Лимит активных рендеров на аккаунт HeyGen
+    ✅ Приоритеты заданий
+    ✅ Дедупликация по хэшу содержимого через `VideoCacheService`
+    """
+
+    def __init__(
+        self,
+        heygen_client,
+        cache_service: VideoCacheService,
+        queue_file: Optional[str] = None,
+        max_concurrent: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        self.heygen_client = heygen_client
+        self.cache_service = cache_service
+        self.queue_file = Path(queue_file or settings.VIDEO_QUEUE_FILE)
+        self.max_concurrent = max_concurrent or settings.HEYGEN_MAX_CONCURRENT_RENDERS
+        self.poll_interval = poll_interval or settings.HEYGEN_POLL_INTERVAL_SECONDS
+        self.jobs: Dict[str, VideoQueueJob] = {}
+        # Время завершения рендеров (epoch seconds) — для расчёта пропускной способности
+        self._completed_at: Deque[float] = deque(maxlen=1000)
+        self._worker_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._load_queue()
+
+    # ------------------------------------------------------------------
+    # Персистентность
+    # ------------------------------------------------------------------
+
+    def _load_queue(self):
+        """Загружает очередь из файла и восстанавливает незавершённые задания"""
+        try:
+            if not self.queue_file.exists():
+                logger.info("Файл очереди видео не найден, создаем новый")
+                return
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for job_id, job_data in data.items():
+                job = VideoQueueJob(**job_data)
+                # Отправка прервалась рестартом: если video_id не получен — ставим в очередь заново
+                if job.status == "submitting":
+                    job.status = "generating" if job.video_id else "queued"
+                self.jobs[job_id] = job
+                if job.status == "completed" and job.finished_at:
+                    self._completed_at.append(job.finished_at.timestamp())
+            pending = sum(1 for j in self.jobs.values() if j.status not in FINAL_STATUSES)
+            logger.info(f"Загружена очередь видео: {len(self.jobs)} заданий, незавершённых: {pending}")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки очереди видео: {e}")
+            self.jobs = {}
+
+    def _save_queue(self):
+        """Сохраняет очередь в файл"""
+        try:
+            self._prune_finished_jobs()
+            data = {job_id: job.model_dump(mode="json") for job_id, job in self.jobs.items()}
+            tmp_file = self.queue_file.with_suffix(self.queue_file.suffix + ".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            tmp_file.replace(self.queue_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения очереди видео: {e}")
+
+    def _prune_finished_jobs(self):
+        """Удаляет самые старые завершённые задания сверх лимита хранения"""
+        finished = [j for j in self.jobs.values() if j.status in FINAL_STATUSES]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda j: j.finished_at or j.created_at)
+        for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+            del self.jobs[job.job_id]
+
+    # ------------------------------------------------------------------
+    # Постановка в очередь
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        """Хэш содержимого (тот же алгоритм, что и в VideoCacheService)"""
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+    def _find_pending_duplicate(self, job: VideoQueueJob) -> Optional[VideoQueueJob]:
+        """Ищет незавершённое задание с тем же уроком/слайдом и тем же содержимым"""
+        for existing in self.jobs.values():
+            if existing.status in FINAL_STATUSES:
+                continue
+            if (
+                existing.content_hash == job.content_hash
+                and existing.course_id == job.course_id
+                and existing.module_number == job.module_number
+                and existing.lesson_index == job.lesson_index
+                and existing.slide_index == job.slide_index
+                and existing.slide_part == job.slide_part
+                and existing.request.avatar_id == job.request.avatar_id
+                and existing.request.voice_id == job.request.voice_id
+                and existing.request.language == job.request.language
+                and existing.request.quality == job.request.quality
+            ):
+                return existing
+        return None
+
+    def _has_lesson_key(self, job: VideoQueueJob) -> bool:
+        return None not in (job.course_id, job.module_number, job.lesson_index)
+
+    def enqueue(
+        self,
+        request: VideoGenerationRequest,
+        course_id: Optional[int] = None,
+        module_number: Optional[int] = None,
+        lesson_index: Optional[int] = None,
+        slide_index: Optional[int] = None,
+        slide_part: Optional[int] = None,
+        priority: int = 100,
+        account: str = "default",
+    ) -> VideoQueueJob:
+        """
+        Ставит задание на генерацию видео в очередь
+
+        Args:
+            request: Параметры генерации (текст, аватар, голос, качество)
+            course_id, module_number, lesson_index, slide_index: Привязка к уроку/слайду (опционально)
+            slide_part: Часть озвучки слайда (с 1), если слайд разбит на несколько видео
+            priority: Приоритет (меньше — раньше)
+            account: Аккаунт HeyGen для учёта лимита параллельных рендеров
+
+        Returns:
+            Задание очереди (новое, уже существующее или взятое из кэша)
+        """
+        job = VideoQueueJob(
+            job_id=uuid.uuid4().hex,
+            account=account,
+            priority=priority,
+            request=request,
+            content_hash=self._content_hash(request.content),
+            course_id=course_id,
+            module_number=module_number,
+            lesson_index=lesson_index,
+            slide_index=slide_index,
+            slide_part=slide_part,
+            created_at=datetime.now(),
+        )
+
+        if not request.regenerate:
+            duplicate = self._find_pending_duplicate(job)
+            if duplicate:
+                logger.info(f"Задание для того же содержимого уже в очереди: {duplicate.job_id}")
+                return duplicate
+
+            if self._has_lesson_key(job):
+                cached = self.cache_service.get_cached_video(
+                    course_id, module_number, lesson_index, request.content, slide_index=slide_index, slide_part=slide_part
+                ) or self.cache_service.reuse_video_by_script(
+                    course_id, module_number, lesson_index, request, slide_index=slide_index, slide_part=slide_part
+                )
+            else:
+                cached = self.cache_service.find_video_by_script(request)
+            if cached:
+                if cached.status == "completed":
+                    self._mark_cached(job, cached)
+                    self.jobs[job.job_id] = job
+                    self._save_queue()
+                    return job
+                if cached.status == "generating" and self._has_lesson_key(job):
+                    # Рендер уже идёт — отслеживаем его как активное задание
+                    job.status = "generating"
+                    job.video_id = cached.video_id
+                    job.submitted_at = cached.created_at
+
+        self.jobs[job.job_id] = job
+        self._save_queue()
+        logger.info(f"Задание {job.job_id} поставлено в очередь (приоритет {priority}, статус {job.status})")
+        self._notify()
+        return job
+
+    def _mark_cached(self, job: VideoQueueJob, cached):
+        """Завершает задание готовым видео из кэша (без рендера HeyGen)"""
+        job.status = "cached"
+        job.video_id = cached.video_id
+        job.download_url = cached.download_url
+        job.finished_at = datetime.now()
+        logger.info(f"Видео взято из кэша без рендера: {cached.video_id}")
+        if self._has_lesson_key(job):
+            self._sync_db(job, "completed")
+
+    def _script_key(self, job: VideoQueueJob) -> str:
+        request = job.request
+        return self.cache_service._generate_script_key(
+            request.content, request.avatar_id, request.voice_id, request.language, request.quality
+        )
+
+    def get_job(self, job_id: str) -> Optional[VideoQueueJob]:
+        """Возвращает задание по ID"""
+        return self.jobs.get(job_id)
+
+    # ------------------------------------------------------------------
+    # Фоновый воркер
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Запускает фоновый воркер очереди (вызывается при старте приложения)"""
+        if self._worker_task and not self._worker_task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._worker_task = asyncio.create_task(self._run())
+        logger.info(f"Воркер очереди видео запущен (лимит рендеров: {self.max_concurrent})")
+
+    async def stop(self):
+        """Останавливает фоновый воркер"""
+        self._stopping = True
+        if self._worker_task:
+            self._notify()
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker_task = None
+        logger.info("Воркер очереди видео остановлен")
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self._poll_active_jobs()
+                await self._dispatch_queued_jobs()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера очереди видео: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _active_count(self, account: str) -> int:
+        return sum(1 for j in self.jobs.values() if j.account == account and j.status in ACTIVE_STATUSES)
+
+    def _next_jobs(self) -> List[VideoQueueJob]:
+        """Выбирает задания для отправки с учётом лимитов по аккаунтам"""
+        now = datetime.now()
+        queued = sorted(
+            (
+                j for j in self.jobs.values()
+                if j.status == "queued" and (j.next_attempt_at is None or j.next_attempt_at <= now)
+            ),
+            key=lambda j: (j.priority, j.created_at),
+        )
+        free_slots: Dict[str, int] = {}
+        selected = []
+        # Скрипты, которые уже рендерятся: такие же задания ждут и потом переиспользуют результат
+        in_flight = {self._script_key(j) for j in self.jobs.values() if j.status in ACTIVE_STATUSES}
+        for job in queued:
+            script_key = self._script_key(job)
+            if script_key in in_flight and not job.request.regenerate:
+                continue
+            if job.account not in free_slots:
+                free_slots[job.account] = self.max_concurrent - self._active_count(job.account)
+            if free_slots[job.account] > 0:
+                selected.append(job)
+                in_flight.add(script_key)
+                free_slots[job.account] -= 1
+        return selected
+
+    def _resolve_from_cache(self) -> bool:
+        """Закрывает задания, чей скрипт уже отрендерен другим заданием/уроком"""
+        resolved = False
+        for job in self.jobs.values():
+            if job.status != "queued" or job.request.regenerate:
+                continue
+            if self._has_lesson_key(job):
+                cached = self.cache_service.reuse_video_by_script(
+                    job.course_id, job.module_number, job.lesson_index, job.request, slide_index=job.slide_index, slide_part=job.slide_part
+                )
+            else:
+                cached = self.cache_service.find_video_by_script(job.request)
+            if cached:
+                self._mark_cached(job, cached)
+                resolved = True
+        return resolved
+
+    async def _dispatch_queued_jobs(self):
+        if self._resolve_from_cache():
+            self._save_queue()
+        jobs = self._next_jobs()
+        if not jobs:
+            return
+        for job in jobs:
+            job.status = "submitting"
+            job.attempts += 1
+        self._save_queue()
+        await asyncio.gather(*(self._submit_job(job) for job in jobs))
+        self._save_queue()
+
+    async def _submit_job(self, job: VideoQueueJob):
+        request = job.request
+        try:
+            response = await run_in_threadpool(
+                self.heygen_client.create_video_from_text,
+                text=request.content,
+                avatar_id=request.avatar_id,
+                voice_id=request.voice_id,
+                language=request.language,
+                quality=request.quality,
+            )
+            video_id = response.get("video_id")
+            if not video_id:
+                raise Exception(response.get("error", "HeyGen не вернул video_id"))
+        except Exception as e:
+            error_msg = str(e)
+            if "limit exceeded" in error_msg.lower() or "timeout" in error_msg.lower():
+                # Лимит/таймаут — не ошибка задания: попытка не считается, но повторы ограничены отдельно
+                job.attempts -= 1
+                job.transient_attempts += 1
+                if job.transient_attempts < MAX_TRANSIENT_ATTEMPTS:
+                    delay = self._schedule_retry(job, job.transient_attempts)
+                    logger.warning(
+                        f"HeyGen временно недоступен для задания {job.job_id}: {error_msg} "
+                        f"(повтор через {delay} с)"
+                    )
+                    return
+            elif job.attempts < MAX_SUBMIT_ATTEMPTS:
+                job.error_message = error_msg
+                delay = self._schedule_retry(job, job.attempts)
+                logger.warning(
+                    f"Ошибка отправки задания {job.job_id} (попытка {job.attempts}): {error_msg} "
+                    f"(повтор через {delay} с)"
+                )
+                return
+            job.status = "failed"
+            job.error_message = error_msg
+            job.next_attempt_at = None
+            job.finished_at = datetime.now()
+            logger.error(f"Задание {job.job_id} не удалось отправить: {error_msg}")
+            if self._has_lesson_key(job):
+                self.cache_service.cache_video(
+                    job.course_id, job.module_number, job.lesson_index, request, "", "failed",
+                    error_message=error_msg, slide_index=job.slide_index, slide_part=job.slide_part,
+                )
+            return
+
+        job.status = "generating"
+        job.video_id = video_id
+        job.submitted_at = datetime.now()
+        job.next_attempt_at = None
+        job.error_message = None
+        logger.info(f"Задание {job.job_id} отправлено в HeyGen: video_id={video_id}")
+        if self._has_lesson_key(job):
+            if request.regenerate:
+                self.cache_service.delete_video(
+                    job.course_id, job.module_number, job.lesson_index, slide_index=job.slide_index, slide_part=job.slide_part
+                )
+            self.cache_service.cache_video(
+                job.course_id, job.module_number, job.lesson_index, request, video_id, "generating",
+                slide_index=job.slide_index, slide_part=job.slide_part,
+            )
+            self._sync_db(job, "generating")
+
+    @staticmethod
+    def _schedule_retry(job: VideoQueueJob, retry_number: int) -> int:
+        """Возвращает задание в очередь с экспоненциальной паузой; возвращает паузу в секундах"""
+        delay = min(RETRY_BASE_DELAY_SECONDS * 2 ** (retry_number - 1), RETRY_MAX_DELAY_SECONDS)
+        job.status = "queued"
+        job.next_attempt_at = datetime.now() + timedelta(seconds=delay)
+        return delay
+
+    async def _poll_active_jobs(self):
+        active = [j for j in self.jobs.values() if j.status == "generating" and j.video_id]
+        if not active:
+            return
+        changed = False
+        for job in active:
+            status = await run_in_threadpool(self.heygen_client.get_video_status, job.video_id)
+            video_status = status.get("status")
+            if video_status == "completed":
+                job.status = "completed"
+                job.download_url = status.get("download_url")
+                job.finished_at = datetime.now()
+                self._completed_at.append(time.time())
+            elif video_status in ("failed", "not_found"):
+                job.status = "failed"
+                job.error_message = status.get("error")
+                job.finished_at = datetime.now()
+            else:
+                continue
+            changed = True
+            logger.info(f"Задание {job.job_id} завершено: {job.status}")
+            self.cache_service.update_video_status(
+                video_id=job.video_id,
+                status=job.status,
+                download_url=job.download_url,
+                duration=status.get("duration"),
+                file_size=status.get("file_size"),
+                error_message=status.get("error"),
+                error_code=status.get("error_code"),
+            )
+            if self._has_lesson_key(job):
+                self._sync_db(job, job.status)
+        if changed:
+            self._save_queue()
+
+    def _sync_db(self, job: VideoQueueJob, video_status: str):
+        """Сохраняет статус видео урока/слайда в БД"""
+        try:
+            if job.slide_index is not None:
+                db.update_lesson_slide_video_info(
+                    course_id=job.course_id,
+                    module_number=job.module_number,
+                    lesson_index=job.lesson_index,
+                    slide_index=job.slide_index, slide_part=job.slide_part,
+                    video_id=job.video_id,
+                    video_status=video_status,
+                    video_download_url=job.download_url,
+                )
+            else:
+                db.update_lesson_video_info(
+                    course_id=job.course_id,
+                    module_number=job.module_number,
+                    lesson_index=job.lesson_index,
+                    video_id=job.video_id,
+                    video_download_url=job.download_url,
+                    video_status=video_status,
+                    video_generated_at=datetime.now(),
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить статус видео задания {job.job_id} в БД: {e}")
+
+    # ------------------------------------------------------------------
+    # Статистика
+    # ------------------------------------------------------------------
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """Возвращает глубину очереди, загрузку слотов и пропускную способность"""
+        by_status: Dict[str, int] = {}
+        active_by_account: Dict[str, int] = {}
+        render_seconds = []
+        for job in self.jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+            if job.status in ACTIVE_STATUSES:
+                active_by_account[job.account] = active_by_account.get(job.account, 0) + 1
+            if job.status == "completed" and job.submitted_at and job.finished_at:
+                render_seconds.append((job.finished_at - job.submitted_at).total_seconds())
+
+        now = time.time()
+        completed_last_hour = sum(1 for ts in self._completed_at if now - ts <= 3600)
+        return {
+            "queue_depth": by_status.get("queued", 0),
+            "active_renders": sum(active_by_account.values()),
+            "active_by_account": active_by_account,
+            "max_concurrent_per_account": self.max_concurrent,
+            "by_status": by_status,
+            "completed_last_hour": completed_last_hour,
+            "avg_render_seconds": round(sum(render_seconds) / len(render_seconds), 1) if render_seconds else None,
+            "worker_running": bool(self._worker_task and not self._worker_task.done()),
+            "queue_file": str(self.queue_file),
+        }
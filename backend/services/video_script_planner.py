@@ -0,0 +1,196 @@
+"""
+Планировщик скрипта озвучки для видео по слайдам.
+
+Что делает:
+- берёт слайды урока (notes, если есть, иначе content) и очищает текст от markdown-разметки;
+- делит текст на предложения за один линейный проход (с учётом сокращений и десятичных чисел);
+- упаковывает предложения в сегменты, укладывающиеся в лимиты HeyGen по длине текста
+  (`HEYGEN_MAX_SCRIPT_CHARS`) и длительности (`HEYGEN_MAX_SEGMENT_SECONDS`);
+- оценивает длительность озвучки каждого сегмента;
+- считает стабильный хэш сегмента. Сегменты не пересекают границы слайдов, поэтому правка
+  одного слайда не меняет хэши остальных и они не перерендериваются.
+"""
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend.config import settings
+from ..models.video_cache_models import ScriptSegment
+from .video_cache_service import VideoCacheService
+
+# Скорость речи (слов в минуту) по языкам озвучки
+WORDS_PER_MINUTE = {
+    "ru": 130,
+    "en": 150,
+}
+DEFAULT_WORDS_PER_MINUTE = 140
+# Пауза между предложениями (сек)
+SENTENCE_PAUSE_SECONDS = 0.3
+
+# Сокращения, после точки в которых предложение не заканчивается
+ABBREVIATIONS = frozenset({
+    "т.е", "т.д", "т.п", "т.к", "т.н", "др", "см", "рис", "стр", "гл", "напр", "прим", "им", "гг", "вв",
+    "e.g", "i.e", "etc", "vs", "mr", "mrs", "dr", "fig", "no", "approx",
+})
+
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'»”)\]]*(?=\s|$)")
+_MARKDOWN_RE = re.compile(r"(\*\*|__|`+|^#{1,6}\s+|^\s*[-*•]\s+|^\s*\d+[.)]\s+)", re.MULTILINE)
+_WORD_RE = re.compile(r"\S+")
+
+
+def clean_narration(text: str) -> str:
+    """Убирает markdown-разметку, которую озвучка прочитала бы вслух"""
+    return _MARKDOWN_RE.sub("", text or "")
+
+
+def _ends_with_abbreviation(text: str, start: int, dot_pos: int) -> bool:
+    """Проверяет, что точка в позиции dot_pos завершает сокращение, а не предложение"""
+    word_start = max(text.rfind(" ", start, dot_pos), text.rfind("\t", start, dot_pos)) + 1
+    word = text[word_start:dot_pos].lower().lstrip("(«\"'")
+    if not word:
+        return False
+    # Инициалы: «А. С. Пушкин»
+    if len(word) == 1 and word.isalpha():
+        return True
+    return word in ABBREVIATIONS
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Делит текст на предложения за линейное время.
+
+    Перевод строки тоже считается границей (списки, абзацы).
+    """
+    sentences: List[str] = []
+    for line in text.splitlines():
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(line):
+            if line[match.start()] == "." and match.end() - match.start() == 1 \
+                    and _ends_with_abbreviation(line, start, match.start()):
+                continue
+            sentence = line[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        tail = line[start:].strip()
+        if tail:
+            sentences.append(tail)
+    return sentences
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """Режет слишком длинное предложение по словам"""
+    parts: List[str] = []
+    current: List[str] = []
+    length = 0
+    for word in _WORD_RE.findall(sentence):
+        extra = len(word) + (1 if current else 0)
+        if current and length + extra > max_chars:
+            parts.append(" ".join(current))
+            current, length = [], 0
+            extra = len(word)
+        current.append(word)
+        length += extra
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+
+def segment_hash(text: str) -> str:
+    """Хэш сегмента по нормализованному тексту (как в глобальном индексе VideoCacheService)"""
+    return hashlib.sha256(VideoCacheService._normalize_script(text).encode("utf-8")).hexdigest()
+
+
+class ScriptPlanner:
+    """Упаковка озвучки слайдов в сегменты под лимиты HeyGen"""
+
+    def __init__(
+        self,
+        max_chars: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        language: str = "ru",
+    ):
+        self.max_chars = max_chars or settings.HEYGEN_MAX_SCRIPT_CHARS
+        self.max_seconds = max_seconds or settings.HEYGEN_MAX_SEGMENT_SECONDS
+        self.words_per_minute = WORDS_PER_MINUTE.get(language, DEFAULT_WORDS_PER_MINUTE)
+
+    def estimate_seconds(self, word_count: int, sentence_count: int) -> float:
+        """Оценка длительности озвучки"""
+        return round(word_count / self.words_per_minute * 60 + sentence_count * SENTENCE_PAUSE_SECONDS, 1)
+
+    @staticmethod
+    def slide_narration(slide: Dict[str, Any]) -> str:
+        """Текст озвучки слайда: заметки преподавателя, иначе основной текст"""
+        notes = (slide.get("notes") or "").strip()
+        return clean_narration(notes or slide.get("content") or "")
+
+    def plan(self, slides: Iterable[Dict[str, Any]]) -> List[ScriptSegment]:
+        """
+        Строит сегменты озвучки по слайдам
+
+        Args:
+            slides: Слайды урока (dict с полями slide_number, content, notes)
+
+        Returns:
+            List сегментов в порядке слайдов
+        """
+        segments: List[ScriptSegment] = []
+        for slide_index, slide in enumerate(slides):
+            slide_number = slide.get("slide_number") or slide_index + 1
+            sentences: List[str] = []
+            for sentence in split_sentences(self.slide_narration(slide)):
+                if len(sentence) > self.max_chars:
+                    sentences.extend(_split_long_sentence(sentence, self.max_chars))
+                else:
+                    sentences.append(sentence)
+            for part, (text, words, count) in enumerate(self._pack(sentences), start=1):
+                segments.append(ScriptSegment(
+                    segment_index=len(segments),
+                    slide_index=slide_index,
+                    slide_number=slide_number,
+                    part=part,
+                    text=text,
+                    char_count=len(text),
+                    word_count=words,
+                    estimated_seconds=self.estimate_seconds(words, count),
+                    segment_hash=segment_hash(text),
+                ))
+        return segments
+
+    def _pack(self, sentences: List[str]):
+        """Жадно упаковывает предложения в сегменты, не превышая лимиты длины и длительности"""
+        current: List[str] = []
+        chars = words = 0
+        for sentence in sentences:
+            sentence_words = len(_WORD_RE.findall(sentence))
+            extra_chars = len(sentence) + (1 if current else 0)
+            too_long = chars + extra_chars > self.max_chars
+            too_slow = self.estimate_seconds(words + sentence_words, len(current) + 1) > self.max_seconds
+            if current and (too_long or too_slow):
+                yield " ".join(current), words, len(current)
+                current, chars, words = [], 0, 0
+                extra_chars = len(sentence)
+            current.append(sentence)
+            chars += extra_chars
+            words += sentence_words
+        if current:
+            yield " ".join(current), words, len(current)
+
+    def truncate(self, text: str, max_chars: Optional[int] = None) -> str:
+        """Обрезает текст по границе предложения (линейно), не разрывая мысль посередине"""
+        max_chars = max_chars or self.max_chars
+        text = clean_narration(text)
+        if len(text) <= max_chars:
+            return text
+        kept: List[str] = []
+        length = 0
+        for sentence in split_sentences(text):
+            extra = len(sentence) + (1 if kept else 0)
+            if length + extra > max_chars:
+                break
+            kept.append(sentence)
+            length += extra
+        if not kept:
+            # Первое предложение само длиннее лимита — режем по словам
+            return _split_long_sentence(text, max_chars)[0]
+        return " ".join(kept)
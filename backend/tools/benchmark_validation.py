@@ -0,0 +1,128 @@
+"""
+Микро-бенчмарк валидации доменных моделей (backend/models/validation.py).
+
+Сравнивает на синтетическом курсе (модули × уроки с тестами):
+- полный Course(**course_data), как раньше делали маршруты урока/модуля,
+  и course_lesson — валидация только нужного модуля;
+- LessonTest(**data) и TypeAdapter, созданный на каждый вызов, с заранее
+  собранным LESSON_TEST_ADAPTER;
+- проверяет, что course_lesson возвращает тот же урок, что и полный Course.
+
+Запуск (из корня репозитория):
+    python -m backend.tools.benchmark_validation [модулей] [уроков_в_модуле]
+"""
+import sys
+import time
+from typing import Any, Callable, Dict
+
+from pydantic import TypeAdapter
+
+from backend.models.domain import Course, LessonTest
+from backend.models.validation import LESSON_TEST_ADAPTER, course_lesson
+
+
+def make_test(title: str) -> Dict[str, Any]:
+    return {
+        "lesson_title": title,
+        "lesson_goal": "Проверить понимание темы",
+        "questions": [
+            {
+                "question_text": f"Вопрос {q + 1} по теме «{title}»?",
+                "options": [
+                    {"option_text": "Правильный ответ", "is_correct": True},
+                    {"option_text": "Неправильный ответ"},
+                    {"option_text": "Ещё один неправильный ответ"},
+                ],
+                "explanation": "Потому что так устроена тема",
+            }
+            for q in range(10)
+        ],
+    }
+
+
+def make_course(modules: int, lessons: int) -> Dict[str, Any]:
+    """Курс в том виде, в каком его возвращает db.get_course"""
+    return {
+        "id": 1,
+        "version": 3,
+        "created_at": "2025-01-01 10:00:00",
+        "updated_at": "2025-01-02 10:00:00",
+        "course_title": "Python с нуля",
+        "target_audience": "Начинающие разработчики",
+        "duration_hours": 40,
+        "modules": [
+            {
+                "module_number": m + 1,
+                "module_title": f"Модуль {m + 1}",
+                "module_goal": "Освоить тему модуля",
+                "lessons": [
+                    {
+                        "lesson_title": f"Урок {m + 1}.{l + 1}",
+                        "lesson_goal": "Разобраться с темой урока и закрепить её на практике",
+                        "content_outline": [f"Пункт плана {i + 1}" for i in range(6)],
+                        "format": "theory",
+                        "estimated_time_minutes": 45,
+                        "test": make_test(f"Урок {m + 1}.{l + 1}"),
+                    }
+                    for l in range(lessons)
+                ],
+            }
+            for m in range(modules)
+        ],
+    }
+
+
+def measure(name: str, func: Callable[[], Any], repeat: int = 200) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+    print(f"   {name:<45} {elapsed_ms:8.3f} мс")
+    return elapsed_ms
+
+
+def full_course_lesson(course_data: Dict[str, Any], module_number: int, lesson_index: int):
+    """Прежний путь маршрутов: валидация всего курса и поиск урока"""
+    course = Course(**course_data)
+    for module in course.modules:
+        if module.module_number == module_number:
+            return module, module.lessons[lesson_index]
+    return None, None
+
+
+def main() -> int:
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    lessons = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    course_data = make_course(modules, lessons)
+    module_number, lesson_index = modules, lessons - 1
+
+    print("=" * 60)
+    print(f"ВАЛИДАЦИЯ: курс {modules} модулей × {lessons} уроков (тесты по 10 вопросов)")
+    print("=" * 60)
+
+    expected = full_course_lesson(course_data, module_number, lesson_index)
+    actual = course_lesson(course_data, module_number, lesson_index)
+    same = actual[0] == expected[0] and actual[1] == expected[1]
+    print(f"{'✅' if same else '❌'} course_lesson возвращает тот же модуль и урок, что и полный Course")
+    missing = course_lesson(course_data, modules + 1, 0) == (None, None)
+    print(f"{'✅' if missing else '❌'} несуществующий модуль — (None, None)")
+
+    print("\nУрок из курса БД:")
+    full_ms = measure("Course(**course_data) + поиск урока", lambda: full_course_lesson(course_data, module_number, lesson_index))
+    partial_ms = measure("course_lesson (только модуль)", lambda: course_lesson(course_data, module_number, lesson_index))
+    print(f"   ускорение: ×{full_ms / partial_ms:.1f}")
+
+    test_data = make_test("Урок")
+    print("\nТест урока:")
+    measure("TypeAdapter(LessonTest) на каждый вызов", lambda: TypeAdapter(LessonTest).validate_python(test_data))
+    measure("LessonTest(**test_data)", lambda: LessonTest(**test_data))
+    measure("LESSON_TEST_ADAPTER.validate_python", lambda: LESSON_TEST_ADAPTER.validate_python(test_data))
+
+    ok = same and missing
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
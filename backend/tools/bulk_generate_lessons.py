@@ -0,0 +1,88 @@
+"""
+Массовая генерация детального контента уроков через Batch API OpenAI.
+
+Использование (из корня репозитория):
+    python -m backend.tools.bulk_generate_lessons submit [--course-id 12 --course-id 15] [--only-missing] [--limit 500]
+    python -m backend.tools.bulk_generate_lessons status <batch_id>
+    python -m backend.tools.bulk_generate_lessons ingest <batch_id> [--wait]
+    python -m backend.tools.bulk_generate_lessons run [--course-id 12] [--only-missing]   # submit + ожидание + ingest
+    python -m backend.tools.bulk_generate_lessons list
+
+Без --course-id обрабатываются все курсы. Задания хранятся в BATCH_JOBS_DIR.
+Для офлайн-проверки: python -m backend.tools.fake_batch_server и
+OPENAI_BATCH_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from backend.services.bulk_generation_service import BulkLessonGenerationService
+
+
+def print_report(report):
+    for key, ids in report.items():
+        print(f"  {key}: {len(ids)}")
+        for custom_id in ids[:10] if key != "saved" else []:
+            print(f"    - {custom_id}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетная генерация контента уроков (Batch API)")
+    parser.add_argument("--poll-interval", type=float, default=None, help="интервал опроса статуса, секунд")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("submit", "run"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--course-id", type=int, action="append", dest="course_ids", help="ID курса (можно несколько)")
+        sub.add_argument("--only-missing", action="store_true", help="только уроки без сохранённого контента")
+        sub.add_argument("--limit", type=int, default=None, help="максимум уроков в пакете")
+    subparsers.add_parser("status").add_argument("batch_id")
+    ingest_parser = subparsers.add_parser("ingest")
+    ingest_parser.add_argument("batch_id")
+    ingest_parser.add_argument("--wait", action="store_true", help="дождаться завершения пакета")
+    subparsers.add_parser("list")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    service = BulkLessonGenerationService()
+
+    if args.command == "list":
+        jobs = service.list_jobs()
+        if not jobs:
+            print("Заданий нет")
+        for job in jobs:
+            print(json.dumps(job, ensure_ascii=False))
+        return 0
+
+    if args.command == "status":
+        print(json.dumps(service.status(args.batch_id), ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command in ("submit", "run"):
+        job = service.submit(args.course_ids, only_missing=args.only_missing, limit=args.limit)
+        if job is None:
+            print("Нет уроков для генерации")
+            return 0
+        print(f"✅ Пакет {job['batch_id']} отправлен: {len(job['items'])} уроков")
+        if args.command == "submit":
+            return 0
+        batch_id, wait = job["batch_id"], True
+    else:
+        batch_id, wait = args.batch_id, args.wait
+
+    try:
+        report = service.ingest(batch_id, wait=wait, poll_interval=args.poll_interval)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Пакет {batch_id} принят:")
+    print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
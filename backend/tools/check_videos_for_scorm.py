@@ -44,75 +44,74 @@ def check_videos_for_scorm(course_id: int, database_url: str = None):
         # Создаем подключение к Render базе данных
         db = RenderDatabase(database_url)
         
-        # Получаем курс
-        course_data = db.get_course(course_id)
-        if not course_data:
-            print(f"❌ Курс с ID {course_id} не найден")
+        # Получаем уроки курса с видео одной проекцией на стороне БД (без загрузки course_data)
+        rows = db.get_lessons_video_overview(course_id=course_id)
+        if not rows:
+            print(f"❌ Курс с ID {course_id} не найден или в нём нет уроков")
             return
         
-        from backend.models.domain import Course
-        course = Course(**{k: v for k, v in course_data.items() if k not in ['id', 'created_at', 'updated_at']})
-        
-        print(f"📚 Курс: {course.course_title}\n")
+        print(f"📚 Курс: {rows[0]['course_title']}\n")
         
         total_lessons = 0
         lessons_with_video = 0
         lessons_ready_for_export = 0
         lessons_missing_video = []
+        current_module = None
         
         valid_statuses = ['completed', 'ready', 'done', 'success', 'finished', 'available']
         
-        for module in course.modules:
-            print(f"📦 Модуль {module.module_number}: {module.module_title}")
-            print("-" * 80)
+        for row in rows:
+            if row['module_number'] != current_module:
+                current_module = row['module_number']
+                print(f"📦 Модуль {row['module_number']}: {row['module_title']}")
+                print("-" * 80)
             
-            for lesson_idx, lesson in enumerate(module.lessons):
-                total_lessons += 1
-                
-                # Получаем информацию о видео
-                video_info = db.get_lesson_video_info(course_id, module.module_number, lesson_idx)
+            total_lessons += 1
+            lesson_idx = row['lesson_index']
+            lesson_title = row['lesson_title']
+            
+            print(f"\n  Урок {lesson_idx + 1}: {lesson_title}")
+            
+            video_id = row.get('video_id')
+            video_url = row.get('video_download_url')
+            video_status = row.get('video_status')
+            
+            if video_id or video_url:
+                lessons_with_video += 1
                 
-                print(f"\n  Урок {lesson_idx + 1}: {lesson.lesson_title}")
+                print(f"    video_id: {video_id}")
+                print(f"    video_status: {video_status}")
+                print(f"    video_url: {'есть' if video_url and video_url.strip() else 'нет'}")
                 
-                if video_info:
-                    lessons_with_video += 1
-                    video_id = video_info.get('video_id')
-                    video_url = video_info.get('video_download_url')
-                    video_status = video_info.get('video_status')
-                    
-                    print(f"    video_id: {video_id}")
-                    print(f"    video_status: {video_status}")
-                    print(f"    video_url: {'есть' if video_url and video_url.strip() else 'нет'}")
-                    
-                    # Проверяем, готово ли видео для экспорта
-                    if video_url and video_url.strip():
-                        if video_status is None or video_status.lower() in [s.lower() for s in valid_statuses]:
-                            lessons_ready_for_export += 1
-                            print(f"    ✅ Готово для экспорта")
-                        else:
-                            print(f"    ⚠️ Статус '{video_status}' не подходит для экспорта")
-                            lessons_missing_video.append({
-                                'module': module.module_number,
-                                'lesson': lesson_idx,
-                                'title': lesson.lesson_title,
-                                'reason': f"Статус '{video_status}' не подходит"
-                            })
+                # Проверяем, готово ли видео для экспорта
+                if video_url and video_url.strip():
+                    if video_status is None or video_status.lower() in [s.lower() for s in valid_statuses]:
+                        lessons_ready_for_export += 1
+                        print(f"    ✅ Готово для экспорта")
                     else:
-                        print(f"    ❌ Нет video_download_url")
+                        print(f"    ⚠️ Статус '{video_status}' не подходит для экспорта")
                         lessons_missing_video.append({
-                            'module': module.module_number,
+                            'module': row['module_number'],
                             'lesson': lesson_idx,
-                            'title': lesson.lesson_title,
-                            'reason': 'Нет video_download_url'
+                            'title': lesson_title,
+                            'reason': f"Статус '{video_status}' не подходит"
                         })
                 else:
-                    print(f"    ❌ Видео не найдено в базе данных")
+                    print(f"    ❌ Нет video_download_url")
                     lessons_missing_video.append({
-                        'module': module.module_number,
+                        'module': row['module_number'],
                         'lesson': lesson_idx,
-                        'title': lesson.lesson_title,
-                        'reason': 'Видео не найдено в БД'
+                        'title': lesson_title,
+                        'reason': 'Нет video_download_url'
                     })
+            else:
+                print(f"    ❌ Видео не найдено в базе данных")
+                lessons_missing_video.append({
+                    'module': row['module_number'],
+                    'lesson': lesson_idx,
+                    'title': lesson_title,
+                    'reason': 'Видео не найдено в БД'
+                })
         
         print(f"\n{'='*80}")
         print(f"Итого:")
@@ -37,7 +37,7 @@ def explain_course_id():
     print(f"{'='*80}\n")
     
     try:
-        courses_list = db.get_all_courses(limit=100, offset=0)
+        courses_list = db.get_all_courses(limit=100)
         
         if not courses_list:
             print("❌ Курсы не найдены в локальной базе данных")
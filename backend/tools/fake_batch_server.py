@@ -0,0 +1,255 @@
+"""
+Локальный фейковый сервер Batch API OpenAI для офлайн-проверки массовой генерации.
+
+Запуск (из корня репозитория):
+    python -m backend.tools.fake_batch_server [--port 8765] [--fail-every N] [--invalid-every N] [--truncate-every N]
+
+и в .env: OPENAI_BATCH_BASE_URL=http://127.0.0.1:8765/v1 (OPENAI_API_KEY — любой).
+
+Реализует то, что использует BatchClient:
+    POST /v1/files                 — загрузка JSONL (multipart)
+    GET  /v1/files/{id}/content    — содержимое файла
+    POST /v1/batches               — создание пакета
+    GET  /v1/batches/{id}          — статус: validating → in_progress → completed
+    POST /v1/batches/{id}/cancel   — отмена
+Ответ на каждый запрос — валидная лекция (GeneratedLecture) по названию и
+длительности урока из промпта; каждый N-й запрос можно сделать ошибкой,
+невалидным JSON или обрезанным по max_tokens.
+Только стандартная библиотека — сервер не требует uvicorn.
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+
+class FakeBatchState:
+    """Файлы и пакеты фейкового сервера (в памяти)"""
+
+    def __init__(self, fail_every: int = 0, invalid_every: int = 0, truncate_every: int = 0, polls_in_progress: int = 1):
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.fail_every = fail_every
+        self.invalid_every = invalid_every
+        self.truncate_every = truncate_every
+        self.polls_in_progress = polls_in_progress
+        self.lock = threading.Lock()
+
+    def add_file(self, filename: str, purpose: str, data: bytes) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        meta = {
+            "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed",
+        }
+        self.files[file_id] = {"meta": meta, "data": data}
+        return meta
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        total = sum(1 for line in self.files[body["input_file_id"]]["data"].splitlines() if line.strip())
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "validating", "created_at": int(time.time()), "metadata": body.get("metadata"),
+            "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": total, "completed": 0, "failed": 0},
+            "_polls": 0,
+        }
+        self.batches[batch_id] = batch
+        return batch
+
+    def advance(self, batch: Dict[str, Any]) -> None:
+        """Каждый опрос продвигает пакет: validating → in_progress (N опросов) → completed"""
+        if batch["status"] in ("completed", "cancelled", "failed", "expired"):
+            return
+        batch["_polls"] += 1
+        if batch["_polls"] == 1:
+            batch["status"] = "in_progress"
+        if batch["_polls"] > self.polls_in_progress:
+            self._complete(batch)
+
+    def _complete(self, batch: Dict[str, Any]) -> None:
+        outputs, errors = [], []
+        lines = [line for line in self.files[batch["input_file_id"]]["data"].splitlines() if line.strip()]
+        for number, raw in enumerate(lines, 1):
+            request = json.loads(raw)
+            if self.fail_every and number % self.fail_every == 0:
+                errors.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"],
+                    "response": None, "error": {"code": "server_error", "message": "Фейковая ошибка"},
+                })
+                continue
+            content, finish_reason = fake_completion(request["body"], number, self)
+            outputs.append({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200, "request_id": uuid.uuid4().hex,
+                    "body": {
+                        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion",
+                        "created": int(time.time()), "model": request["body"].get("model"),
+                        "choices": [{
+                            "index": 0, "finish_reason": finish_reason,
+                            "message": {"role": "assistant", "content": content},
+                        }],
+                        "usage": {"prompt_tokens": len(raw) // 4, "completion_tokens": len(content) // 4,
+                                  "total_tokens": (len(raw) + len(content)) // 4},
+                    },
+                },
+                "error": None,
+            })
+        if outputs:
+            batch["output_file_id"] = self.add_file("output.jsonl", "batch_output", _jsonl(outputs))["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file("errors.jsonl", "batch_output", _jsonl(errors))["id"]
+        batch["request_counts"] = {"total": len(lines), "completed": len(outputs), "failed": len(errors)}
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+
+def _jsonl(rows) -> bytes:
+    return "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode("utf-8")
+
+
+def fake_completion(body: Dict[str, Any], number: int, state: FakeBatchState) -> tuple:
+    """Текст ответа модели и finish_reason для запроса пакета"""
+    prompt = body["messages"][-1]["content"]
+    title = re.search(r"- Урок: (.+)", prompt)
+    minutes = re.search(r"- Время: (\d+)", prompt)
+    lecture = {
+        "lecture_title": title.group(1).strip() if title else "Лекция",
+        "duration_minutes": max(15, min(240, int(minutes.group(1)) if minutes else 45)),
+        "learning_objectives": ["Понять основную идею", "Применить на практике"],
+        "key_takeaways": ["Главный вывод урока"],
+        "slides": [
+            {
+                "slide_number": i,
+                "title": f"Слайд {i}",
+                "content": f"Содержимое слайда {i}: пример {{\"key\": \"value\"}} и пояснение.",
+                "slide_type": "code" if i == 2 else "content",
+                "code_example": "def f(x):\n    return {\"x\": x}" if i == 2 else None,
+                "notes": "Заметка",
+            }
+            for i in range(1, 4)
+        ],
+    }
+    content = json.dumps(lecture, ensure_ascii=False)
+    if state.invalid_every and number % state.invalid_every == 0:
+        return json.dumps({"slides": "нет слайдов"}, ensure_ascii=False), "stop"
+    if state.truncate_every and number % state.truncate_every == 0:
+        return content[: len(content) // 2], "length"
+    return content, "stop"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    state: FakeBatchState
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Any, raw: Optional[bytes] = None) -> None:
+        data = raw if raw is not None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if raw is not None else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self) -> None:
+        self._send(404, {"error": {"message": f"Not found: {self.path}", "type": "invalid_request_error"}})
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    @staticmethod
+    def _public(batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        with self.state.lock:
+            if path == "/v1/files":
+                message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self._body()
+                )
+                fields, filename, data = {}, "upload.jsonl", b""
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    if part.get_filename():
+                        filename, data = part.get_filename(), part.get_payload(decode=True)
+                    else:
+                        fields[name] = part.get_content().strip()
+                return self._send(200, self.state.add_file(filename, fields.get("purpose", "batch"), data))
+            if path == "/v1/batches":
+                body = json.loads(self._body() or b"{}")
+                if body.get("input_file_id") not in self.state.files:
+                    return self._send(400, {"error": {"message": "input_file_id не найден"}})
+                return self._send(200, self._public(self.state.create_batch(body)))
+            match = re.fullmatch(r"/v1/batches/([\w-]+)/cancel", path)
+            if match and match.group(1) in self.state.batches:
+                batch = self.state.batches[match.group(1)]
+                batch["status"] = "cancelled"
+                return self._send(200, self._public(batch))
+        self._not_found()
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        with self.state.lock:
+            match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+            if match and match.group(1) in self.state.files:
+                return self._send(200, None, raw=self.state.files[match.group(1)]["data"])
+            match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+            if match and match.group(1) in self.state.batches:
+                batch = self.state.batches[match.group(1)]
+                self.state.advance(batch)
+                return self._send(200, self._public(batch))
+        self._not_found()
+
+
+class FakeBatchServer:
+    """Фейковый сервер в фоновом потоке; base_url — для OPENAI_BATCH_BASE_URL / openai.OpenAI(base_url=...)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_options):
+        self.state = FakeBatchState(**state_options)
+        handler = type("FakeBatchHandler", (_Handler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeBatchServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-batch-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фейковый сервер Batch API OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="каждый N-й запрос — ошибка")
+    parser.add_argument("--invalid-every", type=int, default=0, help="каждый N-й ответ — невалидная лекция")
+    parser.add_argument("--truncate-every", type=int, default=0, help="каждый N-й ответ — обрезан по max_tokens")
+    args = parser.parse_args()
+
+    server = FakeBatchServer(
+        args.host, args.port,
+        fail_every=args.fail_every, invalid_every=args.invalid_every, truncate_every=args.truncate_every,
+    )
+    print(f"🧪 Фейковый Batch API: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -18,28 +18,25 @@ def find_course(search_term):
     print(f"Поиск курсов содержащих: '{search_term}'")
     print(f"{'='*80}\n")
     
-    courses_list = db.get_all_courses(limit=100, offset=0)
+    # Полнотекстовый поиск в БД (названия курса, модулей и уроков)
+    courses_list = db.get_all_courses(limit=100, search=search_term)
     
-    found = False
     for course_summary in courses_list:
         course_title = course_summary.get('course_title', '')
-        if search_term.lower() in course_title.lower():
-            found = True
-            course_id = course_summary.get('id')
-            print(f"✅ Найден курс: ID={course_id}, Название='{course_title}'")
-            print(f"\nПроверка видео для этого курса...\n")
-            
-            # Запускаем проверку всех уроков
-            from backend.tools.check_lesson_video_info import list_all_lessons_with_videos
-            list_all_lessons_with_videos(course_id)
+        course_id = course_summary.get('id')
+        print(f"✅ Найден курс: ID={course_id}, Название='{course_title}'")
+        print(f"\nПроверка видео для этого курса...\n")
+        
+        # Запускаем проверку всех уроков
+        from backend.tools.check_lesson_video_info import list_all_lessons_with_videos
+        list_all_lessons_with_videos(course_id)
     
-    if not found:
+    if not courses_list:
         print(f"❌ Курсы содержащие '{search_term}' не найдены")
         print(f"\nДоступные курсы:")
-        for course_summary in courses_list:
+        for course_summary in db.get_all_courses(limit=100):
             print(f"  ID={course_summary.get('id')}: {course_summary.get('course_title')}")
 
-
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Использование: python backend/tools/find_course_by_name.py <поисковый_термин>")
@@ -20,7 +20,7 @@ def list_all_course_ids():
     print(f"{'='*80}\n")
     
     try:
-        courses_list = db.get_all_courses(limit=100, offset=0)
+        courses_list = db.get_all_courses(limit=100)
         
         if not courses_list:
             print("❌ Курсы не найдены в базе данных")
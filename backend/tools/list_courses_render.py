@@ -48,7 +48,7 @@ def list_courses_render(database_url: str = None):
         print("✅ Подключение успешно!\n")
         
         # Получаем список всех курсов
-        courses_list = db.get_all_courses(limit=100, offset=0)
+        courses_list = db.get_all_courses(limit=100)
         
         if not courses_list:
             print("❌ Курсы не найдены в базе данных")
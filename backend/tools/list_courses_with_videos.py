@@ -25,73 +25,55 @@ def list_all_courses(course_id: int = None):
         print(f"{'='*80}\n")
     
     try:
-        # Получаем список всех курсов или конкретный курс
-        if course_id:
-            course_data = db.get_course(course_id)
-            if not course_data:
-                print(f"❌ Курс с ID {course_id} не найден в базе данных")
-                return
-            
-            # Создаем список с одним курсом для единообразной обработки
-            courses_list = [{'id': course_id, 'course_title': course_data.get('course_title', 'Без названия')}]
-        else:
-            courses_list = db.get_all_courses(limit=100, offset=0)
+        # Одна проекция на стороне БД: модули/уроки из course_data + колонки видео,
+        # без загрузки и парсинга полных документов курсов
+        rows = db.get_lessons_video_overview(course_id=course_id, limit=100)
         
-        if not courses_list:
-            print("❌ Курсы не найдены в базе данных")
+        if not rows:
+            if course_id:
+                print(f"❌ Курс с ID {course_id} не найден в базе данных (или в нём нет уроков)")
+            else:
+                print("❌ Курсы не найдены в базе данных")
             return
         
-        # Для каждого курса получаем полную информацию
-        for course_summary in courses_list:
-            course_id = course_summary.get('id')
-            course_title = course_summary.get('course_title', 'Без названия')
-            
-            print(f"\n📚 Курс ID: {course_id} - {course_title}")
+        courses = {}
+        for row in rows:
+            courses.setdefault((row['course_id'], row['course_title']), []).append(row)
+        
+        for (course_id, course_title), lessons in courses.items():
+            print(f"\n📚 Курс ID: {course_id} - {course_title or 'Без названия'}")
             print("-" * 80)
             
-            # Получаем полную информацию о курсе
-            course_data = db.get_course(course_id)
-            if not course_data:
-                print("  ⚠️ Не удалось загрузить полную информацию о курсе")
-                continue
-            
-            from backend.models.domain import Course
-            try:
-                course = Course(**{k: v for k, v in course_data.items() if k not in ['id', 'created_at', 'updated_at']})
-            except Exception as e:
-                print(f"  ⚠️ Ошибка парсинга курса: {e}")
-                continue
-            
             total_lessons = 0
             lessons_with_video = 0
             lessons_ready = 0
+            current_module = None
             
-            for module in course.modules:
-                print(f"\n  📦 Модуль {module.module_number}: {module.module_title}")
+            for row in lessons:
+                if row['module_number'] != current_module:
+                    current_module = row['module_number']
+                    print(f"\n  📦 Модуль {row['module_number']}: {row['module_title']}")
                 
-                for lesson_idx, lesson in enumerate(module.lessons):
-                    total_lessons += 1
-                    
-                    # Проверяем наличие видео
-                    video_info = db.get_lesson_video_info(course_id, module.module_number, lesson_idx)
+                total_lessons += 1
+                lesson_idx = row['lesson_index']
+                video_url = row.get('video_download_url')
+                video_status = row.get('video_status')
+                
+                if row.get('video_id') or video_url:
+                    lessons_with_video += 1
                     
-                    if video_info:
-                        lessons_with_video += 1
-                        video_url = video_info.get('video_download_url')
-                        video_status = video_info.get('video_status')
-                        
-                        if video_url and video_url.strip() and (not video_status or video_status in ['completed', 'ready', 'done', 'success']):
-                            status_icon = "✅"
-                            lessons_ready += 1
-                        else:
-                            status_icon = "⚠️"
-                        
-                        print(f"    {status_icon} Урок {lesson_idx + 1}: {lesson.lesson_title}")
-                        print(f"        video_id: {video_info.get('video_id', 'нет')}")
-                        print(f"        video_status: {video_info.get('video_status', 'нет')}")
-                        print(f"        video_url: {'есть' if video_url and video_url.strip() else 'нет'}")
+                    if video_url and video_url.strip() and (not video_status or video_status in ['completed', 'ready', 'done', 'success']):
+                        status_icon = "✅"
+                        lessons_ready += 1
                     else:
-                        print(f"    ❌ Урок {lesson_idx + 1}: {lesson.lesson_title} (видео нет)")
+                        status_icon = "⚠️"
+                    
+                    print(f"    {status_icon} Урок {lesson_idx + 1}: {row['lesson_title']}")
+                    print(f"        video_id: {row.get('video_id') or 'нет'}")
+                    print(f"        video_status: {video_status or 'нет'}")
+                    print(f"        video_url: {'есть' if video_url and video_url.strip() else 'нет'}")
+                else:
+                    print(f"    ❌ Урок {lesson_idx + 1}: {row['lesson_title']} (видео нет)")
             
             print(f"\n  Итого для курса {course_id}:")
             print(f"    Всего уроков: {total_lessons}")
@@ -0,0 +1,123 @@
+"""
+Проверка телеметрии вызовов AI без обращений к AI.
+
+- метки задачи (ai_task) и маршрута/course_id (middleware) попадают в записи,
+  в том числе из пула потоков через bind_context;
+- запись в таблицу ai_calls пачками по AI_TELEMETRY_BATCH_SIZE;
+- сводка (GROUP BY и оконные функции в БД): перцентили только по вызовам
+  модели, попадания в кэш, токены;
+- GET /api/metrics/ai и отказ на неизвестную группировку.
+
+Использование:
+    python backend/tools/test_ai_telemetry.py
+"""
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.config import settings
+
+settings.AI_TELEMETRY_ENABLED = True
+settings.AI_TELEMETRY_BATCH_SIZE = 3
+
+from backend.ai import telemetry
+from backend.database.db import CourseDatabase
+from backend.services.ai_telemetry_service import AITelemetryService, summarize_ai_call_stats
+
+
+def check(ok: bool, message: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {message}")
+    return ok
+
+
+def test_labels() -> bool:
+    telemetry.drain(10 ** 6)
+    scope = {"method": "POST", "path": "/api/courses/7/modules/1/lessons/0/test", "path_params": {"course_id": "7"}}
+    with telemetry.request_context(scope), telemetry.ai_task("lesson_test"):
+        telemetry.record_ai_call("gpt-4o-mini", 120, telemetry.OUTCOME_OK, prompt_tokens=100, completion_tokens=50)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(telemetry.bind_context(telemetry.record_cache_hit), "lesson_test").result()
+    telemetry.record_ai_call("gpt-4o", 10, telemetry.OUTCOME_ERROR, retries=2)
+    records = telemetry.drain(10)
+
+    ok = check(len(records) == 3, f"в буфере 3 записи ({len(records)})")
+    call, hit, outside = records
+    ok &= check(call["task"] == "lesson_test" and call["course_id"] == 7, "задача и course_id из контекста")
+    ok &= check(call["total_tokens"] == 150, "total_tokens = prompt + completion")
+    ok &= check(hit["cache_hit"] and hit["route"] == call["route"], "метки переносятся в пул потоков (bind_context)")
+    ok &= check(outside["task"] == telemetry.UNKNOWN_TASK and outside["route"] is None, "вне запроса и задачи — unknown")
+    return ok
+
+
+def test_flush_and_summary(database: CourseDatabase) -> bool:
+    calls = []
+
+    class CountingDatabase:
+        def save_ai_calls(self, records):
+            calls.append(len(records))
+            return database.save_ai_calls(records)
+
+        def __getattr__(self, name):
+            return getattr(database, name)
+
+    with telemetry.ai_task("lesson_detailed"):
+        for latency in (100, 200, 300, 400, 1000):
+            telemetry.record_ai_call("gpt-4o", latency, telemetry.OUTCOME_OK, prompt_tokens=10, completion_tokens=10)
+        telemetry.record_cache_hit("lesson_detailed")
+    with telemetry.ai_task("module_goal"):
+        telemetry.record_ai_call("gpt-4o-mini", 50, telemetry.OUTCOME_TRUNCATED, retries=1)
+
+    service = AITelemetryService(CountingDatabase())
+    written = service.flush()
+    ok = check(written == 7 and calls == [3, 3, 1], f"записано 7 пачками по 3 ({calls})")
+
+    summary = service.summary(hours=1)
+    groups = {group["task"]: group for group in summary["groups"]}
+    detailed = groups.get("lesson_detailed", {})
+    ok &= check(summary["totals"]["calls"] == 7, f"всего вызовов 7 ({summary['totals']['calls']})")
+    ok &= check(detailed.get("cache_hits") == 1 and detailed.get("model_calls") == 5, "попадание в кэш не считается вызовом модели")
+    ok &= check(detailed.get("latency_ms", {}).get("p50") == 300 and detailed["latency_ms"]["p99"] == 1000,
+                f"перцентили задержки ({detailed.get('latency_ms')})")
+    ok &= check(detailed.get("total_tokens") == 100, "токены по задаче")
+    ok &= check(groups.get("module_goal", {}).get("truncated") == 1, "обрезанный ответ учтён")
+    ok &= check(summary["totals"]["latency_ms"]["max"] == 1000 and summary["totals"]["model_calls"] == 6,
+                "итоги по всем группам")
+    ok &= check(summarize_ai_call_stats([], [], [], "model")["totals"]["latency_ms"]["p50"] is None, "пустая сводка без ошибок")
+    return ok
+
+
+def test_route(database: CourseDatabase) -> bool:
+    from fastapi.testclient import TestClient
+
+    import backend.main
+    import backend.services.ai_telemetry_service as service_module
+
+    service_module.ai_telemetry_service.db = database
+    client = TestClient(backend.main.app)
+    response = client.get("/api/metrics/ai", params={"hours": 1, "group_by": "model"})
+    ok = check(response.status_code == 200 and response.json()["group_by"] == "model", "GET /api/metrics/ai")
+    response = client.get("/api/metrics/ai", params={"group_by": "secret"})
+    ok &= check(response.status_code == 400, "неизвестная группировка — 400")
+    return ok
+
+
+def main() -> int:
+    print("=" * 60)
+    print("ТЕЛЕМЕТРИЯ ВЫЗОВОВ AI")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = CourseDatabase(str(Path(tmp) / "telemetry.db"))
+        ok = test_labels()
+        ok &= test_flush_and_summary(database)
+        ok &= test_route(database)
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
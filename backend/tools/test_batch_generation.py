@@ -0,0 +1,134 @@
+"""
+Офлайн-проверка пакетной генерации уроков (Batch API) на фейковом сервере.
+
+Поднимает backend/tools/fake_batch_server.py в потоке, создаёт курс во временной
+SQLite-базе, отправляет уроки пакетом, дожидается завершения и принимает
+результаты. Проверяется, что сохранённый контент проходит валидацию лекции,
+а ошибки, невалидные и обрезанные ответы и изменённые после отправки уроки
+попадают в отчёт и не сохраняются.
+
+Использование:
+    python backend/tools/test_batch_generation.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-test")
+
+import httpx
+import openai
+
+from backend.ai.batch_client import BatchClient
+from backend.database.db import CourseDatabase
+from backend.models.domain import GeneratedLecture
+from backend.services.bulk_generation_service import BulkLessonGenerationService, lesson_custom_id
+from backend.tools.fake_batch_server import FakeBatchServer
+
+
+def make_course(lessons_per_module: int = 4) -> dict:
+    return {
+        "course_title": "Пакетная генерация: тестовый курс",
+        "target_audience": "Разработчики",
+        "duration_hours": 10,
+        "modules": [
+            {
+                "module_number": module_number,
+                "module_title": f"Модуль {module_number}",
+                "module_goal": f"Цель модуля {module_number}",
+                "lessons": [
+                    {
+                        "lesson_title": f"Урок {module_number}.{i + 1}",
+                        "lesson_goal": "Разобраться в теме",
+                        "content_outline": ["Пункт 1", "Пункт 2"],
+                        "estimated_time_minutes": 30 + 15 * i,
+                    }
+                    for i in range(lessons_per_module)
+                ],
+            }
+            for module_number in (1, 2)
+        ],
+    }
+
+
+def test_batch_generation() -> bool:
+    print("=" * 60)
+    print("ПАКЕТНАЯ ГЕНЕРАЦИЯ УРОКОВ НА ФЕЙКОВОМ BATCH API")
+    print("=" * 60)
+
+    # Каждый 3-й запрос — ошибка, каждый 5-й — невалидная лекция, каждый 7-й — обрезан
+    server = FakeBatchServer(fail_every=3, invalid_every=5, truncate_every=7).start()
+    ok = True
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = CourseDatabase(os.path.join(tmp, "courses.db"))
+            course_id = database.save_course(make_course())
+            client = openai.OpenAI(api_key="sk-offline-test", base_url=server.base_url, http_client=httpx.Client())
+            service = BulkLessonGenerationService(
+                database=database,
+                batch_client=BatchClient(client),
+                jobs_dir=os.path.join(tmp, "batch_jobs"),
+            )
+
+            job = service.submit([course_id])
+            print(f"\n📦 Пакет {job['batch_id']}: {len(job['items'])} уроков")
+            ok &= len(job["items"]) == 8
+
+            # Урок изменён после отправки — его результат не должен перезаписать новый урок
+            course_data = database.get_course(course_id)
+            course_data["modules"][1]["lessons"][3]["lesson_title"] = "Переименованный урок"
+            database.update_course(course_id, {k: v for k, v in course_data.items() if k not in ("id", "created_at", "updated_at")})
+
+            try:
+                service.ingest(job["batch_id"])
+                print("❌ Незавершённый пакет принят")
+                ok = False
+            except ValueError as e:
+                print(f"✅ Незавершённый пакет не принимается: {e}")
+
+            report = service.ingest(job["batch_id"], wait=True, poll_interval=0.05)
+            print(f"\n📊 Отчёт: { {key: len(ids) for key, ids in report.items()} }")
+            expected = {
+                "failed": [3, 6],
+                "invalid": [5],
+                "truncated": [7],
+                "stale": [8],
+                "saved": [1, 2, 4],
+            }
+            ordered_ids = list(job["items"])
+            for key, numbers in expected.items():
+                ids = sorted(ordered_ids[n - 1] for n in numbers)
+                if sorted(report[key]) != ids:
+                    print(f"❌ {key}: ожидалось {ids}, получено {sorted(report[key])}")
+                    ok = False
+
+            for custom_id in report["saved"]:
+                item = job["items"][custom_id]
+                content = database.get_lesson_content(course_id, item["module_number"], item["lesson_index"])
+                lecture = GeneratedLecture(**content)
+                print(f"   ✅ {custom_id}: {lecture.lecture_title}, {len(lecture.slides)} слайдов")
+                ok &= lecture.lecture_title == item["lesson_title"]
+            ok &= database.get_lesson_content(course_id, 2, 3) is None
+
+            # Повторная отправка только недостающих уроков
+            retry_job = service.submit([course_id], only_missing=True)
+            ok &= lesson_custom_id(course_id, 1, 0) not in retry_job["items"]
+            ok &= len(retry_job["items"]) == 8 - len(report["saved"])
+            print(f"\n🔁 Повторный пакет (--only-missing): {len(retry_job['items'])} уроков")
+
+            jobs = service.list_jobs()
+            ok &= len(jobs) == 2 and any(j["report"] for j in jobs)
+    finally:
+        server.stop()
+
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_batch_generation() else 1)
@@ -0,0 +1,241 @@
+"""
+Фазз-тест и бенчмарк однопроходной починки JSON (backend/ai/json_sanitizer).
+
+Запуск (из корня репозитория):
+    python -m backend.tools.test_json_sanitizer [каталог_с_ответами_модели] [итераций]
+
+Корпус: синтетическая структура курса размером с ответ на 12k токенов (с
+примерами кода, где есть `{`, `[` и `"` внутри строк) плюс сохранённые ответы
+модели — файлы *.json / *.txt из указанного каталога (по умолчанию debug_json,
+куда ContentGenerator сохраняет проблемные ответы).
+
+Проверки:
+- валидный JSON проходит без исправлений и без изменения данных;
+- висячие/пропущенные запятые, сырые переносы строк и лишний текст вокруг
+  исправляются с точным восстановлением исходных данных;
+- любой обрезанный ответ превращается в валидный JSON-объект;
+- сравнение скорости с прежней цепочкой регулярных выражений (0, 2 и 20 ошибок в ответе).
+"""
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from backend.ai.json_sanitizer import extract_json, repair_json, summarize_repairs
+
+
+CODE_SAMPLES = [
+    'def parse(data):\n    return {"key": data["value"], "items": [1, 2, 3]}',
+    'if (x > 0) {\n    console.log("x = {" + x + "}");\n}',
+    'pattern = re.compile(r"\\d+\\s*[a-z]{2,}")',
+    'SELECT json_extract(data, \'$.a[0]\') FROM t WHERE s = "}]";',
+    'print(f"{{literal}} {value!r}")\t# табуляция',
+]
+
+
+def _make_course(modules: int = 12, lessons: int = 8) -> dict:
+    rnd = random.Random(42)
+    return {
+        "course_title": "Python для backend-разработчиков: \"от основ\" до продакшена",
+        "target_audience": "Middle-разработчики",
+        "duration_hours": 40,
+        "modules": [
+            {
+                "module_number": m,
+                "module_title": f"Модуль {m}: асинхронность, {{шаблоны}} и [массивы]",
+                "module_goal": "Научиться писать надёжный код\nс тестами и логированием",
+                "lessons": [
+                    {
+                        "lesson_title": f"Урок {m}.{k}",
+                        "lesson_goal": "Разобрать пример и повторить его самостоятельно",
+                        "format": "theory",
+                        "estimated_time_minutes": 30 + k,
+                        "content_outline": [
+                            f"Пункт {j}: {rnd.choice(CODE_SAMPLES)}" for j in range(1, 5)
+                        ],
+                        "assessment": None,
+                        "is_practical": k % 2 == 0,
+                    }
+                    for k in range(1, lessons + 1)
+                ],
+            }
+            for m in range(1, modules + 1)
+        ],
+    }
+
+
+def _load_captured(directory: Path) -> list:
+    """Сохранённые ответы модели; для файлов debug_json берётся секция ORIGINAL JSON"""
+    samples = []
+    if not directory.is_dir():
+        return samples
+    for path in sorted(directory.glob("*")):
+        if path.suffix not in (".json", ".txt"):
+            continue
+        text = path.read_text(encoding="utf-8", errors="replace")
+        if "ORIGINAL JSON:" in text:
+            text = text.split("ORIGINAL JSON:", 1)[1].split("FIXED JSON:", 1)[0].strip("=\n")
+        samples.append((path.name, text))
+    return samples
+
+
+def _legacy_extract(content: str):
+    """Прежний алгоритм: подсчёт скобок без учёта строк и цепочка re.sub"""
+    content = content.replace('```json', '').replace('```', '').strip()
+    json_str = content[content.find('{'):content.rfind('}') + 1]
+    if not json_str.rstrip().endswith('}'):
+        if (json_str.count('"') - json_str.count('\\"')) % 2:
+            json_str += '"'
+        json_str = json_str.rstrip().rstrip(',')
+        json_str += ']' * max(0, json_str.count('[') - json_str.count(']'))
+        json_str += '}' * max(0, json_str.count('{') - json_str.count('}'))
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        pass
+    json_str = re.sub(r',(\s*[}\]])', r'\1', json_str).replace(',,', ',')
+    json_str = re.sub(r'"\s*\n\s*"', '",\n        "', json_str)
+    json_str = re.sub(r'}\s*\n\s*{', '},\n        {', json_str)
+    json_str = re.sub(r'}\s*\n\s*"', '},\n        "', json_str)
+    json_str = re.sub(r']\s*\n\s*"', '],\n        "', json_str)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return None
+
+
+def _drop_commas(text: str, rnd: random.Random, count: int) -> str:
+    """Удаляет запятые в конце строк (между элементами при форматировании с indent)"""
+    positions = [m.start() for m in re.finditer(r",\n", text)]
+    for pos in sorted(rnd.sample(positions, min(count, len(positions))), reverse=True):
+        text = text[:pos] + text[pos + 1:]
+    return text
+
+
+def _add_trailing_commas(text: str, rnd: random.Random, count: int) -> str:
+    positions = [m.start() for m in re.finditer(r"\n\s*[}\]]", text)]
+    for pos in sorted(rnd.sample(positions, min(count, len(positions))), reverse=True):
+        text = text[:pos] + "," + text[pos:]
+    return text
+
+
+def _raw_newlines(text: str) -> str:
+    """Модель пишет переносы строк в значениях как есть, а не как \\n"""
+    return text.replace("\\n", "\n").replace("\\t", "\t")
+
+
+def _check_exact(label: str, broken: str, expected: dict) -> int:
+    repaired = repair_json(broken)
+    parsed = json.loads(repaired.text)
+    assert parsed == expected, f"{label}: данные после починки не совпадают"
+    assert extract_json(broken) == expected, f"{label}: extract_json вернул другие данные"
+    return len(repaired.repairs)
+
+
+def test_valid_roundtrip(corpus: list):
+    print("1️⃣ Валидный JSON: без исправлений")
+    for name, text in corpus:
+        try:
+            expected = json.loads(text)
+        except json.JSONDecodeError:
+            continue
+        repaired = repair_json(text)
+        assert repaired.repairs == [], f"{name}: лишние исправления {repaired.repairs[:3]}"
+        assert json.loads(repaired.text) == expected, f"{name}: данные изменились"
+    print("✅ Валидные документы не изменены")
+
+
+def test_mutations(course: dict, iterations: int):
+    print("2️⃣ Типовые ошибки модели: точное восстановление")
+    rnd = random.Random(7)
+    text = json.dumps(course, ensure_ascii=False, indent=2)
+    total_repairs = 0
+    for it in range(iterations):
+        broken = _drop_commas(text, rnd, rnd.randint(1, 20))
+        broken = _add_trailing_commas(broken, rnd, rnd.randint(0, 20))
+        if it % 2:
+            broken = _raw_newlines(broken)
+        if it % 3 == 0:
+            broken = "Вот структура курса:\n```json\n" + broken + "\n```\nГотово!"
+        total_repairs += _check_exact(f"мутация {it}", broken, course)
+    example = repair_json(_raw_newlines(_drop_commas(text, rnd, 3)))
+    print(f"   пример отчёта: {summarize_repairs(example.repairs)}")
+    print(f"✅ {iterations} вариантов восстановлены точно ({total_repairs} исправлений)")
+
+
+def test_truncation(corpus: list, iterations: int):
+    print("3️⃣ Обрезанные ответы: всегда валидный объект")
+    rnd = random.Random(13)
+    legacy_failures = 0
+    checked = 0
+    for name, text in corpus:
+        start = text.find("{")
+        if start == -1:
+            continue
+        for _ in range(iterations):
+            cut = rnd.randint(start + 1, len(text))
+            fragment = text[:cut]
+            parsed = extract_json(fragment)
+            assert isinstance(parsed, dict), f"{name}: обрезка на {cut} не восстановлена"
+            if _legacy_extract(fragment) is None:
+                legacy_failures += 1
+            checked += 1
+    print(f"✅ {checked} обрезок восстановлены (прежний алгоритм не справился с {legacy_failures})")
+
+
+def test_code_in_strings():
+    print("4️⃣ Скобки и кавычки внутри строк")
+    doc = {"lectures": [{"title": "Код", "code": sample} for sample in CODE_SAMPLES]}
+    text = json.dumps(doc, ensure_ascii=False, indent=2)
+    cut = text.rfind('"code"')
+    parsed = extract_json(text[:cut + 40])
+    assert parsed["lectures"][:-1] == doc["lectures"][:-1], "Содержимое строк с кодом повреждено"
+    quoted = '{"title": "Фраза "в кавычках" внутри", "regex": "\\d+\\w"}'
+    assert extract_json(quoted) == {"title": 'Фраза "в кавычках" внутри', "regex": "\\d+\\w"}
+    # Кавычка перед запятой внутри текста: строка не разрезается и ключ не выдумывается
+    comma = '{"text": "He wrote "stop", then left", "n": 1}'
+    assert extract_json(comma) == {"text": 'He wrote "stop", then left', "n": 1}, extract_json(comma)
+    assert extract_json('{"a": "x", b: 1}') == {"a": "x", "b": 1}, "ключ без кавычек после запятой"
+    # NaN/Infinity не JSON: отбрасываются и на быстром пути, и в сканере
+    assert extract_json('{"a": NaN}') == {"a": None}, extract_json('{"a": NaN}')
+    assert extract_json('{"a": [1, Infinity], "b": 2,}') == {"a": [1], "b": 2}, "Infinity в массиве"
+    print("✅ Содержимое строк с кодом не повреждено")
+
+
+def test_benchmark(course: dict, repeat: int = 20):
+    print("5️⃣ Бенчмарк на структуре курса")
+    text = json.dumps(course, ensure_ascii=False, indent=2)
+    print(f"   размер ответа: {len(text) / 1024:.0f} КБ (~{len(text) // 4} токенов)")
+    for errors in (0, 2, 20):
+        rnd = random.Random(21)
+        broken = _add_trailing_commas(_drop_commas(text, rnd, errors - errors // 2), rnd, errors // 2) if errors else text
+        print(f"   ошибок в ответе: {errors}")
+        for label, fn in (("прежняя цепочка re.sub", _legacy_extract), ("однопроходная починка", extract_json)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                result = fn(broken)
+            elapsed = (time.perf_counter() - started) / repeat
+            status = "данные верны" if result == course else "❌ данные потеряны/повреждены"
+            print(f"      {label}: {elapsed * 1000:.1f} мс — {status}")
+
+
+if __name__ == "__main__":
+    captured_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("debug_json")
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print("🧪 Тест починки JSON")
+    print("=" * 50)
+    course = _make_course()
+    corpus = [("synthetic_course", json.dumps(course, ensure_ascii=False, indent=2))]
+    corpus += _load_captured(captured_dir)
+    print(f"Корпус: {len(corpus)} документов ({len(corpus) - 1} сохранённых ответов из {captured_dir})")
+
+    test_valid_roundtrip(corpus)
+    test_mutations(course, iterations)
+    test_truncation(corpus, iterations)
+    test_code_in_strings()
+    test_benchmark(course)
+
+    print("\n🎉 Все проверки пройдены")
@@ -0,0 +1,97 @@
+"""
+Проверка экспорта детального контента урока через API без обращений к AI.
+
+- курс и контент урока пишутся во временную SQLite;
+- GET .../lessons/{i}/export/{format} для json, markdown и html отдаёт 200
+  и содержит название курса, урока и слайд;
+- неизвестный формат — 400, несуществующий урок — 404.
+
+Использование:
+    python backend/tools/test_lesson_export.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fastapi.testclient import TestClient
+
+import backend.api.lessons_routes as lessons_routes
+import backend.main
+from backend.database.db import CourseDatabase
+
+COURSE = {
+    "course_title": "Python с нуля",
+    "target_audience": "Начинающие разработчики",
+    "duration_hours": 10,
+    "modules": [
+        {
+            "module_number": 1,
+            "module_title": "Основы",
+            "module_goal": "Освоить синтаксис",
+            "lessons": [
+                {
+                    "lesson_title": "Переменные",
+                    "lesson_goal": "Понять переменные",
+                    "content_outline": ["Присваивание", "Типы"],
+                    "format": "theory",
+                    "estimated_time_minutes": 45,
+                }
+            ],
+        }
+    ],
+}
+
+LESSON_CONTENT = {
+    "lecture_title": "Переменные",
+    "duration_minutes": 45,
+    "slides": [{"slide_number": 1, "title": "Присваивание", "content": "x = 1 связывает имя с объектом"}],
+}
+
+
+def check(ok: bool, message: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {message}")
+    return ok
+
+
+def main() -> int:
+    print("=" * 60)
+    print("ЭКСПОРТ КОНТЕНТА УРОКА")
+    print("=" * 60)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        database = CourseDatabase(str(Path(tmp) / "export.db"))
+        course_id = database.save_course(COURSE)
+        database.save_lesson_content(
+            course_id=course_id,
+            module_number=1,
+            lesson_index=0,
+            lesson_title="Переменные",
+            content_data=LESSON_CONTENT,
+        )
+        lessons_routes.db = database
+        client = TestClient(backend.main.app)
+        base = f"/api/courses/{course_id}/modules/1/lessons/0/export"
+
+        for fmt in ("json", "markdown", "html"):
+            response = client.get(f"{base}/{fmt}")
+            text = response.content.decode("utf-8") if response.status_code == 200 else response.text
+            ok &= check(response.status_code == 200, f"{fmt}: статус {response.status_code}")
+            ok &= check(
+                all(part in text for part in ("Python с нуля", "Переменные", "Присваивание")),
+                f"{fmt}: курс, урок и слайд в экспорте",
+            )
+
+        ok &= check(client.get(f"{base}/docx").status_code == 400, "неизвестный формат — 400")
+        missing = client.get(f"/api/courses/{course_id}/modules/1/lessons/5/export/markdown")
+        ok &= check(missing.status_code == 404, "несуществующий урок — 404")
+
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
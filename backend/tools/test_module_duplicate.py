@@ -0,0 +1,99 @@
+"""
+Проверка дублирования модуля вместе с контентом без обращений к AI.
+
+- копия модуля получает контент модуля и уроков исходного;
+- если копирование контента падает (триггер во временной SQLite), не
+  записывается и структура курса: ответ 500, модуля-копии нет, версия курса та же.
+
+Использование:
+    python backend/tools/test_module_duplicate.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fastapi.testclient import TestClient
+
+import backend.api.modules_routes as modules_routes
+import backend.main
+import backend.services.course_update_service as course_update_service
+from backend.database.db import CourseDatabase
+
+COURSE = {
+    "course_title": "Python с нуля",
+    "target_audience": "Начинающие разработчики",
+    "modules": [
+        {
+            "module_number": 1,
+            "module_title": "Основы",
+            "module_goal": "Освоить синтаксис",
+            "lessons": [
+                {"lesson_title": "Переменные", "lesson_goal": "Понять переменные", "format": "theory"},
+                {"lesson_title": "Циклы", "lesson_goal": "Понять циклы", "format": "theory"},
+            ],
+        }
+    ],
+}
+
+DUPLICATE = {"module_title": "Основы (копия)", "module_goal": "Повторить синтаксис"}
+
+
+def check(ok: bool, message: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {message}")
+    return ok
+
+
+def make_course(database: CourseDatabase) -> int:
+    course_id = database.save_course(COURSE)
+    for index, title in enumerate(("Переменные", "Циклы")):
+        database.save_lesson_content(
+            course_id=course_id,
+            module_number=1,
+            lesson_index=index,
+            lesson_title=title,
+            content_data={"lecture_title": title, "slides": []},
+        )
+    return course_id
+
+
+def main() -> int:
+    print("=" * 60)
+    print("ДУБЛИРОВАНИЕ МОДУЛЯ С КОНТЕНТОМ")
+    print("=" * 60)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        database = CourseDatabase(str(Path(tmp) / "duplicate.db"))
+        modules_routes.db = database
+        course_update_service.db = database
+        client = TestClient(backend.main.app)
+
+        course_id = make_course(database)
+        response = client.post(f"/api/courses/{course_id}/modules/1/duplicate", json=DUPLICATE)
+        ok &= check(response.status_code == 200 and response.json().get("new_module_number") == 2, "копия модуля — №2")
+        copied = [database.get_lesson_content(course_id, 2, index) for index in range(2)]
+        ok &= check(all(copied) and copied[1]["lecture_title"] == "Циклы", "контент уроков скопирован")
+
+        course_id = make_course(database)
+        version = database.get_course(course_id)["version"]
+        with database._connect() as conn:
+            conn.execute("""
+                CREATE TRIGGER fail_copy BEFORE INSERT ON lesson_contents
+                WHEN NEW.module_number = 2
+                BEGIN SELECT RAISE(ABORT, 'копирование сорвано'); END
+            """)
+        response = client.post(f"/api/courses/{course_id}/modules/1/duplicate", json=DUPLICATE)
+        course = database.get_course(course_id)
+        ok &= check(response.status_code == 500, f"ошибка копирования — 500 ({response.status_code})")
+        ok &= check(len(course["modules"]) == 1 and course["version"] == version, "структура курса не изменилась")
+        ok &= check(database.get_lesson_content(course_id, 2, 0) is None, "контента копии нет")
+
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
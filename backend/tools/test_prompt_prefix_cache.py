@@ -0,0 +1,167 @@
+"""
+Проверка стабильности префикса промптов (кэширование промпта у провайдера).
+
+Строит промпты для разных уроков и модулей одного курса теми же функциями,
+что и генерация, и проверяет, что все они начинаются с одинакового префикса
+(постоянные инструкции + контекст курса), а поля урока идут только после него.
+Без обращений к AI.
+
+Использование:
+    python backend/tools/test_prompt_prefix_cache.py
+"""
+import os
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.ai.content_generator import ContentGenerator
+from backend.ai.prompts import (
+    LESSON_DETAILED_SYSTEM_PROMPT,
+    LESSON_DETAILED_PROMPT_PREFIX,
+    MODULE_CONTENT_PROMPT_PREFIX,
+    MODULE_CONTENT_PROMPT_TEMPLATE,
+    MODULE_LESSONS_PROMPT_PREFIX,
+    MODULE_LESSONS_PROMPT_TEMPLATE,
+    TEST_GENERATION_SYSTEM_PROMPT,
+    TEST_GENERATION_PROMPT_PREFIX,
+    TEST_BATCH_GENERATION_PROMPT_PREFIX,
+    TOPIC_MATERIAL_PROMPT_PREFIX,
+    TOPIC_MATERIAL_PROMPT_TEMPLATE,
+    format_lessons_list,
+)
+from backend.models.domain import Course
+from backend.services.test_generator_service import TestGeneratorService, CHARS_PER_TOKEN
+
+COURSE_TITLE = "Python для анализа данных"
+TARGET_AUDIENCE = "Начинающие аналитики"
+DURATION = "8 недель"
+
+
+def make_course() -> Course:
+    return Course(
+        course_title=COURSE_TITLE,
+        target_audience=TARGET_AUDIENCE,
+        modules=[
+            {
+                "module_number": module_number,
+                "module_title": f"Модуль {module_number}: {title}",
+                "module_goal": f"Освоить {title.lower()}",
+                "lessons": [
+                    {
+                        "lesson_title": f"{title}: урок {i + 1}",
+                        "lesson_goal": f"Разобраться с темой {i + 1}",
+                        "content_outline": [f"Пункт {j + 1} урока {i + 1}" for j in range(3)],
+                        "estimated_time_minutes": 45 + 15 * i,
+                    }
+                    for i in range(3)
+                ],
+            }
+            for module_number, title in enumerate(["Основы pandas", "Визуализация"], 1)
+        ],
+    )
+
+
+def check_family(name: str, prefix: str, prompts: list, system_prompt: str = "") -> bool:
+    """Все промпты начинаются с prefix, и после префикса промпты различаются"""
+    ok = all(prompt.startswith(prefix) for prompt in prompts)
+    ok &= len({prompt[len(prefix):] for prompt in prompts}) == len(prompts)
+    shared = len(os.path.commonprefix(prompts))
+    prefix_tokens = (len(system_prompt) + len(prefix)) // CHARS_PER_TOKEN
+    share = sum(len(prefix) / len(prompt) for prompt in prompts) / len(prompts)
+    print(
+        f"{'✅' if ok else '❌'} {name}: {len(prompts)} промптов, общий префикс {shared} симв. "
+        f"(~{prefix_tokens} токенов с системным промптом, {share:.0%} промпта)"
+    )
+    return ok
+
+
+def test_prompt_prefix_stability() -> bool:
+    print("=" * 60)
+    print("СТАБИЛЬНОСТЬ ПРЕФИКСА ПРОМПТОВ В РАМКАХ КУРСА")
+    print("=" * 60)
+
+    course = make_course()
+    lessons = [(module, index, lesson) for module in course.modules for index, lesson in enumerate(module.lessons)]
+    course_context = {"course_title": COURSE_TITLE, "target_audience": TARGET_AUDIENCE}
+    ok = True
+
+    ok &= check_family(
+        "Детальный контент урока",
+        LESSON_DETAILED_PROMPT_PREFIX.format(**course_context),
+        [ContentGenerator.build_lesson_detailed_prompt(lesson, module, COURSE_TITLE, TARGET_AUDIENCE)
+         for module, _, lesson in lessons],
+        LESSON_DETAILED_SYSTEM_PROMPT,
+    )
+    ok &= check_family(
+        "Тест урока",
+        TEST_GENERATION_PROMPT_PREFIX.format(**course_context),
+        [TestGeneratorService._single_prompt(lesson, COURSE_TITLE, TARGET_AUDIENCE, module.module_title, 10)
+         for module, _, lesson in lessons],
+        TEST_GENERATION_SYSTEM_PROMPT,
+    )
+    ok &= check_family(
+        "Пакет тестов модуля",
+        TEST_BATCH_GENERATION_PROMPT_PREFIX.format(**course_context),
+        [TestGeneratorService._batch_prompt(
+            list(enumerate(module.lessons)), COURSE_TITLE, TARGET_AUDIENCE, module.module_title, 10
+        ) for module in course.modules],
+        TEST_GENERATION_SYSTEM_PROMPT,
+    )
+    ok &= check_family(
+        "Контент модуля",
+        MODULE_CONTENT_PROMPT_PREFIX.format(**course_context),
+        [MODULE_CONTENT_PROMPT_TEMPLATE.format(
+            module_number=module.module_number,
+            module_title=module.module_title,
+            module_goal=module.module_goal,
+            lessons_list=format_lessons_list(module.lessons),
+            num_lessons=len(module.lessons),
+            **course_context,
+        ) for module in course.modules],
+    )
+    ok &= check_family(
+        "Материал темы",
+        TOPIC_MATERIAL_PROMPT_PREFIX.format(**course_context),
+        [TOPIC_MATERIAL_PROMPT_TEMPLATE.format(
+            module_title=module.module_title,
+            lesson_title=lesson.lesson_title,
+            lesson_goal=lesson.lesson_goal,
+            topic_number=1,
+            topic_title=lesson.content_outline[0],
+            **course_context,
+        ) for module, _, lesson in lessons],
+    )
+    modules_overview = "\n".join(
+        f"{module.module_number}. {module.module_title} — {module.module_goal}" for module in course.modules
+    )
+    skeleton_context = {
+        "course_title": COURSE_TITLE, "audience": TARGET_AUDIENCE,
+        "duration": DURATION, "modules_overview": modules_overview,
+    }
+    ok &= check_family(
+        "Уроки модуля (двухфазная структура)",
+        MODULE_LESSONS_PROMPT_PREFIX.format(**skeleton_context),
+        [MODULE_LESSONS_PROMPT_TEMPLATE.format(
+            module_number=module.module_number,
+            module_title=module.module_title,
+            module_goal=module.module_goal,
+            **skeleton_context,
+        ) for module in course.modules],
+    )
+
+    # Поля урока не должны попадать в префикс
+    prefix = LESSON_DETAILED_PROMPT_PREFIX.format(**course_context)
+    leaked = [lesson.lesson_title for _, _, lesson in lessons if lesson.lesson_title in prefix]
+    if leaked:
+        print(f"❌ Поля урока в префиксе: {leaked}")
+        ok = False
+
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_prompt_prefix_stability() else 1)
@@ -0,0 +1,170 @@
+"""
+Проверка кэша похожих запросов (MinHash) без обращений к AI.
+
+- «Введение в Python» → «Введение в Python.» — готовый ответ без вызова модели;
+- правка цели урока — черновик, непохожий урок — промах, другой курс — промах;
+- фоновая замена черновика свежей генерацией (и отказ, если черновик правили);
+- время поиска по заполненному кэшу.
+
+Использование:
+    python backend/tools/test_similarity_cache.py
+"""
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.config import settings
+
+settings.AI_SIMILARITY_CACHE_ENABLED = True
+settings.AI_CACHE_ENABLED = False
+
+from backend.ai.content_generator import ContentGenerator
+from backend.ai.similarity_cache import SimilarityCache, normalize_text
+from backend.models.domain import Lesson, Module
+from backend.services.draft_refresh_service import DraftRefreshService
+
+
+class FakeAIClient:
+    """Считает вызовы и возвращает валидную лекцию"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def call_ai_json(self, system_prompt, user_prompt, **kwargs):
+        self.calls += 1
+        return {
+            "lecture_title": "Лекция",
+            "duration_minutes": 45,
+            "slides": [{"slide_number": 1, "title": "Слайд", "content": f"Ответ №{self.calls}"}],
+        }
+
+    def call_ai(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def make_lesson(title: str, goal: str = "Понять, зачем нужен Python и как запустить первую программу") -> Lesson:
+    return Lesson(
+        lesson_title=title,
+        lesson_goal=goal,
+        content_outline=["История языка", "Установка интерпретатора", "Первая программа"],
+        estimated_time_minutes=45,
+    )
+
+
+def check(condition: bool, message: str) -> bool:
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def test_generator_tiers() -> bool:
+    print("\n--- Уровни кэша в ContentGenerator ---")
+    client = FakeAIClient()
+    generator = ContentGenerator(ai_client=client)
+    module = Module(module_number=1, module_title="Основы Python", module_goal="Освоить основы")
+    course = ("Python с нуля", "Начинающие")
+    ok = True
+
+    original = make_lesson("Введение в Python")
+    generator.generate_lesson_detailed_content(original, module, *course)
+    ok &= check(client.calls == 1, "первая генерация идёт в модель")
+
+    renamed = make_lesson("Введение в Python.")
+    ok &= check(normalize_text(renamed.lesson_title) == normalize_text(original.lesson_title), "нормализация убирает точку")
+    ok &= check(generator.lesson_detailed_draft(renamed, module, *course) is None, "для точного совпадения черновик не нужен")
+    content = generator.generate_lesson_detailed_content(renamed, module, *course)
+    ok &= check(client.calls == 1, "«Введение в Python.» — готовый ответ без вызова модели")
+    ok &= check(content["lecture_title"] == renamed.lesson_title, "название лекции — текущего урока")
+
+    edited = make_lesson("Введение в Python", goal="Понять, зачем нужен Python, и запустить первую программу")
+    draft = generator.lesson_detailed_draft(edited, module, *course)
+    ok &= check(draft is not None and not draft.final, f"правка цели — черновик (сходство {draft.similarity if draft else None})")
+
+    other = make_lesson("Списки и словари", goal="Научиться работать с коллекциями")
+    other.content_outline = ["Списки", "Кортежи", "Словари", "Множества"]
+    ok &= check(generator.lesson_detailed_draft(other, module, *course) is None, "непохожий урок — промах")
+    ok &= check(
+        generator.lesson_detailed_draft(edited, module, "Другой курс", course[1]) is None,
+        "тот же урок в другом курсе — промах (курс входит в scope)",
+    )
+    return ok
+
+
+def test_draft_refresh() -> bool:
+    print("\n--- Фоновая замена черновика ---")
+    service = DraftRefreshService()
+    stored = {"value": "черновик"}
+    ok = True
+
+    def apply(fresh):
+        if stored["value"] != "черновик":
+            return False
+        stored["value"] = fresh
+        return True
+
+    async def scenario():
+        nonlocal ok
+        ok &= check(service.schedule("lesson:1:1:0", lambda: "свежий", apply), "обновление запланировано")
+        ok &= check(not service.schedule("lesson:1:1:0", lambda: "ещё один", apply), "второе обновление того же урока не запускается")
+        while service.pending():
+            await asyncio.sleep(0.01)
+        ok &= check(stored["value"] == "свежий", "черновик заменён свежей генерацией")
+
+        stored["value"] = "правка пользователя"
+        service.schedule("lesson:1:1:0", lambda: "свежий", apply)
+        while service.pending():
+            await asyncio.sleep(0.01)
+        ok &= check(stored["value"] == "правка пользователя", "правка пользователя не затирается")
+
+    asyncio.run(scenario())
+    return ok
+
+
+def test_index() -> bool:
+    print("\n--- Индекс MinHash/LSH ---")
+    cache = SimilarityCache(num_perm=64, shingle_size=4, max_entries=1000)
+    ok = True
+
+    words = ["переменные", "функции", "классы", "модули", "исключения", "генераторы", "декораторы", "потоки",
+             "файлы", "сети", "тесты", "типы", "словари", "списки", "строки", "регулярные", "запросы", "очереди"]
+
+    def lesson_text(i: int, goal: str = "закрепить на практике") -> str:
+        rng = random.Random(i)
+        topic = " ".join(rng.sample(words, 4))
+        outline = ", ".join(rng.sample(words, 5))
+        return f"Урок {i}: {topic}\nЦель: разобраться, как устроены {topic}, и {goal}\nПлан: {outline}"
+
+    for i in range(1500):
+        cache.add("scope", lesson_text(i), {"i": i}, ttl_seconds=3600)
+    ok &= check(len(cache) == 1000, f"размер ограничен max_entries ({len(cache)})")
+    ok &= check(cache.lookup("scope", lesson_text(3), 0.8, 1.0) is None, "вытесненная запись не находится")
+
+    started = time.perf_counter()
+    match = cache.lookup("scope", lesson_text(1499, "закрепить на практиках"), 0.8, 1.0)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    ok &= check(
+        match is not None and match.value["i"] == 1499 and not match.final,
+        f"почти совпадающий запрос — черновик нужной записи (сходство {match.similarity if match else None})",
+    )
+    match = cache.lookup("scope", lesson_text(1400).upper() + "!", 0.8, 1.0)
+    ok &= check(match is not None and match.value["i"] == 1400 and match.final, "совпадение после нормализации — готовый ответ")
+    ok &= check(cache.lookup("other", lesson_text(1400), 0.8, 1.0) is None, "другой scope не виден")
+    print(f"   поиск среди {len(cache)} записей: {elapsed_ms:.2f} мс")
+
+    cache.add("ttl", "короткоживущая запись", 1, ttl_seconds=-1)
+    ok &= check(cache.lookup("ttl", "короткоживущая запись", 0.8, 1.0) is None, "просроченная запись не отдаётся")
+    return ok
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("КЭШ ПОХОЖИХ ЗАПРОСОВ")
+    print("=" * 60)
+    results = [test_generator_tiers(), test_draft_refresh(), test_index()]
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if all(results) else "❌ ЕСТЬ ОШИБКИ"))
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,118 @@
+"""
+Проверка видео по слайдам: сегменты озвучки привязываются к настоящим слайдам урока.
+
+- слайд, разбитый на несколько сегментов, и слайд без озвучки не сдвигают
+  индексы следующих слайдов;
+- части одного слайда получают разные ключи кэша видео (slide_index, часть);
+- число слайдов в сохранённом контенте урока не меняется, видео частей
+  со 2-й лежат в slides[i].video_parts.
+
+HeyGen подменяется фейковым клиентом, БД и файлы кэша/очереди — временные.
+
+Использование:
+    python backend/tools/test_slide_videos.py
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+ROOT_DIR = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backend.config import settings
+
+settings.HEYGEN_MAX_SCRIPT_CHARS = 60
+
+import backend.services.video_queue_service as video_queue_module
+from backend.database.db import CourseDatabase
+from backend.services.video_cache_service import VideoCacheService
+from backend.services.video_generation_service import VideoGenerationService
+from backend.services.video_queue_service import VideoQueueService
+
+SLIDES = [
+    {
+        "slide_number": 1,
+        "title": "Длинный слайд",
+        "content": (
+            "Переменная — это имя для значения в памяти. Имя связывается с объектом при присваивании. "
+            "Одно значение может иметь несколько имён. Имена чувствительны к регистру."
+        ),
+    },
+    {"slide_number": 2, "title": "Схема без текста", "content": ""},
+    {"slide_number": 3, "title": "Итоги", "content": "Запомните: имя указывает на объект."},
+]
+
+
+class FakeHeyGen:
+    """Возвращает новый video_id на каждый рендер и сразу завершает его"""
+
+    def __init__(self):
+        self.rendered = []
+
+    def create_video_from_text(self, text, **kwargs):
+        self.rendered.append(text)
+        return {"video_id": f"video-{len(self.rendered)}"}
+
+    def get_video_status(self, video_id):
+        return {"status": "completed", "download_url": f"https://cdn.example/{video_id}.mp4"}
+
+
+def check(ok: bool, message: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {message}")
+    return ok
+
+
+async def run(tmp: Path) -> bool:
+    database = CourseDatabase(str(tmp / "slides.db"))
+    video_queue_module.db = database
+    database.save_lesson_content(
+        course_id=1, module_number=1, lesson_index=0, lesson_title="Переменные",
+        content_data={"lecture_title": "Переменные", "slides": [dict(slide) for slide in SLIDES]},
+    )
+
+    heygen = FakeHeyGen()
+    cache = VideoCacheService(str(tmp / "video_cache.json"))
+    queue = VideoQueueService(heygen, cache, queue_file=str(tmp / "video_queue.json"), max_concurrent=10)
+    service = VideoGenerationService(queue_service=queue)
+
+    lesson = await service.generate_lesson_with_slide_videos({
+        "title": "Переменные", "slides": SLIDES, "course_id": 1, "module_number": 1, "lesson_index": 0,
+    })
+    planned = [(item["slide_index"], item["segment"]["part"]) for item in lesson["slides"]]
+    parts = sum(1 for index, _ in planned if index == 0)
+    ok = check(parts > 1, f"длинный слайд разбит на части ({parts})")
+    ok &= check(planned == [(0, part) for part in range(1, parts + 1)] + [(2, 1)], f"сегменты привязаны к слайдам 0 и 2 ({planned})")
+
+    await queue._dispatch_queued_jobs()
+    await queue._poll_active_jobs()
+    ok &= check(len(heygen.rendered) == len(planned), f"отрендерено {len(planned)} сегментов ({len(heygen.rendered)})")
+    keys = sorted(cache.cache)
+    expected = sorted(["1_1_0_0", "1_1_0_2"] + [f"1_1_0_0_p{part}" for part in range(2, parts + 1)])
+    ok &= check(keys == expected, f"ключи кэша по (слайд, часть): {keys}")
+
+    stored = database.get_lesson_content(1, 1, 0)["slides"]
+    ok &= check(len(stored) == len(SLIDES), f"слайдов в уроке по-прежнему {len(SLIDES)} ({len(stored)})")
+    ok &= check(stored[0].get("video_status") == "completed", "видео первой части — в самом слайде")
+    ok &= check(sorted(stored[0].get("video_parts", {})) == [str(part) for part in range(2, parts + 1)],
+                "части со 2-й — в video_parts")
+    ok &= check("video_id" not in stored[1], "слайд без озвучки остался без видео")
+    ok &= check(stored[2].get("video_id") is not None and stored[2]["title"] == "Итоги", "видео третьего слайда — на своём месте")
+    ok &= check(not database.update_lesson_slide_video_info(1, 1, 0, 7, video_id="x"), "несуществующий слайд не создаётся")
+    ok &= check(len(database.get_lesson_content(1, 1, 0)["slides"]) == len(SLIDES), "массив слайдов не дополнен")
+    return ok
+
+
+def main() -> int:
+    print("=" * 60)
+    print("ВИДЕО ПО СЛАЙДАМ")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = asyncio.run(run(Path(tmp)))
+    print("\n" + ("✅ ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ" if ok else "❌ ЕСТЬ ОШИБКИ"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Тест потоковой отдачи видео: корректность Range/ETag и пропускная способность на большом файле.
+
+Запуск (из корня репозитория):
+    python -m backend.tools.test_video_download_throughput [размер_МБ]
+
+HeyGen не нужен: тестовый MP4 создаётся во временном каталоге и кладётся
+в локальный кэш `VideoFileService`, запросы идут через TestClient.
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("HEYGEN_API_KEY", "test")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.routes import video_assets_routes
+from backend.services.video_file_service import VideoFileService
+
+
+class _NoHeyGen:
+    """Заглушка: в тесте видео уже лежит локально, HeyGen не вызывается"""
+
+    def get_video_status(self, video_id):
+        raise AssertionError("HeyGen не должен вызываться для локального видео")
+
+
+class _NoCache:
+    def get_video_by_id(self, video_id):
+        return None
+
+
+def _make_file(path: Path, size_mb: int) -> str:
+    hasher = hashlib.md5()
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _measure(label: str, fn, size_bytes: int):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"   {label}: {elapsed:.2f} с, {size_bytes / (1024 * 1024) / elapsed:.0f} МБ/с")
+    return result
+
+
+def test_video_download_throughput(size_mb: int = 256):
+    print("🧪 Тест потоковой отдачи видео")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = VideoFileService(_NoHeyGen(), _NoCache(), files_dir=tmp)
+        video_assets_routes.video_file_service = service
+        app = FastAPI()
+        app.include_router(video_assets_routes.router)
+        client = TestClient(app)
+
+        video_id = "throughput_test"
+        path = service.local_path(video_id)
+        print(f"1️⃣ Создание тестового файла {size_mb} МБ...")
+        expected_md5 = _make_file(path, size_mb)
+        size_bytes = size_mb * 1024 * 1024
+
+        print("2️⃣ Чтение файла сервисом: 8 КБ против рабочего размера блока")
+        for chunk_size in (8 * 1024, service.chunk_size):
+            _measure(
+                f"iter_file, блок {chunk_size // 1024} КБ",
+                lambda: sum(len(c) for c in service.iter_file(path, 0, size_bytes - 1, chunk_size)),
+                size_bytes,
+            )
+
+        print("3️⃣ Полная загрузка через HTTP")
+        url = f"/api/video/download/{video_id}"
+
+        def full_download():
+            hasher = hashlib.md5()
+            with client.stream("GET", url) as response:
+                assert response.status_code == 200, response.status_code
+                assert response.headers["accept-ranges"] == "bytes"
+                for chunk in response.iter_bytes():
+                    hasher.update(chunk)
+            return response, hasher.hexdigest()
+
+        response, md5 = _measure("GET целиком", full_download, size_bytes)
+        assert md5 == expected_md5, "Содержимое файла не совпадает"
+        etag = response.headers["etag"]
+        print(f"✅ Содержимое совпадает, ETag: {etag}")
+
+        print("4️⃣ Range-запросы")
+        with open(path, "rb") as f:
+            f.seek(1000)
+            expected_part = f.read(1000)
+        part = client.get(url, headers={"Range": "bytes=1000-1999"})
+        assert part.status_code == 206, part.status_code
+        assert part.headers["content-range"] == f"bytes 1000-1999/{size_bytes}"
+        assert part.content == expected_part
+        tail = client.get(url, headers={"Range": "bytes=-500"})
+        assert tail.status_code == 206 and len(tail.content) == 500
+        resume = client.get(url, headers={"Range": f"bytes={size_bytes - 10}-"})
+        assert resume.status_code == 206 and len(resume.content) == 10
+        bad = client.get(url, headers={"Range": f"bytes={size_bytes}-"})
+        assert bad.status_code == 416, bad.status_code
+        print("✅ 206 для диапазонов, 416 для диапазона за концом файла")
+
+        half = size_bytes // 2
+        _measure(
+            "GET второй половины (докачка)",
+            lambda: client.get(url, headers={"Range": f"bytes={half}-"}).content,
+            size_bytes - half,
+        )
+
+        print("5️⃣ If-None-Match")
+        cached = client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304 and not cached.content
+        print("✅ 304 Not Modified для совпадающего ETag")
+
+        invalid = client.get("/api/video/download/..%2Fetc")
+        assert invalid.status_code in (400, 404), invalid.status_code
+        print("✅ Некорректный video_id отклонён")
+
+    print("\n🎉 Все проверки пройдены")
+
+
+if __name__ == "__main__":
+    test_video_download_throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 256)
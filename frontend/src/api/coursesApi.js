@@ -27,6 +27,10 @@ api.interceptors.response.use(
   }
 )
 
+// ETag (версия) последней загруженной копии курса: отправляется в If-Match при сохранении,
+// чтобы не затереть чужие изменения (сервер ответит 409)
+const courseEtags = {}
+
 export const coursesApi = {
   // Создать курс
   createCourse: async (data) => {
@@ -34,23 +38,28 @@ export const coursesApi = {
     return response.data
   },
 
-  // Получить все курсы
-  getCourses: async (limit = 50, offset = 0) => {
-    const response = await api.get('/api/courses/', {
-      params: { limit, offset }
-    })
+  // Получить курсы (со сводкой). Курсор следующей страницы — в заголовке X-Next-Cursor.
+  // q — поиск по названиям курса, модулей и уроков
+  getCourses: async (limit = 50, cursor = null, q = '') => {
+    const params = { limit }
+    if (cursor) params.cursor = cursor
+    if (q) params.q = q
+    const response = await api.get('/api/courses/', { params })
     return response.data
   },
 
   // Получить курс по ID
   getCourse: async (id) => {
     const response = await api.get(`/api/courses/${id}`)
+    if (response.headers.etag) courseEtags[id] = response.headers.etag
     return response.data
   },
 
-  // Обновить курс
+  // Обновить курс (409 — курс изменён после загрузки, нужно перезагрузить)
   updateCourse: async (id, data) => {
-    const response = await api.put(`/api/courses/${id}`, data)
+    const headers = courseEtags[id] ? { 'If-Match': courseEtags[id] } : {}
+    const response = await api.put(`/api/courses/${id}`, data, { headers })
+    if (response.headers.etag) courseEtags[id] = response.headers.etag
     return response.data
   },
 
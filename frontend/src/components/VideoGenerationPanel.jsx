@@ -476,30 +476,16 @@ const VideoGenerationPanel = ({ lesson, onVideoGenerated }) => {
   };
 
   const downloadVideo = async () => {
-    if (!videoStatus?.download_url) return;
-
-    try {
-      const response = await fetch(`${getVideoApiUrl('DOWNLOAD')}/${videoStatus.video_id}`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          output_path: `./downloads/${lesson.title}_video.mp4`
-        }),
-      });
-
-      const data = await response.json();
-      
-      if (data.success) {
-        message.success('Видео скачано');
-      } else {
-        message.error('Ошибка при скачивании');
-      }
-    } catch (error) {
-      console.error('Ошибка скачивания:', error);
-      message.error('Ошибка при скачивании');
-    }
+    if (!videoStatus?.video_id) return;
+
+    // Бэкенд отдаёт MP4 потоково (Range/ETag), браузер сам сохраняет файл
+    const link = document.createElement('a');
+    link.href = `${getVideoApiUrl('DOWNLOAD')}/${videoStatus.video_id}`;
+    link.download = `${lesson.title}_video.mp4`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    message.success('Скачивание видео началось');
   };
 
   const retryGeneration = async () => {
@@ -282,7 +282,13 @@ function CourseViewPage() {
       loadCourse() // Перезагружаем курс
     } catch (error) {
       console.error('Error updating course:', error)
-      message.error('Ошибка обновления курса')
+      if (error.response?.status === 409) {
+        // Курс изменили параллельно: показываем актуальную версию
+        message.error(error.response.data?.detail || 'Курс был изменён, обновите страницу')
+        loadCourse()
+      } else {
+        message.error('Ошибка обновления курса')
+      }
     }
   }
 
@@ -376,7 +382,13 @@ function CourseViewPage() {
       }
     } catch (error) {
       console.error('Error updating module:', error)
-      message.error('Ошибка обновления модуля')
+      if (error.response?.status === 409) {
+        // Курс изменили параллельно: показываем актуальную версию
+        message.error(error.response.data?.detail || 'Курс был изменён, обновите страницу')
+        loadCourse()
+      } else {
+        message.error('Ошибка обновления модуля')
+      }
     }
   }
 
@@ -460,7 +472,13 @@ function CourseViewPage() {
       loadCourse()
     } catch (error) {
       console.error('Error updating lesson:', error)
-      message.error('Ошибка обновления урока')
+      if (error.response?.status === 409) {
+        // Курс изменили параллельно: показываем актуальную версию
+        message.error(error.response.data?.detail || 'Курс был изменён, обновите страницу')
+        loadCourse()
+      } else {
+        message.error('Ошибка обновления урока')
+      }
     }
   }
 
@@ -41,10 +41,10 @@ function CoursesListPage() {
     loadCourses()
   }, [])
 
-  const loadCourses = async () => {
+  const loadCourses = async (query = searchQuery) => {
     setLoading(true)
     try {
-      const data = await coursesApi.getCourses()
+      const data = await coursesApi.getCourses(50, null, query.trim())
       setCourses(data)
     } catch (error) {
       console.error('Error loading courses:', error)
@@ -74,12 +74,10 @@ function CoursesListPage() {
   }
 
   // Применяем фильтры к списку
+  // Поиск выполняется на сервере (названия курса, модулей и уроков), здесь — только фильтр по уровню
   const filteredCourses = courses.filter(c => {
-    const q = searchQuery.trim().toLowerCase()
-    const okSearch = !q || String(c.course_title || '').toLowerCase().includes(q)
     const aud = String(c.target_audience || '').toLowerCase()
-    const okAudience = audienceFilter === 'all' || aud.includes(audienceFilter)
-    return okSearch && okAudience
+    return audienceFilter === 'all' || aud.includes(audienceFilter)
   })
 
   // Колонки таблицы
@@ -91,6 +89,12 @@ function CoursesListPage() {
     { title: 'Недель', dataIndex: 'duration_weeks', key: 'weeks', width: 100 },
     { title: 'Часов', dataIndex: 'duration_hours', key: 'hours', width: 100,
       render: (v) => v ?? '-' },
+    { title: 'Модули / уроки', key: 'structure', width: 140,
+      render: (_, record) => `${record.module_count ?? 0} / ${record.lesson_count ?? 0}` },
+    { title: 'Контент', key: 'content', width: 110,
+      render: (_, record) => `${record.lessons_with_content ?? 0} / ${record.lesson_count ?? 0}` },
+    { title: 'Тесты', dataIndex: 'lessons_with_tests', key: 'tests', width: 90 },
+    { title: 'Видео', dataIndex: 'videos_completed', key: 'videos', width: 90 },
     { title: 'Создан', dataIndex: 'created_at', key: 'created', width: 140,
       render: (v) => new Date(v).toLocaleDateString('ru-RU') },
     { title: 'Действия', key: 'actions', width: 220, render: (_, record) => (
@@ -122,8 +126,9 @@ function CoursesListPage() {
         <Space>
           <Input.Search
             allowClear
-            placeholder="Поиск по названию"
-            onSearch={setSearchQuery}
+            placeholder="Поиск по курсам, модулям, урокам"
+            value={searchQuery}
+            onSearch={(value) => loadCourses(value)}
             onChange={(e) => setSearchQuery(e.target.value)}
             style={{ width: 260 }}
           />